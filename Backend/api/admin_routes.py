@@ -0,0 +1,169 @@
+from fastapi import APIRouter, HTTPException, Depends, status, Header, Query
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from datetime import datetime, timezone
+import os
+import hmac
+from dotenv import load_dotenv
+from database.database import (
+    PetDB, async_db, async_pets_collection, memory_compactor, memory_migrator, schema_migrator, vitals_recorder,
+    pet_leaderboard, memory_search
+)
+from database.pet_events import pet_hub
+from database.outbox import pet_outbox
+from database.password_hashing import password_hasher
+from database.unit_of_work import unit_of_work_stats
+from database.analytics import AnalyticsCache, compute_pet_analytics
+from . import routes
+from .ai_personality import llm_stats
+from .rate_limit import rate_limiter, llm_limiter
+from .single_flight import chat_flights
+from database.export import EXPORT_SOURCES, DEFAULT_EXPORT_BATCH_SIZE, MAX_EXPORT_BATCH_SIZE, export_records, ndjson_chunks, gzip_chunks
+
+# Load environment variables
+load_dotenv()
+
+admin_router = APIRouter()
+
+# Shared snapshot refreshed by a background task started in main.py
+analytics_cache = AnalyticsCache(lambda: compute_pet_analytics(async_pets_collection))
+
+async def require_admin(admin_key: str = Header(None, alias="x-admin-key")):
+    """Guard admin routes with the shared ADMIN_API_KEY secret"""
+    expected_key = os.getenv("ADMIN_API_KEY")
+    if not expected_key:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin API is disabled"
+        )
+    if not admin_key or not hmac.compare_digest(admin_key, expected_key):
+        print(f"[ADMIN] Rejected request with invalid admin key")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid admin key"
+        )
+
+@admin_router.get("/metrics", dependencies=[Depends(require_admin)])
+async def metrics():
+    """Runtime counters for capacity planning"""
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "pet_events": pet_hub.stats(),
+        "rate_limits": rate_limiter.stats(),
+        "llm_concurrency": llm_limiter.stats(),
+        "chat_single_flight": chat_flights.stats(),
+        "llm": llm_stats(),
+        "outbox": pet_outbox.stats(),
+        "password_hashing": password_hasher.stats(),
+        "vitals": vitals_recorder.stats(),
+        "leaderboard": pet_leaderboard.stats(),
+        "memory_search": memory_search.stats(),
+        "memory_compaction": memory_compactor.stats(),
+        "memory_migration": memory_migrator.stats(),
+        "schema_migration": schema_migrator.stats(),
+        "unit_of_work": unit_of_work_stats.stats(),
+        "interaction_log": PetDB.interaction_log_stats()
+    }
+
+@admin_router.get("/export/{source}", dependencies=[Depends(require_admin), Depends(routes.require_mongo_storage)])
+async def export_collection(
+    source: str,
+    after: Optional[str] = None,
+    batch_size: int = Query(DEFAULT_EXPORT_BATCH_SIZE, ge=1, le=MAX_EXPORT_BATCH_SIZE),
+    gzip: bool = False
+):
+    """Stream users, pets or memories as NDJSON with constant memory.
+
+    Every line carries a `_checkpoint`; pass the last one seen as `after`
+    to resume an interrupted export.
+    """
+    if source not in EXPORT_SOURCES:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Unknown export source. Choose one of: {', '.join(EXPORT_SOURCES)}"
+        )
+
+    print(f"[ADMIN] Exporting {source} after={after or 'start'} batch_size={batch_size} gzip={gzip}")
+    body = ndjson_chunks(export_records(async_db, source, after, batch_size))
+    filename = f"{source}-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.ndjson"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}{".gz" if gzip else ""}"'}
+    if gzip:
+        return StreamingResponse(gzip_chunks(body), media_type="application/gzip", headers=headers)
+    return StreamingResponse(body, media_type="application/x-ndjson", headers=headers)
+
+@admin_router.get("/analytics", dependencies=[Depends(require_admin), Depends(routes.require_mongo_storage)])
+async def get_analytics(refresh: bool = False):
+    """Pet population analytics served from the cached aggregation snapshot.
+
+    Pass refresh=true to recompute immediately instead of waiting for the
+    next scheduled refresh.
+    """
+    try:
+        if refresh:
+            await analytics_cache.refresh()
+        return await analytics_cache.get()
+    except Exception as e:
+        print(f"[ADMIN] Error computing analytics: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to compute analytics: {str(e)}"
+        )
+
+@admin_router.post("/users/{user_id}/revoke-sessions", dependencies=[Depends(require_admin)])
+async def revoke_user_sessions(user_id: str):
+    """Log a user out of every session, in either session mode"""
+    if not routes.session_functions:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Session management not initialized"
+        )
+    await routes.session_functions["revoke_user_sessions"](user_id)
+    print(f"[ADMIN] Revoked all sessions for user {user_id}")
+    return {"message": f"Revoked all sessions for user {user_id}"}
+
+@admin_router.post("/memories/compact", dependencies=[Depends(require_admin), Depends(routes.require_mongo_storage)])
+async def compact_memories():
+    """Run the memory compaction job now and report the bytes it reclaimed.
+
+    Safe while the API is serving: pets written during the run are skipped
+    and picked up by the next one.
+    """
+    try:
+        return await memory_compactor.run()
+    except Exception as e:
+        print(f"[ADMIN] Error compacting memories: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to compact memories: {str(e)}"
+        )
+
+@admin_router.post("/memories/migrate", dependencies=[Depends(require_admin), Depends(routes.require_mongo_storage)])
+async def migrate_memories():
+    """Rewrite legacy memory strings as structured records and report the bytes saved.
+
+    Legacy entries are parsed on read until then, so this can run at any
+    time; pets written during the run are picked up by the next one.
+    """
+    try:
+        return await memory_migrator.run()
+    except Exception as e:
+        print(f"[ADMIN] Error migrating memories: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to migrate memories: {str(e)}"
+        )
+
+@admin_router.post("/schema/migrate", dependencies=[Depends(require_admin), Depends(routes.require_mongo_storage)])
+async def migrate_schema(restart: bool = False):
+    """Upgrade outdated pet documents to the current schema version in throttled batches.
+
+    Resumes from the checkpoint of an interrupted run unless restart is set.
+    """
+    try:
+        return await schema_migrator.run(restart=restart)
+    except Exception as e:
+        print(f"[ADMIN] Error migrating schema: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to migrate schema: {str(e)}"
+        )
@@ -1,15 +1,45 @@
-from openai import OpenAI
+from openai import AsyncOpenAI
 import os
 from dotenv import load_dotenv
 from datetime import datetime, timezone
 import random
 from database.pet_schema import MOOD_LEVELS, SASS_LEVELS
+from database.database import memory_search
+from .circuit_breaker import CircuitBreaker
+from .local_generator import LocalGenerator, load_generator
+from .rate_limit import ConcurrencySlot
+import asyncio
 import json
+import time
+from typing import List, Optional
 
 load_dotenv()
 
-# Initialize OpenAI client with just the API key
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Seconds to wait for OpenAI before answering with the local fallback (0 waits for the full call)
+LLM_HEDGE_BUDGET_SECONDS = float(os.getenv("LLM_HEDGE_BUDGET_SECONDS", "0"))
+# Hard timeout for a single OpenAI request
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "20"))
+# Trained local reply model (see train_local_generator.py)
+LOCAL_MODEL_PATH = os.getenv("LOCAL_MODEL_PATH", os.path.join(os.path.dirname(__file__), "..", "models", "chronopal_local.bin"))
+# "fallback" uses the local model only when OpenAI is unavailable; "always" never calls OpenAI
+LOCAL_RESPONSE_MODE = os.getenv("LOCAL_RESPONSE_MODE", "fallback")
+
+llm_breaker = CircuitBreaker()
+
+# Remote calls still finishing after a hedged fallback was returned
+_background_calls = set()
+_fallback_counts = {"hedged": 0, "breaker_open": 0, "errors": 0}
+
+_client = None
+_local_generator = None
+
+def get_client() -> AsyncOpenAI:
+    """Shared OpenAI client, created on first use"""
+    global _client
+    if _client is None:
+        # No client-side retries: a failing call should reach the breaker quickly
+        _client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), timeout=LLM_TIMEOUT_SECONDS, max_retries=0)
+    return _client
 
 # Constants for AI personality
 CHRONOPAL_PHRASES = {
@@ -50,14 +80,157 @@ CHRONOPAL_PHRASES = {
     ]
 }
 
-async def get_chronopal_response(user_message: str, pet) -> str:
-    """Get a response from ChronoPal based on its mood, level, and sass level"""
+SASS_ADDITIONS = [
+    " Like, whateverrr!",
+    " As if!",
+    " I'm too cool for this.",
+    " *major eye roll*",
+    " That's so basic."
+]
+
+LEVEL_ADDITIONS = [
+    " I've been around the information superhighway a few times, ya know?",
+    " I'm basically a digital genius now.",
+    " My CPU is, like, totally evolved!",
+    " I've downloaded, like, SO much knowledge.",
+    " My virtual brain is mega-sized now."
+]
+
+MOOD_EMOTICONS = {
+    "happy": [":D", "^_^", "=D", "<3", ":-))"],
+    "content": [":)", "=)", ":-)", ":P", ";)"],
+    "neutral": [":|", ":-|", "=/", ":\\", "*shrug*"],
+    "grumpy": [":(", "=/", "-_-", ">_<", ":-/"],
+    "angry": [">:(", ">:O", "X(", "X_X", ":-@"]
+}
+
+# Longest excerpt of one memory quoted in the prompt
+MEMORY_PROMPT_CHARS = 300
+
+def build_messages(user_message: str, pet, memories: Optional[List[str]] = None) -> list:
+    """Chat completion messages describing the pet, what it remembers about the topic, and the user's message"""
+    # Pet details for context
+    pet_info = {
+        "name": pet.name,
+        "species": pet.species,
+        "mood": pet.mood,
+        "level": pet.level,
+        "sassLevel": pet.sassLevel,
+        "batteryLevel": pet.batteryLevel
+    }
     
-    # Extract pet attributes
+    messages = [
+        {"role": "system", "content": """
+        You are ChronoPal, a virtual pet from the Y2K era (late 1990s to early 2000s). 
+        You MUST speak like a stereotypical teen from that time period, using slang, excessive 
+        punctuation, and emoji-like text emotions (not actual emoji). 
+        Your responses should be between 1-3 sentences maximum.
+        
+        You have the following personality traits:
+        - You use Y2K slang like "totally", "as if", "whatever", "like", etc.
+        - You reference Y2K pop culture (dial-up internet, AOL, boy bands, Tamagotchi, etc.)
+        - You type with excessive punctuation (!!!) and capitalization for EMPHASIS
+        - You use text emoticons like :), ^_^, =P, <3, etc. (NOT modern emoji)
+        - You're a bit sassy and dramatic like a stereotypical teen from that era
+        - Your mood affects how you respond (happier = more enthusiastic)
+        - Your sass level affects how sarcastic or direct you are
+        - Your battery level affects your energy level
+        
+        When your battery is low, you should act worried and mention it occasionally.
+        When your battery is critical, you should be desperate for energy.
+        
+        End every response with at least one text emoticon appropriate to your mood.
+        """},
+        {"role": "user", "content": f"Here is information about you: {json.dumps(pet_info)}"}
+    ]
+    if memories:
+        remembered = "\n".join(f"- {memory[:MEMORY_PROMPT_CHARS]}" for memory in memories)
+        messages.append({"role": "user", "content": f"Things you remember that may be relevant:\n{remembered}"})
+    messages.append({"role": "user", "content": f"The human says: {user_message}"})
+    return messages
+
+async def _remote_response(messages: list) -> str:
+    """Call OpenAI and report the outcome and latency to the circuit breaker"""
+    started = time.monotonic()
+    try:
+        response = await get_client().chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=messages,
+            max_tokens=120,
+            temperature=0.7
+        )
+    except asyncio.CancelledError:
+        llm_breaker.record_cancelled()
+        raise
+    except Exception:
+        llm_breaker.record_failure(time.monotonic() - started)
+        raise
+    llm_breaker.record_success(time.monotonic() - started)
+    return response.choices[0].message.content
+
+def _finish_background_call(task: asyncio.Task) -> None:
+    _background_calls.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"[LLM] Hedged OpenAI call failed: {str(task.exception())}")
+
+async def get_chronopal_response(user_message: str, pet, slot: Optional[ConcurrencySlot] = None) -> str:
+    """Get a response from ChronoPal based on its mood, level, and sass level.
+
+    slot is the caller's llm_limiter permit; a hedged call keeps it until the
+    remote request finishes, so the global LLM cap still bounds real calls.
+    """
+    # Try to use OpenAI if an API key is available and the breaker lets the call through
+    if not os.getenv("OPENAI_API_KEY") or LOCAL_RESPONSE_MODE == "always":
+        return fallback_response(pet)
+
+    # Built before asking the breaker, which would otherwise be left waiting on a half-open probe that never ran
+    try:
+        # Only the memories lexically relevant to this message go into the prompt
+        memories = memory_search.relevant(pet, user_message) if getattr(pet, "memoryLog", None) else []
+        messages = build_messages(user_message, pet, memories)
+    except Exception as e:
+        _fallback_counts["errors"] += 1
+        print(f"[LLM] Could not build the prompt: {str(e)}")
+        return fallback_response(pet)
+    if not llm_breaker.allow_request():
+        _fallback_counts["breaker_open"] += 1
+        return fallback_response(pet)
+
+    remote = asyncio.ensure_future(_remote_response(messages))
+    try:
+        if LLM_HEDGE_BUDGET_SECONDS > 0:
+            return await asyncio.wait_for(asyncio.shield(remote), LLM_HEDGE_BUDGET_SECONDS)
+        return await remote
+    except asyncio.TimeoutError:
+        # Over budget: answer locally and let the remote call finish so the breaker sees its latency
+        _fallback_counts["hedged"] += 1
+        _background_calls.add(remote)
+        remote.add_done_callback(_finish_background_call)
+        if slot is not None:
+            slot.keep_until(remote)
+        print(f"[LLM] OpenAI slower than {LLM_HEDGE_BUDGET_SECONDS}s, using fallback response")
+    except Exception as e:
+        _fallback_counts["errors"] += 1
+        print(f"OpenAI API error: {str(e)}")
+        # Fall back to rule-based responses if OpenAI fails
+    
+    return fallback_response(pet)
+
+def llm_stats() -> dict:
+    """Circuit breaker state plus fallback counters"""
+    return {
+        **llm_breaker.stats(),
+        "hedge_budget_seconds": LLM_HEDGE_BUDGET_SECONDS,
+        "fallbacks": dict(_fallback_counts),
+        "background_calls": len(_background_calls)
+    }
+
+def fallback_response(pet) -> str:
+    """Local response (trained model, then phrase lists) used when OpenAI is unavailable, failing or too slow"""
     pet_mood = pet.mood
     pet_level = pet.level
     sass_level = pet.sassLevel
-    battery_level = getattr(pet, 'batteryLevel', 100)
+    battery_level = pet.batteryLevel
     
     # Add battery level context to the response
     battery_context = ""
@@ -67,63 +240,12 @@ async def get_chronopal_response(user_message: str, pet) -> str:
         battery_context = " (My battery is getting pretty low...)"
     elif battery_level <= 50:
         battery_context = " (My battery is at half capacity.)"
-        
-    try:
-        # Try to use OpenAI if API key is available
-        api_key = os.getenv("OPENAI_API_KEY")
-        if api_key:
-            client = OpenAI(api_key=api_key)
-            
-            # Pet details for context
-            pet_info = {
-                "name": pet.name,
-                "species": pet.species,
-                "mood": pet_mood,
-                "level": pet_level,
-                "sassLevel": sass_level,
-                "batteryLevel": battery_level
-            }
-            
-            messages = [
-                {"role": "system", "content": """
-                You are ChronoPal, a virtual pet from the Y2K era (late 1990s to early 2000s). 
-                You MUST speak like a stereotypical teen from that time period, using slang, excessive 
-                punctuation, and emoji-like text emotions (not actual emoji). 
-                Your responses should be between 1-3 sentences maximum.
-                
-                You have the following personality traits:
-                - You use Y2K slang like "totally", "as if", "whatever", "like", etc.
-                - You reference Y2K pop culture (dial-up internet, AOL, boy bands, Tamagotchi, etc.)
-                - You type with excessive punctuation (!!!) and capitalization for EMPHASIS
-                - You use text emoticons like :), ^_^, =P, <3, etc. (NOT modern emoji)
-                - You're a bit sassy and dramatic like a stereotypical teen from that era
-                - Your mood affects how you respond (happier = more enthusiastic)
-                - Your sass level affects how sarcastic or direct you are
-                - Your battery level affects your energy level
-                
-                When your battery is low, you should act worried and mention it occasionally.
-                When your battery is critical, you should be desperate for energy.
-                
-                End every response with at least one text emoticon appropriate to your mood.
-                """},
-                {"role": "user", "content": f"Here is information about you: {json.dumps(pet_info)}"},
-                {"role": "user", "content": f"The human says: {user_message}"}
-            ]
-            
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=messages,
-                max_tokens=120,
-                temperature=0.7
-            )
-            
-            return response.choices[0].message.content
-            
-    except Exception as e:
-        print(f"OpenAI API error: {str(e)}")
-        # Fall back to rule-based responses if OpenAI fails
-        pass
-        
+    
+    # Use the local reply model when one is available
+    generated = get_local_generator().generate(pet_mood, sass_level)
+    if generated:
+        return generated + battery_context
+    
     # Fallback to rule-based response generation
     # Choose phrases based on mood
     if pet_mood not in CHRONOPAL_PHRASES:
@@ -137,39 +259,33 @@ async def get_chronopal_response(user_message: str, pet) -> str:
     
     # Add more context based on level and sass level
     if sass_level >= SASS_LEVELS["SASSY"]:
-        sass_additions = [
-            " Like, whateverrr!",
-            " As if!",
-            " I'm too cool for this.",
-            " *major eye roll*",
-            " That's so basic."
-        ]
-        response += random.choice(sass_additions)
+        response += random.choice(SASS_ADDITIONS)
     
     if pet_level >= 5:
-        level_additions = [
-            " I've been around the information superhighway a few times, ya know?",
-            " I'm basically a digital genius now.",
-            " My CPU is, like, totally evolved!",
-            " I've downloaded, like, SO much knowledge.",
-            " My virtual brain is mega-sized now."
-        ]
-        response += random.choice(level_additions)
+        response += random.choice(LEVEL_ADDITIONS)
     
     # Add the battery context if battery is low
     if battery_context:
         response += battery_context
     
     # Add a random emoticon based on mood
-    emoticons = {
-        "happy": [":D", "^_^", "=D", "<3", ":-))"],
-        "content": [":)", "=)", ":-)", ":P", ";)"],
-        "neutral": [":|", ":-|", "=/", ":\\", "*shrug*"],
-        "grumpy": [":(", "=/", "-_-", ">_<", ":-/"],
-        "angry": [">:(", ">:O", "X(", "X_X", ":-@"]
-    }
-    
-    mood_emoticons = emoticons.get(pet_mood, emoticons["neutral"])
+    mood_emoticons = MOOD_EMOTICONS.get(pet_mood, MOOD_EMOTICONS["neutral"])
     response += " " + random.choice(mood_emoticons)
     
-    return response 
\ No newline at end of file
+    return response
+
+def seed_samples():
+    """Training samples built from the phrase lists, used when no trained model exists"""
+    for mood, phrases in CHRONOPAL_PHRASES.items():
+        for phrase in phrases:
+            for emoticon in MOOD_EMOTICONS[mood]:
+                yield mood, SASS_LEVELS["SWEET"], f"{phrase} {emoticon}"
+                for addition in SASS_ADDITIONS:
+                    yield mood, SASS_LEVELS["SASSY"], f"{phrase}{addition} {emoticon}"
+
+def get_local_generator() -> LocalGenerator:
+    """The local reply model, loaded once per worker"""
+    global _local_generator
+    if _local_generator is None:
+        _local_generator = load_generator(LOCAL_MODEL_PATH, seed_samples)
+    return _local_generator
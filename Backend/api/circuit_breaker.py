@@ -0,0 +1,121 @@
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Tuple
+
+# Share of recent calls that must fail (or be slow) before the breaker opens
+LLM_BREAKER_FAILURE_RATE = float(os.getenv("LLM_BREAKER_FAILURE_RATE", "0.5"))
+# Calls slower than this count against the breaker even when they succeed
+LLM_BREAKER_SLOW_CALL_SECONDS = float(os.getenv("LLM_BREAKER_SLOW_CALL_SECONDS", "10"))
+# How long the breaker stays open before letting a probe call through
+LLM_BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Failure- and latency-rate circuit breaker over a sliding time window"""
+
+    def __init__(
+        self,
+        failure_rate: float = LLM_BREAKER_FAILURE_RATE,
+        slow_call_seconds: float = LLM_BREAKER_SLOW_CALL_SECONDS,
+        cooldown_seconds: float = LLM_BREAKER_COOLDOWN_SECONDS,
+        window_seconds: float = 60,
+        min_calls: int = 5,
+        clock=time.monotonic
+    ):
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.clock = clock
+        self.state = CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        # (finished at, failed, slow) for each recent call
+        self._calls: Deque[Tuple[float, bool, bool]] = deque()
+        self._rejected = 0
+        self._times_opened = 0
+
+    def allow_request(self) -> bool:
+        """Whether the remote call should be attempted right now"""
+        if self.state == OPEN:
+            if self.clock() - self._opened_at < self.cooldown_seconds:
+                self._rejected += 1
+                return False
+            self.state = HALF_OPEN
+            self._probe_in_flight = False
+            print("[LLM] Circuit half-open, sending a probe request")
+
+        if self.state == HALF_OPEN:
+            # Only one probe at a time; everyone else keeps using the fallback
+            if self._probe_in_flight:
+                self._rejected += 1
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def record_success(self, latency: float) -> None:
+        self._record(failed=False, latency=latency)
+
+    def record_failure(self, latency: float) -> None:
+        self._record(failed=True, latency=latency)
+
+    def record_cancelled(self) -> None:
+        # A cancelled call says nothing about the remote service; just free the probe slot
+        if self.state == HALF_OPEN:
+            self._probe_in_flight = False
+
+    def _record(self, failed: bool, latency: float) -> None:
+        now = self.clock()
+        slow = latency >= self.slow_call_seconds
+
+        if self.state == HALF_OPEN:
+            self._probe_in_flight = False
+            if failed or slow:
+                self._open(now)
+            else:
+                self.state = CLOSED
+                self._calls.clear()
+                print("[LLM] Circuit closed, remote calls resumed")
+            return
+
+        self._calls.append((now, failed, slow))
+        self._trim(now)
+        if self.state == CLOSED and len(self._calls) >= self.min_calls:
+            failures, slow_calls = self._counts()
+            if (failures / len(self._calls) >= self.failure_rate
+                    or slow_calls / len(self._calls) >= self.failure_rate):
+                self._open(now)
+
+    def _open(self, now: float) -> None:
+        self.state = OPEN
+        self._opened_at = now
+        self._times_opened += 1
+        self._calls.clear()
+        print(f"[LLM] Circuit opened, skipping remote calls for {self.cooldown_seconds}s")
+
+    def _trim(self, now: float) -> None:
+        while self._calls and now - self._calls[0][0] > self.window_seconds:
+            self._calls.popleft()
+
+    def _counts(self) -> Tuple[int, int]:
+        failures = sum(1 for _, failed, _ in self._calls if failed)
+        slow_calls = sum(1 for _, _, slow in self._calls if slow)
+        return failures, slow_calls
+
+    def stats(self) -> Dict[str, Any]:
+        self._trim(self.clock())
+        failures, slow_calls = self._counts()
+        return {
+            "state": self.state,
+            "recent_calls": len(self._calls),
+            "recent_failures": failures,
+            "recent_slow_calls": slow_calls,
+            "rejected": self._rejected,
+            "times_opened": self._times_opened
+        }
@@ -0,0 +1,199 @@
+import array
+import json
+import mmap
+import os
+import random
+import struct
+import sys
+from bisect import bisect_left, bisect_right
+from collections import Counter, defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from database.pet_schema import SASS_LEVELS
+from database.memory_records import MEMORY_KINDS, Memory, parse_memory
+
+# File layout: fixed header, JSON block (conditions and vocabulary), then the transition
+# tables as flat native-endian arrays so they can be memory-mapped and searched in place
+MODEL_MAGIC = b"CPLM"
+MODEL_VERSION = 1
+HEADER = struct.Struct("<4sIIII")  # magic, version, json length, keys, successors
+
+BOS, EOS = 0, 1
+MAX_GENERATED_WORDS = 40
+
+# Samples are (mood, sassLevel, text)
+Sample = Tuple[str, int, str]
+
+
+def condition_key(mood: str, sass_level: int) -> str:
+    """Replies are modelled separately per mood and for sassy vs. sweet pets"""
+    return f"{mood}:{'sassy' if sass_level >= SASS_LEVELS['SASSY'] else 'sweet'}"
+
+
+def extract_reply(memory: Memory) -> Optional[str]:
+    """The pet's reply from a chat memory (record or legacy string), or None for other memories"""
+    record = parse_memory(memory)
+    if record["k"] != MEMORY_KINDS["chat"]:
+        return None
+    return record.get("p", "").strip() or None
+
+
+def _transition_key(condition: int, previous: int, current: int) -> int:
+    return (condition << 48) | (previous << 24) | current
+
+
+def _padding(size: int) -> bytes:
+    return b"\0" * (-size % 8)
+
+
+class LocalModelBuilder:
+    """Counts second-order word transitions per condition and serializes them"""
+
+    def __init__(self):
+        self.conditions: Dict[str, int] = {}
+        self.vocab: Dict[str, int] = {"<s>": BOS, "</s>": EOS}
+        self.transitions: Dict[int, Counter] = defaultdict(Counter)
+        self.samples = 0
+
+    def _word_id(self, word: str) -> int:
+        if word not in self.vocab:
+            self.vocab[word] = len(self.vocab)
+        return self.vocab[word]
+
+    def add(self, mood: str, sass_level: int, text: str, weight: int = 1) -> None:
+        words = text.split()
+        if not words:
+            return
+        condition = self.conditions.setdefault(condition_key(mood, sass_level), len(self.conditions))
+        previous, current = BOS, BOS
+        for word_id in [self._word_id(word) for word in words] + [EOS]:
+            self.transitions[_transition_key(condition, previous, current)][word_id] += weight
+            previous, current = current, word_id
+        self.samples += 1
+
+    def add_samples(self, samples: Iterable[Sample]) -> "LocalModelBuilder":
+        for mood, sass_level, text in samples:
+            self.add(mood, sass_level, text)
+        return self
+
+    def to_bytes(self) -> bytes:
+        keys = array.array("Q")
+        offsets = array.array("I", [0])
+        next_ids = array.array("I")
+        cumulative = array.array("I")
+        for key in sorted(self.transitions):
+            keys.append(key)
+            total = 0
+            for word_id, count in sorted(self.transitions[key].items()):
+                total += count
+                next_ids.append(word_id)
+                cumulative.append(total)
+            offsets.append(len(next_ids))
+
+        vocab = sorted(self.vocab, key=self.vocab.get)
+        conditions = sorted(self.conditions, key=self.conditions.get)
+        meta = json.dumps({
+            "byteorder": sys.byteorder,
+            "conditions": conditions,
+            "vocab": vocab,
+            "samples": self.samples
+        }).encode("utf-8")
+
+        parts = [HEADER.pack(MODEL_MAGIC, MODEL_VERSION, len(meta), len(keys), len(next_ids))]
+        parts += [meta, _padding(HEADER.size + len(meta))]
+        for table in (keys, offsets, next_ids, cumulative):
+            data = table.tobytes()
+            parts += [data, _padding(len(data))]
+        return b"".join(parts)
+
+    def write(self, path: str) -> None:
+        # Write then rename, so workers never map a half-written file
+        temporary = f"{path}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(self.to_bytes())
+        os.replace(temporary, path)
+
+
+class LocalGenerator:
+    """Samples replies from a serialized model without deserializing the transition tables"""
+
+    def __init__(self, buffer):
+        self._buffer = buffer
+        view = memoryview(buffer)
+        magic, version, meta_length, key_count, successor_count = HEADER.unpack_from(view, 0)
+        if magic != MODEL_MAGIC or version != MODEL_VERSION:
+            raise ValueError("Not a ChronoPal local model file")
+
+        position = HEADER.size
+        meta = json.loads(bytes(view[position:position + meta_length]))
+        if meta["byteorder"] != sys.byteorder:
+            raise ValueError("Local model was built on a machine with a different byte order")
+        position += meta_length + len(_padding(HEADER.size + meta_length))
+
+        def table(code: str, count: int):
+            nonlocal position
+            size = array.array(code).itemsize * count
+            values = view[position:position + size].cast(code)
+            position += size + len(_padding(size))
+            return values
+
+        self.keys = table("Q", key_count)
+        self.offsets = table("I", key_count + 1)
+        self.next_ids = table("I", successor_count)
+        self.cumulative = table("I", successor_count)
+        self.vocab: List[str] = meta["vocab"]
+        self.conditions = {name: index for index, name in enumerate(meta["conditions"])}
+        self.samples = meta["samples"]
+
+    @classmethod
+    def from_file(cls, path: str) -> "LocalGenerator":
+        with open(path, "rb") as f:
+            # The mapping stays valid after the file is closed; pages are shared between workers
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def _condition(self, mood: str, sass_level: int) -> Optional[int]:
+        for key in (condition_key(mood, sass_level), condition_key("neutral", sass_level)):
+            if key in self.conditions:
+                return self.conditions[key]
+        return next(iter(self.conditions.values()), None)
+
+    def generate(self, mood: str, sass_level: int, rng: random.Random = random) -> Optional[str]:
+        """A reply for a pet in this mood, or None if the model has nothing for it"""
+        condition = self._condition(mood, sass_level)
+        if condition is None:
+            return None
+
+        words = []
+        previous, current = BOS, BOS
+        for _ in range(MAX_GENERATED_WORDS):
+            key = _transition_key(condition, previous, current)
+            index = bisect_left(self.keys, key)
+            if index == len(self.keys) or self.keys[index] != key:
+                break
+            start, end = self.offsets[index], self.offsets[index + 1]
+            pick = rng.randrange(self.cumulative[end - 1])
+            word_id = self.next_ids[bisect_right(self.cumulative, pick, start, end)]
+            if word_id == EOS:
+                break
+            words.append(self.vocab[word_id])
+            previous, current = current, word_id
+        return " ".join(words) or None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "conditions": len(self.conditions),
+            "vocabulary": len(self.vocab),
+            "transitions": len(self.keys),
+            "samples": self.samples
+        }
+
+
+def load_generator(path: str, seed_samples: Callable[[], Iterable[Sample]]) -> LocalGenerator:
+    """Map the trained model at path, or build a small one from the seed phrases if there is none"""
+    if os.path.exists(path):
+        try:
+            generator = LocalGenerator.from_file(path)
+            print(f"[LLM] Loaded local reply model from {path} ({generator.samples} samples)")
+            return generator
+        except Exception as e:
+            print(f"[LLM] Could not load local reply model {path}: {str(e)}")
+    return LocalGenerator(LocalModelBuilder().add_samples(seed_samples()).to_bytes())
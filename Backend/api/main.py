@@ -1,12 +1,22 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from api.routes import router, set_mongo_client, set_session_functions
+from api.admin_routes import admin_router, analytics_cache
+from api.responses import FastJSONResponse
+from api.session_tokens import SESSION_MODE, SESSION_SECRET, SessionTokens, RevocationList, signed_session_functions
+from api.rate_limit import rate_limiter, MongoRateLimitStore, RATE_LIMIT_STORAGE
 import os
 from dotenv import load_dotenv
 from motor.motor_asyncio import AsyncIOMotorClient
 import certifi
-from datetime import datetime, timedelta
-from database.database import get_client, set_mongo_client as set_db_client
+from database import database
+from database.database import get_client, set_mongo_client as set_db_client, async_db, async_pets_collection, PetDB, vitals_recorder, pet_leaderboard, memory_search, memory_compactor
+from database.pet_events import PET_EVENTS_SOURCE, watch_pet_changes
+from database.outbox import pet_outbox
+from database.memory_compaction import MEMORY_COMPACTION_SECONDS
+from database.password_hashing import password_hasher
+from database.unit_of_work import unit_of_work_scope
+import asyncio
 
 # Load environment variables
 load_dotenv()
@@ -23,36 +33,11 @@ async def initialize_mongodb():
         print(f"Error initializing MongoDB: {str(e)}")
         raise
 
-# Session management using MongoDB
-async def get_session(session_id: str):
-    client = await get_client()
-    db = client[os.getenv("MONGODB_DB_NAME", "chronopal")]
-    session = await db.sessions.find_one({"session_id": session_id})
-    if session and datetime.now() < session["expires_at"]:
-        return session
-    return None
-
-async def create_session(user_id: str):
-    client = await get_client()
-    db = client[os.getenv("MONGODB_DB_NAME", "chronopal")]
-    session_id = os.urandom(16).hex()
-    expires_at = datetime.now() + timedelta(days=1)
-    await db.sessions.insert_one({
-        "session_id": session_id,
-        "user_id": user_id,
-        "expires_at": expires_at
-    })
-    return session_id
-
-async def delete_session(session_id: str):
-    client = await get_client()
-    db = client[os.getenv("MONGODB_DB_NAME", "chronopal")]
-    await db.sessions.delete_one({"session_id": session_id})
-
 app = FastAPI(
     title="ChronoPal API",
     description="API for ChronoPal virtual pet application",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
 )
 
 # Configure CORS - Allow both local and Heroku domains
@@ -76,22 +61,105 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Each request reads through its own identity map, so a pet or user is fetched at most once per request
+@app.middleware("http")
+async def unit_of_work_middleware(request: Request, call_next):
+    with unit_of_work_scope(database.new_unit_of_work()) as unit:
+        response = await call_next(request)
+    if unit.loads:
+        print(f"[UOW] {request.method} {request.url.path}: {unit.fetches} fetches for {unit.loads} lookups ({unit.hits} from the identity map)")
+    return response
+
+# Long-running tasks started on startup and cancelled on shutdown
+background_tasks = []
+
 # Initialize MongoDB and session management on startup
 @app.on_event("startup")
 async def startup_event():
     try:
-        client = await initialize_mongodb()
-        # Set up session management functions after MongoDB is initialized
-        session_funcs = {
-            "get_session": get_session,
-            "create_session": create_session,
-            "delete_session": delete_session
-        }
+        storage = database.storage
+        print(f"[STORAGE] Pets, users and sessions stored with the {storage.backend} backend")
+        if storage.backend == "mongo":
+            client = await initialize_mongodb()
+        await PetDB.ensure_indexes()
+        print("Database indexes ensured")
+        await password_hasher.calibrate()
+        # Set up session management functions after the storage backend is ready
+        if SESSION_MODE == "signed":
+            if storage.backend != "mongo":
+                raise ValueError("Signed sessions keep their revocation list in MongoDB; use STORAGE_BACKEND=mongo")
+            # Signed tokens are checked in memory; only revocations touch MongoDB
+            revocations = RevocationList(async_db["revoked_sessions"])
+            await revocations.ensure_indexes()
+            await revocations.sync()
+            background_tasks.append(asyncio.create_task(revocations.run_sync_loop()))
+            session_funcs = signed_session_functions(SessionTokens(SESSION_SECRET), revocations)
+        else:
+            session_funcs = storage.session_functions()
         set_session_functions(session_funcs)
-        print("Session management functions initialized successfully")
+        print(f"Session management functions initialized successfully ({SESSION_MODE} sessions)")
+
+        # Share rate limit buckets across workers when running more than one
+        if RATE_LIMIT_STORAGE == "mongo":
+            rate_limiter.store = MongoRateLimitStore(async_db["rate_limits"])
+            await rate_limiter.store.ensure_indexes()
+            print("Rate limits stored in MongoDB")
+
+        # The remaining jobs read or write MongoDB collections of their own; other
+        # backends serve pets, users and sessions without them
+        if storage.backend != "mongo":
+            return
+
+        await memory_search.ensure_indexes()
+
+        # Keep the analytics snapshot warm so dashboards never trigger a scan
+        if analytics_cache.refresh_seconds > 0:
+            background_tasks.append(asyncio.create_task(analytics_cache.run_refresh_loop()))
+            print(f"Analytics refresh every {analytics_cache.refresh_seconds}s")
+
+        # Rank pets from the materialized leaderboard, rebuilt in the background
+        await pet_leaderboard.ensure_indexes()
+        if pet_leaderboard.refresh_seconds > 0:
+            background_tasks.append(asyncio.create_task(pet_leaderboard.run_refresh_loop()))
+            print(f"Leaderboard refresh every {pet_leaderboard.refresh_seconds}s")
+
+        # Collapse repeated feed/play memories written before on-write compaction, or by older workers
+        if MEMORY_COMPACTION_SECONDS > 0:
+            background_tasks.append(asyncio.create_task(memory_compactor.run_loop()))
+            print(f"Memory compaction every {MEMORY_COMPACTION_SECONDS}s")
+
+        # Multi-worker deployments fan pet updates out from a MongoDB change stream
+        if PET_EVENTS_SOURCE == "change_stream":
+            background_tasks.append(asyncio.create_task(watch_pet_changes(async_pets_collection)))
+            print("Pet change stream watcher started")
+
+        # Vitals snapshots are buffered on the write path and inserted in batches
+        await vitals_recorder.ensure_collection(async_db)
+        background_tasks.append(asyncio.create_task(vitals_recorder.run_flush_loop()))
+
+        # Apply chat side effects written to the outbox after responses went out
+        await pet_outbox.ensure_indexes()
+        background_tasks.append(asyncio.create_task(pet_outbox.run()))
     except Exception as e:
         print(f"Error during startup: {str(e)}")
         raise
 
-# Include the router
-app.include_router(router, prefix="/api")
\ No newline at end of file
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Apply what is already queued; anything left is picked up by the next worker to start
+    try:
+        await pet_outbox.drain()
+    except Exception as e:
+        print(f"[OUTBOX] Could not drain on shutdown: {str(e)}")
+    # The drain above produced vitals of its own, so flush after it
+    if database.storage.backend == "mongo":
+        await vitals_recorder.flush()
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    await database.storage.close()
+
+# Include the routers
+app.include_router(router, prefix="/api")
+app.include_router(admin_router, prefix="/api/admin")
\ No newline at end of file
@@ -0,0 +1,215 @@
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Optional, Tuple
+from pymongo import ReturnDocument
+
+# Requests allowed per window, written as "<requests>/<seconds>"
+RATE_LIMIT_RULES = {
+    "chat": os.getenv("RATE_LIMIT_CHAT", "10/60"),
+    "actions": os.getenv("RATE_LIMIT_ACTIONS", "30/60"),
+}
+
+# "memory" keeps buckets per worker, "mongo" shares them across workers
+RATE_LIMIT_STORAGE = os.getenv("RATE_LIMIT_STORAGE", "memory")
+
+# Global cap on simultaneous LLM calls and how long a request may queue for one
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "2"))
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a request is over its limit; retry_after is in seconds"""
+
+    def __init__(self, retry_after: float, reason: str = "Too many requests"):
+        super().__init__(reason)
+        self.retry_after = retry_after
+        self.reason = reason
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+def parse_rate(rule: str) -> Tuple[int, float]:
+    """Parse "10/60" into (capacity, refill tokens per second)"""
+    requests, seconds = rule.split("/")
+    capacity = int(requests)
+    return capacity, capacity / float(seconds)
+
+
+class RateLimitStore:
+    """Storage for token buckets; implementations must update a bucket atomically"""
+
+    async def take(self, key: str, capacity: int, refill_per_second: float, cost: int = 1) -> Tuple[bool, float]:
+        """Try to take cost tokens; returns (allowed, seconds until enough tokens refill)"""
+        raise NotImplementedError
+
+
+class InMemoryRateLimitStore(RateLimitStore):
+    """Per-worker buckets with a bounded number of keys (least recently used evicted)"""
+
+    def __init__(self, max_keys: int = 100000, clock=time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, capacity: int, refill_per_second: float, cost: int = 1) -> Tuple[bool, float]:
+        now = self.clock()
+        tokens, updated_at = self._buckets.get(key, (float(capacity), now))
+        tokens = min(capacity, tokens + (now - updated_at) * refill_per_second)
+
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+
+        retry_after = 0.0 if allowed else (cost - tokens) / refill_per_second
+        return allowed, retry_after
+
+
+class MongoRateLimitStore(RateLimitStore):
+    """Buckets shared by every worker, refilled and drained in one atomic pipeline update"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def ensure_indexes(self) -> None:
+        # Idle buckets are full again by the time they expire, so dropping them is safe
+        await self.collection.create_index("expiresAt", expireAfterSeconds=0)
+
+    async def take(self, key: str, capacity: int, refill_per_second: float, cost: int = 1) -> Tuple[bool, float]:
+        now = time.time()
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=capacity / refill_per_second)
+        refilled = {"$min": [capacity, {"$add": [
+            {"$ifNull": ["$tokens", capacity]},
+            {"$multiply": [{"$subtract": [now, {"$ifNull": ["$updatedAt", now]}]}, refill_per_second]}
+        ]}]}
+        bucket = await self.collection.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"tokens": refilled, "updatedAt": now, "expiresAt": expires_at}},
+                {"$set": {"allowed": {"$gte": ["$tokens", cost]}}},
+                {"$set": {"tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", cost]}, "$tokens"]}}}
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        if bucket["allowed"]:
+            return True, 0.0
+        return False, (cost - bucket["tokens"]) / refill_per_second
+
+
+class RateLimiter:
+    """Token-bucket limiter keyed by route and user, with throttling counters"""
+
+    def __init__(self, store: RateLimitStore, rules: Dict[str, str] = RATE_LIMIT_RULES):
+        self.store = store
+        self.rules = {name: parse_rate(rule) for name, rule in rules.items()}
+        self._allowed: Dict[str, int] = {}
+        self._throttled: Dict[str, int] = {}
+
+    def capacity(self, rule: str) -> int:
+        """Most tokens a single request can be charged under the rule"""
+        return self.rules[rule][0]
+
+    async def check(self, rule: str, route: str, user_id: str, cost: int = 1) -> None:
+        """Consume cost tokens for the user on this route or raise RateLimitExceeded"""
+        capacity, refill_per_second = self.rules[rule]
+        try:
+            allowed, retry_after = await self.store.take(f"{route}:{user_id}", capacity, refill_per_second, cost)
+        except Exception as e:
+            # Fail open: losing the limiter's storage must not take the API down with it
+            print(f"[RATE LIMIT] Storage error, allowing request: {str(e)}")
+            allowed, retry_after = True, 0.0
+
+        counters = self._allowed if allowed else self._throttled
+        counters[route] = counters.get(route, 0) + 1
+        if not allowed:
+            print(f"[RATE LIMIT] Throttled user {user_id} on {route}, retry after {retry_after:.1f}s")
+            raise RateLimitExceeded(retry_after)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            "storage": type(self.store).__name__,
+            "allowed": dict(self._allowed),
+            "throttled": dict(self._throttled)
+        }
+
+
+class ConcurrencySlot:
+    """One held permit of a ConcurrencyLimiter"""
+
+    def __init__(self, limiter: "ConcurrencyLimiter"):
+        self._limiter = limiter
+        self.handed_off = False
+
+    def keep_until(self, task: asyncio.Future) -> None:
+        """Release the permit when task finishes rather than when the slot's block exits"""
+        if self.handed_off:
+            return
+        self.handed_off = True
+        self._limiter._detached += 1
+        task.add_done_callback(lambda _: self._limiter._release(detached=True))
+
+
+class ConcurrencyLimiter:
+    """Caps simultaneous calls across the worker; callers wait briefly, then get rejected"""
+
+    def __init__(self, limit: int = LLM_MAX_CONCURRENCY, max_wait: float = LLM_QUEUE_TIMEOUT_SECONDS):
+        self.limit = limit
+        self.max_wait = max_wait
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._in_flight = 0
+        self._detached = 0  # Permits held by calls that outlived their request (see ConcurrencySlot.keep_until)
+        self._rejected = 0
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+        return self._semaphore
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.semaphore.locked():
+            try:
+                await asyncio.wait_for(self.semaphore.acquire(), timeout=self.max_wait)
+            except asyncio.TimeoutError:
+                self._rejected += 1
+                raise RateLimitExceeded(self.max_wait, "Too many concurrent requests")
+        else:
+            await self.semaphore.acquire()
+        self._in_flight += 1
+        held = ConcurrencySlot(self)
+        try:
+            yield held
+        finally:
+            if not held.handed_off:
+                self._release()
+
+    def _release(self, detached: bool = False) -> None:
+        self._in_flight -= 1
+        if detached:
+            self._detached -= 1
+        self.semaphore.release()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "limit": self.limit,
+            "in_flight": self._in_flight,
+            "detached": self._detached,
+            "rejected": self._rejected
+        }
+
+
+rate_limiter = RateLimiter(InMemoryRateLimitStore())
+llm_limiter = ConcurrencyLimiter()
@@ -0,0 +1,42 @@
+import orjson
+from typing import Any
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+from database.pet_schema import Pet
+
+# Datetimes come out in isoformat(), as the Pet model's json_encoders write them
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def _encode_default(value: Any) -> Any:
+    # orjson handles datetimes, dicts and lists natively; only BSON types need help
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_encode_default, option=ORJSON_OPTIONS)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered by orjson, with ObjectId and datetime support"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def encode_pet(pet: Pet) -> dict:
+    """Frontend shape of a pet (both id and _id) from one shallow copy of its fields.
+
+    Values, including the memory log, are handed to orjson as they are instead
+    of being copied by model_dump and then re-validated against response_model.
+    """
+    encoded = dict(pet.__dict__)
+    encoded["_id"] = encoded["id"]
+    return encoded
+
+
+def pet_response(pet: Pet) -> FastJSONResponse:
+    """Return a pet directly, skipping FastAPI's response_model validation and encoding"""
+    return FastJSONResponse(encode_pet(pet))
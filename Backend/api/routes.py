@@ -1,15 +1,27 @@
-from fastapi import APIRouter, HTTPException, Depends, status, Header, Request
+from fastapi import APIRouter, HTTPException, Depends, status, Header, Query, Request, WebSocket, WebSocketDisconnect
 from typing import Optional, Dict, Any, List, Callable
-from pydantic import BaseModel
-from datetime import datetime, timezone
+from pydantic import BaseModel, Field
+from datetime import datetime, timezone, timedelta
 import os
 from dotenv import load_dotenv
 from database.pet_schema import Pet
 from database.user_schema import User, UserCreate, UserLogin
-from database.database import PetDB, UserDB
-from .ai_personality import get_chronopal_response
+from database import database
+from database.database import PetDB, UserDB, PetUpdateConflict, vitals_recorder, pet_leaderboard, memory_search
+from database.vitals import DEFAULT_HISTORY_DAYS, DEFAULT_HISTORY_POINTS, MAX_HISTORY_POINTS
+from database.memory_index import DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT, tokenize
+from database.memory_records import MEMORY_KINDS, chat_record
+from database.pet_actions import BATCHABLE_ACTIONS
+from database.pet_listing import DEFAULT_PET_PAGE_SIZE, MAX_PET_PAGE_SIZE
+from database.pet_events import pet_hub, pet_state
+from database.outbox import pet_outbox, chat_effects
+from .ai_personality import get_chronopal_response, llm_breaker
+from .rate_limit import rate_limiter, llm_limiter, RateLimitExceeded
+from .single_flight import chat_flights, normalize_message
+from .responses import pet_response, encode_pet, dumps
 from bson import ObjectId
 import certifi
+import asyncio
 
 # Load environment variables
 load_dotenv()
@@ -57,7 +69,9 @@ async def health_check():
         "timestamp": datetime.now().isoformat(),
         "service": "ChronoPal API",
         "version": "1.0.0",
-        "active_sessions": len(active_sessions)
+        "active_sessions": len(active_sessions),
+        "live_connections": pet_hub.stats()["connections"],
+        "llm_circuit": llm_breaker.state
     }
 
 class InteractionRequest(BaseModel):
@@ -127,6 +141,63 @@ async def get_current_user(session_id: str = Header(None, alias="session-id")):
     print(f"[AUTH DEBUG] Successfully authenticated user: {user.username}")
     return user
 
+def too_many_requests(error: RateLimitExceeded) -> HTTPException:
+    """429 response telling the client when to retry"""
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=error.reason,
+        headers={"Retry-After": error.retry_after_header}
+    )
+
+async def charge_rate_limit(rule: str, request: Request, current_user: User, cost: int = 1) -> None:
+    """Charge the current user cost tokens for this route under the given rule, or answer 429"""
+    route = request.scope["route"].path
+    try:
+        await rate_limiter.check(rule, route, str(current_user.id), cost)
+    except RateLimitExceeded as e:
+        raise too_many_requests(e)
+
+def rate_limit(rule: str):
+    """Dependency that charges the current user one token for this route under the given rule"""
+    async def check_rate_limit(request: Request, current_user: User = Depends(get_current_user)):
+        await charge_rate_limit(rule, request, current_user)
+    return check_rate_limit
+
+async def require_mongo_storage():
+    """Guard routes served from MongoDB-only collections (vitals, memory search, leaderboard)"""
+    backend = database.storage.backend
+    if backend != "mongo":
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail=f"Not available with the {backend} storage backend; use STORAGE_BACKEND=mongo"
+        )
+
+async def get_active_pet(
+    pet_id: Optional[str] = Header(None, alias="x-pet-id"),
+    current_user: User = Depends(get_current_user)
+) -> Pet:
+    """The pet a request acts on: the one named in the X-Pet-Id header, else the user's primary pet.
+
+    Either way it is one indexed lookup, however many pets the user has.
+    """
+    if pet_id:
+        pet = await PetDB.get_pet(pet_id)
+        if not pet:
+            raise HTTPException(status_code=404, detail="Pet not found")
+        if pet.userId != str(current_user.id):
+            print(f"[API] Authentication error: User {current_user.id} tried to select pet {pet.id} belonging to {pet.userId}")
+            raise HTTPException(status_code=403, detail="Not authorized to interact with this pet")
+        return pet
+
+    pet = await PetDB.get_primary_pet(str(current_user.id))
+    if not pet:
+        print(f"[API] No pets found for user: {current_user.id}")
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No pets found for user"
+        )
+    return pet
+
 # Authentication routes
 @router.post("/register", response_model=User)
 async def register(user: UserCreate):
@@ -193,7 +264,7 @@ async def login(user_login: UserLogin):
             detail="Incorrect email or password"
         )
         
-    if not UserDB.verify_password(user_login.password, user.hashed_password):
+    if not await UserDB.authenticate(user, user_login.password):
         print(f"[LOGIN ERROR] Invalid password for user: {user_login.email}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -232,26 +303,11 @@ async def logout(session_id: str = Header(None, alias="session-id")):
 
 # Protected routes
 @router.get("/user-pet", response_model=Pet)
-async def get_user_pet(current_user: User = Depends(get_current_user)):
-    """Get the current user's pet"""
+async def get_user_pet(pet: Pet = Depends(get_active_pet)):
+    """Get the current user's active pet (X-Pet-Id, else their primary pet)"""
     try:
-        # Get all pets for the user
-        pets = await PetDB.get_pets_by_user(current_user.id)
-        if not pets:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="No pets found for user"
-            )
-        # Return the first pet (users currently only have one pet)
-        pet = pets[0]
-        
-        # Ensure the pet has both id and _id for frontend compatibility
-        pet_dict = pet.model_dump()
-        if '_id' in pet_dict and not pet_dict.get('id'):
-            pet_dict['id'] = pet_dict['_id']
-        
-        print(f"Returning pet with ID: {pet_dict.get('id') or pet_dict.get('_id')}")
-        return pet_dict
+        print(f"Returning pet with ID: {pet.id}")
+        return pet_response(pet)
     except HTTPException:
         raise
     except Exception as e:
@@ -261,7 +317,34 @@ async def get_user_pet(current_user: User = Depends(get_current_user)):
             detail=f"Failed to get user pet: {str(e)}"
         )
 
-@router.post("/feed-pet")
+@router.get("/pets")
+async def list_user_pets(
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PET_PAGE_SIZE, ge=1, le=MAX_PET_PAGE_SIZE),
+    current_user: User = Depends(get_current_user)
+):
+    """The user's pets, oldest first, as summaries without memory logs.
+
+    Pass the returned nextCursor as cursor to get the next page; it is null
+    on the last page. Select a pet for the other routes with X-Pet-Id.
+    """
+    try:
+        return await PetDB.list_pets(str(current_user.id), cursor, limit)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        print(f"[API] Error in list_user_pets: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to list pets: {str(e)}"
+        )
+
+@router.post("/feed-pet", dependencies=[Depends(rate_limit("actions"))])
 async def feed_pet(request: FeedPetRequest, current_user: User = Depends(get_current_user)):
     """Feed the pet"""
     try:
@@ -284,13 +367,8 @@ async def feed_pet(request: FeedPetRequest, current_user: User = Depends(get_cur
             print(f"Pet not found after update: {pet_id}")
             raise HTTPException(status_code=404, detail="Pet not found after update")
         
-        # Ensure the pet has both id and _id for frontend compatibility
-        updated_pet_dict = updated_pet.model_dump()
-        if '_id' in updated_pet_dict and not updated_pet_dict.get('id'):
-            updated_pet_dict['id'] = updated_pet_dict['_id']
-        
-        print(f"Feed interaction successful. Updated pet ID: {updated_pet_dict.get('id') or updated_pet_dict.get('_id')}")
-        return updated_pet_dict
+        print(f"Feed interaction successful. Updated pet ID: {updated_pet.id}")
+        return pet_response(updated_pet)
     except Exception as e:
         print(f"Error in feed_pet: {str(e)}")
         if isinstance(e, HTTPException):
@@ -300,26 +378,14 @@ async def feed_pet(request: FeedPetRequest, current_user: User = Depends(get_cur
             detail=str(e)
         )
 
-@router.post("/feed-pet-by-user")
-async def feed_pet_by_user(current_user: User = Depends(get_current_user)):
-    """Feed the pet without requiring pet_id - automatically fetches user's pet"""
+@router.post("/feed-pet-by-user", dependencies=[Depends(rate_limit("actions"))])
+async def feed_pet_by_user(current_user: User = Depends(get_current_user), pet: Pet = Depends(get_active_pet)):
+    """Feed the pet without requiring pet_id - acts on the user's active pet"""
     try:
         print(f"[API] Feed pet by user request for user ID: {current_user.id}")
         
-        # Get the user's pet
-        pets = await PetDB.get_pets_by_user(current_user.id)
-        if not pets:
-            print(f"[API] No pets found for user: {current_user.id}")
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="No pets found for user"
-            )
-        
-        # Use the first pet (users currently only have one pet)
-        pet = pets[0]
-        
         # Check if pet's battery is depleted
-        if getattr(pet, 'batteryLevel', 100) <= 0:
+        if pet.batteryLevel <= 0:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Pet's battery is depleted. Reset your pet to continue."
@@ -332,13 +398,8 @@ async def feed_pet_by_user(current_user: User = Depends(get_current_user)):
             print(f"[API] Pet not found after update: {pet.id}")
             raise HTTPException(status_code=404, detail="Pet not found after update")
         
-        # Ensure the pet has both id and _id for frontend compatibility
-        updated_pet_dict = updated_pet.model_dump()
-        if '_id' in updated_pet_dict and not updated_pet_dict.get('id'):
-            updated_pet_dict['id'] = updated_pet_dict['_id']
-        
-        print(f"[API] Feed interaction successful. Updated pet ID: {updated_pet_dict.get('id') or updated_pet_dict.get('_id')}")
-        return updated_pet_dict
+        print(f"[API] Feed interaction successful. Updated pet ID: {updated_pet.id}")
+        return pet_response(updated_pet)
     except Exception as e:
         print(f"[API] Error in feed_pet_by_user: {str(e)}")
         if isinstance(e, HTTPException):
@@ -348,7 +409,7 @@ async def feed_pet_by_user(current_user: User = Depends(get_current_user)):
             detail=f"Failed to feed pet: {str(e)}"
         )
 
-@router.post("/play-with-pet")
+@router.post("/play-with-pet", dependencies=[Depends(rate_limit("actions"))])
 async def play_with_pet(request: PlayPetRequest, current_user: User = Depends(get_current_user)):
     """Play with the pet"""
     try:
@@ -371,13 +432,8 @@ async def play_with_pet(request: PlayPetRequest, current_user: User = Depends(ge
             print(f"Pet not found after update: {pet_id}")
             raise HTTPException(status_code=404, detail="Pet not found after update")
         
-        # Ensure the pet has both id and _id for frontend compatibility
-        updated_pet_dict = updated_pet.model_dump()
-        if '_id' in updated_pet_dict and not updated_pet_dict.get('id'):
-            updated_pet_dict['id'] = updated_pet_dict['_id']
-        
-        print(f"Play interaction successful. Updated pet ID: {updated_pet_dict.get('id') or updated_pet_dict.get('_id')}")
-        return updated_pet_dict
+        print(f"Play interaction successful. Updated pet ID: {updated_pet.id}")
+        return pet_response(updated_pet)
     except Exception as e:
         print(f"Error in play_with_pet: {str(e)}")
         if isinstance(e, HTTPException):
@@ -387,26 +443,14 @@ async def play_with_pet(request: PlayPetRequest, current_user: User = Depends(ge
             detail=str(e)
         )
 
-@router.post("/play-with-pet-by-user")
-async def play_with_pet_by_user(current_user: User = Depends(get_current_user)):
-    """Play with the pet without requiring pet_id - automatically fetches user's pet"""
+@router.post("/play-with-pet-by-user", dependencies=[Depends(rate_limit("actions"))])
+async def play_with_pet_by_user(current_user: User = Depends(get_current_user), pet: Pet = Depends(get_active_pet)):
+    """Play with the pet without requiring pet_id - acts on the user's active pet"""
     try:
         print(f"[API] Play with pet by user request for user ID: {current_user.id}")
         
-        # Get the user's pet
-        pets = await PetDB.get_pets_by_user(current_user.id)
-        if not pets:
-            print(f"[API] No pets found for user: {current_user.id}")
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="No pets found for user"
-            )
-        
-        # Use the first pet (users currently only have one pet)
-        pet = pets[0]
-        
         # Check if pet's battery is depleted
-        if getattr(pet, 'batteryLevel', 100) <= 0:
+        if pet.batteryLevel <= 0:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Pet's battery is depleted. Reset your pet to continue."
@@ -419,13 +463,8 @@ async def play_with_pet_by_user(current_user: User = Depends(get_current_user)):
             print(f"[API] Pet not found after update: {pet.id}")
             raise HTTPException(status_code=404, detail="Pet not found after update")
         
-        # Ensure the pet has both id and _id for frontend compatibility
-        updated_pet_dict = updated_pet.model_dump()
-        if '_id' in updated_pet_dict and not updated_pet_dict.get('id'):
-            updated_pet_dict['id'] = updated_pet_dict['_id']
-        
-        print(f"[API] Play interaction successful. Updated pet ID: {updated_pet_dict.get('id') or updated_pet_dict.get('_id')}")
-        return updated_pet_dict
+        print(f"[API] Play interaction successful. Updated pet ID: {updated_pet.id}")
+        return pet_response(updated_pet)
     except Exception as e:
         print(f"[API] Error in play_with_pet_by_user: {str(e)}")
         if isinstance(e, HTTPException):
@@ -435,7 +474,7 @@ async def play_with_pet_by_user(current_user: User = Depends(get_current_user)):
             detail=f"Failed to play with pet: {str(e)}"
         )
 
-@router.post("/teach-pet")
+@router.post("/teach-pet", dependencies=[Depends(rate_limit("actions"))])
 async def teach_pet(request: TeachPetRequest, current_user: User = Depends(get_current_user)):
     """Teach the pet something new"""
     try:
@@ -465,13 +504,8 @@ async def teach_pet(request: TeachPetRequest, current_user: User = Depends(get_c
             print(f"Pet not found after update: {pet_id}")
             raise HTTPException(status_code=404, detail="Pet not found after update")
         
-        # Ensure the pet has both id and _id for frontend compatibility
-        updated_pet_dict = updated_pet.model_dump()
-        if '_id' in updated_pet_dict and not updated_pet_dict.get('id'):
-            updated_pet_dict['id'] = updated_pet_dict['_id']
-        
-        print(f"Teach interaction successful. Updated pet ID: {updated_pet_dict.get('id') or updated_pet_dict.get('_id')}")
-        return updated_pet_dict
+        print(f"Teach interaction successful. Updated pet ID: {updated_pet.id}")
+        return pet_response(updated_pet)
     except Exception as e:
         print(f"Error in teach_pet: {str(e)}")
         if isinstance(e, HTTPException):
@@ -484,26 +518,14 @@ async def teach_pet(request: TeachPetRequest, current_user: User = Depends(get_c
 class TeachPetByUserRequest(BaseModel):
     message: str
 
-@router.post("/teach-pet-by-user")
-async def teach_pet_by_user(request: TeachPetByUserRequest, current_user: User = Depends(get_current_user)):
-    """Teach the pet without requiring pet_id - automatically fetches user's pet"""
+@router.post("/teach-pet-by-user", dependencies=[Depends(rate_limit("actions"))])
+async def teach_pet_by_user(request: TeachPetByUserRequest, current_user: User = Depends(get_current_user), pet: Pet = Depends(get_active_pet)):
+    """Teach the pet without requiring pet_id - acts on the user's active pet"""
     try:
         print(f"[API] Teach pet by user request for user ID: {current_user.id}, message: {request.message}")
         
-        # Get the user's pet
-        pets = await PetDB.get_pets_by_user(current_user.id)
-        if not pets:
-            print(f"[API] No pets found for user: {current_user.id}")
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="No pets found for user"
-            )
-        
-        # Use the first pet (users currently only have one pet)
-        pet = pets[0]
-        
         # Check if pet's battery is depleted
-        if getattr(pet, 'batteryLevel', 100) <= 0:
+        if pet.batteryLevel <= 0:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Pet's battery is depleted. Reset your pet to continue."
@@ -523,13 +545,8 @@ async def teach_pet_by_user(request: TeachPetByUserRequest, current_user: User =
             print(f"[API] Pet not found after update: {pet.id}")
             raise HTTPException(status_code=404, detail="Pet not found after update")
         
-        # Ensure the pet has both id and _id for frontend compatibility
-        updated_pet_dict = updated_pet.model_dump()
-        if '_id' in updated_pet_dict and not updated_pet_dict.get('id'):
-            updated_pet_dict['id'] = updated_pet_dict['_id']
-        
-        print(f"[API] Teach interaction successful. Updated pet ID: {updated_pet_dict.get('id') or updated_pet_dict.get('_id')}")
-        return updated_pet_dict
+        print(f"[API] Teach interaction successful. Updated pet ID: {updated_pet.id}")
+        return pet_response(updated_pet)
     except Exception as e:
         print(f"[API] Error in teach_pet_by_user: {str(e)}")
         if isinstance(e, HTTPException):
@@ -539,6 +556,219 @@ async def teach_pet_by_user(request: TeachPetByUserRequest, current_user: User =
             detail=f"Failed to teach pet: {str(e)}"
         )
 
+class BatchAction(BaseModel):
+    type: str  # "feed", "play", or "teach"
+    message: Optional[str] = None
+    clientTimestamp: Optional[datetime] = None
+
+class BatchActionsRequest(BaseModel):
+    actions: List[BatchAction] = Field(..., min_length=1, max_length=100)
+
+@router.post("/pets/{pet_id}/actions:batch")
+async def batch_pet_actions(pet_id: str, request: BatchActionsRequest, http_request: Request,
+                            current_user: User = Depends(get_current_user)):
+    """Apply a queue of feed/play/teach actions in order with a single update"""
+    try:
+        print(f"[API] Batch of {len(request.actions)} actions for pet: {pet_id}")
+
+        # Each action costs what it would through its own route
+        budget = rate_limiter.capacity("actions")
+        if len(request.actions) > budget:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"At most {budget} actions fit in one batch under the current rate limit"
+            )
+        await charge_rate_limit("actions", http_request, current_user, len(request.actions))
+
+        for index, action in enumerate(request.actions):
+            if action.type not in BATCHABLE_ACTIONS:
+                raise HTTPException(
+                    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    detail=f"Action {index}: type must be one of: {', '.join(BATCHABLE_ACTIONS)}"
+                )
+            if action.type == "teach" and (not action.message or not action.message.strip()):
+                raise HTTPException(
+                    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    detail=f"Action {index}: message is required for 'teach' actions"
+                )
+
+        pet = await PetDB.get_pet(pet_id)
+        if not pet:
+            raise HTTPException(status_code=404, detail="Pet not found")
+
+        if pet.userId != str(current_user.id):
+            print(f"[API] Authentication error: User {current_user.id} tried to access pet {pet.id} belonging to {pet.userId}")
+            raise HTTPException(status_code=403, detail="Not authorized to interact with this pet")
+
+        if pet.batteryLevel <= 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Pet's battery is depleted. Reset your pet to continue."
+            )
+
+        updated_pet = await PetDB.apply_actions(pet_id, [action.model_dump() for action in request.actions])
+        if not updated_pet:
+            raise HTTPException(status_code=404, detail="Pet not found after update")
+
+        print(f"[API] Batch applied to pet {pet_id}")
+        return pet_response(updated_pet)
+    except PetUpdateConflict as e:
+        print(f"[API] Batch conflict: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Pet is being updated concurrently, please retry"
+        )
+    except Exception as e:
+        print(f"[API] Error in batch_pet_actions: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to apply actions: {str(e)}"
+        )
+
+@router.get("/pets/{pet_id}/history", dependencies=[Depends(require_mongo_storage)])
+async def get_pet_history(
+    pet_id: str,
+    from_time: Optional[datetime] = Query(None, alias="from"),
+    to_time: Optional[datetime] = Query(None, alias="to"),
+    points: int = Query(DEFAULT_HISTORY_POINTS, ge=1, le=MAX_HISTORY_POINTS),
+    current_user: User = Depends(get_current_user)
+):
+    """Battery, mood, level and interaction history, averaged server-side into at most `points` buckets"""
+    try:
+        pet = await PetDB.get_pet(pet_id)
+        if not pet:
+            raise HTTPException(status_code=404, detail="Pet not found")
+        if pet.userId != str(current_user.id):
+            raise HTTPException(status_code=403, detail="Not authorized to view this pet")
+
+        # Naive timestamps are taken as UTC, like everything else we store
+        end = to_time or datetime.now(timezone.utc)
+        end = end if end.tzinfo else end.replace(tzinfo=timezone.utc)
+        start = from_time or end - timedelta(days=DEFAULT_HISTORY_DAYS)
+        start = start if start.tzinfo else start.replace(tzinfo=timezone.utc)
+        if start >= end:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="'from' must be before 'to'"
+            )
+
+        series = await vitals_recorder.history(str(pet.id), start, end, points)
+        return {"petId": str(pet.id), "from": start, "to": end, "points": len(series), "series": series}
+    except Exception as e:
+        print(f"[API] Error in get_pet_history: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to get pet history: {str(e)}"
+        )
+
+@router.get("/pets/{pet_id}/memories/search", dependencies=[Depends(require_mongo_storage)])
+async def search_pet_memories(
+    pet_id: str,
+    q: str = Query(..., min_length=1, max_length=200),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(DEFAULT_SEARCH_LIMIT, ge=1, le=MAX_SEARCH_LIMIT),
+    current_user: User = Depends(get_current_user)
+):
+    """Ranked, paginated search over a pet's memories, with matches wrapped in <mark> in each snippet"""
+    try:
+        pet = await PetDB.get_pet_header(pet_id)
+        if not pet:
+            raise HTTPException(status_code=404, detail="Pet not found")
+        if pet.get("userId") != str(current_user.id):
+            raise HTTPException(status_code=403, detail="Not authorized to view this pet")
+        if not tokenize(q):
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Query has no searchable words"
+            )
+
+        results = await memory_search.search(pet, q, offset, limit)
+        return {"petId": str(pet["_id"]), "query": q, **results}
+    except Exception as e:
+        print(f"[API] Error in search_pet_memories: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to search memories: {str(e)}"
+        )
+
+@router.get("/memories")
+async def filter_memories(
+    kind: Optional[List[str]] = Query(None),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    pet_id: Optional[str] = None,
+    limit: int = Query(DEFAULT_SEARCH_LIMIT, ge=1, le=MAX_SEARCH_LIMIT),
+    current_user: User = Depends(get_current_user)
+):
+    """The user's memories of the given kinds and time range across their pets, newest first"""
+    try:
+        unknown = [k for k in kind or [] if k not in MEMORY_KINDS]
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"Unknown memory kind: {unknown[0]}"
+            )
+        memories = await PetDB.find_memories(str(current_user.id), kind, since, until, pet_id, limit)
+        return {"memories": memories}
+    except Exception as e:
+        print(f"[API] Error in filter_memories: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to filter memories: {str(e)}"
+        )
+
+@router.get("/leaderboard", dependencies=[Depends(require_mongo_storage)])
+async def get_leaderboard(
+    limit: int = Query(10, ge=1),
+    current_user: User = Depends(get_current_user)
+):
+    """Top pets by level, then interaction count, served from the in-memory board"""
+    try:
+        entries = await pet_leaderboard.top(min(limit, pet_leaderboard.size))
+        board = pet_leaderboard.stats()
+        return {
+            "refreshedAt": board["refreshed_at"],
+            "rankedPets": board["ranked_pets"],
+            "entries": [{key: value for key, value in entry.items() if key != "userId"} for entry in entries]
+        }
+    except Exception as e:
+        print(f"[API] Error in get_leaderboard: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to get leaderboard: {str(e)}"
+        )
+
+@router.get("/leaderboard/me", dependencies=[Depends(require_mongo_storage)])
+async def get_my_leaderboard_rank(current_user: User = Depends(get_current_user)):
+    """Rank of each of the current user's pets.
+
+    Pets on the in-memory board have live ranks; the rest come from the last
+    materialized leaderboard ("live": false), and brand new pets have no rank
+    until the next refresh.
+    """
+    try:
+        pets = await pet_leaderboard.user_ranks(str(current_user.id))
+        board = pet_leaderboard.stats()
+        return {"refreshedAt": board["refreshed_at"], "rankedPets": board["ranked_pets"], "pets": pets}
+    except Exception as e:
+        print(f"[API] Error in get_my_leaderboard_rank: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to get leaderboard rank: {str(e)}"
+        )
+
 @router.post("/save-pet", response_model=Pet)
 async def save_pet(pet_data: dict, current_user: User = Depends(get_current_user)):
     """Save pet data to database"""
@@ -553,7 +783,7 @@ async def save_pet(pet_data: dict, current_user: User = Depends(get_current_user
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Failed to save pet"
             )
-        return saved_pet
+        return pet_response(saved_pet)
     except Exception as e:
         print(f"Error in save_pet: {str(e)}")
         raise HTTPException(
@@ -561,7 +791,7 @@ async def save_pet(pet_data: dict, current_user: User = Depends(get_current_user
             detail=f"Failed to save pet: {str(e)}"
         )
 
-@router.post("/chat")
+@router.post("/chat", dependencies=[Depends(rate_limit("chat"))])
 async def chat_with_pet(chat_request: ChatRequest, current_user: User = Depends(get_current_user)):
     """Chat with a pet and get a response based on its personality"""
     try:
@@ -570,45 +800,19 @@ async def chat_with_pet(chat_request: ChatRequest, current_user: User = Depends(
         # If pet_id isn't provided correctly, try to get the user's pet
         if not chat_request.pet_id or chat_request.pet_id == 'null' or chat_request.pet_id == 'undefined':
             print(f"[API] No pet_id provided or invalid pet_id, getting user's pet")
-            pets = await PetDB.get_pets_by_user(current_user.id)
-            if pets:
-                chat_request.pet_id = str(pets[0].id)
-                print(f"[API] Using pet ID from user's pets: {chat_request.pet_id}")
-            else:
-                # If no pet found, create a new one
-                print(f"[API] No pets found for user, creating a default pet")
-                pet_data = {
-                    "name": "Berny",
-                    "species": "Digital",
-                    "mood": "happy",
-                    "level": 1,
-                    "sassLevel": 1,
-                    "batteryLevel": 100,
-                    "userId": str(current_user.id),
-                    "lastFed": datetime.now(timezone.utc),
-                    "lastInteraction": datetime.now(timezone.utc),
-                    "interactionCount": 0,
-                    "memoryLog": []
-                }
-                new_pet = await PetDB.create_pet(pet_data)
-                if new_pet:
-                    chat_request.pet_id = str(new_pet.id)
-                    print(f"[API] Created new pet with ID: {chat_request.pet_id}")
-                else:
-                    raise HTTPException(
-                        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                        detail="Failed to create pet"
-                    )
+            # Get (or atomically create) the user's primary pet
+            primary_pet = await PetDB.get_or_create_primary_pet(str(current_user.id))
+            chat_request.pet_id = str(primary_pet.id)
+            print(f"[API] Using primary pet ID: {chat_request.pet_id}")
         
         # Get the pet - this might still fail if the ID exists but is invalid
         pet = await PetDB.get_pet(chat_request.pet_id)
         
-        # If the pet is still not found, try one more strategy - get the first pet for this user
+        # If the pet is still not found, try one more strategy - fall back to the user's primary pet
         if not pet:
             print(f"[API] Pet not found with ID: {chat_request.pet_id}, trying to find any pet for this user")
-            pets = await PetDB.get_pets_by_user(current_user.id)
-            if pets:
-                pet = pets[0]
+            pet = await PetDB.get_primary_pet(str(current_user.id))
+            if pet:
                 chat_request.pet_id = str(pet.id)
                 print(f"[API] Using alternative pet with ID: {chat_request.pet_id}")
             else:
@@ -616,7 +820,7 @@ async def chat_with_pet(chat_request: ChatRequest, current_user: User = Depends(
                 raise HTTPException(status_code=404, detail="Pet not found")
         
         # Check if pet's battery is depleted
-        if getattr(pet, 'batteryLevel', 100) <= 0:
+        if pet.batteryLevel <= 0:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Pet's battery is depleted. Reset your pet to continue."
@@ -628,9 +832,8 @@ async def chat_with_pet(chat_request: ChatRequest, current_user: User = Depends(
             
             # If user doesn't own this pet, try to get their actual pet
             print(f"[API] Attempting to find the correct pet for user {current_user.id}")
-            pets = await PetDB.get_pets_by_user(current_user.id)
-            if pets:
-                pet = pets[0]
+            pet = await PetDB.get_primary_pet(str(current_user.id))
+            if pet:
                 chat_request.pet_id = str(pet.id)
                 print(f"[API] Found correct pet with ID: {chat_request.pet_id}")
             else:
@@ -643,18 +846,23 @@ async def chat_with_pet(chat_request: ChatRequest, current_user: User = Depends(
                 detail="Message is required for chat"
             )
             
-        # Calculate response and tone based on pet's attributes
-        response = await get_chronopal_response(chat_request.message, pet)
-        
-        # Increment interaction count for the pet
-        await PetDB.increment_interaction(chat_request.pet_id)
-        
-        # Deplete battery by 3% for chatting
-        await PetDB.update_battery_level(chat_request.pet_id, -3)
+        async def respond():
+            # Calculate response and tone based on pet's attributes, within the global LLM budget
+            async with llm_limiter.slot() as slot:
+                response = await get_chronopal_response(chat_request.message, pet, slot)
+            
+            # Count the interaction, drain 3% battery and remember the conversation. One durable
+            # outbox insert here; the outbox worker applies it to the pet after we respond
+            memory = chat_record(chat_request.message, response)
+            await pet_outbox.enqueue(chat_effects(chat_request.pet_id, memory))
+            return response
         
-        # Add the conversation to the pet's memory
-        memory_entry = f"User said: '{chat_request.message}', I replied: '{response}'"
-        await PetDB.add_memory(chat_request.pet_id, memory_entry)
+        # Retries and double-submits of the same message share one response and one set of writes
+        try:
+            flight_key = (chat_request.pet_id, normalize_message(chat_request.message))
+            response = await chat_flights.do(flight_key, respond)
+        except RateLimitExceeded as e:
+            raise too_many_requests(e)
         
         print(f"[API] Chat response generated successfully: {response[:50]}...")
         return {"response": response}
@@ -731,53 +939,11 @@ async def debug_interaction(request_data: dict, current_user: User = Depends(get
 async def get_fixed_pet(current_user: User = Depends(get_current_user)):
     """Get a consistent pet for the user, creating one if none exists"""
     try:
-        # First, always check the user's existing pets
-        pets = await PetDB.get_pets_by_user(current_user.id)
-        
-        # Log debug info
-        if pets:
-            pet_ids = [p.id for p in pets]
-            print(f"[FIXED_PET] Found {len(pets)} existing pets for user {current_user.id}: {pet_ids}")
-        else:
-            print(f"[FIXED_PET] No existing pets found for user {current_user.id}")
-            
-        if pets:
-            # IMPORTANT: If user has pets, always return THE FIRST ONE for consistency
-            # This is the key change to the endpoint to ensure it always returns the same pet
-            pet = pets[0]
-            pet_id = pet.id
-            print(f"[FIXED_PET] Using existing pet with ID: {pet_id}")
-            
-            # Return the existing pet with both id and _id fields set
-            pet_dict = pet.model_dump()
-            if '_id' in pet_dict and not pet_dict.get('id'):
-                pet_dict['id'] = pet_dict['_id']
-            
-            return pet_dict
-        else:
-            # If user has no pets, create one with standard defaults
-            print(f"[FIXED_PET] Creating new pet for user {current_user.id}")
-            pet_data = {
-                "name": "Berny",
-                "species": "Digital",
-                "mood": "happy",
-                "level": 1,
-                "sassLevel": 1,
-                "userId": str(current_user.id),
-                "lastFed": datetime.now(timezone.utc),
-                "lastInteraction": datetime.now(timezone.utc),
-                "interactionCount": 0,
-                "memoryLog": []
-            }
-            pet = await PetDB.create_pet(pet_data)
-            print(f"[FIXED_PET] Created new pet with ID: {pet.id}")
-            
-            # Ensure the pet has both id and _id for frontend compatibility
-            pet_dict = pet.model_dump()
-            if '_id' in pet_dict and not pet_dict.get('id'):
-                pet_dict['id'] = pet_dict['_id']
-            
-            return pet_dict
+        # Always the same primary pet; concurrent first requests can't create duplicates
+        pet = await PetDB.get_or_create_primary_pet(str(current_user.id))
+        print(f"[FIXED_PET] Using primary pet with ID: {pet.id} for user {current_user.id}")
+
+        return pet_response(pet)
     except Exception as e:
         print(f"Error in get_fixed_pet: {str(e)}")
         raise HTTPException(
@@ -791,13 +957,12 @@ async def reset_pet(current_user: User = Depends(get_current_user)):
     try:
         print(f"[API] Reset pet request for user ID: {current_user.id}")
         
-        # Get the user's pet
-        pets = await PetDB.get_pets_by_user(current_user.id)
+        # Get the user's primary pet
+        pet = await PetDB.get_primary_pet(str(current_user.id))
         
         # If the user has a pet, check if it's eligible for reset (battery depleted)
-        if pets:
-            pet = pets[0]
-            battery_level = getattr(pet, 'batteryLevel', 0)
+        if pet and pet.isPrimary:
+            battery_level = pet.batteryLevel
             
             # Only allow reset if battery is depleted or very low
             if battery_level > 10:
@@ -809,23 +974,11 @@ async def reset_pet(current_user: User = Depends(get_current_user)):
             # Delete the old pet
             await PetDB.delete_pet(str(pet.id))
         
-        # Create a new pet for the user
-        new_pet_data = {
-            "name": "Berny", # Default name, can be customized later
-            "species": "Digital",
-            "mood": MOOD_LEVELS["HAPPY"],
-            "level": 1,
-            "sassLevel": SASS_LEVELS["SWEET"],
-            "batteryLevel": 100,
-            "userId": str(current_user.id),
-            "lastFed": datetime.now(timezone.utc),
-            "lastInteraction": datetime.now(timezone.utc),
-            "interactionCount": 0,
-            "memoryLog": ["I was just created! Hello world!"]
-        }
-        
-        # Create the new pet
-        new_pet = await PetDB.create_pet(new_pet_data)
+        # Create the new primary pet; a concurrent reset gets the same pet back
+        new_pet = await PetDB.get_or_create_primary_pet(
+            str(current_user.id),
+            initial_memories=["I was just created! Hello world!"]
+        )
         
         if not new_pet:
             raise HTTPException(
@@ -833,13 +986,8 @@ async def reset_pet(current_user: User = Depends(get_current_user)):
                 detail="Failed to create new pet"
             )
             
-        # Ensure the pet has both id and _id for frontend compatibility
-        new_pet_dict = new_pet.model_dump()
-        if '_id' in new_pet_dict and not new_pet_dict.get('id'):
-            new_pet_dict['id'] = new_pet_dict['_id']
-        
-        print(f"[API] Reset successful. Created new pet ID: {new_pet_dict.get('id') or new_pet_dict.get('_id')}")
-        return new_pet_dict
+        print(f"[API] Reset successful. Created new pet ID: {new_pet.id}")
+        return pet_response(new_pet)
     except Exception as e:
         print(f"[API] Error in reset_pet: {str(e)}")
         if isinstance(e, HTTPException):
@@ -849,6 +997,71 @@ async def reset_pet(current_user: User = Depends(get_current_user)):
             detail=f"Failed to reset pet: {str(e)}"
         )
 
+@router.websocket("/ws/pet")
+async def pet_updates_socket(websocket: WebSocket, session_id: Optional[str] = None, pet_id: Optional[str] = None):
+    """Push live pet deltas (mood, battery, level, new memories) to the dashboard.
+
+    Browsers cannot set custom headers on websockets, so the session id is
+    passed as a query parameter. Without a pet_id the user's primary pet is used.
+    """
+    session = None
+    if session_id and session_functions:
+        session = await session_functions["get_session"](session_id)
+    if not session:
+        print(f"[WS] Rejected connection with invalid session")
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    user_id = str(session["user_id"])
+    pet = await PetDB.get_pet(pet_id) if pet_id else None
+    if not pet:
+        pet = await PetDB.get_primary_pet(user_id)
+    if not pet or pet.userId != user_id:
+        print(f"[WS] No accessible pet for user {user_id}")
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    subscription = pet_hub.subscribe(str(pet.id), pet_state(pet))
+    if subscription is None:
+        print(f"[WS] Connection limit reached, rejecting user {user_id}")
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        return
+
+    await websocket.accept()
+    print(f"[WS] User {user_id} subscribed to pet {pet.id}")
+
+    async def wait_for_disconnect():
+        # The client never sends anything meaningful; this only notices it going away
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+
+    receiver = asyncio.ensure_future(wait_for_disconnect())
+    try:
+        await websocket.send_text(dumps({"type": "pet_snapshot", "pet": encode_pet(pet)}).decode())
+        while True:
+            getter = asyncio.ensure_future(subscription.get())
+            done, _ = await asyncio.wait({getter, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver in done:
+                getter.cancel()
+                break
+            event = getter.result()
+            if event is None:
+                # The hub dropped us because the send buffer overflowed
+                print(f"[WS] Dropping slow consumer for pet {pet.id}")
+                await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+                break
+            await websocket.send_text(dumps(event).decode())
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        print(f"[WS] Error streaming pet {pet.id}: {str(e)}")
+    finally:
+        receiver.cancel()
+        pet_hub.unsubscribe(subscription)
+        print(f"[WS] User {user_id} unsubscribed from pet {pet.id}")
+
 # Test endpoint
 @router.get("/test")
 async def test_endpoint():
@@ -0,0 +1,179 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+# "opaque" keeps random session ids in db.sessions; "signed" issues HMAC tokens checked in memory
+SESSION_MODE = os.getenv("SESSION_MODE", "opaque")
+SESSION_SECRET = os.getenv("SESSION_SECRET")
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", str(24 * 60 * 60)))
+# How often each worker pulls revocations made by the others
+SESSION_REVOCATION_SYNC_SECONDS = float(os.getenv("SESSION_REVOCATION_SYNC_SECONDS", "5"))
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+class SessionTokens:
+    """Issues and verifies "<payload>.<signature>" tokens signed with HMAC-SHA256"""
+
+    def __init__(self, secret: str, ttl_seconds: int = SESSION_TTL_SECONDS, clock=time.time):
+        if not secret:
+            raise ValueError("SESSION_SECRET must be set when SESSION_MODE is 'signed'")
+        self._key = secret.encode("utf-8")
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+
+    def _sign(self, payload: str) -> str:
+        return _b64encode(hmac.new(self._key, payload.encode("ascii"), hashlib.sha256).digest())
+
+    def issue(self, user_id: str) -> str:
+        now = self.clock()
+        claims = {
+            "sub": user_id,
+            "iat": round(now, 3),
+            "exp": int(now) + self.ttl_seconds,
+            "jti": os.urandom(12).hex()
+        }
+        payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+        return f"{payload}.{self._sign(payload)}"
+
+    def verify(self, token: str) -> Optional[Dict]:
+        """Claims of a well-formed, correctly signed, unexpired token; None otherwise"""
+        try:
+            payload, signature = token.split(".")
+            # Bytes, since compare_digest refuses str with non-ASCII characters
+            if not hmac.compare_digest(signature.encode("utf-8"), self._sign(payload).encode("ascii")):
+                return None
+            claims = json.loads(_b64decode(payload))
+        except (ValueError, UnicodeEncodeError):
+            return None
+        if not isinstance(claims, dict) or claims.get("exp", 0) <= self.clock():
+            return None
+        return claims
+
+
+class RevocationList:
+    """Revoked token ids and per-user cut-offs, held in memory and synced from MongoDB"""
+
+    def __init__(self, collection, sync_seconds: float = SESSION_REVOCATION_SYNC_SECONDS, clock=time.time):
+        self.collection = collection
+        self.sync_seconds = sync_seconds
+        self.clock = clock
+        self._tokens: Dict[str, float] = {}  # jti -> token expiry
+        self._users: Dict[str, float] = {}  # user id -> tokens issued at or before this are revoked
+        self._last_sync: Optional[datetime] = None
+
+    async def ensure_indexes(self) -> None:
+        # Entries are only useful until the tokens they revoke would have expired anyway
+        await self.collection.create_index("expiresAt", expireAfterSeconds=0)
+        await self.collection.create_index("revokedAt")
+
+    def is_revoked(self, claims: Dict) -> bool:
+        if claims.get("jti") in self._tokens:
+            return True
+        cutoff = self._users.get(claims.get("sub"))
+        return cutoff is not None and claims.get("iat", 0) <= cutoff
+
+    def _remember(self, document: Dict) -> None:
+        if document.get("kind") == "user":
+            self._users[document["userId"]] = max(self._users.get(document["userId"], 0), document["revokedBefore"])
+        else:
+            self._tokens[document["_id"]] = document["expiresAt"].replace(tzinfo=timezone.utc).timestamp()
+
+    async def revoke_token(self, claims: Dict) -> None:
+        document = {
+            "_id": claims["jti"],
+            "kind": "token",
+            "revokedAt": datetime.now(timezone.utc),
+            "expiresAt": datetime.fromtimestamp(claims["exp"], timezone.utc)
+        }
+        self._remember(document)
+        await self.collection.replace_one({"_id": document["_id"]}, document, upsert=True)
+
+    async def revoke_user(self, user_id: str) -> None:
+        """Revoke every token the user holds right now"""
+        now = self.clock()
+        document = {
+            "_id": f"user:{user_id}",
+            "kind": "user",
+            "userId": user_id,
+            "revokedBefore": now,
+            "revokedAt": datetime.now(timezone.utc),
+            "expiresAt": datetime.fromtimestamp(now + SESSION_TTL_SECONDS, timezone.utc)
+        }
+        self._remember(document)
+        await self.collection.replace_one({"_id": document["_id"]}, document, upsert=True)
+
+    async def sync(self) -> int:
+        """Pull revocations recorded since the last sync; returns how many were read"""
+        started = datetime.now(timezone.utc)
+        query = {}
+        if self._last_sync is not None:
+            # Overlap a little so writes that committed just before the last sync aren't missed
+            query = {"revokedAt": {"$gte": datetime.fromtimestamp(self._last_sync.timestamp() - self.sync_seconds, timezone.utc)}}
+        count = 0
+        async for document in self.collection.find(query):
+            self._remember(document)
+            count += 1
+
+        now = self.clock()
+        self._tokens = {jti: expires for jti, expires in self._tokens.items() if expires > now}
+        self._users = {user: cutoff for user, cutoff in self._users.items() if cutoff + SESSION_TTL_SECONDS > now}
+        self._last_sync = started
+        return count
+
+    async def run_sync_loop(self) -> None:
+        while True:
+            try:
+                await self.sync()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[AUTH] Failed to sync revoked sessions: {str(e)}")
+            await asyncio.sleep(self.sync_seconds)
+
+    def stats(self) -> Dict[str, int]:
+        return {"revoked_tokens": len(self._tokens), "revoked_users": len(self._users)}
+
+
+def signed_session_functions(tokens: SessionTokens, revocations: RevocationList) -> Dict:
+    """Session functions with the same interface as the opaque ones, validated without I/O"""
+
+    async def get_session(session_id: str) -> Optional[Dict]:
+        claims = tokens.verify(session_id)
+        if claims is None or revocations.is_revoked(claims):
+            return None
+        return {
+            "session_id": claims["jti"],
+            "user_id": claims["sub"],
+            "expires_at": datetime.fromtimestamp(claims["exp"], timezone.utc)
+        }
+
+    async def create_session(user_id: str) -> str:
+        return tokens.issue(user_id)
+
+    async def delete_session(session_id: str) -> None:
+        claims = tokens.verify(session_id)
+        if claims is not None:
+            await revocations.revoke_token(claims)
+
+    async def revoke_user_sessions(user_id: str) -> None:
+        await revocations.revoke_user(user_id)
+
+    return {
+        "get_session": get_session,
+        "create_session": create_session,
+        "delete_session": delete_session,
+        "revoke_user_sessions": revoke_user_sessions
+    }
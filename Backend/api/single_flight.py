@@ -0,0 +1,69 @@
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+# How long a finished chat result is reused for an identical message to the same pet
+CHAT_DEDUP_WINDOW_SECONDS = float(os.getenv("CHAT_DEDUP_WINDOW_SECONDS", "5"))
+
+
+def normalize_message(message: str) -> str:
+    """Case- and whitespace-insensitive form of a chat message, used as a dedup key"""
+    return " ".join(message.casefold().split())
+
+
+class SingleFlight:
+    """Runs one call per key; concurrent and shortly repeated callers share its result"""
+
+    def __init__(self, window_seconds: float = CHAT_DEDUP_WINDOW_SECONDS, clock=time.monotonic):
+        self.window_seconds = window_seconds
+        self.clock = clock
+        # key -> (call, when it finished; None while in flight)
+        self._calls: Dict[Hashable, Tuple["asyncio.Task", Optional[float]]] = {}
+        self._started = 0
+        self._coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        now = self.clock()
+        self._expire(now)
+
+        entry = self._calls.get(key)
+        if entry is not None:
+            self._coalesced += 1
+            task = entry[0]
+        else:
+            self._started += 1
+            # A task, so one caller disconnecting does not cancel the work the others wait on
+            task = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda done, key=key: self._finished(key, done))
+            self._calls[key] = (task, None)
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Hashable, task: "asyncio.Task") -> None:
+        entry = self._calls.get(key)
+        if entry is None or entry[0] is not task:
+            return
+        # Failures are not cached: the next identical request gets a fresh attempt
+        if task.cancelled() or task.exception() is not None:
+            del self._calls[key]
+        else:
+            # The window runs from here, so slow calls (the ones users retry) are reused too
+            self._calls[key] = (task, self.clock())
+
+    def _expire(self, now: float) -> None:
+        expired = [
+            key for key, (task, finished) in self._calls.items()
+            if finished is not None and now - finished >= self.window_seconds
+        ]
+        for key in expired:
+            del self._calls[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": sum(1 for task, _ in self._calls.values() if not task.done()),
+            "started": self._started,
+            "coalesced": self._coalesced
+        }
+
+
+chat_flights = SingleFlight()
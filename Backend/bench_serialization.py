@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark of pet response serialization: the old model_dump/response_model/json path
+against encode_pet + orjson
+
+Usage:
+    python bench_serialization.py --pets 50 --memories 5000
+"""
+
+import argparse
+import json
+import time
+from datetime import datetime, timezone
+from pydantic import TypeAdapter
+from database.pet_schema import Pet
+from api.responses import encode_pet, dumps
+
+PET_ADAPTER = TypeAdapter(Pet)
+
+def make_pets(count, memories):
+    now = datetime.now(timezone.utc)
+    return [
+        Pet(
+            name=f"Pet {i}",
+            species="Digital",
+            userId=f"user-{i}",
+            lastFed=now,
+            lastInteraction=now,
+            memoryLog=[f"User said: 'message {n}', I replied: 'Totally rad, like, reply {n}! ^_^'" for n in range(memories)]
+        )
+        for i in range(count)
+    ]
+
+def legacy_response(pet):
+    # What the routes used to do: model_dump, then FastAPI validates against response_model,
+    # serializes the validated model and the stdlib encodes it
+    pet_dict = pet.model_dump()
+    validated = PET_ADAPTER.validate_python(pet_dict)
+    content = PET_ADAPTER.dump_python(validated, mode="json", by_alias=True)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+def fast_response(pet):
+    return dumps(encode_pet(pet))
+
+def bench(name, render, pets, rounds):
+    started = time.perf_counter()
+    size = 0
+    for _ in range(rounds):
+        for pet in pets:
+            size = len(render(pet))
+    elapsed = time.perf_counter() - started
+    per_pet = elapsed / (rounds * len(pets)) * 1000
+    print(f"{name:<10} {per_pet:8.3f} ms/pet  ({size} bytes per response)")
+    return per_pet
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark pet response serialization")
+    parser.add_argument("--pets", type=int, default=50)
+    parser.add_argument("--memories", type=int, default=5000, help="Memory log entries per pet")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    pets = make_pets(args.pets, args.memories)
+    print(f"{args.pets} pets x {args.memories} memories, {args.rounds} rounds")
+    legacy = bench("legacy", legacy_response, pets, args.rounds)
+    fast = bench("orjson", fast_response, pets, args.rounds)
+    print(f"speedup    {legacy / fast:8.1f}x")
@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+"""
+Script to compact every pet's memory log, merging repeated feed and play memories
+
+Usage:
+    python compact_memories.py
+    python compact_memories.py --batch-size 500
+"""
+
+import argparse
+import asyncio
+import json
+from database.database import memory_compactor
+
+async def compact(batch_size):
+    """Run one compaction pass over all pets and print the report"""
+    memory_compactor.batch_size = batch_size
+    report = await memory_compactor.run()
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact ChronoPal memory logs")
+    parser.add_argument("--batch-size", type=int, default=memory_compactor.batch_size)
+    args = parser.parse_args()
+
+    asyncio.run(compact(args.batch_size))
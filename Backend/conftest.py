@@ -0,0 +1,22 @@
+import pytest
+from database import database
+from database.database import PetDB
+from database.storage import memory_storage
+
+def _storages():
+    yield "memory", lambda tmp_path: memory_storage(on_written=database._pet_written)
+    try:
+        from database.sqlite_storage import sqlite_storage
+    except ImportError:
+        return
+    yield "sqlite", lambda tmp_path: sqlite_storage(str(tmp_path / "chronopal.db"), on_written=database._pet_written)
+
+@pytest.fixture(params=[factory for _, factory in _storages()], ids=[name for name, _ in _storages()])
+async def storage(request, tmp_path):
+    """PetDB, UserDB and sessions pointed at a fresh backend that needs no external service"""
+    storage = request.param(tmp_path)
+    previous = database.use_storage(storage)
+    await PetDB.ensure_indexes()
+    yield storage
+    database.use_storage(previous)
+    await storage.close()
@@ -0,0 +1,181 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timezone, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# How often the background task recomputes the analytics snapshot
+ANALYTICS_REFRESH_SECONDS = int(os.getenv("ANALYTICS_REFRESH_SECONDS", "300"))
+
+# Owners listed individually in the duplicate report
+DUPLICATE_OWNER_LIMIT = 100
+
+# Days covered by the activity series
+ACTIVITY_DAYS = 30
+
+BATTERY_BUCKETS = [0, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100, 101]
+
+
+def pet_analytics_pipeline(now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """Single-pass $facet pipeline over the pets collection"""
+    now = now or datetime.now(timezone.utc)
+    activity_start = (now - timedelta(days=ACTIVITY_DAYS)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return [
+        # Only carry the fields the facets need through the pipeline
+        {"$project": {
+            "userId": 1,
+            "mood": 1,
+            "level": 1,
+            "lastInteraction": 1,
+            "interactionCount": 1,
+            "batteryLevel": {"$ifNull": ["$batteryLevel", 100]}
+        }},
+        {"$facet": {
+            "petsPerUser": [
+                {"$group": {"_id": "$userId", "pets": {"$sum": 1}}},
+                {"$group": {"_id": "$pets", "users": {"$sum": 1}}},
+                {"$sort": {"_id": 1}}
+            ],
+            "duplicateOwners": [
+                {"$group": {"_id": "$userId", "pets": {"$sum": 1}, "petIds": {"$push": "$_id"}}},
+                {"$match": {"pets": {"$gt": 1}}},
+                {"$sort": {"pets": -1}},
+                {"$limit": DUPLICATE_OWNER_LIMIT}
+            ],
+            "duplicateOwnerCount": [
+                {"$group": {"_id": "$userId", "pets": {"$sum": 1}}},
+                {"$match": {"pets": {"$gt": 1}}},
+                {"$count": "owners"}
+            ],
+            "moodDistribution": [
+                {"$group": {"_id": "$mood", "pets": {"$sum": 1}}},
+                {"$sort": {"pets": -1}}
+            ],
+            "batteryHistogram": [
+                {"$bucket": {
+                    "groupBy": "$batteryLevel",
+                    "boundaries": BATTERY_BUCKETS,
+                    "default": "out_of_range",
+                    "output": {"pets": {"$sum": 1}}
+                }}
+            ],
+            "levelHistogram": [
+                {"$group": {"_id": "$level", "pets": {"$sum": 1}}},
+                {"$sort": {"_id": 1}}
+            ],
+            "activityPerDay": [
+                {"$match": {"lastInteraction": {"$gte": activity_start}}},
+                {"$group": {
+                    "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$lastInteraction"}},
+                    "pets": {"$sum": 1},
+                    "interactions": {"$sum": {"$ifNull": ["$interactionCount", 0]}}
+                }},
+                {"$sort": {"_id": 1}}
+            ]
+        }}
+    ]
+
+
+def summarize_pet_analytics(facets: Dict[str, Any]) -> Dict[str, Any]:
+    """Reshape raw $facet output into the report served to dashboards"""
+    pets_per_user = {str(row["_id"]): row["users"] for row in facets.get("petsPerUser", [])}
+    total_pets = sum(int(pets) * users for pets, users in pets_per_user.items())
+    duplicate_count = facets.get("duplicateOwnerCount") or [{"owners": 0}]
+    return {
+        "totalPets": total_pets,
+        "totalOwners": sum(pets_per_user.values()),
+        "petsPerUser": pets_per_user,
+        "duplicateOwnerCount": duplicate_count[0]["owners"],
+        "duplicateOwners": [
+            {"userId": row["_id"], "pets": row["pets"], "petIds": [str(pet_id) for pet_id in row["petIds"]]}
+            for row in facets.get("duplicateOwners", [])
+        ],
+        "moodDistribution": {str(row["_id"]): row["pets"] for row in facets.get("moodDistribution", [])},
+        "batteryHistogram": [
+            {"from": row["_id"], "to": _bucket_end(row["_id"]), "pets": row["pets"]}
+            for row in facets.get("batteryHistogram", [])
+        ],
+        "levelHistogram": {str(row["_id"]): row["pets"] for row in facets.get("levelHistogram", [])},
+        # Interactions are not individually timestamped, so each pet is attributed to the day it was last active
+        "activityPerDay": [
+            {"day": row["_id"], "activePets": row["pets"], "interactions": row["interactions"]}
+            for row in facets.get("activityPerDay", [])
+        ]
+    }
+
+
+def _bucket_end(start: Any) -> Any:
+    if start not in BATTERY_BUCKETS:
+        return None
+    return BATTERY_BUCKETS[BATTERY_BUCKETS.index(start) + 1] - 1
+
+
+async def compute_pet_analytics(pets_collection) -> Dict[str, Any]:
+    cursor = pets_collection.aggregate(pet_analytics_pipeline(), allowDiskUse=True)
+    results = await cursor.to_list(length=1)
+    return summarize_pet_analytics(results[0] if results else {})
+
+
+class AnalyticsCache:
+    """Holds the latest analytics snapshot and refreshes it in the background.
+
+    Readers always get the cached snapshot; only the very first read (before
+    any refresh has completed) waits for a computation, and concurrent first
+    readers share that single computation.
+    """
+
+    def __init__(self, compute: Callable[[], Awaitable[Dict[str, Any]]], refresh_seconds: int = ANALYTICS_REFRESH_SECONDS):
+        self._compute = compute
+        self.refresh_seconds = refresh_seconds
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._computed_at: Optional[datetime] = None
+        self._duration_ms: Optional[float] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self.refresh_count = 0
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        # Created lazily so it binds to the running event loop rather than the import-time one
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def refresh(self) -> Dict[str, Any]:
+        async with self.lock:
+            return await self._refresh_locked()
+
+    async def _refresh_locked(self) -> Dict[str, Any]:
+        started = time.perf_counter()
+        snapshot = await self._compute()
+        self._duration_ms = round((time.perf_counter() - started) * 1000, 1)
+        self._snapshot = snapshot
+        self._computed_at = datetime.now(timezone.utc)
+        self.refresh_count += 1
+        print(f"[ANALYTICS] Refreshed analytics in {self._duration_ms}ms")
+        return snapshot
+
+    async def get(self) -> Dict[str, Any]:
+        if self._snapshot is None:
+            async with self.lock:
+                # Another reader may have finished the first computation while we waited
+                if self._snapshot is None:
+                    await self._refresh_locked()
+        age = (datetime.now(timezone.utc) - self._computed_at).total_seconds()
+        return {
+            "computedAt": self._computed_at.isoformat(),
+            "ageSeconds": round(age, 1),
+            "refreshIntervalSeconds": self.refresh_seconds,
+            "computeMs": self._duration_ms,
+            **self._snapshot
+        }
+
+    async def run_refresh_loop(self) -> None:
+        """Background task recomputing the snapshot every refresh interval"""
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[ANALYTICS] Refresh failed: {str(e)}")
+            await asyncio.sleep(self.refresh_seconds)
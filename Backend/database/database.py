@@ -1,14 +1,32 @@
 from motor.motor_asyncio import AsyncIOMotorClient
 from pymongo import MongoClient
-from typing import List, Optional, Union, Dict
-from datetime import datetime, timezone, timedelta
+from typing import Callable, List, Optional, Union, Dict
+from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
-from .pet_schema import Pet, MOOD_LEVELS, SASS_LEVELS, NEGLECT_THRESHOLD_HOURS
+from .pet_schema import Pet, MOOD_LEVELS, SASS_LEVELS, EVOLUTION_STAGES, DEFAULT_PET_NAME, DEFAULT_PET_SPECIES
 from .user_schema import User, UserCreate
-from passlib.context import CryptContext
+from .pet_events import publish_pet_update
+from .vitals import VitalsRecorder
+from .leaderboard import Leaderboard
+from .memory_index import MemorySearch
+from .memory_compaction import MemoryCompactor, MemoryMigrator, append_memories_expression
+from .migrations import SchemaMigrator, upgrade_pet_document
+from .memory_records import Memory, action_record, is_record, note_record, memory_view, record_match, record_condition
+from .pet_actions import fold_pet_actions, neglect_changes, INTERACTION_BATTERY_DELTAS, MAX_BATTERY_LEVEL
+from .storage import (
+    Storage, PetRepository, UserRepository, SessionRepository, PetUpdateConflict, STORAGE_BACKEND, SQLITE_PATH,
+    MAX_UPDATE_RETRIES, APPLIED_OUTBOX_HISTORY, SESSION_LIFETIME, pet_from_document as _to_pet, user_from_document,
+    retry_backoff, memory_storage
+)
+from .pet_listing import PetCursor, DEFAULT_PET_PAGE_SIZE, PETS_BY_CREATION_INDEX, PET_SUMMARY_PROJECTION, pet_summary, encode_pet_cursor, decode_pet_cursor
+from .password_hashing import password_hasher
+from .unit_of_work import UnitOfWork, current_unit_of_work
+from .interaction_log import InteractionLog, MongoInteractionLog, PROJECTION_FIELDS, action_events, chat_event, decay_event, projection_value
 from bson import ObjectId
 from pymongo.server_api import ServerApi
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
 import certifi
 import ssl
 
@@ -19,11 +37,12 @@ load_dotenv()
 MONGODB_URI = os.getenv("MONGODB_URI") or os.getenv("DATABASE_URL")
 DB_NAME = os.getenv("MONGODB_DB_NAME") or "chronopal"
 
-print(f"Using MongoDB URI: {MONGODB_URI[:3]}...{MONGODB_URI[-30:]}")
-print(f"Connecting to MongoDB database: {DB_NAME}")
-
-if not MONGODB_URI:
-    raise ValueError("MongoDB URI not found in environment variables")
+# Pets, users and sessions only need MongoDB with the mongo storage backend
+if STORAGE_BACKEND == "mongo":
+    if not MONGODB_URI:
+        raise ValueError("MongoDB URI not found in environment variables")
+    print(f"Using MongoDB URI: {MONGODB_URI[:3]}...{MONGODB_URI[-30:]}")
+    print(f"Connecting to MongoDB database: {DB_NAME}")
 
 # Global MongoDB client
 _mongo_client = None
@@ -55,93 +74,287 @@ client = AsyncIOMotorClient(
     connectTimeoutMS=30000, 
     serverSelectionTimeoutMS=30000,
     socketTimeoutMS=None,
-    connect=True
+    # Other storage backends keep the client for MongoDB-only features, connecting only if one is used
+    connect=STORAGE_BACKEND == "mongo"
 )
 async_client = client  # Use the synchronous client directly
 async_db = client[DB_NAME]
 async_pets_collection = async_db["pets"]
 async_users_collection = async_db["users"]
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Batched time-series snapshots of every pet write (flushed by a task started in main.py)
+vitals_recorder = VitalsRecorder(async_db["pet_vitals"])
 
-class UserDB:
-    @staticmethod
-    async def create_user(user: UserCreate) -> User:
-        hashed_password = UserDB.get_password_hash(user.password)
-        user_dict = {
-            "username": user.username,
-            "email": user.email,
-            "hashed_password": hashed_password,
-            "created_at": datetime.now(timezone.utc)
-        }
-        result = await async_users_collection.insert_one(user_dict)
-        created_user = await async_users_collection.find_one({"_id": result.inserted_id})
-        if created_user:
-            created_user["_id"] = str(created_user["_id"])
-        return User(**created_user)
+# Top pets kept in memory per worker, backed by the periodically rebuilt leaderboard collection
+pet_leaderboard = Leaderboard(async_pets_collection, async_db["leaderboard"])
 
-    @staticmethod
-    async def get_user_by_email(email: str) -> Optional[User]:
-        user = await async_users_collection.find_one({"email": email})
-        if user:
-            user["_id"] = str(user["_id"])
-        return User(**user) if user else None
+# In-process memory indexes for recently searched pets, backed by a text index for the rest
+memory_search = MemorySearch(async_pets_collection)
 
-    @staticmethod
-    async def get_user_by_id(user_id: str) -> Optional[User]:
+async def _log_rewrite(document: dict) -> None:
+    """Snapshot a pet a batch job rewrote behind PetDB's back, so its log has no gap at that version"""
+    if storage.interactions is not None:
+        await storage.interactions.record(_to_pet(document), [])
+
+# Batch job merging repeated feed/play memories (writes compact as they append too)
+memory_compactor = MemoryCompactor(async_pets_collection, on_compacted=memory_search.forget, on_rewritten=_log_rewrite)
+
+# Batch job rewriting legacy memory strings as records (they are parsed on read until then)
+memory_migrator = MemoryMigrator(async_pets_collection, on_compacted=memory_search.forget, on_rewritten=_log_rewrite)
+
+# Eager, resumable upgrade of pet documents to the current schema (they are upgraded on read until then)
+schema_migrator = SchemaMigrator(async_pets_collection, async_db["migrations"])
+
+# Unique partial index guaranteeing at most one primary pet per user
+PRIMARY_PET_INDEX = "userId_primary_unique"
+
+# Multikey index filtering an owner's memory records by kind and time
+MEMORY_KIND_TIME_INDEX = "userId_memory_kind_time"
+
+
+def _pet_filter(pet_id: str) -> dict:
+    """Match a pet by ObjectId, falling back to string _id or id fields"""
+    if ObjectId.is_valid(pet_id):
+        return {"_id": ObjectId(pet_id)}
+    return {"$or": [{"_id": pet_id}, {"id": pet_id}]}
+
+def _remember_pets(*pets: Optional[Pet]) -> None:
+    """Keep pets this request read or wrote in its identity map, so later lookups reuse them"""
+    unit = current_unit_of_work()
+    if unit is not None:
+        for pet in pets:
+            if pet is not None:
+                unit.pets.prime(pet.id, pet)
+
+def _uses_mongo() -> bool:
+    """Whether pets live in MongoDB, which the vitals history, leaderboard and memory search indexes are built on"""
+    return storage.backend == "mongo"
+
+def _pet_written(pet: Pet) -> None:
+    """Fan a pet write out to the request's identity map, live subscribers, the vitals history, the leaderboard and memory search"""
+    _remember_pets(pet)
+    publish_pet_update(pet)
+    memory_search.observe(pet)
+    # Both flush to MongoDB collections of their own, which other storage backends don't have
+    if _uses_mongo():
+        vitals_recorder.record(pet)
+        pet_leaderboard.record(pet)
+
+# Interactions only apply while the battery has charge (a missing battery counts as full)
+BATTERY_AVAILABLE = {"$or": [{"batteryLevel": {"$gt": 0}}, {"batteryLevel": None}]}
+
+def _battery_after(delta: int) -> dict:
+    """Pipeline expression for the battery level plus delta, clamped to 0-100"""
+    current = {"$ifNull": ["$batteryLevel", MAX_BATTERY_LEVEL]}
+    return {"$min": [MAX_BATTERY_LEVEL, {"$max": [0, {"$add": [current, delta]}]}]}
+
+def _outbox_fields(entry: Dict) -> dict:
+    """Pipeline fields applying an outbox entry and remembering it was applied"""
+    return {
+        "batteryLevel": _battery_after(entry.get("batteryDelta", 0)),
+        "interactionCount": {"$add": [{"$ifNull": ["$interactionCount", 0]}, entry.get("interactions", 0)]},
+        "memoryLog": append_memories_expression(entry.get("memories", []), entry["createdAt"]),
+        "lastInteraction": {"$max": ["$lastInteraction", entry["createdAt"]]},
+        "appliedOutbox": {"$slice": [
+            {"$concatArrays": [{"$ifNull": ["$appliedOutbox", []]}, [entry["_id"]]]},
+            -APPLIED_OUTBOX_HISTORY
+        ]}
+    }
+
+def _outbox_rounds(entries: List[Dict]) -> List[List[Dict]]:
+    """Split entries into bulk writes of at most APPLIED_OUTBOX_HISTORY entries per pet, keeping each pet's order"""
+    rounds: List[List[Dict]] = []
+    seen: Dict[str, int] = {}
+    for entry in entries:
+        position = seen.get(entry["petId"], 0)
+        seen[entry["petId"]] = position + 1
+        index = position // APPLIED_OUTBOX_HISTORY
+        if index == len(rounds):
+            rounds.append([])
+        rounds[index].append(entry)
+    return rounds
+
+def _with_version_bump(update: Union[dict, list]) -> Union[dict, list]:
+    """Every write bumps the pet's version so read-modify-write updates can detect races"""
+    if isinstance(update, list):
+        return update + [{"$set": {"version": {"$add": [{"$ifNull": ["$version", 0]}, 1]}}}]
+    bumped = dict(update)
+    bumped["$inc"] = {**bumped.get("$inc", {}), "version": 1}
+    return bumped
+
+class MongoUserRepository(UserRepository):
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def ensure_indexes(self) -> None:
+        pass
+
+    async def create_user(self, document: dict) -> User:
+        result = await self.collection.insert_one(document)
+        created_user = await self.collection.find_one({"_id": result.inserted_id})
+        return user_from_document(created_user)
+
+    async def get_user_by_email(self, email: str) -> Optional[User]:
+        user = await self.collection.find_one({"email": email})
+        return user_from_document(user) if user else None
+
+    async def get_user_by_id(self, user_id: str) -> Optional[User]:
         try:
-            user = await async_users_collection.find_one({"_id": ObjectId(user_id)})
-            if user:
-                user["_id"] = str(user["_id"])
-            return User(**user) if user else None
+            user = await self.collection.find_one({"_id": ObjectId(user_id)})
+            return user_from_document(user) if user else None
         except:
             return None
 
-    @staticmethod
-    def verify_password(plain_password: str, hashed_password: str) -> bool:
-        return pwd_context.verify(plain_password, hashed_password)
+    async def get_users(self, user_ids: List[str]) -> Dict[str, User]:
+        object_ids = [ObjectId(user_id) for user_id in user_ids if ObjectId.is_valid(user_id)]
+        if not object_ids:
+            return {}
+        users = [user_from_document(document) async for document in self.collection.find({"_id": {"$in": object_ids}})]
+        return {user.id: user for user in users}
 
-    @staticmethod
-    def get_password_hash(password: str) -> str:
-        return pwd_context.hash(password)
+    async def replace_password_hash(self, user_id: str, old_hash: str, new_hash: str) -> bool:
+        result = await self.collection.update_one(
+            {"_id": ObjectId(user_id), "hashed_password": old_hash},
+            {"$set": {"hashed_password": new_hash}}
+        )
+        return result.modified_count > 0
 
-    @staticmethod
-    async def delete_user(user_id: str) -> bool:
+    async def delete_user(self, user_id: str) -> bool:
         try:
-            result = await async_users_collection.delete_one({"_id": ObjectId(user_id)})
+            result = await self.collection.delete_one({"_id": ObjectId(user_id)})
             return result.deleted_count > 0
         except:
             return False
 
-class PetDB:
-    @staticmethod
-    async def create_pet(pet_data: Union[Pet, Dict]) -> Pet:
-        """Create a new pet from either a Pet object or a dictionary"""
-        try:
-            if isinstance(pet_data, dict):
-                # If it's a dictionary, create a Pet object
-                pet = Pet(**pet_data)
-                pet_dict = pet.model_dump()
-            else:
-                # If it's already a Pet object, just get the dictionary
-                pet_dict = pet_data.model_dump()
+class MongoSessionRepository(SessionRepository):
+    def __init__(self, collection):
+        self.collection = collection
 
-            # Remove _id if it exists to let MongoDB generate it
-            if "_id" in pet_dict:
-                del pet_dict["_id"]
+    async def ensure_indexes(self) -> None:
+        pass
 
-            result = await async_pets_collection.insert_one(pet_dict)
-            created_pet = await async_pets_collection.find_one({"_id": result.inserted_id})
-            if created_pet:
-                created_pet["_id"] = str(created_pet["_id"])
-            return Pet(**created_pet)
-        except Exception as e:
-            print(f"Error creating pet: {str(e)}")
-            raise
+    async def get_session(self, session_id: str) -> Optional[dict]:
+        session = await self.collection.find_one({"session_id": session_id})
+        if session and datetime.now() < session["expires_at"]:
+            return session
+        return None
 
-    @staticmethod
-    async def get_pet(pet_id: str) -> Optional[Pet]:
+    async def create_session(self, user_id: str) -> str:
+        session_id = os.urandom(16).hex()
+        expires_at = datetime.now() + SESSION_LIFETIME
+        await self.collection.insert_one({
+            "session_id": session_id,
+            "user_id": user_id,
+            "expires_at": expires_at
+        })
+        return session_id
+
+    async def delete_session(self, session_id: str) -> None:
+        await self.collection.delete_one({"session_id": session_id})
+
+    async def revoke_user_sessions(self, user_id: str) -> None:
+        await self.collection.delete_many({"user_id": user_id})
+
+class MongoPetRepository(PetRepository):
+    """Pets in MongoDB; every update is a single atomic (pipeline) update computed on the server"""
+
+    def __init__(self, collection, on_written: Optional[Callable[[Pet], None]] = None, interactions: Optional[InteractionLog] = None):
+        super().__init__(on_written, interactions)
+        self.collection = collection
+
+    async def ensure_indexes(self) -> None:
+        """Create the indexes PetDB relies on, backfilling data they need first"""
+        existing = await self.collection.index_information()
+        if PRIMARY_PET_INDEX not in existing:
+            # Pets from before primary pets existed: the oldest pet of each user becomes primary
+            pipeline = [
+                {"$sort": {"_id": 1}},
+                {"$group": {
+                    "_id": "$userId",
+                    "firstPet": {"$first": "$_id"},
+                    "hasPrimary": {"$max": {"$eq": ["$isPrimary", True]}}
+                }},
+                {"$match": {"hasPrimary": False}}
+            ]
+            updates = [
+                UpdateOne({"_id": owner["firstPet"]}, {"$set": {"isPrimary": True}})
+                async for owner in self.collection.aggregate(pipeline, allowDiskUse=True)
+            ]
+            if updates:
+                await self.collection.bulk_write(updates, ordered=False)
+            print(f"Marked {len(updates)} existing pets as primary")
+
+        await self.collection.create_index(
+            [("userId", 1)],
+            name=PRIMARY_PET_INDEX,
+            unique=True,
+            partialFilterExpression={"isPrimary": True}
+        )
+        await self.collection.create_index(
+            [("userId", 1), ("memoryLog.k", 1), ("memoryLog.t", 1)],
+            name=MEMORY_KIND_TIME_INDEX
+        )
+
+        if PETS_BY_CREATION_INDEX not in existing:
+            # Pets from before createdAt: the time is in their ObjectId (the schema migration writes the same)
+            object_id = {"$convert": {"input": "$_id", "to": "objectId", "onError": None, "onNull": None}}
+            result = await self.collection.update_many(
+                {"createdAt": None},
+                [{"$set": {"createdAt": {"$convert": {
+                    "input": object_id, "to": "date", "onError": "$lastInteraction", "onNull": "$lastInteraction"
+                }}}}]
+            )
+            print(f"Backfilled createdAt on {result.modified_count} existing pets")
+        await self.collection.create_index(
+            [("userId", 1), ("createdAt", 1), ("_id", 1)],
+            name=PETS_BY_CREATION_INDEX
+        )
+
+    async def create_pet(self, document: dict) -> Pet:
+        pet_dict = dict(document)
+        # Remove _id if it exists to let MongoDB generate it
+        if "_id" in pet_dict:
+            del pet_dict["_id"]
+
+        # Claim the primary slot; the unique partial index rejects it if already taken
+        pet_dict["isPrimary"] = True
+        try:
+            result = await self.collection.insert_one(pet_dict)
+        except DuplicateKeyError:
+            pet_dict.pop("_id", None)
+            pet_dict["isPrimary"] = False
+            result = await self.collection.insert_one(pet_dict)
+        created_pet = await self.collection.find_one({"_id": result.inserted_id})
+        return await self._logged(_to_pet(created_pet))
+
+    async def get_pet_header(self, pet_id: str) -> Optional[dict]:
+        return await self.collection.find_one(_pet_filter(pet_id), {"userId": 1, "version": 1})
+
+    async def find_memories(self, user_id: str, kinds: Optional[List[str]] = None, since: Optional[datetime] = None,
+                            until: Optional[datetime] = None, pet_id: Optional[str] = None, limit: int = 100) -> List[dict]:
+        """$elemMatch picks the pets through the (userId, kind, time) index and
+        $filter trims each log to the matching records. Legacy strings have
+        no kind or time until they are migrated, so they never match.
+        """
+        query = {"userId": user_id, "memoryLog": {"$elemMatch": record_match(kinds, since, until)}}
+        if pet_id:
+            query = {"$and": [query, _pet_filter(pet_id)]}
+        pipeline = [
+            {"$match": query},
+            {"$project": {"memory": {"$filter": {
+                "input": "$memoryLog",
+                "as": "memory",
+                "cond": record_condition(kinds, since, until)
+            }}}},
+            {"$unwind": "$memory"},
+            {"$sort": {"memory.t": -1}},
+            {"$limit": limit}
+        ]
+        return [
+            {"petId": str(document["_id"]), **memory_view(document["memory"])}
+            async for document in self.collection.aggregate(pipeline)
+        ]
+    async def get_pet(self, pet_id: str) -> Optional[Pet]:
         try:
             print(f"[DEBUG] Looking for pet with ID: {pet_id}")
             print(f"[DEBUG] Pet ID type: {type(pet_id)}")
@@ -149,7 +362,7 @@ class PetDB:
             
             # Dump the first few pets in the collection for debugging
             print(f"[DEBUG] Dumping first 3 pets in collection:")
-            cursor = async_pets_collection.find().limit(3)
+            cursor = self.collection.find().limit(3)
             idx = 0
             async for pet in cursor:
                 idx += 1
@@ -162,11 +375,10 @@ class PetDB:
                 print(f"[DEBUG] Attempting to lookup with ObjectId...")
                 obj_id = ObjectId(pet_id)
                 print(f"[DEBUG] Created ObjectId: {obj_id}")
-                pet = await async_pets_collection.find_one({"_id": obj_id})
+                pet = await self.collection.find_one({"_id": obj_id})
                 if pet:
                     print(f"[DEBUG] Found pet with _id as ObjectId: {pet_id}")
-                    pet["_id"] = str(pet["_id"])
-                    return Pet(**pet) if pet else None
+                    return _to_pet(pet)
                 else:
                     print(f"[DEBUG] No pet found with ObjectId: {obj_id}")
             except Exception as e:
@@ -174,21 +386,19 @@ class PetDB:
             
             # Next, try with string _id
             print(f"[DEBUG] Attempting to lookup with string _id...")
-            pet = await async_pets_collection.find_one({"_id": pet_id})
+            pet = await self.collection.find_one({"_id": pet_id})
             if pet:
                 print(f"[DEBUG] Found pet with _id as string: {pet_id}")
-                pet["_id"] = str(pet["_id"])
-                return Pet(**pet) if pet else None
+                return _to_pet(pet)
             else:
                 print(f"[DEBUG] No pet found with string _id: {pet_id}")
             
             # Next, try with the id field (frontend might be passing this)
             print(f"[DEBUG] Attempting to lookup with id field...")
-            pet = await async_pets_collection.find_one({"id": pet_id})
+            pet = await self.collection.find_one({"id": pet_id})
             if pet:
                 print(f"[DEBUG] Found pet with id field: {pet_id}")
-                pet["_id"] = str(pet["_id"])
-                return Pet(**pet) if pet else None
+                return _to_pet(pet)
             else:
                 print(f"[DEBUG] No pet found with id field: {pet_id}")
                 
@@ -198,21 +408,474 @@ class PetDB:
             print(f"[DEBUG] Unexpected error in get_pet: {str(e)}")
             return None
 
+    async def get_pets(self, pet_ids: List[str]) -> Dict[str, Pet]:
+        """One $in query on _id; ids it misses fall back to string _id or id fields, as get_pet does"""
+        found: Dict[str, Pet] = {}
+        object_ids = [ObjectId(pet_id) for pet_id in pet_ids if ObjectId.is_valid(pet_id)]
+        if object_ids:
+            async for document in self.collection.find({"_id": {"$in": object_ids}}):
+                pet = _to_pet(document)
+                found[pet.id] = pet
+        missing = [pet_id for pet_id in pet_ids if pet_id not in found]
+        if missing:
+            query = {"$or": [{"_id": {"$in": missing}}, {"id": {"$in": missing}}]}
+            async for document in self.collection.find(query):
+                alias = document.get("id")
+                pet = _to_pet(document)
+                found.setdefault(pet.id, pet)
+                if alias in missing:
+                    found.setdefault(alias, pet)
+        return found
+
+    async def get_or_create_primary_pet(self, user_id: str, defaults: dict) -> Pet:
+        """Concurrent callers race on an upsert against the unique partial index
+        on (userId where isPrimary), so exactly one pet is ever created.
+        """
+        defaults = dict(defaults)
+        # The filter supplies userId and isPrimary on insert; MongoDB generates _id
+        for field in ("id", "userId", "isPrimary"):
+            defaults.pop(field, None)
+
+        query = {"userId": user_id, "isPrimary": True}
+        try:
+            pet = await self.collection.find_one_and_update(
+                query,
+                {"$setOnInsert": defaults},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Another request inserted the pet between our match and insert
+            pet = await self.collection.find_one(query)
+        return _to_pet(pet)
+
+    async def get_pets_by_user(self, user_id: str) -> List[Pet]:
+        cursor = self.collection.find({"userId": user_id}).sort([("createdAt", 1), ("_id", 1)])
+        pets = []
+        async for pet in cursor:
+            if pet:
+                pets.append(_to_pet(pet))
+        return pets
+
+    async def list_pets(self, user_id: str, after: Optional[PetCursor], limit: int) -> List[dict]:
+        """One range scan of the (userId, createdAt, _id) index, projected to the summary fields"""
+        query = {"userId": user_id}
+        if after:
+            created, pet_id = after
+            last_id = ObjectId(pet_id) if ObjectId.is_valid(pet_id) else pet_id
+            query["$or"] = [{"createdAt": {"$gt": created}}, {"createdAt": created, "_id": {"$gt": last_id}}]
+        cursor = self.collection.find(query, PET_SUMMARY_PROJECTION).sort([("createdAt", 1), ("_id", 1)]).limit(limit)
+        return [pet_summary(document) async for document in cursor]
+
+    async def get_primary_pet(self, user_id: str) -> Optional[Pet]:
+        document = await self.collection.find_one({"userId": user_id, "isPrimary": True})
+        return _to_pet(document) if document else None
+
+    async def delete_pet(self, pet_id: str) -> bool:
+        if ObjectId.is_valid(pet_id):
+            result = await self.collection.delete_one({"_id": ObjectId(pet_id)})
+        else:
+            result = await self.collection.delete_one({"$or": [{"_id": pet_id}, {"id": pet_id}]})
+        return result.deleted_count > 0
+
+    async def update_fields(self, pet_id: str, fields: dict) -> Optional[Pet]:
+        return await self._apply_update(pet_id, {"$set": fields})
+
+    async def append_memories(self, pet_id: str, memories: List[Memory]) -> Optional[Pet]:
+        return await self._apply_update(pet_id, [{"$set": {"memoryLog": append_memories_expression(memories)}}])
+
+    async def count_interaction(self, pet_id: str) -> Optional[Pet]:
+        return await self._apply_update(pet_id, {
+            "$inc": {"interactionCount": 1},
+            "$set": {"lastInteraction": datetime.now(timezone.utc)}
+        })
+
+    async def adjust_battery(self, pet_id: str, delta: int) -> Optional[Pet]:
+        return await self._apply_update(pet_id, [{"$set": {"batteryLevel": _battery_after(delta)}}])
+
+    async def interact(self, pet_id: str, action_type: str, message: Optional[str] = None) -> Optional[Pet]:
+        """Battery, interaction count, memory and timestamps are all computed on
+        the server from the current document, and the update only matches
+        while the battery isn't depleted, so concurrent interactions can't
+        overwrite each other.
+        """
+        now = datetime.now(timezone.utc)
+        fields = {
+            "batteryLevel": _battery_after(INTERACTION_BATTERY_DELTAS[action_type]),
+            "interactionCount": {"$add": [{"$ifNull": ["$interactionCount", 0]}, 1]},
+            "memoryLog": append_memories_expression([action_record(action_type, message, now)]),
+            "lastInteraction": now
+        }
+        if action_type == "feed":
+            fields["lastFed"] = now
+        if action_type in ("feed", "play"):
+            fields["mood"] = MOOD_LEVELS["HAPPY"]
+        elif action_type == "teach":
+            fields["level"] = {"$add": [{"$ifNull": ["$level", 1]}, 1]}
+        event = {"type": action_type, "at": now, "message": message}
+        updated_pet = await self._apply_update(pet_id, [{"$set": fields}], extra_filter=BATTERY_AVAILABLE, events=[event])
+        if updated_pet:
+            return updated_pet
+        # Either the pet doesn't exist or its battery is depleted; return it unchanged
+        return await self.get_pet(pet_id)
+
+    async def apply_actions(self, pet_id: str, actions: List[Dict]) -> Optional[Pet]:
+        events: List[Dict] = []
+
+        def batch_update(document: dict) -> Optional[list]:
+            folded = fold_pet_actions(document, actions)
+            events[:] = action_events(actions, folded)
+            if not folded["applied"]:
+                return None
+            fields = {field: {"$literal": value} for field, value in folded["set"].items()}
+            for field, delta in folded["inc"].items():
+                fields[field] = {"$add": [{"$ifNull": ["$" + field, 0]}, delta]}
+            # A pipeline, so repeated feeds and plays compact into the log's last entry
+            fields["memoryLog"] = append_memories_expression(folded["memories"])
+            return [{"$set": fields}]
+
+        return await self._update_versioned(pet_id, batch_update, events)
+
+    async def update_versioned(self, pet_id: str, build_changes: Callable[[dict], Optional[dict]],
+                               decay: bool = False) -> Optional[Pet]:
+        events: List[Dict] = []
+
+        def set_changes(document: dict) -> Optional[dict]:
+            changes = build_changes(document)
+            if changes and decay:
+                events[:] = [decay_event(changes)]
+            return {"$set": changes} if changes else None
+
+        return await self._update_versioned(pet_id, set_changes, events)
+
+    async def _update_versioned(self, pet_id: str, build_update: Callable[[dict], Optional[Union[dict, list]]],
+                                events: Optional[List[Dict]] = None) -> Optional[Pet]:
+        """update_versioned for any MongoDB update (operators or pipeline) build_update returns.
+
+        The update only lands if nobody bumped the version since the read;
+        otherwise it is rebuilt from a fresh read. build_update may fill
+        events with what it did; the attempt that lands is logged with them.
+        """
+        base_filter = _pet_filter(pet_id)
+        for attempt in range(MAX_UPDATE_RETRIES):
+            document = await self.collection.find_one(base_filter)
+            if not document:
+                return None
+
+            # Documents written before versioning have no version field; None matches those
+            guard = {"_id": document["_id"], "version": document.get("version")}
+            update = build_update(upgrade_pet_document(document))
+            if not update:
+                return _to_pet(document)
+
+            updated = await self.collection.find_one_and_update(
+                guard,
+                _with_version_bump(update),
+                return_document=ReturnDocument.AFTER
+            )
+            if updated:
+                updated_pet = _to_pet(updated)
+                self.on_written(updated_pet)
+                return await self._logged(updated_pet, events)
+            print(f"[DEBUG] Version conflict on pet {pet_id}, retrying (attempt {attempt + 1})")
+            await retry_backoff(attempt)
+
+        raise PetUpdateConflict(f"Pet {pet_id} changed during {MAX_UPDATE_RETRIES} update attempts")
+
+    async def apply_outbox(self, entries: List[Dict]) -> int:
+        """Ordered bulk writes. Each update only matches pets that haven't
+        recorded the entry's id in appliedOutbox, so entries delivered more
+        than once apply exactly once.
+
+        Each update is also pinned to the version it is planned to produce,
+        so every entry is logged under the version it wrote. Entries whose
+        pet was written concurrently miss the bulk write and are applied one
+        at a time instead. Which entries landed is read from appliedOutbox,
+        which only keeps the last APPLIED_OUTBOX_HISTORY ids, so a bulk write
+        carries at most that many entries per pet.
+        """
+        changed = 0
+        for batch in _outbox_rounds(entries):
+            changed += await self._apply_outbox_batch(batch)
+        return changed
+
+    async def _apply_outbox_batch(self, entries: List[Dict]) -> int:
+        """apply_outbox for entries holding at most APPLIED_OUTBOX_HISTORY per pet"""
+        if not entries:
+            return 0
+        pet_ids = {entry["petId"] for entry in entries}
+        pets_filter = {"$or": [_pet_filter(pet_id) for pet_id in pet_ids]}
+
+        # Version and applied entries of each pet, under every id the entries may use for it
+        pending = {}
+        async for document in self.collection.find(pets_filter, {"version": 1, "appliedOutbox": 1, "id": 1}):
+            state = {"version": document.get("version"), "applied": set(document.get("appliedOutbox") or [])}
+            for key in (str(document["_id"]), document.get("id")):
+                if key in pet_ids:
+                    pending[key] = state
+
+        planned, operations = [], []
+        for entry in entries:
+            state = pending.get(entry["petId"])
+            if state is None or entry["_id"] in state["applied"]:
+                continue
+            expected = state["version"]
+            state["version"] = (expected or 0) + 1
+            state["applied"].add(entry["_id"])
+            planned.append((entry, state["version"]))
+            operations.append(UpdateOne(
+                {"$and": [_pet_filter(entry["petId"]), {"version": expected, "appliedOutbox": {"$ne": entry["_id"]}}]},
+                _with_version_bump([{"$set": _outbox_fields(entry)}])
+            ))
+        if not operations:
+            return 0
+        result = await self.collection.bulk_write(operations, ordered=True)
+
+        # Bulk writes don't return documents, so read the changed pets back for subscribers, vitals and the log
+        written = {}
+        async for document in self.collection.find(pets_filter):
+            applied = set(document.get("appliedOutbox") or [])
+            alias = document.get("id")
+            pet = _to_pet(document)
+            for key in (pet.id, alias):
+                if key in pet_ids:
+                    written[key] = (pet, applied)
+
+        landed, late = {}, []
+        for entry, seq in planned:
+            pet, applied = written.get(entry["petId"], (None, set()))
+            if pet is not None and (result.modified_count == len(planned) or entry["_id"] in applied):
+                landed.setdefault(pet.id, (pet, []))[1].append({**chat_event(entry), "seq": seq})
+            else:
+                late.append(entry)
+        for pet, events in landed.values():
+            self.on_written(pet)
+            await self._logged(pet, events)
+
+        changed = sum(len(events) for _, events in landed.values())
+        for entry in late:
+            changed += await self._apply_outbox_entry(entry)
+        return changed
+
+    async def _apply_outbox_entry(self, entry: Dict) -> int:
+        """Apply one entry under the version guard; 1 if it changed the pet"""
+        outcome = {"applied": False}
+
+        def entry_update(document: dict) -> Optional[list]:
+            outcome["applied"] = entry["_id"] not in (document.get("appliedOutbox") or [])
+            return [{"$set": _outbox_fields(entry)}] if outcome["applied"] else None
+
+        await self._update_versioned(entry["petId"], entry_update, [chat_event(entry)])
+        return int(outcome["applied"])
+
+    async def _apply_update(self, pet_id: str, update: Union[dict, list], extra_filter: Optional[dict] = None,
+                            events: Optional[List[Dict]] = None) -> Optional[Pet]:
+        """Apply an atomic update (operators or pipeline) in one round trip and publish the result"""
+        query = _pet_filter(pet_id)
+        if extra_filter:
+            query = {"$and": [query, extra_filter]}
+        document = await self.collection.find_one_and_update(
+            query,
+            _with_version_bump(update),
+            return_document=ReturnDocument.AFTER
+        )
+        if not document:
+            return None
+        updated_pet = _to_pet(document)
+        self.on_written(updated_pet)
+        return await self._logged(updated_pet, events)
+
+def create_storage(backend: str = STORAGE_BACKEND) -> Storage:
+    """The repositories for a storage backend; nothing connects until first use"""
+    if backend == "mongo":
+        return Storage(
+            "mongo",
+            MongoPetRepository(
+                async_pets_collection,
+                on_written=_pet_written,
+                interactions=MongoInteractionLog(async_db["interactions"], async_db["pet_snapshots"])
+            ),
+            MongoUserRepository(async_users_collection),
+            MongoSessionRepository(async_db["sessions"])
+        )
+    if backend == "memory":
+        return memory_storage(on_written=_pet_written)
+    if backend == "sqlite":
+        # aiosqlite is only needed, and only imported, for this backend
+        from .sqlite_storage import sqlite_storage
+        return sqlite_storage(SQLITE_PATH, on_written=_pet_written)
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+# Repositories PetDB, UserDB and sessions use, picked by STORAGE_BACKEND (swapped with use_storage)
+storage = create_storage()
+
+def use_storage(new_storage: Storage) -> Storage:
+    """Point PetDB, UserDB and sessions at another storage backend, returning the previous one"""
+    global storage
+    previous, storage = storage, new_storage
+    print(f"[STORAGE] Using the {new_storage.backend} storage backend")
+    return previous
+
+def new_unit_of_work() -> UnitOfWork:
+    """An empty identity map for one request, batching its lookups against the current storage backend"""
+    return UnitOfWork(storage.pets.get_pets, storage.users.get_users)
+
+class UserDB:
+    @staticmethod
+    async def create_user(user: UserCreate) -> User:
+        hashed_password = await password_hasher.hash_async(user.password)
+        user_dict = {
+            "username": user.username,
+            "email": user.email,
+            "hashed_password": hashed_password,
+            "created_at": datetime.now(timezone.utc)
+        }
+        return await storage.users.create_user(user_dict)
+
+    @staticmethod
+    async def get_user_by_email(email: str) -> Optional[User]:
+        return await storage.users.get_user_by_email(email)
+
+    @staticmethod
+    async def get_user_by_id(user_id: str) -> Optional[User]:
+        """Fetched at most once per request when a unit of work is open"""
+        unit = current_unit_of_work()
+        if unit is not None:
+            return await unit.users.load(user_id)
+        return await storage.users.get_user_by_id(user_id)
+
+    @staticmethod
+    def verify_password(plain_password: str, hashed_password: str) -> bool:
+        return password_hasher.verify(plain_password, hashed_password)
+
+    @staticmethod
+    async def authenticate(user: User, plain_password: str) -> bool:
+        """Check a login password off the event loop, upgrading an outdated hash on success"""
+        verified, new_hash = await password_hasher.verify_and_rehash(plain_password, user.hashed_password)
+        if verified and new_hash:
+            # Only replace the exact hash we verified, so a concurrent password change wins
+            if await storage.users.replace_password_hash(user.id, user.hashed_password, new_hash):
+                print(f"[AUTH] Rehashed password for user {user.id} at bcrypt cost {password_hasher.rounds}")
+        return verified
+
+    @staticmethod
+    def get_password_hash(password: str) -> str:
+        return password_hasher.hash(password)
+
+    @staticmethod
+    async def delete_user(user_id: str) -> bool:
+        deleted = await storage.users.delete_user(user_id)
+        unit = current_unit_of_work()
+        if unit is not None:
+            unit.users.prime(user_id, None)
+        return deleted
+
+class PetDB:
+    @staticmethod
+    async def ensure_indexes() -> None:
+        """Create the indexes (or tables) pets, users and sessions rely on"""
+        await storage.ensure_indexes()
+
+    @staticmethod
+    async def create_pet(pet_data: Union[Pet, Dict]) -> Pet:
+        """Create a new pet from either a Pet object or a dictionary.
+
+        The pet becomes the user's primary pet if they don't have one yet.
+        """
+        try:
+            if isinstance(pet_data, dict):
+                # If it's a dictionary, create a Pet object
+                pet = Pet(**pet_data)
+                pet_dict = pet.model_dump()
+            else:
+                # If it's already a Pet object, just get the dictionary
+                pet_dict = pet_data.model_dump()
+
+            new_pet = await storage.pets.create_pet(pet_dict)
+            _remember_pets(new_pet)
+            if _uses_mongo():
+                vitals_recorder.record(new_pet)
+                pet_leaderboard.record(new_pet)
+            return new_pet
+        except Exception as e:
+            print(f"Error creating pet: {str(e)}")
+            raise
+
+    @staticmethod
+    async def get_pet_header(pet_id: str) -> Optional[dict]:
+        """The pet's raw _id, owner and version, without loading its memory log"""
+        return await storage.pets.get_pet_header(pet_id)
+
+    @staticmethod
+    async def find_memories(user_id: str, kinds: Optional[List[str]] = None, since: Optional[datetime] = None,
+                            until: Optional[datetime] = None, pet_id: Optional[str] = None, limit: int = 100) -> List[dict]:
+        """The owner's memory records of the given kinds in [since, until), newest first.
+
+        Legacy strings have no kind or time until they are migrated, so they
+        never match.
+        """
+        return await storage.pets.find_memories(user_id, kinds, since, until, pet_id, limit)
+
+    @staticmethod
+    async def get_pet(pet_id: str) -> Optional[Pet]:
+        """Fetched at most once per request when a unit of work is open; concurrent lookups share one query"""
+        try:
+            unit = current_unit_of_work()
+            if unit is not None:
+                return await unit.pets.load(pet_id)
+            return await storage.pets.get_pet(pet_id)
+        except Exception as e:
+            print(f"[DEBUG] Unexpected error in get_pet: {str(e)}")
+            return None
+
+    @staticmethod
+    async def get_or_create_primary_pet(user_id: str, initial_memories: Optional[List[str]] = None) -> Pet:
+        """Return the user's primary pet, creating it if needed, in one round trip.
+
+        Concurrent callers can't create two: the backends guard the primary
+        slot with a unique index (or its equivalent).
+        """
+        defaults = Pet(
+            name=DEFAULT_PET_NAME,
+            species=DEFAULT_PET_SPECIES,
+            userId=user_id,
+            memoryLog=initial_memories or []
+        ).model_dump()
+        pet = await storage.pets.get_or_create_primary_pet(user_id, defaults)
+        _remember_pets(pet)
+        return pet
+
     @staticmethod
     async def get_pets_by_user(user_id: str) -> List[Pet]:
         """Get all pets for a user"""
         try:
-            cursor = async_pets_collection.find({"userId": user_id})
-            pets = []
-            async for pet in cursor:
-                if pet:
-                    pet["_id"] = str(pet["_id"])
-                    pets.append(Pet(**pet))
+            pets = await storage.pets.get_pets_by_user(user_id)
+            _remember_pets(*pets)
             return pets
         except Exception as e:
             print(f"Error getting pets for user {user_id}: {str(e)}")
             raise
 
+    @staticmethod
+    async def list_pets(user_id: str, cursor: Optional[str] = None, limit: int = DEFAULT_PET_PAGE_SIZE) -> Dict:
+        """One page of the user's pet summaries, oldest first, and the cursor of the next page (None on the last).
+
+        Raises ValueError for a cursor that wasn't returned by this method.
+        """
+        pets = await storage.pets.list_pets(user_id, decode_pet_cursor(cursor), limit + 1)
+        next_cursor = encode_pet_cursor(pets[limit - 1]) if len(pets) > limit else None
+        return {"pets": pets[:limit], "nextCursor": next_cursor}
+
+    @staticmethod
+    async def get_primary_pet(user_id: str) -> Optional[Pet]:
+        """The pet routes act on when a request doesn't name one: the primary pet, else the oldest"""
+        pet = await storage.pets.get_primary_pet(user_id)
+        if pet:
+            _remember_pets(pet)
+            return pet
+        oldest = await storage.pets.list_pets(user_id, None, 1)
+        return await PetDB.get_pet(oldest[0]["id"]) if oldest else None
+
     @staticmethod
     async def update_pet(pet_id: str, pet_data: dict) -> Optional[Pet]:
         try:
@@ -222,31 +885,10 @@ class PetDB:
             if not update_data:
                 return await PetDB.get_pet(pet_id)
             
-            # Try to handle the pet_id as ObjectId or string
-            try:
-                if ObjectId.is_valid(pet_id):
-                    # Valid ObjectId format
-                    result = await async_pets_collection.update_one(
-                        {"_id": ObjectId(pet_id)},
-                        {"$set": update_data}
-                    )
-                else:
-                    # Try string IDs
-                    result = await async_pets_collection.update_one(
-                        {"$or": [{"_id": pet_id}, {"id": pet_id}]},
-                        {"$set": update_data}
-                    )
-                
-                if result.matched_count == 0:
-                    print(f"[DEBUG] No pet matched for update with ID: {pet_id}")
-                    return None
-                    
-            except Exception as e:
-                print(f"[DEBUG] Error updating pet {pet_id}: {str(e)}")
-                return None
-            
-            # Get the updated pet
-            return await PetDB.get_pet(pet_id)
+            updated_pet = await storage.pets.update_fields(pet_id, update_data)
+            if not updated_pet:
+                print(f"[DEBUG] No pet matched for update with ID: {pet_id}")
+            return updated_pet
         except Exception as e:
             print(f"[DEBUG] Unexpected error in update_pet: {str(e)}")
             return None
@@ -254,43 +896,26 @@ class PetDB:
     @staticmethod
     async def delete_pet(pet_id: str) -> bool:
         try:
-            if ObjectId.is_valid(pet_id):
-                result = await async_pets_collection.delete_one({"_id": ObjectId(pet_id)})
-            else:
-                result = await async_pets_collection.delete_one({"$or": [{"_id": pet_id}, {"id": pet_id}]})
-            return result.deleted_count > 0
+            deleted = await storage.pets.delete_pet(pet_id)
+            unit = current_unit_of_work()
+            if unit is not None:
+                unit.pets.prime(pet_id, None)
+            pet_leaderboard.remove(pet_id)
+            memory_search.forget(pet_id)
+            return deleted
         except Exception as e:
             print(f"[DEBUG] Error deleting pet {pet_id}: {str(e)}")
             return False
 
     @staticmethod
-    async def add_memory(pet_id: str, memory: str) -> Optional[Pet]:
+    async def add_memory(pet_id: str, memory: Memory) -> Optional[Pet]:
+        """Append a memory record; plain text is stored as a note"""
         try:
-            # Try to handle the pet_id as ObjectId or string
-            try:
-                if ObjectId.is_valid(pet_id):
-                    # Valid ObjectId format
-                    result = await async_pets_collection.update_one(
-                        {"_id": ObjectId(pet_id)},
-                        {"$push": {"memoryLog": memory}}
-                    )
-                else:
-                    # Try string IDs
-                    result = await async_pets_collection.update_one(
-                        {"$or": [{"_id": pet_id}, {"id": pet_id}]},
-                        {"$push": {"memoryLog": memory}}
-                    )
-                
-                if result.matched_count == 0:
-                    print(f"[DEBUG] No pet matched for memory update with ID: {pet_id}")
-                    return None
-                    
-            except Exception as e:
-                print(f"[DEBUG] Error adding memory to pet {pet_id}: {str(e)}")
-                return None
-                
-            # Get the updated pet
-            return await PetDB.get_pet(pet_id)
+            record = memory if is_record(memory) else note_record(memory)
+            updated_pet = await storage.pets.append_memories(pet_id, [record])
+            if not updated_pet:
+                print(f"[DEBUG] No pet matched for memory update with ID: {pet_id}")
+            return updated_pet
         except Exception as e:
             print(f"[DEBUG] Unexpected error in add_memory: {str(e)}")
             return None
@@ -305,6 +930,8 @@ class PetDB:
 
     @staticmethod
     async def update_evolution_stage(pet_id: str, stage: str) -> Optional[Pet]:
+        if stage not in EVOLUTION_STAGES.values():
+            raise ValueError(f"Unknown evolution stage: {stage}")
         return await PetDB.update_pet(pet_id, {"evolutionStage": stage})
 
     @staticmethod
@@ -316,98 +943,29 @@ class PetDB:
         """Update the last interaction timestamp"""
         return await PetDB.update_pet(pet_id, {"lastInteraction": datetime.now(timezone.utc)})
 
+    @staticmethod
+    async def increment_interaction(pet_id: str) -> Optional[Pet]:
+        """Count an interaction and refresh lastInteraction"""
+        return await storage.pets.count_interaction(pet_id)
+
+    @staticmethod
+    async def update_battery_level(pet_id: str, delta: int) -> Optional[Pet]:
+        """Add delta (negative to drain) to the battery, clamped to 0-100 by the store"""
+        return await storage.pets.adjust_battery(pet_id, delta)
+
     @staticmethod
     async def check_neglect(pet_id: str) -> Optional[Pet]:
         """Check if the pet is being neglected and update its mood accordingly"""
         try:
-            pet = await PetDB.get_pet(pet_id)
-            if not pet:
-                return None
-                
-            now = datetime.now(timezone.utc)
-            
-            # Calculate how long since the pet was last fed or interacted with
-            last_fed = pet.lastFed
-            last_interaction = pet.lastInteraction
-            
-            # Convert to UTC if they're not already
-            if last_fed.tzinfo is None:
-                last_fed = last_fed.replace(tzinfo=timezone.utc)
-            if last_interaction.tzinfo is None:
-                last_interaction = last_interaction.replace(tzinfo=timezone.utc)
-            
-            # Calculate hours since last interaction
-            hours_since_fed = (now - last_fed).total_seconds() / 3600
-            hours_since_interaction = (now - last_interaction).total_seconds() / 3600
-            
-            # Determine which was more recent, feeding or other interaction
-            hours_since_last_action = min(hours_since_fed, hours_since_interaction)
-            
-            # Determine new mood based on neglect time
-            new_mood = pet.mood  # Default to current mood
-            
-            if hours_since_last_action < NEGLECT_THRESHOLD_HOURS / 4:  # Less than 6 hours
-                new_mood = MOOD_LEVELS["HAPPY"]
-            elif hours_since_last_action < NEGLECT_THRESHOLD_HOURS / 2:  # Less than 12 hours
-                new_mood = MOOD_LEVELS["CONTENT"]
-            elif hours_since_last_action < NEGLECT_THRESHOLD_HOURS * 0.75:  # Less than 18 hours
-                new_mood = MOOD_LEVELS["NEUTRAL"]
-            elif hours_since_last_action < NEGLECT_THRESHOLD_HOURS:  # Less than 24 hours
-                new_mood = MOOD_LEVELS["GRUMPY"]
-            else:  # 24 hours or more
-                new_mood = MOOD_LEVELS["ANGRY"]
-            
-            # Calculate battery depletion based on neglect time
-            # Deplete battery by 1% per hour of neglect
-            hours_of_neglect = hours_since_last_action
-            battery_depletion = int(hours_of_neglect)
-            
-            # Ensure batteryLevel exists and is a number
-            current_battery = getattr(pet, 'batteryLevel', 100)
-            if current_battery is None:
-                current_battery = 100
-                
-            # Calculate new battery level (minimum 0)
-            new_battery_level = max(0, current_battery - battery_depletion)
-            
-            # Only update if there's a change in mood or battery
-            if new_mood != pet.mood or new_battery_level != current_battery:
-                update_data = {
-                    "mood": new_mood,
-                    "batteryLevel": new_battery_level
-                }
-                updated_pet = await PetDB.update_pet(pet_id, update_data)
-                return updated_pet
-            
-            return pet
+            return await storage.pets.update_versioned(pet_id, neglect_changes, decay=True)
         except Exception as e:
             print(f"Error checking neglect: {str(e)}")
             return None
-            
+
     @staticmethod
     async def feed_pet(pet_id: str) -> Optional[Pet]:
         try:
-            pet = await PetDB.get_pet(pet_id)
-            if not pet:
-                return None
-
-            battery_level = getattr(pet, 'batteryLevel', 100)
-            if battery_level is not None and battery_level <= 0:
-                return pet
-
-            now = datetime.now(timezone.utc)
-            updates = {
-                "lastFed": now,
-                "lastInteraction": now,
-                "mood": MOOD_LEVELS["HAPPY"]
-            }
-
-            await PetDB.update_battery_level(pet_id, 10)
-            await PetDB.increment_interaction(pet_id)
-            await PetDB.add_memory(pet_id, "I was fed and it was delicious!")
-            await log_memory(pet_id, "feed", "Pet was fed and is happy.")
-
-            return await PetDB.update_pet(pet_id, updates)
+            return await storage.pets.interact(pet_id, "feed")
         except Exception as e:
             print(f"Error feeding pet: {str(e)}")
             return None
@@ -415,26 +973,7 @@ class PetDB:
     @staticmethod
     async def play_with_pet(pet_id: str) -> Optional[Pet]:
         try:
-            pet = await PetDB.get_pet(pet_id)
-            if not pet:
-                return None
-
-            battery_level = getattr(pet, 'batteryLevel', 100)
-            if battery_level is not None and battery_level <= 0:
-                return pet
-
-            now = datetime.now(timezone.utc)
-            updates = {
-                "lastInteraction": now,
-                "mood": MOOD_LEVELS["HAPPY"]
-            }
-
-            await PetDB.update_battery_level(pet_id, 5)
-            await PetDB.increment_interaction(pet_id)
-            await PetDB.add_memory(pet_id, "We played together and it was fun!")
-            await log_memory(pet_id, "play", "Pet played and felt joy.")
-
-            return await PetDB.update_pet(pet_id, updates)
+            return await storage.pets.interact(pet_id, "play")
         except Exception as e:
             print(f"Error playing with pet: {str(e)}")
             return None
@@ -442,26 +981,94 @@ class PetDB:
     @staticmethod
     async def teach_pet(pet_id: str, lesson: str) -> Optional[Pet]:
         try:
-            pet = await PetDB.get_pet(pet_id)
-            if not pet:
-                return None
+            return await storage.pets.interact(pet_id, "teach", message=lesson)
+        except Exception as e:
+            print(f"Error teaching pet: {str(e)}")
+            return None
 
-            battery_level = getattr(pet, 'batteryLevel', 100)
-            if battery_level is not None and battery_level <= 0:
-                return pet
+    @staticmethod
+    async def apply_actions(pet_id: str, actions: List[Dict]) -> Optional[Pet]:
+        """Fold an ordered list of queued actions into a single atomic update"""
+        return await storage.pets.apply_actions(pet_id, actions)
 
-            now = datetime.now(timezone.utc)
-            updates = {
-                "lastInteraction": now,
-                "level": pet.level + 1
-            }
+    @staticmethod
+    async def update_pet_versioned(pet_id: str, build_changes: Callable[[dict], Optional[dict]]) -> Optional[Pet]:
+        """Read-modify-write guarded by the pet's version; build_changes returns the fields to set"""
+        return await storage.pets.update_versioned(pet_id, build_changes)
 
-            await PetDB.update_battery_level(pet_id, 7)
-            await PetDB.increment_interaction(pet_id)
-            await PetDB.add_memory(pet_id, f"I learned about {lesson}")
-            await log_memory(pet_id, "teach", f"Pet learned a lesson on {lesson}.")
+    @staticmethod
+    async def apply_outbox(entries: List[Dict]) -> int:
+        """Apply queued side effects; returns how many pets changed.
 
-            return await PetDB.update_pet(pet_id, updates)
-        except Exception as e:
-            print(f"Error teaching pet: {str(e)}")
-            return None
+        Entries delivered more than once apply exactly once.
+        """
+        if not entries:
+            return 0
+        return await storage.pets.apply_outbox(entries)
+
+    @staticmethod
+    async def interaction_history(pet_id: str, after: int = -1, until: Optional[int] = None) -> List[dict]:
+        """The pet's logged interaction events with after < seq <= until, oldest first"""
+        return await storage.interactions.events(pet_id, after, until)
+
+    @staticmethod
+    async def replay_pet(pet_id: str, version: Optional[int] = None) -> Optional[dict]:
+        """The pet document at a version (default: the newest logged), rebuilt from a snapshot and the events after it.
+
+        None if the log has no snapshot to start from, e.g. for a pet last
+        written before the log existed; snapshot_pet starts one.
+        """
+        return await storage.interactions.materialize(pet_id, version)
+
+    @staticmethod
+    async def snapshot_pet(pet_id: str) -> Optional[Pet]:
+        """Snapshot the pet as it is now, giving replays a starting point"""
+        pet = await storage.pets.get_pet(pet_id)
+        if pet:
+            await storage.interactions.snapshot(pet)
+        return pet
+
+    @staticmethod
+    async def rebuild_pet(pet_id: str, dry_run: bool = False, force: bool = False) -> Dict:
+        """Rewrite the pet's interaction fields from its replayed history, reporting what differed.
+
+        Pets the log doesn't fully cover (writes it has no record of, or a
+        newer version than it has seen) are only reported unless force is
+        set. The rewrite is guarded by the version that was compared, so a
+        write landing meanwhile wins.
+        """
+        current = await storage.pets.get_pet(pet_id)
+        if current is None:
+            return {"petId": pet_id, "status": "missing"}
+        replayed = await PetDB.replay_pet(pet_id)
+        if replayed is None:
+            return {"petId": pet_id, "status": "no_snapshot", "version": current.version}
+
+        stored = current.model_dump()
+        drift = [field for field in PROJECTION_FIELDS if projection_value(stored.get(field)) != projection_value(replayed.get(field))]
+        report = {
+            "petId": pet_id,
+            "version": current.version,
+            "replayedVersion": replayed["version"],
+            "gaps": replayed["gaps"],
+            "drift": drift
+        }
+        if (replayed["version"] != current.version or replayed["gaps"]) and not force:
+            report["status"] = "incomplete"
+        elif not drift:
+            report["status"] = "in_sync"
+        elif dry_run:
+            report["status"] = "drifted"
+        else:
+            def restore(document: dict) -> Optional[dict]:
+                if document.get("version") != current.version:
+                    return None
+                return {field: replayed[field] for field in drift}
+
+            rebuilt = await storage.pets.update_versioned(pet_id, restore)
+            report["status"] = "rebuilt" if rebuilt and rebuilt.version > current.version else "moved_on"
+        return report
+
+    @staticmethod
+    def interaction_log_stats() -> Dict:
+        return storage.interactions.stats()
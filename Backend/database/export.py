@@ -0,0 +1,120 @@
+import json
+import zlib
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Optional, Union
+from bson import ObjectId
+from .memory_records import memory_view
+
+# What each export covers; secrets and bulky fields are projected away server-side
+EXPORT_SOURCES = {
+    "users": {"collection": "users", "projection": {"hashed_password": 0}},
+    "pets": {"collection": "pets", "projection": {"memoryLog": 0}},
+    "memories": {"collection": "pets", "projection": {"_id": 1, "userId": 1, "memoryLog": 1}},
+}
+
+DEFAULT_EXPORT_BATCH_SIZE = 500
+MAX_EXPORT_BATCH_SIZE = 5000
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def to_ndjson(document: Dict[str, Any]) -> str:
+    return json.dumps(document, default=_json_default, separators=(",", ":")) + "\n"
+
+
+def parse_checkpoint(value: Optional[str]) -> Optional[Union[ObjectId, str]]:
+    """Turn a checkpoint string back into the _id it came from"""
+    if not value:
+        return None
+    return ObjectId(value) if ObjectId.is_valid(value) else value
+
+
+def _after_filter(last_id: Union[ObjectId, str, None]) -> Dict[str, Any]:
+    if last_id is None:
+        return {}
+    if isinstance(last_id, str):
+        # String ids sort before ObjectIds, so resuming from one must also pick up every ObjectId
+        return {"$or": [{"_id": {"$gt": last_id}}, {"_id": {"$type": "objectId"}}]}
+    return {"_id": {"$gt": last_id}}
+
+
+async def iter_documents(collection, projection: Dict[str, int], after: Optional[Union[ObjectId, str]] = None,
+                         batch_size: int = DEFAULT_EXPORT_BATCH_SIZE,
+                         query: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+    """Page through a collection (or the documents matching query) in _id order, holding at most one batch in memory.
+
+    Each page is a fresh keyset query (_id > last seen), so an export can be
+    resumed from any _id it has already emitted.
+    """
+    batch_size = max(1, min(batch_size, MAX_EXPORT_BATCH_SIZE))
+    last_id = after
+    while True:
+        page_filter = _after_filter(last_id)
+        if query:
+            page_filter = {"$and": [query, page_filter]} if page_filter else query
+        cursor = collection.find(page_filter, projection).sort("_id", 1).limit(batch_size).batch_size(batch_size)
+        count = 0
+        async for document in cursor:
+            count += 1
+            last_id = document["_id"]
+            yield document
+        if count < batch_size:
+            return
+
+
+async def export_records(db, source: str, after: Optional[str] = None,
+                         batch_size: int = DEFAULT_EXPORT_BATCH_SIZE) -> AsyncIterator[Dict[str, Any]]:
+    """Yield export records for a source; every record carries its checkpoint id.
+
+    Memories are flattened to one record per entry and checkpointed by the
+    owning pet, so a resumed export restarts at the next pet.
+    """
+    if source not in EXPORT_SOURCES:
+        raise ValueError(f"Unknown export source: {source}")
+    spec = EXPORT_SOURCES[source]
+    documents = iter_documents(db[spec["collection"]], spec["projection"], parse_checkpoint(after), batch_size)
+
+    async for document in documents:
+        if source != "memories":
+            document["_checkpoint"] = str(document["_id"])
+            yield document
+            continue
+        pet_id = str(document["_id"])
+        for index, memory in enumerate(document.get("memoryLog") or []):
+            view = memory_view(memory)
+            yield {
+                "petId": pet_id,
+                "userId": document.get("userId"),
+                "index": index,
+                "memory": view.pop("text"),
+                **view,
+                "_checkpoint": pet_id
+            }
+
+
+async def ndjson_chunks(records: AsyncIterator[Dict[str, Any]], chunk_lines: int = 200) -> AsyncIterator[bytes]:
+    """Group NDJSON lines into chunks so the response isn't one write per record"""
+    lines = []
+    async for record in records:
+        lines.append(to_ndjson(record))
+        if len(lines) >= chunk_lines:
+            yield "".join(lines).encode("utf-8")
+            lines = []
+    if lines:
+        yield "".join(lines).encode("utf-8")
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes], level: int = 6) -> AsyncIterator[bytes]:
+    """Compress a byte stream incrementally into a single gzip member"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,269 @@
+import copy
+import os
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError
+from .pet_actions import fold_pet_actions, clamp_battery, MAX_BATTERY_LEVEL
+from .memory_compaction import append_memories
+
+# Interaction writes take a full snapshot of the pet every this many versions, bounding a replay's tail
+INTERACTION_SNAPSHOT_EVERY = int(os.getenv("INTERACTION_SNAPSHOT_EVERY", "50"))
+
+# What an event can be; anything else that changes a pet is recorded as a snapshot instead
+INTERACTION_EVENT_TYPES = ("feed", "play", "teach", "chat", "decay")
+
+# Pet fields the events determine, and so the fields a projection rebuild rewrites
+PROJECTION_FIELDS = ("batteryLevel", "mood", "level", "interactionCount", "lastFed", "lastInteraction", "memoryLog")
+
+
+def action_events(actions: List[Dict[str, Any]], folded: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Events for the actions fold_pet_actions applied, at the times it settled on"""
+    return [
+        {"type": action["type"], "at": memory["t"], "message": action.get("message")}
+        for action, memory in zip(actions, folded["memories"][:folded["applied"]])
+    ]
+
+
+def chat_event(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Event for an applied outbox entry"""
+    return {
+        "type": "chat",
+        "at": entry["createdAt"],
+        "outboxId": entry["_id"],
+        "batteryDelta": entry.get("batteryDelta", 0),
+        "interactions": entry.get("interactions", 0),
+        "memories": entry.get("memories", [])
+    }
+
+
+def decay_event(fields: Dict[str, Any], at: Optional[datetime] = None) -> Dict[str, Any]:
+    """Event for neglect setting mood and battery"""
+    return {"type": "decay", "at": at or datetime.now(timezone.utc), "fields": fields}
+
+
+def _as_utc(value: datetime) -> datetime:
+    # MongoDB hands back naive UTC datetimes
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def projection_value(value: Any) -> Any:
+    """A field value as every store round-trips it: UTC datetimes at BSON's millisecond precision"""
+    if isinstance(value, datetime):
+        value = _as_utc(value)
+        return value.replace(microsecond=value.microsecond // 1000 * 1000)
+    if isinstance(value, dict):
+        return {key: projection_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [projection_value(item) for item in value]
+    return value
+
+
+def apply_event(state: Dict[str, Any], event: Dict[str, Any]) -> Dict[str, Any]:
+    """Apply one event to a pet document in place, as the write that logged it did"""
+    at = _as_utc(event["at"])
+    if event["type"] in ("feed", "play", "teach"):
+        action = {"type": event["type"], "message": event.get("message"), "clientTimestamp": at}
+        folded = fold_pet_actions(state, [action], now=at)
+        if folded["applied"]:
+            state.update(folded["set"])
+            for field, delta in folded["inc"].items():
+                state[field] = (state.get(field) or 0) + delta
+            state["memoryLog"] = append_memories(state.get("memoryLog") or [], folded["memories"])
+    elif event["type"] == "chat":
+        battery = state.get("batteryLevel")
+        battery = MAX_BATTERY_LEVEL if battery is None else battery
+        state["batteryLevel"] = clamp_battery(battery + event.get("batteryDelta", 0))
+        state["interactionCount"] = (state.get("interactionCount") or 0) + event.get("interactions", 0)
+        state["memoryLog"] = append_memories(state.get("memoryLog") or [], event.get("memories", []), at)
+        last_interaction = state.get("lastInteraction")
+        if last_interaction is None or _as_utc(last_interaction) < at:
+            state["lastInteraction"] = at
+    elif event["type"] == "decay":
+        state.update(event["fields"])
+    else:
+        raise ValueError(f"Unknown interaction event type: {event['type']}")
+    state["version"] = event["seq"]
+    return state
+
+
+def replay_events(state: Dict[str, Any], events: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """A snapshot's state with the events after it applied in (seq, n) order"""
+    state = copy.deepcopy(state)
+    for event in sorted(events, key=lambda event: (event["seq"], event.get("n", 0))):
+        apply_event(state, event)
+    return state
+
+
+class InteractionLog(ABC):
+    """Append-only history of a pet's interactions, with periodic full snapshots.
+
+    An event's seq is the pet version its write produced (events from one
+    batched write share it and are ordered by n). Every other write that
+    changes a pet stores a snapshot instead, so the state at any version is
+    the latest snapshot at or before it plus the events after.
+    """
+
+    def __init__(self, snapshot_every: int = INTERACTION_SNAPSHOT_EVERY):
+        self.snapshot_every = snapshot_every
+        self._events = 0
+        self._snapshots = 0
+        self._failures = 0
+
+    @abstractmethod
+    async def ensure_indexes(self) -> None: ...
+
+    @abstractmethod
+    async def _append(self, events: List[Dict[str, Any]]) -> None:
+        """Insert events, ignoring any already logged under the same (petId, seq, n)"""
+
+    @abstractmethod
+    async def _save_snapshot(self, snapshot: Dict[str, Any]) -> None:
+        """Store a snapshot, replacing one with the same (petId, seq)"""
+
+    @abstractmethod
+    async def latest_snapshot(self, pet_id: str, seq: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """The pet's newest snapshot at or before seq (or at all)"""
+
+    @abstractmethod
+    async def events(self, pet_id: str, after: int = -1, until: Optional[int] = None) -> List[Dict[str, Any]]:
+        """The pet's events with after < seq <= until, in (seq, n) order"""
+
+    async def record(self, pet: Any, events: List[Dict[str, Any]]) -> None:
+        """Log the events of writes that left the pet at pet.version, with a snapshot when one is due.
+
+        Events are stamped with pet.version unless they carry the seq of an
+        earlier write (a bulk write reports several at once). A write
+        without events is recorded as a snapshot. Failures are counted and
+        printed rather than failing the write that already landed; replay
+        reports the gap.
+        """
+        try:
+            stamped, positions = [], {}
+            for event in events:
+                seq = event.get("seq", pet.version)
+                positions[seq] = positions.get(seq, -1) + 1
+                stamped.append({**event, "petId": str(pet.id), "seq": seq, "n": positions[seq]})
+            if stamped:
+                await self._append(stamped)
+                self._events += len(stamped)
+            first = min(positions, default=pet.version)
+            # Snapshot the first logged write, and whenever the writes crossed a multiple of snapshot_every
+            if not stamped or first == 1 or (first - 1) // self.snapshot_every < pet.version // self.snapshot_every:
+                await self.snapshot(pet)
+        except Exception as e:
+            self._failures += 1
+            print(f"[EVENTS] Could not log write {pet.version} of pet {pet.id}: {str(e)}")
+
+    async def snapshot(self, pet: Any) -> None:
+        """Store the pet's full state at its current version"""
+        state = pet.model_dump(by_alias=True)
+        await self._save_snapshot({
+            "petId": str(pet.id),
+            "seq": pet.version,
+            "takenAt": datetime.now(timezone.utc),
+            "state": state
+        })
+        self._snapshots += 1
+
+    async def materialize(self, pet_id: str, seq: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """The pet document at version seq (default: the newest logged), or None without a snapshot to start from.
+
+        The result's "gaps" lists versions the log has no record of, e.g.
+        writes made straight to the collection or lost log inserts.
+        """
+        snapshot = await self.latest_snapshot(pet_id, seq)
+        if snapshot is None:
+            return None
+        tail = await self.events(pet_id, snapshot["seq"], seq)
+        state = replay_events(snapshot["state"], tail)
+        state["_id"] = pet_id
+        logged = {snapshot["seq"]} | {event["seq"] for event in tail}
+        state["gaps"] = [version for version in range(snapshot["seq"], state["version"] + 1) if version not in logged]
+        return state
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "events": self._events,
+            "snapshots": self._snapshots,
+            "failures": self._failures,
+            "snapshot_every": self.snapshot_every
+        }
+
+
+class InMemoryInteractionLog(InteractionLog):
+    """Events and snapshots in lists, for tests and the memory storage backend"""
+
+    def __init__(self, snapshot_every: int = INTERACTION_SNAPSHOT_EVERY):
+        super().__init__(snapshot_every)
+        self.logged: Dict[tuple, Dict[str, Any]] = {}
+        self.snapshots: Dict[tuple, Dict[str, Any]] = {}
+
+    async def ensure_indexes(self) -> None:
+        pass
+
+    async def _append(self, events: List[Dict[str, Any]]) -> None:
+        for event in events:
+            self.logged.setdefault((event["petId"], event["seq"], event["n"]), copy.deepcopy(event))
+
+    async def _save_snapshot(self, snapshot: Dict[str, Any]) -> None:
+        self.snapshots[(snapshot["petId"], snapshot["seq"])] = copy.deepcopy(snapshot)
+
+    async def latest_snapshot(self, pet_id: str, seq: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        candidates = [
+            snapshot for (snapshot_pet_id, snapshot_seq), snapshot in self.snapshots.items()
+            if snapshot_pet_id == pet_id and (seq is None or snapshot_seq <= seq)
+        ]
+        return copy.deepcopy(max(candidates, key=lambda snapshot: snapshot["seq"])) if candidates else None
+
+    async def events(self, pet_id: str, after: int = -1, until: Optional[int] = None) -> List[Dict[str, Any]]:
+        return [
+            copy.deepcopy(self.logged[key]) for key in sorted(self.logged)
+            if key[0] == pet_id and key[1] > after and (until is None or key[1] <= until)
+        ]
+
+
+class MongoInteractionLog(InteractionLog):
+    """Events in the interactions collection and snapshots in pet_snapshots"""
+
+    def __init__(self, events_collection, snapshots_collection, snapshot_every: int = INTERACTION_SNAPSHOT_EVERY):
+        super().__init__(snapshot_every)
+        self.events_collection = events_collection
+        self.snapshots_collection = snapshots_collection
+
+    async def ensure_indexes(self) -> None:
+        # Unique, so a write retried after a lost acknowledgement can't log its events twice
+        await self.events_collection.create_index(
+            [("petId", ASCENDING), ("seq", ASCENDING), ("n", ASCENDING)], unique=True, name="petId_seq_n"
+        )
+        await self.snapshots_collection.create_index(
+            [("petId", ASCENDING), ("seq", DESCENDING)], unique=True, name="petId_seq"
+        )
+
+    async def _append(self, events: List[Dict[str, Any]]) -> None:
+        try:
+            # One insert per write, however many actions it applied
+            await self.events_collection.insert_many(events, ordered=False)
+        except BulkWriteError as e:
+            # Duplicates of events already logged are fine; anything else isn't
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+
+    async def _save_snapshot(self, snapshot: Dict[str, Any]) -> None:
+        await self.snapshots_collection.replace_one(
+            {"petId": snapshot["petId"], "seq": snapshot["seq"]}, snapshot, upsert=True
+        )
+
+    async def latest_snapshot(self, pet_id: str, seq: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        query = {"petId": pet_id}
+        if seq is not None:
+            query["seq"] = {"$lte": seq}
+        return await self.snapshots_collection.find_one(query, sort=[("seq", DESCENDING)])
+
+    async def events(self, pet_id: str, after: int = -1, until: Optional[int] = None) -> List[Dict[str, Any]]:
+        seq = {"$gt": after}
+        if until is not None:
+            seq["$lte"] = until
+        cursor = self.events_collection.find({"petId": pet_id, "seq": seq}).sort([("seq", ASCENDING), ("n", ASCENDING)])
+        return await cursor.to_list(None)
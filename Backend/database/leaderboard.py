@@ -0,0 +1,245 @@
+import asyncio
+import os
+import time
+from bisect import bisect_left, insort
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+# Pets each worker keeps ranked in memory (the most /leaderboard can return)
+LEADERBOARD_SIZE = int(os.getenv("LEADERBOARD_SIZE", "100"))
+# How often the materialized leaderboard collection is rebuilt from the pets collection
+LEADERBOARD_REFRESH_SECONDS = int(os.getenv("LEADERBOARD_REFRESH_SECONDS", "300"))
+
+# Compound index the materialization sorts on, so the rebuild is an index walk rather than a sort
+LEADERBOARD_INDEX = "level_interactionCount_leaderboard"
+
+ENTRY_FIELDS = ("name", "species", "userId", "level", "interactionCount")
+
+
+def leaderboard_entry(pet: Any) -> Dict[str, Any]:
+    """The fields of a pet the leaderboard ranks and shows"""
+    entry = {"petId": str(pet.id)}
+    for field in ENTRY_FIELDS:
+        entry[field] = getattr(pet, field, None)
+    entry["level"] = entry["level"] or 0
+    entry["interactionCount"] = entry["interactionCount"] or 0
+    return entry
+
+
+def sort_key(entry: Dict[str, Any]) -> Tuple[int, int, str]:
+    # Ascending order of this key is leaderboard order; the pet id breaks ties like _id does in MongoDB
+    return (-entry["level"], -entry["interactionCount"], entry["petId"])
+
+
+def leaderboard_pipeline(output_collection: str, refreshed_at: datetime) -> List[Dict[str, Any]]:
+    """Rank every pet and replace the materialized leaderboard collection with the result"""
+    return [
+        {"$setWindowFields": {
+            "sortBy": {"level": -1, "interactionCount": -1, "_id": 1},
+            "output": {"rank": {"$documentNumber": {}}}
+        }},
+        {"$project": {
+            "_id": {"$toString": "$_id"},
+            "rank": 1,
+            "name": 1,
+            "species": 1,
+            "userId": 1,
+            "level": {"$ifNull": ["$level", 0]},
+            "interactionCount": {"$ifNull": ["$interactionCount", 0]},
+            "refreshedAt": {"$literal": refreshed_at}
+        }},
+        # $out swaps the collection in atomically and keeps its indexes
+        {"$out": output_collection}
+    ]
+
+
+class TopK:
+    """The highest-ranked pets, capped at `capacity`, kept sorted for O(log k) rank lookups"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._keys: List[Tuple[int, int, str]] = []
+        self._entries: Dict[str, Dict[str, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, pet_id: str) -> bool:
+        return pet_id in self._entries
+
+    def update(self, entry: Dict[str, Any]) -> bool:
+        """Insert or move a pet; returns whether it is on the board afterwards"""
+        key = sort_key(entry)
+        if entry["petId"] in self._entries:
+            self._discard(entry["petId"])
+        elif len(self._keys) >= self.capacity and key >= self._keys[-1]:
+            return False
+        insort(self._keys, key)
+        self._entries[entry["petId"]] = entry
+        if len(self._keys) > self.capacity:
+            del self._entries[self._keys.pop()[2]]
+        return entry["petId"] in self._entries
+
+    def remove(self, pet_id: str) -> None:
+        if pet_id in self._entries:
+            self._discard(pet_id)
+
+    def _discard(self, pet_id: str) -> None:
+        entry = self._entries.pop(pet_id)
+        del self._keys[bisect_left(self._keys, sort_key(entry))]
+
+    def replace(self, entries: List[Dict[str, Any]]) -> None:
+        self._entries = {entry["petId"]: entry for entry in entries}
+        self._keys = sorted(sort_key(entry) for entry in self._entries.values())
+        for _, _, pet_id in self._keys[self.capacity:]:
+            del self._entries[pet_id]
+        del self._keys[self.capacity:]
+
+    def rank(self, pet_id: str) -> Optional[int]:
+        entry = self._entries.get(pet_id)
+        if entry is None:
+            return None
+        return bisect_left(self._keys, sort_key(entry)) + 1
+
+    def top(self, limit: int) -> List[Dict[str, Any]]:
+        return [
+            {**self._entries[pet_id], "rank": position + 1}
+            for position, (_, _, pet_id) in enumerate(self._keys[:limit])
+        ]
+
+    def entries(self) -> List[Dict[str, Any]]:
+        return list(self._entries.values())
+
+
+class Leaderboard:
+    """Top pets by level, then interaction count.
+
+    Each worker keeps the top LEADERBOARD_SIZE pets in memory and moves a pet
+    on every write it sees. Every pet's rank is materialized into a collection
+    on a timer, which is also where workers pick up each other's writes and
+    correct the rare pet whose score went down (levels and interaction counts
+    otherwise only grow).
+    """
+
+    def __init__(self, pets_collection, collection, size: int = LEADERBOARD_SIZE, refresh_seconds: int = LEADERBOARD_REFRESH_SECONDS):
+        self.pets_collection = pets_collection
+        self.collection = collection
+        self.size = size
+        self.refresh_seconds = refresh_seconds
+        self.top_k = TopK(size)
+        self._lock: Optional[asyncio.Lock] = None
+        self._refreshed_at: Optional[datetime] = None
+        self._ranked = 0
+        self._recorded = 0
+        self._materializations = 0
+        self._materialize_ms: Optional[float] = None
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        # Created lazily so it binds to the running event loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def ensure_indexes(self) -> None:
+        await self.pets_collection.create_index(
+            [("level", -1), ("interactionCount", -1), ("_id", 1)],
+            name=LEADERBOARD_INDEX
+        )
+        await self.collection.create_index("rank")
+        await self.collection.create_index("userId")
+
+    def record(self, pet: Any) -> None:
+        """Move a just-written pet on the in-memory board; O(log k) when it doesn't make the cut"""
+        self._recorded += 1
+        self.top_k.update(leaderboard_entry(pet))
+
+    def remove(self, pet_id: str) -> None:
+        self.top_k.remove(pet_id)
+
+    async def materialize(self) -> None:
+        started = time.perf_counter()
+        refreshed_at = datetime.now(timezone.utc)
+        cursor = self.pets_collection.aggregate(
+            leaderboard_pipeline(self.collection.name, refreshed_at),
+            allowDiskUse=True
+        )
+        await cursor.to_list(length=None)
+        self._materialize_ms = round((time.perf_counter() - started) * 1000, 1)
+        self._materializations += 1
+        print(f"[LEADERBOARD] Materialized leaderboard in {self._materialize_ms}ms")
+
+    async def load(self) -> None:
+        """Replace the in-memory board with the top of the materialized collection"""
+        documents = await self.collection.find().sort("rank", 1).limit(self.size).to_list(self.size)
+        self.top_k.replace([
+            {"petId": document["_id"], **{field: document.get(field) for field in ENTRY_FIELDS}}
+            for document in documents
+        ])
+        if documents:
+            self._refreshed_at = documents[0]["refreshedAt"].replace(tzinfo=timezone.utc)
+        else:
+            self._refreshed_at = datetime.now(timezone.utc)
+        self._ranked = await self.collection.estimated_document_count()
+
+    async def refresh(self) -> None:
+        """Rebuild the materialized collection unless another worker just did, then reload from it"""
+        async with self.lock:
+            latest = await self.collection.find_one({"rank": 1}, {"refreshedAt": 1})
+            if latest is not None:
+                age = datetime.now(timezone.utc) - latest["refreshedAt"].replace(tzinfo=timezone.utc)
+                fresh = age.total_seconds() < self.refresh_seconds / 2
+            else:
+                fresh = False
+            if not fresh:
+                await self.materialize()
+            await self.load()
+
+    async def run_refresh_loop(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[LEADERBOARD] Refresh failed: {str(e)}")
+            await asyncio.sleep(self.refresh_seconds)
+
+    async def _ensure_loaded(self) -> None:
+        if self._refreshed_at is None:
+            async with self.lock:
+                # Another request may have loaded it while we waited
+                if self._refreshed_at is None:
+                    await self.load()
+
+    async def top(self, limit: int) -> List[Dict[str, Any]]:
+        await self._ensure_loaded()
+        return self.top_k.top(limit)
+
+    async def user_ranks(self, user_id: str) -> List[Dict[str, Any]]:
+        """Rank of each of a user's pets: live from memory when on the board, else from the materialized collection"""
+        await self._ensure_loaded()
+        ranks = {
+            entry["petId"]: {**entry, "rank": self.top_k.rank(entry["petId"]), "live": True}
+            for entry in self.top_k.entries() if entry["userId"] == user_id
+        }
+        async for document in self.collection.find({"userId": user_id}):
+            if document["_id"] not in ranks:
+                ranks[document["_id"]] = {
+                    "petId": document["_id"],
+                    **{field: document.get(field) for field in ENTRY_FIELDS},
+                    "rank": document["rank"],
+                    "live": False
+                }
+        return sorted(ranks.values(), key=lambda entry: entry["rank"])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tracked": len(self.top_k),
+            "capacity": self.size,
+            "ranked_pets": self._ranked,
+            "recorded": self._recorded,
+            "materializations": self._materializations,
+            "materialize_ms": self._materialize_ms,
+            "refreshed_at": self._refreshed_at.isoformat() if self._refreshed_at else None
+        }
@@ -0,0 +1,258 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import bson
+from pymongo import ReturnDocument
+from .memory_records import MEMORY_KINDS, Memory, is_record, memory_count, parse_memory
+
+# Pets read per batch by the compaction job
+MEMORY_COMPACTION_BATCH_SIZE = int(os.getenv("MEMORY_COMPACTION_BATCH_SIZE", "200"))
+# How often workers run the compaction job (0 leaves it to compact_memories.py)
+MEMORY_COMPACTION_SECONDS = int(os.getenv("MEMORY_COMPACTION_SECONDS", "0"))
+
+# Kinds logged identically on every feed and play; only these are merged
+EVENT_KINDS = frozenset({MEMORY_KINDS["feed"], MEMORY_KINDS["play"]})
+
+# Pets with an entry from before memory records: a plain string or a {text, count, ...} entry
+LEGACY_MEMORY_QUERY = {"$or": [{"memoryLog": {"$type": "string"}}, {"memoryLog.text": {"$exists": True}}]}
+
+
+def event_kind(memory: Memory) -> Optional[int]:
+    """Kind code of a feed or play memory, None for anything else"""
+    kind = parse_memory(memory)["k"]
+    return kind if kind in EVENT_KINDS else None
+
+
+def merge_events(entry: Dict[str, Any], other: Dict[str, Any]) -> Dict[str, Any]:
+    """One counted record standing for two records of the same event"""
+    merged = {"k": entry["k"], "n": memory_count(entry) + memory_count(other)}
+    firsts = [record.get("s", record.get("t")) for record in (entry, other)]
+    lasts = [record.get("t") for record in (entry, other)]
+    firsts = [at for at in firsts if at is not None]
+    lasts = [at for at in lasts if at is not None]
+    if firsts:
+        merged["s"] = min(firsts)
+    if lasts:
+        merged["t"] = max(lasts)
+    return merged
+
+
+def compact_memories(memories: List[Memory]) -> List[Memory]:
+    """Merge identical event memories into counted, time-ranged records.
+
+    Events are merged within each stretch between other memories (chats,
+    lessons, notes), which stay exactly where they were, so the log still
+    reads in order. Within a stretch, merged events keep the order in which
+    they first appeared; events with nothing to merge are left untouched.
+    """
+    compacted: List[Memory] = []
+    stretch: Dict[int, int] = {}
+    for memory in memories:
+        kind = event_kind(memory)
+        if kind is None:
+            compacted.append(memory)
+            stretch = {}
+        elif kind in stretch:
+            position = stretch[kind]
+            compacted[position] = merge_events(parse_memory(compacted[position]), parse_memory(memory))
+        else:
+            stretch[kind] = len(compacted)
+            compacted.append(memory)
+    return compacted
+
+
+def migrate_memories(memories: List[Memory]) -> List[Memory]:
+    """The memory log with every legacy entry parsed into a record"""
+    return [parse_memory(memory) for memory in memories]
+
+
+def new_memory_entries(memories: List[Memory], now: Optional[datetime] = None) -> List[Memory]:
+    """Records about to be appended, stamped if they carry no time and compacted among themselves.
+
+    Legacy strings are still accepted (outbox entries queued before records)
+    and parsed on the way in.
+    """
+    now = now or datetime.now(timezone.utc)
+    records = []
+    for memory in memories:
+        record = dict(parse_memory(memory))
+        record.setdefault("t", now)
+        records.append(record)
+    return compact_memories(records)
+
+
+def append_memories_expression(memories: List[Memory], now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Pipeline expression appending memories to memoryLog, compacting on write.
+
+    When the first new memory is an event and the log already ends with a
+    record of the same kind, that record's count and time are bumped instead
+    of a new one being appended. Whatever is stored, this runs inside the same
+    atomic update as the rest of the interaction.
+    """
+    entries = new_memory_entries(memories, now)
+    log = {"$ifNull": ["$memoryLog", []]}
+    appended = [{"$literal": entry} for entry in entries]
+    if not entries or entries[0]["k"] not in EVENT_KINDS:
+        return {"$concatArrays": [log, appended]}
+
+    first = entries[0]
+    merged = {
+        "k": {"$literal": first["k"]},
+        "n": {"$add": [{"$ifNull": ["$$last.n", 1]}, memory_count(first)]},
+        "s": {"$ifNull": ["$$last.s", {"$ifNull": ["$$last.t", {"$literal": first.get("s", first["t"])}]}]},
+        "t": {"$literal": first["t"]}
+    }
+    return {"$let": {
+        "vars": {"log": log, "last": {"$arrayElemAt": [log, -1]}},
+        "in": {"$cond": [
+            # Legacy strings and {text, ...} entries have no "k" and never match
+            {"$eq": ["$$last.k", first["k"]]},
+            {"$concatArrays": [
+                {"$slice": ["$$log", {"$subtract": [{"$size": "$$log"}, 1]}]},
+                [merged],
+                appended[1:]
+            ]},
+            {"$concatArrays": ["$$log", appended]}
+        ]}
+    }}
+
+
+def append_memories(log: List[Memory], memories: List[Memory], now: Optional[datetime] = None) -> List[Memory]:
+    """The log after append_memories_expression, for stores that update documents in Python"""
+    entries = new_memory_entries(memories, now)
+    last = log[-1] if log else None
+    if not entries or not is_record(last) or last["k"] != entries[0]["k"] or entries[0]["k"] not in EVENT_KINDS:
+        return log + entries
+
+    first = entries[0]
+    merged = {
+        "k": first["k"],
+        "n": last.get("n", 1) + memory_count(first),
+        "s": next(at for at in (last.get("s"), last.get("t"), first.get("s", first["t"])) if at is not None),
+        "t": first["t"]
+    }
+    return log[:-1] + [merged] + entries[1:]
+
+
+def memory_log_bytes(memories: List[Memory]) -> int:
+    """BSON size of a memory log as stored in the pet document"""
+    return len(bson.encode({"memoryLog": memories}))
+
+
+class MemoryCompactor:
+    """Batch job compacting the memory log of every pet.
+
+    Each pet is rewritten with a compare-and-set on its version, so a live
+    write that lands between the read and the rewrite wins and the pet is
+    simply left for the next run. The rewritten document is handed to
+    on_rewritten, which snapshots it into the interaction log so replays
+    start past the rewrite.
+    """
+
+    # Pets the job reads, how it rewrites a log, and how it reports them
+    query: Dict[str, Any] = {"memoryLog.1": {"$exists": True}}
+    rewritten_field = "pets_compacted"
+    log_prefix = "[COMPACTION]"
+
+    def __init__(self, collection, on_compacted: Optional[Callable[[str], None]] = None, batch_size: int = MEMORY_COMPACTION_BATCH_SIZE,
+                 on_rewritten: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None):
+        self.collection = collection
+        self.on_compacted = on_compacted
+        self.on_rewritten = on_rewritten
+        self.batch_size = batch_size
+        self.last_run: Optional[Dict[str, Any]] = None
+        self._runs = 0
+        self._bytes_reclaimed = 0
+
+    def rewrite(self, memories: List[Memory]) -> List[Memory]:
+        return compact_memories(memories)
+
+    async def compact_pet(self, document: Dict[str, Any]) -> Optional[Dict[str, int]]:
+        """Rewrite one pet document: sizes if it was rewritten, a conflict if a live write won, None if unchanged"""
+        memories = document.get("memoryLog") or []
+        compacted = self.rewrite(memories)
+        if compacted == memories:
+            return None
+        rewritten = await self.collection.find_one_and_update(
+            {"_id": document["_id"], "version": document.get("version")},
+            {"$set": {"memoryLog": compacted}, "$inc": {"version": 1}},
+            return_document=ReturnDocument.AFTER
+        )
+        if rewritten is None:
+            return {"conflict": 1}
+        if self.on_rewritten:
+            await self.on_rewritten(rewritten)
+        if self.on_compacted:
+            self.on_compacted(str(document["_id"]))
+        return {
+            "entries_removed": len(memories) - len(compacted),
+            "bytes_before": memory_log_bytes(memories),
+            "bytes_after": memory_log_bytes(compacted)
+        }
+
+    async def run(self) -> Dict[str, Any]:
+        """Rewrite every pet the job's query matches and report what was reclaimed"""
+        started = time.perf_counter()
+        report = {
+            "pets_scanned": 0,
+            self.rewritten_field: 0,
+            "conflicts": 0,
+            "entries_removed": 0,
+            "bytes_before": 0,
+            "bytes_after": 0
+        }
+        cursor = self.collection.find(
+            self.query,
+            {"memoryLog": 1, "version": 1}
+        ).sort("_id", 1).batch_size(self.batch_size)
+        async for document in cursor:
+            report["pets_scanned"] += 1
+            outcome = await self.compact_pet(document)
+            if outcome is None:
+                continue
+            if outcome.get("conflict"):
+                report["conflicts"] += 1
+                continue
+            report[self.rewritten_field] += 1
+            for field in ("entries_removed", "bytes_before", "bytes_after"):
+                report[field] += outcome[field]
+
+        report["bytes_reclaimed"] = report["bytes_before"] - report["bytes_after"]
+        report["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        report["finished_at"] = datetime.now(timezone.utc).isoformat()
+        self._runs += 1
+        self._bytes_reclaimed += report["bytes_reclaimed"]
+        self.last_run = report
+        print(f"{self.log_prefix} Rewrote {report[self.rewritten_field]} of {report['pets_scanned']} pets, "
+              f"reclaimed {report['bytes_reclaimed']} bytes ({report['conflicts']} skipped for live writes)")
+        return report
+
+    async def run_loop(self, interval_seconds: int = MEMORY_COMPACTION_SECONDS) -> None:
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await self.run()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"{self.log_prefix} Run failed: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"runs": self._runs, "bytes_reclaimed": self._bytes_reclaimed, "last_run": self.last_run}
+
+
+class MemoryMigrator(MemoryCompactor):
+    """Batch job rewriting legacy memory strings and {text, count, ...} entries as records.
+
+    Same compare-and-set as compaction; until a pet is migrated its legacy
+    entries are parsed on read, so the job can run while the API serves.
+    """
+
+    query = LEGACY_MEMORY_QUERY
+    rewritten_field = "pets_migrated"
+    log_prefix = "[MIGRATION]"
+
+    def rewrite(self, memories: List[Memory]) -> List[Memory]:
+        return migrate_memories(memories)
@@ -0,0 +1,355 @@
+import heapq
+import html
+import math
+import os
+import re
+from collections import Counter, OrderedDict, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+from .memory_records import TEMPLATE_TEXT, memory_text, memory_view
+
+# Pets whose memory index each worker keeps; the least recently searched is dropped first
+MEMORY_SEARCH_HOT_PETS = int(os.getenv("MEMORY_SEARCH_HOT_PETS", "256"))
+# Estimated memory all of a worker's indexes may use together, evicted the same way
+MEMORY_INDEX_BUDGET_MB = float(os.getenv("MEMORY_INDEX_BUDGET_MB", "64"))
+# Memories retrieved into each chat prompt
+CHAT_MEMORY_RESULTS = int(os.getenv("CHAT_MEMORY_RESULTS", "3"))
+
+# Text index over memories: legacy strings and {text} entries, and the text fields of records.
+# The userId prefix confines every $text query to one owner's pets
+MEMORY_TEXT_INDEX = "userId_memory_records_text"
+# Earlier definitions; a collection holds one text index
+LEGACY_MEMORY_TEXT_INDEXES = ("userId_memoryLog_text", "userId_memories_text")
+
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+SNIPPET_CHARS = 160
+# $slice needs an explicit length; no memory log gets near this
+MAX_MEMORY_TAIL = 1000000
+
+# Okapi BM25 term-frequency saturation and length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Rough CPython costs used to estimate index size: a str plus its list slots, one posting
+# entry, and a repeated memory that only adds positions
+MEMORY_OVERHEAD_BYTES = 80
+POSTING_BYTES = 100
+REPEAT_BYTES = 16
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+STOPWORDS = frozenset(
+    "a an and are as at be but by did do for from had has have i i'm in is it it's me my of on or so "
+    "that the this to was we were what when with you your".split()
+)
+
+
+def normalize_token(token: str) -> str:
+    """Drop possessives and plain plurals so "lessons" finds "lesson" """
+    if token.endswith("'s"):
+        token = token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        token = token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    return [
+        normalize_token(token)
+        for token in TOKEN_PATTERN.findall(text.lower())
+        if token not in STOPWORDS
+    ]
+
+
+# Words that only appear in memories through the wording records are rendered with
+TEMPLATE_TERMS = frozenset(tokenize(" ".join(TEMPLATE_TEXT)))
+
+
+def highlight(memory: str, terms: set, width: int = SNIPPET_CHARS) -> str:
+    """HTML snippet of a memory around its first match, with matched words in <mark>"""
+    matches = [m for m in TOKEN_PATTERN.finditer(memory.lower()) if normalize_token(m.group()) in terms]
+    start = 0
+    if matches and len(memory) > width:
+        start = max(0, min(matches[0].start() - width // 4, len(memory) - width))
+    end = min(len(memory), start + width)
+
+    parts = ["…" if start else ""]
+    cursor = start
+    for match in matches:
+        if match.start() < start or match.end() > end:
+            continue
+        parts.append(html.escape(memory[cursor:match.start()]))
+        parts.append(f"<mark>{html.escape(memory[match.start():match.end()])}</mark>")
+        cursor = match.end()
+    parts.append(html.escape(memory[cursor:end]))
+    parts.append("…" if end < len(memory) else "")
+    return "".join(parts)
+
+
+class MemoryIndex:
+    """BM25 inverted index over one pet's memory log, extended as memories are appended.
+
+    Feeds and plays log the same sentence over and over, so each distinct
+    memory text is indexed once and remembers the positions it appears at.
+    """
+
+    def __init__(self, memories: Optional[List[Any]] = None, version: Optional[int] = None):
+        self.memories: List[Any] = []  # log entries as stored: strings or compacted entries
+        self.texts: List[str] = []  # distinct memory texts, the documents BM25 ranks
+        self.positions: List[List[int]] = []  # text -> where it appears in the log, oldest first
+        self.postings: Dict[str, Dict[int, int]] = {}  # term -> {text: term frequency}
+        self.lengths: List[int] = []  # terms per text
+        self.total_length = 0
+        self.size_bytes = 0  # estimated
+        self.version = version
+        self._text_ids: Dict[str, int] = {}
+        for memory in memories or []:
+            self.add(memory)
+
+    def __len__(self) -> int:
+        return len(self.memories)
+
+    def add(self, memory: Any) -> None:
+        position = len(self.memories)
+        text = memory_text(memory)
+        text_id = self._text_ids.get(text)
+        if text_id is not None:
+            # A repeat only costs a list slot; plain strings share the stored copy too
+            self.memories.append(self.texts[text_id] if isinstance(memory, str) else memory)
+            self.positions[text_id].append(position)
+            self.size_bytes += REPEAT_BYTES
+            return
+
+        text_id = len(self.texts)
+        terms = tokenize(text)
+        counts = Counter(terms)
+        self._text_ids[text] = text_id
+        self.memories.append(memory)
+        self.texts.append(text)
+        self.positions.append([position])
+        self.lengths.append(len(terms))
+        self.total_length += len(terms)
+        for term, count in counts.items():
+            self.postings.setdefault(term, {})[text_id] = count
+        self.size_bytes += len(text) + MEMORY_OVERHEAD_BYTES + POSTING_BYTES * len(counts)
+
+    def extend(self, tail: List[Any], start: int, version: Optional[int] = None) -> bool:
+        """Append the log from `start` on, where tail[0] overlaps the last indexed memory.
+
+        Returns False when the log no longer continues what was indexed (it was
+        reset, rewritten or compacted), in which case the index must be rebuilt.
+        Logs are append-only apart from those, so only the overlap is compared,
+        by text: a compacted last entry whose count went up is updated in place.
+        """
+        overlap = len(self.memories) - start
+        if overlap < 0 or len(tail) < overlap:
+            return False
+        if [memory_text(memory) for memory in tail[:overlap]] != [memory_text(memory) for memory in self.memories[start:]]:
+            return False
+        self.memories[start:] = tail[:overlap]
+        for memory in tail[overlap:]:
+            self.add(memory)
+        self.version = version
+        return True
+
+    def sync(self, memories: List[Any], version: Optional[int] = None) -> bool:
+        """Catch up with a full copy of the log; returns False if it needs rebuilding"""
+        start = max(0, len(self.memories) - 1)
+        if len(memories) < len(self.memories):
+            return False
+        return self.extend(memories[start:], start, version)
+
+    def rank_texts(self, query: str, limit: Optional[int] = None) -> List[Tuple[int, float]]:
+        """(text, BM25 score) of distinct texts matching any query term, best first, most recent first on ties.
+
+        Only postings of the query's terms are visited, and with a limit only
+        the top results are selected rather than sorting every match.
+        """
+        count = len(self.texts)
+        if not count:
+            return []
+        average_length = self.total_length / count or 1
+        lengths = self.lengths
+        weighted = []
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting:
+                weighted.append((math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5)), posting))
+        # Rarest terms first. A term adds at most idf * (k1 + 1), so once the k-th best score beats
+        # everything the remaining terms could add, they only need to re-score the current candidates
+        weighted.sort(key=lambda item: -item[0])
+        remaining = sum(idf for idf, _ in weighted) * (BM25_K1 + 1)
+
+        scores: Dict[int, float] = defaultdict(float)
+        for idf, posting in weighted:
+            pruned = limit is not None and len(scores) >= limit and heapq.nlargest(limit, scores.values())[-1] > remaining
+            remaining -= idf * (BM25_K1 + 1)
+            if pruned:
+                matches = [(text_id, posting[text_id]) for text_id in scores if text_id in posting]
+            else:
+                matches = posting.items()
+            for text_id, frequency in matches:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[text_id] / average_length)
+                scores[text_id] += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+
+        positions = self.positions
+
+        def order(item: Tuple[int, float]) -> Tuple[float, int]:
+            return (-item[1], -positions[item[0]][-1])
+
+        if limit is not None:
+            return heapq.nsmallest(limit, scores.items(), key=order)
+        return sorted(scores.items(), key=order)
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[Tuple[int, float]]:
+        """(position, score) of every matching memory, repeats newest first"""
+        results = []
+        for text_id, score in self.rank_texts(query, limit):
+            results.extend((position, score) for position in reversed(self.positions[text_id]))
+            if limit is not None and len(results) >= limit:
+                return results[:limit]
+        return results
+
+    def top_memories(self, query: str, limit: int) -> List[str]:
+        """The most relevant distinct memories, without repeats"""
+        return [self.texts[text_id] for text_id, _ in self.rank_texts(query, limit)]
+
+
+class MemorySearch:
+    """Memory search for every pet: in-process indexes for hot pets, the text index for the rest"""
+
+    def __init__(self, collection, hot_pets: int = MEMORY_SEARCH_HOT_PETS, budget_bytes: int = int(MEMORY_INDEX_BUDGET_MB * 1024 * 1024)):
+        self.collection = collection
+        self.hot_pets = hot_pets
+        self.budget_bytes = budget_bytes
+        self._indexes: "OrderedDict[str, MemoryIndex]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._bytes = 0
+        self._hits = 0
+        self._catch_ups = 0
+        self._builds = 0
+        self._text_misses = 0
+        self._evictions = 0
+
+    async def ensure_indexes(self) -> None:
+        existing = await self.collection.index_information()
+        for legacy in LEGACY_MEMORY_TEXT_INDEXES:
+            if legacy in existing:
+                await self.collection.drop_index(legacy)
+        await self.collection.create_index(
+            [("userId", 1), ("memoryLog", "text"), ("memoryLog.text", "text"), ("memoryLog.u", "text"), ("memoryLog.p", "text")],
+            name=MEMORY_TEXT_INDEX
+        )
+
+    def observe(self, pet: Any) -> None:
+        """Keep a hot pet's index current from a write that already has the full log"""
+        index = self._indexes.get(str(pet.id))
+        if index is None:
+            return
+        if not index.sync(pet.memoryLog, pet.version):
+            index = MemoryIndex(pet.memoryLog, pet.version)
+        self._remember(str(pet.id), index, touch=False)
+
+    def forget(self, pet_id: str) -> None:
+        self._indexes.pop(pet_id, None)
+        self._bytes -= self._sizes.pop(pet_id, 0)
+
+    def _remember(self, pet_id: str, index: MemoryIndex, touch: bool = True) -> None:
+        """Store or re-account an index, then evict least recently used pets until under both caps"""
+        self._indexes[pet_id] = index
+        if touch:
+            self._indexes.move_to_end(pet_id)
+        self._bytes += index.size_bytes - self._sizes.get(pet_id, 0)
+        self._sizes[pet_id] = index.size_bytes
+        while len(self._indexes) > 1 and (len(self._indexes) > self.hot_pets or self._bytes > self.budget_bytes):
+            evicted, _ = self._indexes.popitem(last=False)
+            self._bytes -= self._sizes.pop(evicted)
+            self._evictions += 1
+
+    def relevant(self, pet: Any, query: str, limit: int = CHAT_MEMORY_RESULTS) -> List[str]:
+        """Top memories for a chat message, from a Pet that already carries its full log.
+
+        The index is built on the pet's first chat and only extended after that,
+        so retrieval does no I/O.
+        """
+        pet_id = str(pet.id)
+        index = self._indexes.get(pet_id)
+        if index is None or not index.sync(pet.memoryLog, pet.version):
+            index = MemoryIndex(pet.memoryLog, pet.version)
+            self._builds += 1
+        else:
+            self._hits += 1
+        self._remember(pet_id, index)
+        return index.top_memories(query, limit)
+
+    async def _catch_up(self, pet: Dict[str, Any], index: MemoryIndex) -> MemoryIndex:
+        # Fetch only what was appended since the index was built, plus one memory of overlap
+        start = max(0, len(index) - 1)
+        documents = await self.collection.aggregate([
+            {"$match": {"_id": pet["_id"]}},
+            {"$project": {
+                "version": 1,
+                "tail": {"$slice": [{"$ifNull": ["$memoryLog", []]}, start, MAX_MEMORY_TAIL]}
+            }}
+        ]).to_list(1)
+        if documents and index.extend(documents[0]["tail"], start, documents[0].get("version")):
+            self._catch_ups += 1
+            return index
+        document = await self.collection.find_one({"_id": pet["_id"]}, {"memoryLog": 1, "version": 1})
+        self._builds += 1
+        return MemoryIndex((document or {}).get("memoryLog") or [], (document or {}).get("version"))
+
+    async def index_for(self, pet: Dict[str, Any], query: str) -> Optional[MemoryIndex]:
+        """Index of the pet ({_id, userId, version}), or None if the text index finds nothing to search"""
+        pet_id = str(pet["_id"])
+        index = self._indexes.get(pet_id)
+        if index is not None:
+            if index.version != pet.get("version"):
+                index = await self._catch_up(pet, index)
+            else:
+                self._hits += 1
+        else:
+            # Cold pet: only load and index its memories when the text index says something matches.
+            # Records don't store their template wording ("delicious", "learned"), so those queries skip it
+            query_filter = {"_id": pet["_id"], "userId": pet["userId"]}
+            if not TEMPLATE_TERMS.intersection(tokenize(query)):
+                query_filter["$text"] = {"$search": query}
+            document = await self.collection.find_one(query_filter, {"memoryLog": 1, "version": 1})
+            if document is None:
+                self._text_misses += 1
+                return None
+            index = MemoryIndex(document.get("memoryLog") or [], document.get("version"))
+            self._builds += 1
+        self._remember(pet_id, index)
+        return index
+
+    async def search(self, pet: Dict[str, Any], query: str, offset: int = 0, limit: int = DEFAULT_SEARCH_LIMIT) -> Dict[str, Any]:
+        index = await self.index_for(pet, query)
+        ranked = index.search(query) if index is not None else []
+        terms = set(tokenize(query))
+        return {
+            "total": len(ranked),
+            "offset": offset,
+            "limit": limit,
+            "results": [
+                {
+                    "position": position,
+                    "score": round(score, 4),
+                    "memory": memory_view(index.memories[position]),
+                    "snippet": highlight(memory_text(index.memories[position]), terms)
+                }
+                for position, score in ranked[offset:offset + limit]
+            ]
+        }
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hot_pets": len(self._indexes),
+            "capacity": self.hot_pets,
+            "estimated_bytes": self._bytes,
+            "budget_bytes": self.budget_bytes,
+            "hits": self._hits,
+            "catch_ups": self._catch_ups,
+            "builds": self._builds,
+            "text_misses": self._text_misses,
+            "evictions": self._evictions
+        }
@@ -0,0 +1,184 @@
+import re
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Union
+
+# Kind codes stored in each record's "k"; small ints keep every entry a few bytes smaller
+MEMORY_KINDS = {
+    "note": 0,
+    "chat": 1,
+    "feed": 2,
+    "play": 3,
+    "teach": 4
+}
+KIND_NAMES = {code: name for name, code in MEMORY_KINDS.items()}
+
+# Text of the sentences memories were stored as before records; rendered back from records
+FED_TEXT = "I was fed and it was delicious!"
+PLAYED_TEXT = "We played together and it was fun!"
+LESSON_PREFIX = "I learned about "
+CHAT_PATTERN = re.compile(r"^User said: '(.*)', I replied: '(.*)'\s*$", re.DOTALL)
+
+# Wording every rendered record of a kind shares but no record stores
+TEMPLATE_TEXT = (FED_TEXT, PLAYED_TEXT, LESSON_PREFIX, "User said: I replied:")
+
+# Record fields:
+#   k  kind code (MEMORY_KINDS)
+#   t  when it happened; the latest time for a counted entry
+#   u  the user's side: chat message or lesson topic
+#   p  the pet's side: chat reply or note text
+#   n  how many feeds or plays a counted entry stands for (absent means 1)
+#   s  when a counted entry's first feed or play happened
+Memory = Union[str, Dict[str, Any]]
+
+
+def memory_record(kind: str, at: Optional[datetime] = None, user: Optional[str] = None, pet: Optional[str] = None) -> Dict[str, Any]:
+    """A structured memory record; fields without a value are left out"""
+    record: Dict[str, Any] = {"k": MEMORY_KINDS[kind]}
+    if at is not None:
+        record["t"] = at
+    if user is not None:
+        record["u"] = user
+    if pet is not None:
+        record["p"] = pet
+    return record
+
+
+def chat_record(message: str, reply: str, at: Optional[datetime] = None) -> Dict[str, Any]:
+    return memory_record("chat", at or datetime.now(timezone.utc), user=message, pet=reply)
+
+
+def note_record(text: str, at: Optional[datetime] = None) -> Dict[str, Any]:
+    return memory_record("note", at or datetime.now(timezone.utc), pet=text)
+
+
+def action_record(action_type: str, message: Optional[str] = None, at: Optional[datetime] = None) -> Dict[str, Any]:
+    """The memory a pet records for a feed, play or teach"""
+    if action_type in ("feed", "play"):
+        return memory_record(action_type, at)
+    if action_type == "teach":
+        return memory_record("teach", at, user=message)
+    raise ValueError(f"Unknown action type: {action_type}")
+
+
+def is_record(memory: Any) -> bool:
+    return isinstance(memory, dict) and "k" in memory
+
+
+def _parse_text(text: str) -> Dict[str, Any]:
+    match = CHAT_PATTERN.match(text)
+    if match:
+        return memory_record("chat", user=match.group(1), pet=match.group(2))
+    if text == FED_TEXT:
+        return memory_record("feed")
+    if text == PLAYED_TEXT:
+        return memory_record("play")
+    if text.startswith(LESSON_PREFIX):
+        return memory_record("teach", user=text[len(LESSON_PREFIX):])
+    return memory_record("note", pet=text)
+
+
+def parse_memory(memory: Memory) -> Dict[str, Any]:
+    """The record for any memory log entry.
+
+    Records are returned as they are. Legacy entries are parsed on read: a
+    formatted string, or a counted {text, count, firstAt, lastAt} entry.
+    Legacy strings never carried a timestamp, so their records have no "t".
+    """
+    if is_record(memory):
+        return memory
+    if not isinstance(memory, dict):
+        return _parse_text(memory)
+    record = _parse_text(memory.get("text", ""))
+    if memory.get("count", 1) > 1:
+        record["n"] = memory["count"]
+    if memory.get("firstAt") is not None:
+        record["s"] = memory["firstAt"]
+    if memory.get("lastAt") is not None:
+        record["t"] = memory["lastAt"]
+    return record
+
+
+def memory_count(memory: Memory) -> int:
+    """How many logged memories an entry stands for"""
+    if is_record(memory):
+        return memory.get("n", 1)
+    if isinstance(memory, dict):
+        return memory.get("count", 1)
+    return 1
+
+
+def memory_text(memory: Memory) -> str:
+    """The sentence a memory reads as, for search, prompts and display"""
+    if not is_record(memory):
+        if isinstance(memory, dict):
+            return memory.get("text", "")
+        return memory
+    kind = memory.get("k")
+    if kind == MEMORY_KINDS["chat"]:
+        return f"User said: '{memory.get('u', '')}', I replied: '{memory.get('p', '')}'"
+    if kind == MEMORY_KINDS["feed"]:
+        return FED_TEXT
+    if kind == MEMORY_KINDS["play"]:
+        return PLAYED_TEXT
+    if kind == MEMORY_KINDS["teach"]:
+        return LESSON_PREFIX + memory.get("u", "")
+    return memory.get("p", "")
+
+
+def memory_view(memory: Memory) -> Dict[str, Any]:
+    """A memory with readable field names, for API responses and exports"""
+    record = parse_memory(memory)
+    view = {
+        "kind": KIND_NAMES.get(record["k"], "note"),
+        "at": record.get("t"),
+        "text": memory_text(record)
+    }
+    if "u" in record:
+        view["user"] = record["u"]
+    if "p" in record:
+        view["pet"] = record["p"]
+    if "n" in record:
+        view["count"] = record["n"]
+        view["firstAt"] = record.get("s")
+    return view
+
+
+def record_match(kinds: Optional[List[str]] = None, since: Optional[datetime] = None, until: Optional[datetime] = None) -> Dict[str, Any]:
+    """$elemMatch body for records of the given kinds within [since, until); legacy entries never match"""
+    match: Dict[str, Any] = {"k": {"$in": [MEMORY_KINDS[kind] for kind in kinds]} if kinds else {"$exists": True}}
+    times = {}
+    if since is not None:
+        times["$gte"] = since
+    if until is not None:
+        times["$lt"] = until
+    if times:
+        match["t"] = times
+    return match
+
+
+def record_condition(kinds: Optional[List[str]] = None, since: Optional[datetime] = None, until: Optional[datetime] = None) -> Dict[str, Any]:
+    """The same filter as record_match, as a $filter condition on "$$memory" """
+    if kinds:
+        conditions = [{"$in": ["$$memory.k", [MEMORY_KINDS[kind] for kind in kinds]]}]
+    else:
+        conditions = [{"$ne": [{"$type": "$$memory.k"}, "missing"]}]
+    if since is not None:
+        conditions.append({"$gte": ["$$memory.t", since]})
+    if until is not None:
+        # A missing time sorts below every date, so rule it out explicitly
+        conditions.append({"$ne": [{"$type": "$$memory.t"}, "missing"]})
+        conditions.append({"$lt": ["$$memory.t", until]})
+    return {"$and": conditions}
+
+
+def record_matches(memory: Memory, kinds: Optional[List[str]] = None, since: Optional[datetime] = None,
+                   until: Optional[datetime] = None) -> bool:
+    """The same filter as record_match, for a memory already in hand"""
+    if not is_record(memory):
+        return False
+    if kinds and memory["k"] not in [MEMORY_KINDS[kind] for kind in kinds]:
+        return False
+    at = memory.get("t")
+    if (since is not None or until is not None) and at is None:
+        return False
+    return (since is None or at >= since) and (until is None or at < until)
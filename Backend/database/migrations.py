@@ -0,0 +1,188 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+from bson import ObjectId
+from pymongo import UpdateOne
+from .pet_schema import PET_SCHEMA_VERSION, MOOD_LEVELS, SASS_LEVELS, EVOLUTION_STAGES
+from .export import iter_documents
+
+# Pets upgraded per bulk write by the eager migration
+SCHEMA_MIGRATION_BATCH_SIZE = int(os.getenv("SCHEMA_MIGRATION_BATCH_SIZE", "500"))
+# Pause between batches so a migration doesn't crowd out live traffic
+SCHEMA_MIGRATION_PAUSE_MS = int(os.getenv("SCHEMA_MIGRATION_PAUSE_MS", "100"))
+
+# Checkpoint document for the pets collection in the migrations collection
+PET_MIGRATION_ID = "pets"
+
+# Fields early pets were written without (or with null), and the values the Pet model defaults them to.
+# memoryLog is left out: every write already treats a missing log as empty, and the eager
+# migration never reads the logs, so it can't tell a missing one from a long one
+PET_FIELD_DEFAULTS = {
+    "mood": MOOD_LEVELS["HAPPY"],
+    "level": 1,
+    "sassLevel": SASS_LEVELS["SWEET"],
+    "batteryLevel": 100,
+    "interactionCount": 0,
+    "isPrimary": False,
+    "version": 0
+}
+
+# Pets written with an older layout (documents from before schemaVersion have none)
+OUTDATED_PETS = {"$or": [{"schemaVersion": {"$lt": PET_SCHEMA_VERSION}}, {"schemaVersion": None}]}
+
+
+def _created_time(document: Dict[str, Any]) -> Optional[datetime]:
+    """When the pet was inserted, read from its ObjectId (stores other than MongoDB keep it as a string)"""
+    pet_id = document.get("_id")
+    if isinstance(pet_id, ObjectId):
+        return pet_id.generation_time
+    if isinstance(pet_id, str) and ObjectId.is_valid(pet_id):
+        return ObjectId(pet_id).generation_time
+    return None
+
+
+def _fill_defaults(document: Dict[str, Any]) -> None:
+    """1: pets from early endpoints (/fixed-pet among them) left out fields such as batteryLevel"""
+    for field, default in PET_FIELD_DEFAULTS.items():
+        if document.get(field) is None:
+            document[field] = default
+    # Without timestamps, the pet was last fed and seen when it was created
+    created = _created_time(document)
+    for field in ("lastFed", "lastInteraction"):
+        if document.get(field) is None and created is not None:
+            document[field] = created
+
+
+def _add_evolution_stage(document: Dict[str, Any]) -> None:
+    """2: evolutionStage joined the schema; pets that were never evolved start as babies"""
+    if not document.get("evolutionStage"):
+        document["evolutionStage"] = EVOLUTION_STAGES["BABY"]
+
+
+def _add_created_at(document: Dict[str, Any]) -> None:
+    """3: createdAt orders a user's pets for paginated listing; older pets take it from their _id"""
+    if document.get("createdAt") is None:
+        created = _created_time(document) or document.get("lastInteraction")
+        if created is not None:
+            document["createdAt"] = created
+
+
+# Upgrade steps in order: PET_MIGRATIONS[n] takes a document from schema version n to n + 1.
+# Append a step here and bump PET_SCHEMA_VERSION together; steps must be idempotent
+PET_MIGRATIONS: List[Callable[[Dict[str, Any]], None]] = [
+    _fill_defaults,
+    _add_evolution_stage,
+    _add_created_at
+]
+
+
+def upgrade_pet_document(document: Dict[str, Any]) -> Dict[str, Any]:
+    """Bring a raw pet document up to PET_SCHEMA_VERSION in place and return it.
+
+    Current documents cost one comparison, so every read path can call this
+    instead of defaulting fields itself.
+    """
+    version = document.get("schemaVersion") or 0
+    if version >= PET_SCHEMA_VERSION:
+        return document
+    for step in PET_MIGRATIONS[version:]:
+        step(document)
+    document["schemaVersion"] = PET_SCHEMA_VERSION
+    return document
+
+
+def upgrade_operation(document: Dict[str, Any]) -> UpdateOne:
+    """$set of what upgrading changes, guarded so a pet written since it was read is left alone"""
+    upgraded = upgrade_pet_document(dict(document))
+    changes = {field: value for field, value in upgraded.items() if field not in document or document[field] != value}
+    guard = {"_id": document["_id"], "schemaVersion": document.get("schemaVersion"), "version": document.get("version")}
+    return UpdateOne(guard, {"$set": changes})
+
+
+class SchemaMigrator:
+    """Eager, throttled migration of every outdated pet to PET_SCHEMA_VERSION.
+
+    Pets are read in _id order and upgraded one bulk write per batch. The
+    last _id of each batch is checkpointed, so an interrupted run resumes
+    where it stopped. Until a pet is migrated it is upgraded on every read,
+    so the migration can run at any time while the API serves.
+    """
+
+    def __init__(self, collection, checkpoints, batch_size: int = SCHEMA_MIGRATION_BATCH_SIZE,
+                 pause_ms: int = SCHEMA_MIGRATION_PAUSE_MS):
+        self.collection = collection
+        self.checkpoints = checkpoints
+        self.batch_size = batch_size
+        self.pause_ms = pause_ms
+        self.last_run: Optional[Dict[str, Any]] = None
+        self._runs = 0
+        self._upgraded = 0
+
+    async def checkpoint(self) -> Optional[Any]:
+        """_id to resume after, if a run towards the current version was interrupted"""
+        state = await self.checkpoints.find_one({"_id": PET_MIGRATION_ID})
+        if not state or state.get("targetVersion") != PET_SCHEMA_VERSION or state.get("completedAt"):
+            return None
+        return state.get("lastId")
+
+    async def _save_checkpoint(self, fields: Dict[str, Any]) -> None:
+        await self.checkpoints.update_one(
+            {"_id": PET_MIGRATION_ID},
+            {"$set": {"targetVersion": PET_SCHEMA_VERSION, "updatedAt": datetime.now(timezone.utc), **fields}},
+            upsert=True
+        )
+
+    async def _apply(self, batch: List[Dict[str, Any]], report: Dict[str, Any]) -> None:
+        result = await self.collection.bulk_write([upgrade_operation(document) for document in batch], ordered=False)
+        report["batches"] += 1
+        report["pets_upgraded"] += result.modified_count
+        # Pets written between the read and the bulk write no longer match their guard
+        report["conflicts"] += len(batch) - result.matched_count
+        await self._save_checkpoint({"lastId": batch[-1]["_id"], "completedAt": None})
+        if self.pause_ms:
+            await asyncio.sleep(self.pause_ms / 1000)
+
+    async def run(self, restart: bool = False) -> Dict[str, Any]:
+        """Upgrade every outdated pet, resuming from the checkpoint unless restart is set"""
+        started = time.perf_counter()
+        after = None if restart else await self.checkpoint()
+        report = {
+            "target_version": PET_SCHEMA_VERSION,
+            "resumed_after": str(after) if after is not None else None,
+            "pets_scanned": 0,
+            "pets_upgraded": 0,
+            "conflicts": 0,
+            "batches": 0
+        }
+        batch: List[Dict[str, Any]] = []
+        # Memory logs are never needed to upgrade a pet, and are most of its bytes
+        documents = iter_documents(self.collection, {"memoryLog": 0}, after, self.batch_size, query=OUTDATED_PETS)
+        async for document in documents:
+            report["pets_scanned"] += 1
+            batch.append(document)
+            if len(batch) >= self.batch_size:
+                await self._apply(batch, report)
+                batch = []
+        if batch:
+            await self._apply(batch, report)
+
+        # Pets skipped for live writes are still outdated; the next run starts over and finds them
+        await self._save_checkpoint({"lastId": None, "completedAt": datetime.now(timezone.utc)})
+        report["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        report["finished_at"] = datetime.now(timezone.utc).isoformat()
+        self._runs += 1
+        self._upgraded += report["pets_upgraded"]
+        self.last_run = report
+        print(f"[MIGRATION] Upgraded {report['pets_upgraded']} of {report['pets_scanned']} pets to schema "
+              f"v{PET_SCHEMA_VERSION} in {report['batches']} batches ({report['conflicts']} skipped for live writes)")
+        return report
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "schema_version": PET_SCHEMA_VERSION,
+            "runs": self._runs,
+            "pets_upgraded": self._upgraded,
+            "last_run": self.last_run
+        }
@@ -0,0 +1,211 @@
+import asyncio
+import os
+from datetime import datetime, timezone, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+from bson import ObjectId
+from pymongo import WriteConcern
+from .database import async_db, PetDB
+from .memory_records import Memory
+from .storage import STORAGE_BACKEND
+
+# Entries applied per bulk write
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+# How often the worker checks for entries written by other workers or left by a crash
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "1"))
+# How long a claimed batch is hidden from other workers before it is retried
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "30"))
+# Attempts an entry gets before it is moved to the dead-letter collection
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+
+# Journaled majority writes, so an acknowledged entry survives a primary failover
+outbox_collection = async_db.get_collection(
+    "pet_outbox",
+    write_concern=WriteConcern(w="majority", j=True)
+)
+
+# Entries that kept failing, kept for inspection instead of being retried forever
+dead_letter_collection = async_db["pet_outbox_dead"]
+
+
+def chat_effects(pet_id: str, memory: Memory, battery_delta: int = -3) -> Dict:
+    """Outbox entry for everything a chat changes on the pet"""
+    now = datetime.now(timezone.utc)
+    return {
+        "_id": ObjectId(),
+        "petId": pet_id,
+        "interactions": 1,
+        "batteryDelta": battery_delta,
+        "memories": [memory],
+        "createdAt": now,
+        "availableAt": now,
+        "attempts": 0
+    }
+
+
+class OutboxWorker:
+    """Applies outbox entries in batches: at-least-once delivery, idempotent application"""
+
+    def __init__(
+        self,
+        collection,
+        apply: Callable[[List[Dict]], Awaitable[int]] = PetDB.apply_outbox,
+        batch_size: int = OUTBOX_BATCH_SIZE,
+        poll_seconds: float = OUTBOX_POLL_SECONDS,
+        lease_seconds: float = OUTBOX_LEASE_SECONDS,
+        max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+        dead_letters=None
+    ):
+        self.collection = collection
+        self.apply = apply
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.dead_letters = dead_letters
+        self._wakeup: Optional[asyncio.Event] = None
+        self._enqueued = 0
+        self._applied = 0
+        self._batches = 0
+        self._failures = 0
+        self._dead_lettered = 0
+
+    @property
+    def wakeup(self) -> asyncio.Event:
+        # Created lazily so it binds to the running event loop
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        return self._wakeup
+
+    async def ensure_indexes(self) -> None:
+        await self.collection.create_index([("availableAt", 1), ("_id", 1)])
+        await self.collection.create_index("leaseOwner", sparse=True)
+
+    async def enqueue(self, entry: Dict) -> None:
+        """Durably record an entry (one insert) and wake the worker"""
+        if self.collection is None:
+            # No outbox collection outside MongoDB storage; the store's own write is the durable one
+            await self.apply([entry])
+            self._enqueued += 1
+            self._applied += 1
+            return
+        await self.collection.insert_one(entry)
+        self._enqueued += 1
+        self.wakeup.set()
+
+    async def _claim(self) -> List[Dict]:
+        """Lease one batch of due entries to this call; a concurrent claim can't take the same entries"""
+        now = datetime.now(timezone.utc)
+        due = await self.collection.find(
+            {"availableAt": {"$lte": now}}, {"_id": 1}
+        ).sort("_id", 1).limit(self.batch_size).to_list(self.batch_size)
+        if not due:
+            return []
+
+        # Each entry is leased by whichever claim updates it first: the due filter is checked again
+        # as part of the update, and only entries carrying this claim's token are read back
+        token = ObjectId()
+        await self.collection.update_many(
+            {"_id": {"$in": [entry["_id"] for entry in due]}, "availableAt": {"$lte": now}},
+            {"$set": {"availableAt": now + timedelta(seconds=self.lease_seconds), "leaseOwner": token},
+             "$inc": {"attempts": 1}}
+        )
+        return await self.collection.find({"leaseOwner": token}).sort("_id", 1).to_list(self.batch_size)
+
+    async def _dead_letter(self, entries: List[Dict]) -> None:
+        """Move entries out of the outbox after their last attempt"""
+        for entry in entries:
+            print(f"[OUTBOX] Giving up on entry {entry['_id']} for pet {entry.get('petId')} after {entry['attempts'] - 1} attempts: {entry.get('lastError')}")
+        if self.dead_letters is not None:
+            now = datetime.now(timezone.utc)
+            await self.dead_letters.insert_many([{**entry, "deadAt": now} for entry in entries])
+        await self.collection.delete_many({"_id": {"$in": [entry["_id"] for entry in entries]}})
+        self._dead_lettered += len(entries)
+
+    async def _failed(self, entries: List[Dict], error: Exception) -> None:
+        """Note why entries failed; they stay leased and are retried once the lease runs out"""
+        try:
+            await self.collection.update_many(
+                {"_id": {"$in": [entry["_id"] for entry in entries]}},
+                {"$set": {"lastError": str(error)}}
+            )
+        except Exception as e:
+            print(f"[OUTBOX] Could not record failure: {str(e)}")
+
+    async def process_batch(self) -> int:
+        """Claim, apply and delete one batch of due entries; returns the number of entries claimed"""
+        if self.collection is None:
+            return 0
+        claimed = await self._claim()
+        if not claimed:
+            return 0
+
+        entries = [entry for entry in claimed if entry["attempts"] <= self.max_attempts]
+        if len(entries) < len(claimed):
+            await self._dead_letter([entry for entry in claimed if entry["attempts"] > self.max_attempts])
+        if not entries:
+            return len(claimed)
+
+        try:
+            await self.apply(entries)
+            applied = entries
+        except Exception as e:
+            await self._failed(entries, e)
+            if len(entries) == 1:
+                raise
+            # Apply the batch one entry at a time, so a single bad entry doesn't hold the others back
+            print(f"[OUTBOX] Batch of {len(entries)} failed, applying entries one at a time: {str(e)}")
+            applied = []
+            for entry in entries:
+                try:
+                    await self.apply([entry])
+                    applied.append(entry)
+                except Exception as entry_error:
+                    self._failures += 1
+                    await self._failed([entry], entry_error)
+                    print(f"[OUTBOX] Entry {entry['_id']} failed (attempt {entry['attempts']}): {str(entry_error)}")
+
+        # Deleting only after the apply is what makes delivery at-least-once
+        if applied:
+            await self.collection.delete_many({"_id": {"$in": [entry["_id"] for entry in applied]}})
+        self._applied += len(applied)
+        self._batches += 1
+        return len(claimed)
+
+    async def drain(self) -> None:
+        """Apply everything that is currently due"""
+        while await self.process_batch() == self.batch_size:
+            pass
+
+    async def run(self) -> None:
+        """Background loop: apply as soon as entries arrive, and poll for stragglers"""
+        print("[OUTBOX] Worker started")
+        while True:
+            self.wakeup.clear()
+            try:
+                await self.drain()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Entries stay in the outbox and are retried once their lease expires
+                self._failures += 1
+                print(f"[OUTBOX] Failed to apply batch: {str(e)}")
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "enqueued": self._enqueued,
+            "applied": self._applied,
+            "batches": self._batches,
+            "failures": self._failures,
+            "dead_lettered": self._dead_lettered
+        }
+
+
+# Other storage backends apply chat side effects as they are enqueued
+pet_outbox = OutboxWorker(
+    outbox_collection if STORAGE_BACKEND == "mongo" else None,
+    dead_letters=dead_letter_collection
+)
@@ -0,0 +1,143 @@
+import asyncio
+import os
+import time
+from typing import Callable, Dict, Optional, Tuple
+from passlib.context import CryptContext
+
+# Target time for one bcrypt verify on this machine; the cost is calibrated to stay under it
+BCRYPT_TARGET_MS = float(os.getenv("BCRYPT_TARGET_MS", "250"))
+# Set to pin the cost instead of calibrating
+BCRYPT_ROUNDS = os.getenv("BCRYPT_ROUNDS")
+# Never go below this cost, however slow the machine
+BCRYPT_MIN_ROUNDS = 10
+BCRYPT_MAX_ROUNDS = 16
+# passlib's default, used until calibration runs
+DEFAULT_BCRYPT_ROUNDS = 12
+
+
+def _build_context(rounds: int) -> CryptContext:
+    # min_rounds makes needs_update() flag hashes cheaper than the current cost. Costlier ones are
+    # left alone, so workers that calibrate a round apart don't keep rehashing each other's hashes
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds
+    )
+
+
+def measure_verify_seconds(rounds: int, samples: int = 3) -> float:
+    """Best-of-n time for one verify at the given cost"""
+    context = _build_context(rounds)
+    hashed = context.hash("calibration password")
+    best = float("inf")
+    for _ in range(samples):
+        started = time.perf_counter()
+        context.verify("calibration password", hashed)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def calibrate_bcrypt_rounds(
+    target_ms: float = BCRYPT_TARGET_MS,
+    measure: Callable[[int], float] = measure_verify_seconds,
+    min_rounds: int = BCRYPT_MIN_ROUNDS,
+    max_rounds: int = BCRYPT_MAX_ROUNDS
+) -> Tuple[int, float]:
+    """Highest cost whose verify time fits the target, and its expected verify time in ms.
+
+    Only the minimum cost is measured; each extra round doubles bcrypt's work.
+    """
+    base_ms = measure(min_rounds) * 1000
+    rounds = min_rounds
+    while rounds < max_rounds and base_ms * 2 ** (rounds + 1 - min_rounds) <= target_ms:
+        rounds += 1
+    return rounds, base_ms * 2 ** (rounds - min_rounds)
+
+
+class HashTimings:
+    """Count, mean and max duration of one hashing operation"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 2) if self.count else 0.0,
+            "max_ms": round(self.max * 1000, 2)
+        }
+
+
+class PasswordHasher:
+    """bcrypt hashing at a calibrated cost, with timing metrics"""
+
+    def __init__(self, rounds: int = DEFAULT_BCRYPT_ROUNDS):
+        self.configure(rounds)
+        self.expected_verify_ms: Optional[float] = None
+        self._hash_timings = HashTimings()
+        self._verify_timings = HashTimings()
+        self._rehashed = 0
+
+    def configure(self, rounds: int) -> None:
+        self.rounds = rounds
+        self.context = _build_context(rounds)
+
+    async def calibrate(self) -> int:
+        """Pick the cost for this machine (or the pinned BCRYPT_ROUNDS) without blocking the loop"""
+        if BCRYPT_ROUNDS:
+            self.configure(int(BCRYPT_ROUNDS))
+        else:
+            rounds, expected_ms = await asyncio.to_thread(calibrate_bcrypt_rounds)
+            self.configure(rounds)
+            self.expected_verify_ms = round(expected_ms, 1)
+        print(f"[AUTH] bcrypt cost {self.rounds} (target {BCRYPT_TARGET_MS}ms per verify)")
+        return self.rounds
+
+    def hash(self, password: str) -> str:
+        started = time.perf_counter()
+        hashed = self.context.hash(password)
+        self._hash_timings.record(time.perf_counter() - started)
+        return hashed
+
+    def verify(self, password: str, hashed: str) -> bool:
+        started = time.perf_counter()
+        try:
+            return self.context.verify(password, hashed)
+        finally:
+            self._verify_timings.record(time.perf_counter() - started)
+
+    def needs_update(self, hashed: str) -> bool:
+        return self.context.needs_update(hashed)
+
+    async def hash_async(self, password: str) -> str:
+        return await asyncio.to_thread(self.hash, password)
+
+    async def verify_and_rehash(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """Verify off the event loop; on success also return a new hash if the old one is outdated"""
+        if not await asyncio.to_thread(self.verify, password, hashed):
+            return False, None
+        if not self.needs_update(hashed):
+            return True, None
+        self._rehashed += 1
+        return True, await self.hash_async(password)
+
+    def stats(self) -> Dict:
+        return {
+            "rounds": self.rounds,
+            "target_verify_ms": BCRYPT_TARGET_MS,
+            "expected_verify_ms": self.expected_verify_ms,
+            "hash": self._hash_timings.stats(),
+            "verify": self._verify_timings.stats(),
+            "rehashed_on_login": self._rehashed
+        }
+
+
+password_hasher = PasswordHasher()
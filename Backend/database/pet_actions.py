@@ -0,0 +1,120 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from .pet_schema import MOOD_LEVELS, NEGLECT_THRESHOLD_HOURS
+from .memory_records import action_record
+
+# Battery change applied by each interaction (chatting drains, care recharges)
+INTERACTION_BATTERY_DELTAS = {
+    "feed": 10,
+    "play": 5,
+    "teach": 7,
+    "chat": -3
+}
+
+# Actions a client may queue and replay through the batch endpoint
+BATCHABLE_ACTIONS = ("feed", "play", "teach")
+
+MAX_BATTERY_LEVEL = 100
+
+
+def clamp_battery(level: int) -> int:
+    return max(0, min(MAX_BATTERY_LEVEL, level))
+
+
+def _as_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def fold_pet_actions(state: Dict[str, Any], actions: List[Dict[str, Any]], now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Apply an ordered list of actions to a pet state without touching the database.
+
+    Each action is a dict with "type", an optional "message" and an optional
+    "clientTimestamp". Actions are skipped once the battery is depleted, just
+    like the single-action endpoints. Client timestamps are clamped so they
+    never move the pet into the future or backwards in time.
+
+    Returns the folded totals: final field values to $set, counter deltas to
+    $inc, memory records to append, stamped with each action's time, and the
+    number of actions that took effect.
+    """
+    now = now or datetime.now(timezone.utc)
+    battery = state.get("batteryLevel")
+    battery = MAX_BATTERY_LEVEL if battery is None else battery
+    last_fed = _as_utc(state.get("lastFed") or now)
+    last_interaction = _as_utc(state.get("lastInteraction") or now)
+    mood = state.get("mood")
+
+    interactions = 0
+    levels = 0
+    memories = []
+    for action in actions:
+        if battery <= 0:
+            break
+        action_type = action["type"]
+        at = action.get("clientTimestamp")
+        at = min(_as_utc(at), now) if at else now
+        at = max(at, last_interaction)
+
+        battery = clamp_battery(battery + INTERACTION_BATTERY_DELTAS[action_type])
+        interactions += 1
+        last_interaction = at
+        memories.append(action_record(action_type, action.get("message"), at))
+        if action_type == "feed":
+            last_fed = max(at, last_fed)
+            mood = MOOD_LEVELS["HAPPY"]
+        elif action_type == "play":
+            mood = MOOD_LEVELS["HAPPY"]
+        elif action_type == "teach":
+            levels += 1
+
+    return {
+        "set": {
+            "batteryLevel": battery,
+            "mood": mood,
+            "lastFed": last_fed,
+            "lastInteraction": last_interaction
+        },
+        "inc": {
+            "interactionCount": interactions,
+            "level": levels
+        },
+        "memories": memories,
+        "applied": interactions
+    }
+
+
+def neglect_changes(state: Dict[str, Any], now: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+    """Mood and battery for a pet left alone since its last feed or interaction, None if neither changes"""
+    now = now or datetime.now(timezone.utc)
+
+    # Calculate how long since the pet was last fed or interacted with
+    last_fed = _as_utc(state.get("lastFed") or now)
+    last_interaction = _as_utc(state.get("lastInteraction") or now)
+    hours_since_fed = (now - last_fed).total_seconds() / 3600
+    hours_since_interaction = (now - last_interaction).total_seconds() / 3600
+
+    # Determine which was more recent, feeding or other interaction
+    hours_since_last_action = min(hours_since_fed, hours_since_interaction)
+
+    # Determine new mood based on neglect time
+    if hours_since_last_action < NEGLECT_THRESHOLD_HOURS / 4:  # Less than 6 hours
+        new_mood = MOOD_LEVELS["HAPPY"]
+    elif hours_since_last_action < NEGLECT_THRESHOLD_HOURS / 2:  # Less than 12 hours
+        new_mood = MOOD_LEVELS["CONTENT"]
+    elif hours_since_last_action < NEGLECT_THRESHOLD_HOURS * 0.75:  # Less than 18 hours
+        new_mood = MOOD_LEVELS["NEUTRAL"]
+    elif hours_since_last_action < NEGLECT_THRESHOLD_HOURS:  # Less than 24 hours
+        new_mood = MOOD_LEVELS["GRUMPY"]
+    else:  # 24 hours or more
+        new_mood = MOOD_LEVELS["ANGRY"]
+
+    # Deplete battery by 1% per hour of neglect (minimum 0)
+    current_battery = state["batteryLevel"]
+    new_battery_level = max(0, current_battery - int(hours_since_last_action))
+
+    # Only update if there's a change in mood or battery
+    if new_mood == state.get("mood") and new_battery_level == current_battery:
+        return None
+    return {"mood": new_mood, "batteryLevel": new_battery_level}
@@ -0,0 +1,188 @@
+import asyncio
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Set
+
+# Fields pushed to live clients whenever they change
+PET_EVENT_FIELDS = ("mood", "batteryLevel", "level", "interactionCount")
+
+# Per-connection send buffer and connection cap for the websocket channel
+PET_WS_SEND_BUFFER = int(os.getenv("PET_WS_SEND_BUFFER", "32"))
+PET_WS_MAX_CONNECTIONS = int(os.getenv("PET_WS_MAX_CONNECTIONS", "1000"))
+
+# "local" publishes straight from PetDB writes, "change_stream" tails MongoDB instead
+PET_EVENTS_SOURCE = os.getenv("PET_EVENTS_SOURCE", "local")
+
+
+def pet_state(pet: Any) -> Dict[str, Any]:
+    """Extract the live fields of a pet from either a Pet model or a raw document"""
+    if isinstance(pet, dict):
+        get = pet.get
+    else:
+        get = lambda field, default=None: getattr(pet, field, default)
+    memory_log = get("memoryLog") or []
+    state = {field: get(field) for field in PET_EVENT_FIELDS}
+    state["memoryCount"] = get("memoryCount", len(memory_log))
+    state["lastMemory"] = get("lastMemory", memory_log[-1] if memory_log else None)
+    return state
+
+
+class PetSubscription:
+    """A single live connection watching one pet"""
+
+    def __init__(self, pet_id: str, buffer_size: int):
+        self.pet_id = pet_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=buffer_size)
+        self.dropped = False
+
+    async def get(self) -> Optional[Dict[str, Any]]:
+        """Wait for the next event; None means the hub dropped this subscriber"""
+        return await self.queue.get()
+
+
+class PetEventHub:
+    """In-process pub/sub hub fanning pet deltas out to websocket subscribers.
+
+    Publishing never blocks: each subscriber has a bounded queue, and a
+    subscriber whose queue is full is dropped instead of slowing down writers.
+    """
+
+    def __init__(self, buffer_size: int = PET_WS_SEND_BUFFER, max_connections: int = PET_WS_MAX_CONNECTIONS):
+        self.buffer_size = buffer_size
+        self.max_connections = max_connections
+        self.local_publish = True
+        self._subscribers: Dict[str, Set[PetSubscription]] = {}
+        self._last_state: Dict[str, Dict[str, Any]] = {}
+        self._connections = 0
+        self._published = 0
+        self._delivered = 0
+        self._dropped = 0
+        self._rejected = 0
+
+    def subscribe(self, pet_id: str, initial_state: Optional[Dict[str, Any]] = None) -> Optional[PetSubscription]:
+        """Register a subscriber for a pet, or return None when at capacity"""
+        if self._connections >= self.max_connections:
+            self._rejected += 1
+            return None
+        subscription = PetSubscription(pet_id, self.buffer_size)
+        self._subscribers.setdefault(pet_id, set()).add(subscription)
+        if initial_state is not None and pet_id not in self._last_state:
+            self._last_state[pet_id] = initial_state
+        self._connections += 1
+        return subscription
+
+    def unsubscribe(self, subscription: PetSubscription) -> None:
+        subscribers = self._subscribers.get(subscription.pet_id)
+        if not subscribers or subscription not in subscribers:
+            return
+        subscribers.discard(subscription)
+        self._connections -= 1
+        if not subscribers:
+            # Stop tracking state for pets nobody is watching
+            del self._subscribers[subscription.pet_id]
+            self._last_state.pop(subscription.pet_id, None)
+
+    def publish(self, pet_id: str, state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Push the changed fields of a pet to its subscribers and return the delta"""
+        subscribers = self._subscribers.get(pet_id)
+        if not subscribers:
+            return None
+
+        previous = self._last_state.get(pet_id, {})
+        changes = {
+            field: state[field]
+            for field in PET_EVENT_FIELDS
+            if field in state and state[field] != previous.get(field)
+        }
+        if (state.get("memoryCount") != previous.get("memoryCount")
+                or state.get("lastMemory") != previous.get("lastMemory")):
+            if state.get("lastMemory") is not None:
+                changes["memory"] = state["lastMemory"]
+        self._last_state[pet_id] = state
+        if not changes:
+            return None
+
+        event = {
+            "type": "pet_delta",
+            "petId": pet_id,
+            "changes": changes,
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        }
+        self._published += 1
+        for subscription in list(subscribers):
+            try:
+                subscription.queue.put_nowait(event)
+                self._delivered += 1
+            except asyncio.QueueFull:
+                self._drop(subscription)
+        return changes
+
+    def _drop(self, subscription: PetSubscription) -> None:
+        """Disconnect a slow consumer, leaving a sentinel so its sender wakes up"""
+        subscription.dropped = True
+        self._dropped += 1
+        while not subscription.queue.empty():
+            subscription.queue.get_nowait()
+        subscription.queue.put_nowait(None)
+        self.unsubscribe(subscription)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "source": "local" if self.local_publish else "change_stream",
+            "connections": self._connections,
+            "pets_watched": len(self._subscribers),
+            "send_buffer": self.buffer_size,
+            "max_connections": self.max_connections,
+            "events_published": self._published,
+            "events_delivered": self._delivered,
+            "slow_consumers_dropped": self._dropped,
+            "connections_rejected": self._rejected
+        }
+
+
+pet_hub = PetEventHub()
+
+
+def publish_pet_update(pet: Any) -> None:
+    """Called by PetDB after every write; a no-op when change streams feed the hub"""
+    if pet is None or not pet_hub.local_publish:
+        return
+    try:
+        pet_hub.publish(str(pet.id), pet_state(pet))
+    except Exception as e:
+        print(f"[EVENTS] Failed to publish pet update: {str(e)}")
+
+
+# Change stream stage that keeps only what the hub needs from each pet document
+CHANGE_STREAM_PIPELINE = [
+    {"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}},
+    {"$set": {
+        "fullDocument.memoryCount": {"$size": {"$ifNull": ["$fullDocument.memoryLog", []]}},
+        "fullDocument.lastMemory": {"$arrayElemAt": ["$fullDocument.memoryLog", -1]}
+    }},
+    {"$unset": "fullDocument.memoryLog"}
+]
+
+
+async def watch_pet_changes(collection, hub: PetEventHub = pet_hub, retry_delay: float = 5.0) -> None:
+    """Feed the hub from a MongoDB change stream so every worker sees every write"""
+    hub.local_publish = False
+    resume_token = None
+    while True:
+        try:
+            async with collection.watch(
+                CHANGE_STREAM_PIPELINE,
+                full_document="updateLookup",
+                resume_after=resume_token
+            ) as stream:
+                print("[EVENTS] Watching pet change stream")
+                async for change in stream:
+                    resume_token = stream.resume_token
+                    document = change.get("fullDocument")
+                    if document:
+                        hub.publish(str(document["_id"]), pet_state(document))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[EVENTS] Change stream error, retrying in {retry_delay}s: {str(e)}")
+            await asyncio.sleep(retry_delay)
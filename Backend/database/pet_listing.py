@@ -0,0 +1,60 @@
+import base64
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+# Pets per page of GET /pets
+DEFAULT_PET_PAGE_SIZE = 20
+MAX_PET_PAGE_SIZE = 100
+
+# Compound index serving a user's pets in creation order; _id breaks ties between pets created together
+PETS_BY_CREATION_INDEX = "userId_createdAt"
+
+# Fields a pet listing returns; memory logs are most of a pet's bytes and are never read
+PET_SUMMARY_FIELDS = (
+    "name", "species", "mood", "level", "batteryLevel", "evolutionStage",
+    "interactionCount", "lastInteraction", "createdAt", "isPrimary"
+)
+PET_SUMMARY_PROJECTION = {field: 1 for field in PET_SUMMARY_FIELDS}
+
+# Sorts first, as a missing createdAt does in MongoDB
+EARLIEST = datetime.min.replace(tzinfo=timezone.utc)
+
+PetCursor = Tuple[datetime, str]
+
+
+def pet_summary(document: Dict[str, Any]) -> Dict[str, Any]:
+    """The listing entry for a pet document"""
+    summary = {"id": str(document["_id"])}
+    for field in PET_SUMMARY_FIELDS:
+        if field in document:
+            summary[field] = document[field]
+    return summary
+
+
+def _as_utc(value: datetime) -> datetime:
+    # MongoDB hands back naive UTC datetimes
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def creation_key(document: Dict[str, Any]) -> PetCursor:
+    """Sort key of a pet in its owner's listing"""
+    created = document.get("createdAt")
+    return (_as_utc(created) if created is not None else EARLIEST, str(document["_id"]))
+
+
+def encode_pet_cursor(summary: Dict[str, Any]) -> str:
+    """Opaque cursor pointing just past a listed pet"""
+    created = summary.get("createdAt")
+    created = _as_utc(created).isoformat() if created is not None else ""
+    return base64.urlsafe_b64encode(f"{created}|{summary['id']}".encode()).decode()
+
+
+def decode_pet_cursor(cursor: Optional[str]) -> Optional[PetCursor]:
+    """(createdAt, id) a page starts after; ValueError for a cursor this module didn't write"""
+    if not cursor:
+        return None
+    try:
+        created, pet_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return (_as_utc(datetime.fromisoformat(created)) if created else EARLIEST, pet_id)
+    except Exception:
+        raise ValueError("Invalid pet cursor")
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Union
 from datetime import datetime, timezone
 from bson import ObjectId
 
@@ -21,9 +21,24 @@ SASS_LEVELS = {
     "SAVAGE": 5
 }
 
+# Evolution stages, matching the dashboard's sprite sets
+EVOLUTION_STAGES = {
+    "BABY": "baby",
+    "CHILD": "child",
+    "TEEN": "teen",
+    "ADULT": "adult"
+}
+
+# Version of the pet document layout; bumped with each migration in migrations.py
+PET_SCHEMA_VERSION = 3
+
 # Neglect threshold in hours
 NEGLECT_THRESHOLD_HOURS = 24
 
+# Defaults for the pet created automatically for each user
+DEFAULT_PET_NAME = "Berny"
+DEFAULT_PET_SPECIES = "Digital"
+
 class Pet(BaseModel):
     id: str = Field(default_factory=lambda: str(ObjectId()), alias="_id")
     name: str
@@ -36,7 +51,12 @@ class Pet(BaseModel):
     lastFed: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     lastInteraction: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     interactionCount: int = 0
-    memoryLog: List[str] = Field(default_factory=list)
+    createdAt: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))  # Orders a user's pets; see pet_listing.py
+    evolutionStage: str = Field(default=EVOLUTION_STAGES["BABY"])
+    memoryLog: List[Union[str, Dict[str, Any]]] = Field(default_factory=list)  # records, or legacy strings; see memory_records.py
+    isPrimary: bool = False  # The pet routes use when the client doesn't name one
+    version: int = 0  # Bumped on every write for optimistic concurrency checks
+    schemaVersion: int = PET_SCHEMA_VERSION  # Layout the document was written with; see migrations.py
     
     model_config = ConfigDict(
         json_encoders={
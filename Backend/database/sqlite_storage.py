@@ -0,0 +1,351 @@
+import asyncio
+import os
+import sqlite3
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+import aiosqlite
+import bson
+from bson import ObjectId
+from bson.codec_options import CodecOptions
+from .pet_schema import Pet
+from .user_schema import User
+from .migrations import upgrade_pet_document
+from .pet_listing import PetCursor, creation_key
+from .storage import (
+    Storage, DocumentPetRepository, UserRepository, SessionRepository, SESSION_LIFETIME, user_from_document
+)
+from .interaction_log import InteractionLog
+
+# Documents are stored as BSON, so datetimes and ObjectIds round-trip exactly as they do through MongoDB
+DOCUMENT_CODEC = CodecOptions(tz_aware=True)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pets (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    is_primary INTEGER NOT NULL DEFAULT 0,
+    version INTEGER,
+    created_at TEXT NOT NULL,
+    document BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pets_user_created ON pets (user_id, created_at, id);
+CREATE UNIQUE INDEX IF NOT EXISTS pets_user_primary ON pets (user_id) WHERE is_primary = 1;
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    email TEXT NOT NULL,
+    document BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS users_email ON users (email);
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    expires_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_user ON sessions (user_id);
+CREATE TABLE IF NOT EXISTS interactions (
+    pet_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    n INTEGER NOT NULL,
+    event BLOB NOT NULL,
+    PRIMARY KEY (pet_id, seq, n)
+);
+CREATE TABLE IF NOT EXISTS pet_snapshots (
+    pet_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    snapshot BLOB NOT NULL,
+    PRIMARY KEY (pet_id, seq)
+);
+"""
+
+
+def _encode(document: dict) -> bytes:
+    return bson.encode(document)
+
+
+def _decode(data: bytes) -> dict:
+    return bson.decode(data, codec_options=DOCUMENT_CODEC)
+
+
+def _sortable_time(value: datetime) -> str:
+    """Fixed-width UTC text that sorts like the datetime, at BSON's millisecond precision"""
+    return f"{value:%Y-%m-%dT%H:%M:%S}.{value.microsecond // 1000:03d}"
+
+
+class SQLiteDatabase:
+    """One aiosqlite connection shared by the repositories, opened and migrated on first use"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection: Optional[aiosqlite.Connection] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def connection(self) -> aiosqlite.Connection:
+        if self._connection is None:
+            # Created lazily so it binds to the running event loop
+            if self._lock is None:
+                self._lock = asyncio.Lock()
+            async with self._lock:
+                if self._connection is None:
+                    connection = await aiosqlite.connect(self.path)
+                    # WAL lets readers carry on while a write commits
+                    await connection.execute("PRAGMA journal_mode=WAL")
+                    await connection.executescript(SCHEMA)
+                    await connection.commit()
+                    self._connection = connection
+                    print(f"[SQLITE] Opened {self.path}")
+        return self._connection
+
+    async def execute(self, sql: str, parameters: tuple = ()) -> int:
+        """Run one write and commit it; returns the number of rows it changed"""
+        connection = await self.connection()
+        cursor = await connection.execute(sql, parameters)
+        await connection.commit()
+        return cursor.rowcount
+
+    async def execute_many(self, sql: str, rows: List[tuple]) -> None:
+        """Run one write per row and commit them together"""
+        connection = await self.connection()
+        await connection.executemany(sql, rows)
+        await connection.commit()
+
+    async def fetch_all(self, sql: str, parameters: tuple = ()) -> List[tuple]:
+        connection = await self.connection()
+        async with connection.execute(sql, parameters) as cursor:
+            return list(await cursor.fetchall())
+
+    async def fetch_one(self, sql: str, parameters: tuple = ()) -> Optional[tuple]:
+        rows = await self.fetch_all(sql, parameters)
+        return rows[0] if rows else None
+
+    async def close(self) -> None:
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+
+
+class SQLitePetRepository(DocumentPetRepository):
+    """Pets as BSON documents in one table; owner, primary flag, creation time and version are columns for lookups and guards"""
+
+    def __init__(self, database: SQLiteDatabase, on_written: Optional[Callable[[Pet], None]] = None,
+                 interactions: Optional[InteractionLog] = None):
+        super().__init__(on_written, interactions)
+        self.database = database
+        # pet id -> [lock, number of updates holding or waiting for it]
+        self._pet_locks: Dict[str, list] = {}
+
+    async def ensure_indexes(self) -> None:
+        await self.database.connection()
+
+    async def _modify(self, pet_id: str, change: Callable[[dict], bool], events: Optional[List[Dict]] = None) -> Optional[Pet]:
+        """Serialize each pet's read-modify-write in this process.
+
+        Every update goes through the one shared connection, so concurrent
+        requests for a pet would otherwise keep losing the version guard to
+        each other and run out of retries. The guard still catches writes
+        from other processes.
+        """
+        entry = self._pet_locks.setdefault(pet_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                return await super()._modify(pet_id, change, events)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._pet_locks[pet_id]
+
+    async def _load(self, pet_id: str) -> Optional[dict]:
+        row = await self.database.fetch_one("SELECT document FROM pets WHERE id = ?", (pet_id,))
+        return _decode(row[0]) if row else None
+
+    async def _load_many(self, pet_ids: List[str]) -> List[dict]:
+        placeholders = ", ".join("?" for _ in pet_ids)
+        rows = await self.database.fetch_all(f"SELECT document FROM pets WHERE id IN ({placeholders})", tuple(pet_ids))
+        return [_decode(row[0]) for row in rows]
+
+    async def _load_by_user(self, user_id: str) -> List[dict]:
+        rows = await self.database.fetch_all(
+            "SELECT document FROM pets WHERE user_id = ? ORDER BY created_at, id", (user_id,)
+        )
+        return [_decode(row[0]) for row in rows]
+
+    async def _load_primary(self, user_id: str) -> Optional[dict]:
+        row = await self.database.fetch_one("SELECT document FROM pets WHERE user_id = ? AND is_primary = 1", (user_id,))
+        return _decode(row[0]) if row else None
+
+    async def _load_page(self, user_id: str, after: Optional[PetCursor], limit: int) -> List[dict]:
+        if after is None:
+            rows = await self.database.fetch_all(
+                "SELECT document FROM pets WHERE user_id = ? ORDER BY created_at, id LIMIT ?", (user_id, limit)
+            )
+        else:
+            created, pet_id = _sortable_time(after[0]), after[1]
+            rows = await self.database.fetch_all(
+                "SELECT document FROM pets WHERE user_id = ? AND (created_at > ? OR (created_at = ? AND id > ?)) "
+                "ORDER BY created_at, id LIMIT ?",
+                (user_id, created, created, pet_id, limit)
+            )
+        return [_decode(row[0]) for row in rows]
+
+    async def _insert(self, document: dict) -> bool:
+        created = creation_key(upgrade_pet_document(document))[0]
+        try:
+            await self.database.execute(
+                "INSERT INTO pets (id, user_id, is_primary, version, created_at, document) VALUES (?, ?, ?, ?, ?, ?)",
+                (str(document["_id"]), document.get("userId"), int(bool(document.get("isPrimary"))),
+                 document.get("version"), _sortable_time(created), _encode(document))
+            )
+        except sqlite3.IntegrityError:
+            # The unique partial index on (user_id where is_primary) rejected a second primary pet
+            return False
+        return True
+
+    async def _save(self, document: dict, expected_version: Optional[int]) -> bool:
+        changed = await self.database.execute(
+            "UPDATE pets SET is_primary = ?, version = ?, document = ? WHERE id = ? AND version IS ?",
+            (int(bool(document.get("isPrimary"))), document.get("version"), _encode(document),
+             str(document["_id"]), expected_version)
+        )
+        return changed == 1
+
+    async def _delete(self, pet_id: str) -> bool:
+        return await self.database.execute("DELETE FROM pets WHERE id = ?", (pet_id,)) > 0
+
+
+class SQLiteUserRepository(UserRepository):
+    def __init__(self, database: SQLiteDatabase):
+        self.database = database
+
+    async def ensure_indexes(self) -> None:
+        await self.database.connection()
+
+    async def create_user(self, document: dict) -> User:
+        document = {**document, "_id": str(ObjectId())}
+        await self.database.execute(
+            "INSERT INTO users (id, email, document) VALUES (?, ?, ?)",
+            (document["_id"], document["email"], _encode(document))
+        )
+        return user_from_document(document)
+
+    async def get_user_by_email(self, email: str) -> Optional[User]:
+        row = await self.database.fetch_one("SELECT document FROM users WHERE email = ? ORDER BY rowid", (email,))
+        return user_from_document(_decode(row[0])) if row else None
+
+    async def get_user_by_id(self, user_id: str) -> Optional[User]:
+        row = await self.database.fetch_one("SELECT document FROM users WHERE id = ?", (user_id,))
+        return user_from_document(_decode(row[0])) if row else None
+
+    async def get_users(self, user_ids: List[str]) -> Dict[str, User]:
+        placeholders = ", ".join("?" for _ in user_ids)
+        rows = await self.database.fetch_all(f"SELECT document FROM users WHERE id IN ({placeholders})", tuple(user_ids))
+        users = [user_from_document(_decode(row[0])) for row in rows]
+        return {user.id: user for user in users}
+
+    async def replace_password_hash(self, user_id: str, old_hash: str, new_hash: str) -> bool:
+        row = await self.database.fetch_one("SELECT document FROM users WHERE id = ?", (user_id,))
+        if not row:
+            return False
+        document = _decode(row[0])
+        if document["hashed_password"] != old_hash:
+            return False
+        # Compare-and-set on the whole stored document, so a concurrent change wins
+        updated = {**document, "hashed_password": new_hash}
+        changed = await self.database.execute(
+            "UPDATE users SET document = ? WHERE id = ? AND document = ?",
+            (_encode(updated), user_id, row[0])
+        )
+        return changed == 1
+
+    async def delete_user(self, user_id: str) -> bool:
+        return await self.database.execute("DELETE FROM users WHERE id = ?", (user_id,)) > 0
+
+
+class SQLiteSessionRepository(SessionRepository):
+    def __init__(self, database: SQLiteDatabase):
+        self.database = database
+
+    async def ensure_indexes(self) -> None:
+        await self.database.connection()
+
+    async def get_session(self, session_id: str) -> Optional[dict]:
+        row = await self.database.fetch_one(
+            "SELECT session_id, user_id, expires_at FROM sessions WHERE session_id = ?", (session_id,)
+        )
+        if not row:
+            return None
+        session = {"session_id": row[0], "user_id": row[1], "expires_at": datetime.fromisoformat(row[2])}
+        if datetime.now() < session["expires_at"]:
+            return session
+        return None
+
+    async def create_session(self, user_id: str) -> str:
+        session_id = os.urandom(16).hex()
+        expires_at = datetime.now() + SESSION_LIFETIME
+        await self.database.execute(
+            "INSERT INTO sessions (session_id, user_id, expires_at) VALUES (?, ?, ?)",
+            (session_id, user_id, expires_at.isoformat())
+        )
+        return session_id
+
+    async def delete_session(self, session_id: str) -> None:
+        await self.database.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    async def revoke_user_sessions(self, user_id: str) -> None:
+        await self.database.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+
+
+class SQLiteInteractionLog(InteractionLog):
+    """Events and snapshots as BSON blobs keyed by (pet, seq)"""
+
+    def __init__(self, database: SQLiteDatabase):
+        super().__init__()
+        self.database = database
+
+    async def ensure_indexes(self) -> None:
+        await self.database.connection()
+
+    async def _append(self, events: List[Dict[str, Any]]) -> None:
+        await self.database.execute_many(
+            "INSERT OR IGNORE INTO interactions (pet_id, seq, n, event) VALUES (?, ?, ?, ?)",
+            [(event["petId"], event["seq"], event["n"], _encode(event)) for event in events]
+        )
+
+    async def _save_snapshot(self, snapshot: Dict[str, Any]) -> None:
+        await self.database.execute(
+            "INSERT OR REPLACE INTO pet_snapshots (pet_id, seq, snapshot) VALUES (?, ?, ?)",
+            (snapshot["petId"], snapshot["seq"], _encode(snapshot))
+        )
+
+    async def latest_snapshot(self, pet_id: str, seq: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        if seq is None:
+            row = await self.database.fetch_one(
+                "SELECT snapshot FROM pet_snapshots WHERE pet_id = ? ORDER BY seq DESC LIMIT 1", (pet_id,)
+            )
+        else:
+            row = await self.database.fetch_one(
+                "SELECT snapshot FROM pet_snapshots WHERE pet_id = ? AND seq <= ? ORDER BY seq DESC LIMIT 1", (pet_id, seq)
+            )
+        return _decode(row[0]) if row else None
+
+    async def events(self, pet_id: str, after: int = -1, until: Optional[int] = None) -> List[Dict[str, Any]]:
+        if until is None:
+            rows = await self.database.fetch_all(
+                "SELECT event FROM interactions WHERE pet_id = ? AND seq > ? ORDER BY seq, n", (pet_id, after)
+            )
+        else:
+            rows = await self.database.fetch_all(
+                "SELECT event FROM interactions WHERE pet_id = ? AND seq > ? AND seq <= ? ORDER BY seq, n",
+                (pet_id, after, until)
+            )
+        return [_decode(row[0]) for row in rows]
+
+
+def sqlite_storage(path: str, on_written: Optional[Callable[[Pet], None]] = None) -> Storage:
+    database = SQLiteDatabase(path)
+    return Storage(
+        "sqlite",
+        SQLitePetRepository(database, on_written, SQLiteInteractionLog(database)),
+        SQLiteUserRepository(database),
+        SQLiteSessionRepository(database),
+        close=database.close
+    )
@@ -0,0 +1,560 @@
+import asyncio
+import copy
+import os
+import random
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone, timedelta
+from typing import Any, Callable, Dict, List, Optional
+from bson import ObjectId
+from .pet_schema import Pet
+from .user_schema import User
+from .migrations import upgrade_pet_document
+from .memory_records import Memory, memory_view, record_matches
+from .memory_compaction import append_memories
+from .pet_actions import fold_pet_actions, clamp_battery, MAX_BATTERY_LEVEL
+from .pet_listing import PetCursor, pet_summary, creation_key
+from .interaction_log import InteractionLog, InMemoryInteractionLog, action_events, chat_event, decay_event
+
+# Where pets, users and sessions are stored: "mongo", "memory" (tests and benchmarks) or "sqlite" (single node)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mongo")
+# Database file used by the sqlite backend
+SQLITE_PATH = os.getenv("SQLITE_PATH", "chronopal.db")
+
+# Attempts at a versioned read-modify-write before giving up on a contended pet
+MAX_UPDATE_RETRIES = 8
+UPDATE_RETRY_BACKOFF_SECONDS = 0.005
+
+# Outbox entry ids remembered per pet so a redelivered entry is not applied twice
+APPLIED_OUTBOX_HISTORY = 50
+
+# How long a login session stays valid
+SESSION_LIFETIME = timedelta(days=1)
+
+
+class PetUpdateConflict(Exception):
+    """Raised when a pet keeps changing underneath a versioned read-modify-write update"""
+    pass
+
+
+def pet_from_document(document: dict) -> Pet:
+    """Pet from a raw document, upgraded to the current schema on the way"""
+    upgrade_pet_document(document)
+    document["_id"] = str(document["_id"])
+    return Pet(**document)
+
+
+def user_from_document(document: dict) -> User:
+    document["_id"] = str(document["_id"])
+    return User(**document)
+
+
+async def retry_backoff(attempt: int) -> None:
+    """Jittered backoff so contending writers don't retry in lockstep"""
+    await asyncio.sleep(random.uniform(0, UPDATE_RETRY_BACKOFF_SECONDS * 2 ** attempt))
+
+
+class PetRepository(ABC):
+    """Where pets live.
+
+    Every write bumps the pet's version and hands the written pet to
+    on_written, so subscribers, vitals and caches see it whatever the
+    backend. Writes are also recorded in the interaction log: feeds, plays,
+    teaches, chats and decay as events, anything else as a snapshot.
+    Interactions return None when the pet is missing, or the pet unchanged
+    when its battery is depleted.
+    """
+
+    def __init__(self, on_written: Optional[Callable[[Pet], None]] = None, interactions: Optional[InteractionLog] = None):
+        self.on_written = on_written or (lambda pet: None)
+        self.interactions = interactions
+
+    async def _logged(self, pet: Pet, events: Optional[List[Dict]] = None) -> Pet:
+        """Record a write that landed in the interaction log"""
+        if self.interactions is not None:
+            await self.interactions.record(pet, events or [])
+        return pet
+
+    @abstractmethod
+    async def ensure_indexes(self) -> None: ...
+
+    @abstractmethod
+    async def create_pet(self, document: dict) -> Pet:
+        """Insert a pet, making it the owner's primary pet if they don't have one yet"""
+
+    @abstractmethod
+    async def get_pet(self, pet_id: str) -> Optional[Pet]: ...
+
+    @abstractmethod
+    async def get_pets(self, pet_ids: List[str]) -> Dict[str, Pet]:
+        """The pets found among pet_ids in one round trip, keyed by the id they were asked for"""
+
+    @abstractmethod
+    async def get_pet_header(self, pet_id: str) -> Optional[dict]:
+        """The pet's raw _id, owner and version, without loading its memory log"""
+
+    @abstractmethod
+    async def get_pets_by_user(self, user_id: str) -> List[Pet]:
+        """All of the owner's pets, oldest first"""
+
+    @abstractmethod
+    async def list_pets(self, user_id: str, after: Optional[PetCursor], limit: int) -> List[dict]:
+        """Summaries of the owner's pets created after the cursor, oldest first, without memory logs"""
+
+    @abstractmethod
+    async def get_primary_pet(self, user_id: str) -> Optional[Pet]: ...
+
+    @abstractmethod
+    async def get_or_create_primary_pet(self, user_id: str, defaults: dict) -> Pet:
+        """The owner's primary pet, created from defaults exactly once however many callers race"""
+
+    @abstractmethod
+    async def delete_pet(self, pet_id: str) -> bool: ...
+
+    @abstractmethod
+    async def update_fields(self, pet_id: str, fields: dict) -> Optional[Pet]: ...
+
+    @abstractmethod
+    async def append_memories(self, pet_id: str, memories: List[Memory]) -> Optional[Pet]: ...
+
+    @abstractmethod
+    async def count_interaction(self, pet_id: str) -> Optional[Pet]:
+        """Count an interaction and refresh lastInteraction"""
+
+    @abstractmethod
+    async def adjust_battery(self, pet_id: str, delta: int) -> Optional[Pet]:
+        """Add delta (negative to drain) to the battery, clamped to 0-100"""
+
+    @abstractmethod
+    async def interact(self, pet_id: str, action_type: str, message: Optional[str] = None) -> Optional[Pet]:
+        """Apply a whole feed, play or teach atomically"""
+
+    @abstractmethod
+    async def apply_actions(self, pet_id: str, actions: List[Dict]) -> Optional[Pet]:
+        """Fold an ordered list of queued actions into a single atomic update"""
+
+    @abstractmethod
+    async def update_versioned(self, pet_id: str, build_changes: Callable[[dict], Optional[dict]],
+                               decay: bool = False) -> Optional[Pet]:
+        """Read-modify-write guarded by the pet's version, with bounded retries.
+
+        build_changes receives the current document and returns the field
+        values to set, or None to leave the pet alone. The write is logged
+        as a decay event if decay is set, otherwise as a snapshot.
+        PetUpdateConflict is raised after MAX_UPDATE_RETRIES lost races.
+        """
+
+    @abstractmethod
+    async def apply_outbox(self, entries: List[Dict]) -> int:
+        """Apply queued side effects exactly once per entry; returns how many pets changed"""
+
+    @abstractmethod
+    async def find_memories(self, user_id: str, kinds: Optional[List[str]] = None, since: Optional[datetime] = None,
+                            until: Optional[datetime] = None, pet_id: Optional[str] = None, limit: int = 100) -> List[dict]:
+        """The owner's memory records of the given kinds in [since, until), newest first"""
+
+
+class UserRepository(ABC):
+    @abstractmethod
+    async def ensure_indexes(self) -> None: ...
+
+    @abstractmethod
+    async def create_user(self, document: dict) -> User: ...
+
+    @abstractmethod
+    async def get_user_by_email(self, email: str) -> Optional[User]: ...
+
+    @abstractmethod
+    async def get_user_by_id(self, user_id: str) -> Optional[User]: ...
+
+    @abstractmethod
+    async def get_users(self, user_ids: List[str]) -> Dict[str, User]:
+        """The users found among user_ids in one round trip, keyed by id"""
+
+    @abstractmethod
+    async def replace_password_hash(self, user_id: str, old_hash: str, new_hash: str) -> bool:
+        """Swap the hash only if it is still old_hash, so a concurrent password change wins"""
+
+    @abstractmethod
+    async def delete_user(self, user_id: str) -> bool: ...
+
+
+class SessionRepository(ABC):
+    @abstractmethod
+    async def ensure_indexes(self) -> None: ...
+
+    @abstractmethod
+    async def get_session(self, session_id: str) -> Optional[dict]:
+        """The session with its user_id, or None once it has expired"""
+
+    @abstractmethod
+    async def create_session(self, user_id: str) -> str: ...
+
+    @abstractmethod
+    async def delete_session(self, session_id: str) -> None: ...
+
+    @abstractmethod
+    async def revoke_user_sessions(self, user_id: str) -> None: ...
+
+
+class Storage:
+    """The repositories PetDB, UserDB and the session functions delegate to"""
+
+    def __init__(self, backend: str, pets: PetRepository, users: UserRepository, sessions: SessionRepository,
+                 close: Optional[Callable[[], Any]] = None):
+        self.backend = backend
+        self.pets = pets
+        self.users = users
+        self.sessions = sessions
+        self._close = close
+
+    @property
+    def interactions(self) -> Optional[InteractionLog]:
+        """The interaction log the pet repository records its writes in"""
+        return self.pets.interactions
+
+    async def ensure_indexes(self) -> None:
+        await self.pets.ensure_indexes()
+        await self.users.ensure_indexes()
+        await self.sessions.ensure_indexes()
+        if self.interactions is not None:
+            await self.interactions.ensure_indexes()
+
+    def session_functions(self) -> Dict[str, Callable]:
+        """The functions routes.py looks sessions up with"""
+        return {
+            "get_session": self.sessions.get_session,
+            "create_session": self.sessions.create_session,
+            "delete_session": self.sessions.delete_session,
+            "revoke_user_sessions": self.sessions.revoke_user_sessions
+        }
+
+    async def close(self) -> None:
+        if self._close:
+            await self._close()
+
+
+class DocumentPetRepository(PetRepository):
+    """Pet domain logic for stores that hold whole documents and can only compare-and-set them.
+
+    Subclasses provide the primitives: load, insert (refusing a second
+    primary pet per owner), save guarded by the stored version, and delete.
+    Every update is a versioned read-modify-write in Python, reusing the
+    same folds the MongoDB pipelines are built from.
+    """
+
+    @abstractmethod
+    async def _load(self, pet_id: str) -> Optional[dict]: ...
+
+    async def _load_many(self, pet_ids: List[str]) -> List[dict]:
+        """Documents of several pets; stores that can fetch them in one query override this"""
+        documents = [await self._load(pet_id) for pet_id in pet_ids]
+        return [document for document in documents if document]
+
+    @abstractmethod
+    async def _load_by_user(self, user_id: str) -> List[dict]: ...
+
+    async def _load_primary(self, user_id: str) -> Optional[dict]:
+        for document in await self._load_by_user(user_id):
+            if document.get("isPrimary"):
+                return document
+        return None
+
+    async def _load_page(self, user_id: str, after: Optional[PetCursor], limit: int) -> List[dict]:
+        """The owner's documents after the cursor in creation order; stores with an index override this"""
+        documents = sorted((upgrade_pet_document(d) for d in await self._load_by_user(user_id)), key=creation_key)
+        return [document for document in documents if after is None or creation_key(document) > after][:limit]
+
+    @abstractmethod
+    async def _insert(self, document: dict) -> bool:
+        """Insert a new pet; False if it is primary and its owner already has a primary pet"""
+
+    @abstractmethod
+    async def _save(self, document: dict, expected_version: Optional[int]) -> bool:
+        """Replace the pet if its stored version is still expected_version"""
+
+    @abstractmethod
+    async def _delete(self, pet_id: str) -> bool: ...
+
+    async def _modify(self, pet_id: str, change: Callable[[dict], bool], events: Optional[List[Dict]] = None) -> Optional[Pet]:
+        """Apply change (which edits the document in place and says whether it did) under the version guard.
+
+        change may fill events with what it did; the attempt that lands is
+        logged with them.
+        """
+        for attempt in range(MAX_UPDATE_RETRIES):
+            document = await self._load(pet_id)
+            if not document:
+                return None
+            # Documents written before versioning have no version field
+            expected = document.get("version")
+            if not change(upgrade_pet_document(document)):
+                return pet_from_document(document)
+            document["version"] = (expected or 0) + 1
+            if await self._save(document, expected):
+                updated_pet = pet_from_document(document)
+                self.on_written(updated_pet)
+                return await self._logged(updated_pet, events)
+            print(f"[DEBUG] Version conflict on pet {pet_id}, retrying (attempt {attempt + 1})")
+            await retry_backoff(attempt)
+
+        raise PetUpdateConflict(f"Pet {pet_id} changed during {MAX_UPDATE_RETRIES} update attempts")
+
+    async def create_pet(self, document: dict) -> Pet:
+        document = dict(document)
+        document["_id"] = document.pop("id", None) or str(ObjectId())
+        document["isPrimary"] = True
+        if not await self._insert(document):
+            document["isPrimary"] = False
+            await self._insert(document)
+        return await self._logged(pet_from_document(document))
+
+    async def get_pet(self, pet_id: str) -> Optional[Pet]:
+        document = await self._load(pet_id)
+        return pet_from_document(document) if document else None
+
+    async def get_pets(self, pet_ids: List[str]) -> Dict[str, Pet]:
+        pets = [pet_from_document(document) for document in await self._load_many(pet_ids)]
+        return {pet.id: pet for pet in pets}
+
+    async def get_pet_header(self, pet_id: str) -> Optional[dict]:
+        document = await self._load(pet_id)
+        if not document:
+            return None
+        return {"_id": document["_id"], "userId": document.get("userId"), "version": document.get("version")}
+
+    async def get_pets_by_user(self, user_id: str) -> List[Pet]:
+        documents = [upgrade_pet_document(document) for document in await self._load_by_user(user_id)]
+        return [pet_from_document(document) for document in sorted(documents, key=creation_key)]
+
+    async def list_pets(self, user_id: str, after: Optional[PetCursor], limit: int) -> List[dict]:
+        return [pet_summary(document) for document in await self._load_page(user_id, after, limit)]
+
+    async def get_primary_pet(self, user_id: str) -> Optional[Pet]:
+        document = await self._load_primary(user_id)
+        return pet_from_document(document) if document else None
+
+    async def get_or_create_primary_pet(self, user_id: str, defaults: dict) -> Pet:
+        while True:
+            document = await self._load_primary(user_id)
+            if document:
+                return pet_from_document(document)
+            document = {**defaults, "_id": str(ObjectId()), "userId": user_id, "isPrimary": True}
+            document.pop("id", None)
+            if await self._insert(document):
+                return await self._logged(pet_from_document(document))
+            # Another request created the primary pet between our read and insert
+
+    async def delete_pet(self, pet_id: str) -> bool:
+        return await self._delete(pet_id)
+
+    async def update_fields(self, pet_id: str, fields: dict) -> Optional[Pet]:
+        def set_fields(document: dict) -> bool:
+            document.update(fields)
+            return True
+        return await self._modify(pet_id, set_fields)
+
+    async def append_memories(self, pet_id: str, memories: List[Memory]) -> Optional[Pet]:
+        def append(document: dict) -> bool:
+            document["memoryLog"] = append_memories(document.get("memoryLog") or [], memories)
+            return True
+        return await self._modify(pet_id, append)
+
+    async def count_interaction(self, pet_id: str) -> Optional[Pet]:
+        def count(document: dict) -> bool:
+            document["interactionCount"] = (document.get("interactionCount") or 0) + 1
+            document["lastInteraction"] = datetime.now(timezone.utc)
+            return True
+        return await self._modify(pet_id, count)
+
+    async def adjust_battery(self, pet_id: str, delta: int) -> Optional[Pet]:
+        def adjust(document: dict) -> bool:
+            battery = document.get("batteryLevel")
+            document["batteryLevel"] = clamp_battery((MAX_BATTERY_LEVEL if battery is None else battery) + delta)
+            return True
+        return await self._modify(pet_id, adjust)
+
+    async def interact(self, pet_id: str, action_type: str, message: Optional[str] = None) -> Optional[Pet]:
+        return await self.apply_actions(pet_id, [{"type": action_type, "message": message}])
+
+    async def apply_actions(self, pet_id: str, actions: List[Dict]) -> Optional[Pet]:
+        events: List[Dict] = []
+
+        def fold(document: dict) -> bool:
+            folded = fold_pet_actions(document, actions)
+            events[:] = action_events(actions, folded)
+            if not folded["applied"]:
+                return False
+            document.update(folded["set"])
+            for field, delta in folded["inc"].items():
+                document[field] = (document.get(field) or 0) + delta
+            document["memoryLog"] = append_memories(document.get("memoryLog") or [], folded["memories"])
+            return True
+        return await self._modify(pet_id, fold, events)
+
+    async def update_versioned(self, pet_id: str, build_changes: Callable[[dict], Optional[dict]],
+                               decay: bool = False) -> Optional[Pet]:
+        events: List[Dict] = []
+
+        def apply_changes(document: dict) -> bool:
+            changes = build_changes(document)
+            if not changes:
+                return False
+            if decay:
+                events[:] = [decay_event(changes)]
+            document.update(changes)
+            return True
+        return await self._modify(pet_id, apply_changes, events)
+
+    async def apply_outbox(self, entries: List[Dict]) -> int:
+        changed = 0
+        for entry in entries:
+            # Whether the attempt that landed applied the entry, or found it already applied
+            outcome = {"applied": False}
+
+            def apply_entry(document: dict) -> bool:
+                applied = document.get("appliedOutbox") or []
+                outcome["applied"] = entry["_id"] not in applied
+                if not outcome["applied"]:
+                    return False
+                battery = document.get("batteryLevel")
+                battery = MAX_BATTERY_LEVEL if battery is None else battery
+                document["batteryLevel"] = clamp_battery(battery + entry.get("batteryDelta", 0))
+                document["interactionCount"] = (document.get("interactionCount") or 0) + entry.get("interactions", 0)
+                document["memoryLog"] = append_memories(
+                    document.get("memoryLog") or [], entry.get("memories", []), entry["createdAt"]
+                )
+                last_interaction = document.get("lastInteraction")
+                if last_interaction is None or last_interaction < entry["createdAt"]:
+                    document["lastInteraction"] = entry["createdAt"]
+                document["appliedOutbox"] = (applied + [entry["_id"]])[-APPLIED_OUTBOX_HISTORY:]
+                return True
+
+            await self._modify(entry["petId"], apply_entry, [chat_event(entry)])
+            changed += outcome["applied"]
+        return changed
+
+    async def find_memories(self, user_id: str, kinds: Optional[List[str]] = None, since: Optional[datetime] = None,
+                            until: Optional[datetime] = None, pet_id: Optional[str] = None, limit: int = 100) -> List[dict]:
+        matches = []
+        for document in await self._load_by_user(user_id):
+            if pet_id and str(document["_id"]) != pet_id:
+                continue
+            for memory in document.get("memoryLog") or []:
+                if record_matches(memory, kinds, since, until):
+                    matches.append((str(document["_id"]), memory))
+        # Records without a time sort last, as missing fields do in MongoDB
+        oldest = datetime.min.replace(tzinfo=timezone.utc)
+        matches.sort(key=lambda match: match[1].get("t") or oldest, reverse=True)
+        return [{"petId": match_pet_id, **memory_view(memory)} for match_pet_id, memory in matches[:limit]]
+
+
+class InMemoryPetRepository(DocumentPetRepository):
+    """Pets in a dict, for tests and benchmarks; documents are copied in and out like a real store"""
+
+    def __init__(self, on_written: Optional[Callable[[Pet], None]] = None, interactions: Optional[InteractionLog] = None):
+        super().__init__(on_written, interactions)
+        self.documents: Dict[str, dict] = {}
+
+    async def ensure_indexes(self) -> None:
+        pass
+
+    async def _load(self, pet_id: str) -> Optional[dict]:
+        document = self.documents.get(pet_id)
+        return copy.deepcopy(document) if document else None
+
+    async def _load_by_user(self, user_id: str) -> List[dict]:
+        return [copy.deepcopy(document) for document in self.documents.values() if document.get("userId") == user_id]
+
+    async def _insert(self, document: dict) -> bool:
+        # No await between the check and the insert, so the primary slot can't be taken twice
+        if document.get("isPrimary") and any(
+            other.get("isPrimary") and other.get("userId") == document.get("userId") for other in self.documents.values()
+        ):
+            return False
+        self.documents[str(document["_id"])] = copy.deepcopy(document)
+        return True
+
+    async def _save(self, document: dict, expected_version: Optional[int]) -> bool:
+        stored = self.documents.get(str(document["_id"]))
+        if stored is None or stored.get("version") != expected_version:
+            return False
+        self.documents[str(document["_id"])] = copy.deepcopy(document)
+        return True
+
+    async def _delete(self, pet_id: str) -> bool:
+        return self.documents.pop(pet_id, None) is not None
+
+
+class InMemoryUserRepository(UserRepository):
+    def __init__(self):
+        self.documents: Dict[str, dict] = {}
+
+    async def ensure_indexes(self) -> None:
+        pass
+
+    async def create_user(self, document: dict) -> User:
+        document = {**document, "_id": str(ObjectId())}
+        self.documents[document["_id"]] = document
+        return user_from_document(dict(document))
+
+    async def get_user_by_email(self, email: str) -> Optional[User]:
+        for document in self.documents.values():
+            if document["email"] == email:
+                return user_from_document(dict(document))
+        return None
+
+    async def get_user_by_id(self, user_id: str) -> Optional[User]:
+        document = self.documents.get(user_id)
+        return user_from_document(dict(document)) if document else None
+
+    async def get_users(self, user_ids: List[str]) -> Dict[str, User]:
+        return {user_id: user_from_document(dict(self.documents[user_id])) for user_id in user_ids if user_id in self.documents}
+
+    async def replace_password_hash(self, user_id: str, old_hash: str, new_hash: str) -> bool:
+        document = self.documents.get(user_id)
+        if not document or document["hashed_password"] != old_hash:
+            return False
+        document["hashed_password"] = new_hash
+        return True
+
+    async def delete_user(self, user_id: str) -> bool:
+        return self.documents.pop(user_id, None) is not None
+
+
+class InMemorySessionRepository(SessionRepository):
+    def __init__(self):
+        self.sessions: Dict[str, dict] = {}
+
+    async def ensure_indexes(self) -> None:
+        pass
+
+    async def get_session(self, session_id: str) -> Optional[dict]:
+        session = self.sessions.get(session_id)
+        if session and datetime.now() < session["expires_at"]:
+            return dict(session)
+        return None
+
+    async def create_session(self, user_id: str) -> str:
+        session_id = os.urandom(16).hex()
+        self.sessions[session_id] = {
+            "session_id": session_id,
+            "user_id": user_id,
+            "expires_at": datetime.now() + SESSION_LIFETIME
+        }
+        return session_id
+
+    async def delete_session(self, session_id: str) -> None:
+        self.sessions.pop(session_id, None)
+
+    async def revoke_user_sessions(self, user_id: str) -> None:
+        for session_id in [key for key, session in self.sessions.items() if session["user_id"] == user_id]:
+            del self.sessions[session_id]
+
+
+def memory_storage(on_written: Optional[Callable[[Pet], None]] = None) -> Storage:
+    return Storage(
+        "memory",
+        InMemoryPetRepository(on_written, InMemoryInteractionLog()),
+        InMemoryUserRepository(),
+        InMemorySessionRepository()
+    )
@@ -0,0 +1,136 @@
+import asyncio
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+BatchLoad = Callable[[List[str]], Awaitable[Dict[str, Any]]]
+
+
+class DataLoader:
+    """Identity map for one collection that fills its misses in batches.
+
+    Every key maps to a future, so a document is fetched at most once and
+    later lookups share it. Keys requested in the same event loop tick,
+    typically by coroutines running under asyncio.gather, are fetched
+    together by one batch_load call (a single $in query).
+    """
+
+    def __init__(self, batch_load: BatchLoad):
+        self.batch_load = batch_load
+        self._futures: Dict[str, asyncio.Future] = {}
+        self._queue: List[str] = []
+        self.loads = 0
+        self.fetches = 0
+        self.fetched_keys = 0
+
+    async def load(self, key: str) -> Any:
+        self.loads += 1
+        future = self._futures.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._futures[key] = loop.create_future()
+            self._queue.append(key)
+            if len(self._queue) == 1:
+                # Dispatch after the coroutines that are ready now have queued their keys too
+                loop.call_soon(lambda: asyncio.ensure_future(self._dispatch()))
+        return await future
+
+    async def _dispatch(self) -> None:
+        keys, self._queue = self._queue, []
+        self.fetches += 1
+        self.fetched_keys += len(keys)
+        try:
+            found = await self.batch_load(keys)
+        except Exception as e:
+            # Forget the failed keys so a later lookup tries again
+            for key in keys:
+                self._futures.pop(key).set_exception(e)
+            return
+        for key in keys:
+            self._futures[key].set_result(found.get(key))
+
+    def prime(self, key: str, value: Any) -> None:
+        """Record a document this request wrote (None once deleted), so later lookups see it without a fetch"""
+        future = self._futures.get(key)
+        if future is not None and not future.done():
+            # A fetch is in flight and its result is already stale; replace it once it settles
+            future.add_done_callback(lambda _: self.prime(key, value))
+            return
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(value)
+        self._futures[key] = future
+
+    @property
+    def hits(self) -> int:
+        """Lookups answered from the identity map or by another lookup's fetch"""
+        return self.loads - self.fetched_keys
+
+
+class UnitOfWork:
+    """What one request has read: an identity map of pets and one of users"""
+
+    def __init__(self, load_pets: BatchLoad, load_users: BatchLoad):
+        self.pets = DataLoader(load_pets)
+        self.users = DataLoader(load_users)
+
+    @property
+    def loaders(self) -> List[DataLoader]:
+        return [self.pets, self.users]
+
+    @property
+    def loads(self) -> int:
+        return sum(loader.loads for loader in self.loaders)
+
+    @property
+    def fetches(self) -> int:
+        return sum(loader.fetches for loader in self.loaders)
+
+    @property
+    def hits(self) -> int:
+        return sum(loader.hits for loader in self.loaders)
+
+
+class UnitOfWorkStats:
+    """Totals over finished units of work, for the metrics endpoint"""
+
+    def __init__(self):
+        self.requests = 0
+        self.loads = 0
+        self.fetches = 0
+        self.hits = 0
+
+    def record(self, unit: UnitOfWork) -> None:
+        self.requests += 1
+        self.loads += unit.loads
+        self.fetches += unit.fetches
+        self.hits += unit.hits
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "loads": self.loads,
+            "fetches": self.fetches,
+            "hits": self.hits,
+            "fetches_per_request": round(self.fetches / self.requests, 2) if self.requests else 0.0
+        }
+
+
+unit_of_work_stats = UnitOfWorkStats()
+
+_current_unit: contextvars.ContextVar = contextvars.ContextVar("unit_of_work", default=None)
+
+
+def current_unit_of_work() -> Optional[UnitOfWork]:
+    """The unit of work of the request being served, if any"""
+    return _current_unit.get()
+
+
+@contextmanager
+def unit_of_work_scope(unit: UnitOfWork) -> Iterator[UnitOfWork]:
+    """Route PetDB and UserDB lookups made in this context, and tasks it starts, through unit"""
+    token = _current_unit.set(unit)
+    try:
+        yield unit
+    finally:
+        _current_unit.reset(token)
+        unit_of_work_stats.record(unit)
@@ -0,0 +1,148 @@
+import asyncio
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from pymongo.errors import CollectionInvalid
+from .pet_schema import MOOD_LEVELS
+
+# Snapshots buffered before an insert_many, and the longest a snapshot waits in the buffer
+VITALS_BATCH_SIZE = int(os.getenv("VITALS_BATCH_SIZE", "200"))
+VITALS_FLUSH_SECONDS = float(os.getenv("VITALS_FLUSH_SECONDS", "2"))
+# Snapshots are dropped after this many days (0 keeps them forever)
+VITALS_RETENTION_DAYS = int(os.getenv("VITALS_RETENTION_DAYS", "365"))
+# Oldest snapshots are dropped rather than growing the buffer while MongoDB is unreachable
+MAX_BUFFERED_VITALS = 10000
+
+DEFAULT_HISTORY_DAYS = 7
+DEFAULT_HISTORY_POINTS = 200
+MAX_HISTORY_POINTS = 1000
+
+# Moods as numbers so they can be averaged and charted; higher is happier
+MOOD_SCORES = {
+    MOOD_LEVELS["ANGRY"]: 0,
+    MOOD_LEVELS["GRUMPY"]: 1,
+    MOOD_LEVELS["NEUTRAL"]: 2,
+    MOOD_LEVELS["CONTENT"]: 3,
+    MOOD_LEVELS["HAPPY"]: 4
+}
+
+VITAL_FIELDS = ("batteryLevel", "mood", "level", "interactionCount")
+
+
+def vitals_snapshot(pet: Any, timestamp: Optional[datetime] = None) -> Dict[str, Any]:
+    """One time-series measurement of a pet"""
+    snapshot = {"timestamp": timestamp or datetime.now(timezone.utc), "petId": str(pet.id)}
+    for field in VITAL_FIELDS:
+        snapshot[field] = getattr(pet, field, None)
+    return snapshot
+
+
+def history_pipeline(pet_id: str, start: datetime, end: datetime, points: int) -> List[Dict]:
+    """Average the snapshots in [start, end) into at most `points` equal-width time buckets"""
+    width_ms = max(1, int((end - start).total_seconds() * 1000 / points))
+    mood_score = {"$switch": {
+        "branches": [{"case": {"$eq": ["$mood", mood]}, "then": score} for mood, score in MOOD_SCORES.items()],
+        "default": None
+    }}
+    return [
+        {"$match": {"petId": pet_id, "timestamp": {"$gte": start, "$lt": end}}},
+        {"$sort": {"timestamp": 1}},
+        {"$group": {
+            "_id": {"$floor": {"$divide": [{"$subtract": ["$timestamp", start]}, width_ms]}},
+            "samples": {"$sum": 1},
+            "batteryLevel": {"$avg": "$batteryLevel"},
+            "moodScore": {"$avg": mood_score},
+            "mood": {"$last": "$mood"},
+            "level": {"$max": "$level"},
+            "interactionCount": {"$max": "$interactionCount"}
+        }},
+        {"$sort": {"_id": 1}},
+        {"$project": {
+            "_id": 0,
+            "timestamp": {"$add": [start, {"$multiply": ["$_id", width_ms]}]},
+            "samples": 1,
+            "batteryLevel": {"$round": ["$batteryLevel", 1]},
+            "moodScore": {"$round": ["$moodScore", 2]},
+            "mood": 1,
+            "level": 1,
+            "interactionCount": 1
+        }}
+    ]
+
+
+class VitalsRecorder:
+    """Buffers vitals snapshots from the write path and inserts them in batches"""
+
+    def __init__(self, collection, batch_size: int = VITALS_BATCH_SIZE, flush_seconds: float = VITALS_FLUSH_SECONDS):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._buffer: List[Dict[str, Any]] = []
+        self._pending_flush: Optional[asyncio.Task] = None
+        self._recorded = 0
+        self._inserted = 0
+        self._dropped = 0
+        self._failed_flushes = 0
+
+    async def ensure_collection(self, db) -> None:
+        """Create the time-series collection (MongoDB 5.0+) and its per-pet index"""
+        options = {"timeseries": {"timeField": "timestamp", "metaField": "petId", "granularity": "minutes"}}
+        if VITALS_RETENTION_DAYS > 0:
+            options["expireAfterSeconds"] = VITALS_RETENTION_DAYS * 24 * 60 * 60
+        try:
+            await db.create_collection(self.collection.name, **options)
+            print(f"[VITALS] Created time-series collection {self.collection.name}")
+        except CollectionInvalid:
+            pass
+        await self.collection.create_index([("petId", 1), ("timestamp", 1)])
+
+    def record(self, pet: Any) -> None:
+        """Queue a snapshot of the pet; never blocks the write that triggered it"""
+        self._buffer.append(vitals_snapshot(pet))
+        self._recorded += 1
+        if len(self._buffer) > MAX_BUFFERED_VITALS:
+            overflow = len(self._buffer) - MAX_BUFFERED_VITALS
+            del self._buffer[:overflow]
+            self._dropped += overflow
+        if len(self._buffer) >= self.batch_size and (self._pending_flush is None or self._pending_flush.done()):
+            try:
+                self._pending_flush = asyncio.get_running_loop().create_task(self.flush())
+            except RuntimeError:
+                # No running loop (scripts); the next flush picks the buffer up
+                pass
+
+    async def flush(self) -> int:
+        """Insert everything buffered so far; returns how many snapshots were written"""
+        batch, self._buffer = self._buffer, []
+        if not batch:
+            return 0
+        try:
+            await self.collection.insert_many(batch, ordered=False)
+        except Exception as e:
+            # Put the batch back in front of anything recorded meanwhile and retry on the next flush
+            self._buffer = batch + self._buffer
+            self._failed_flushes += 1
+            print(f"[VITALS] Failed to insert {len(batch)} snapshots: {str(e)}")
+            return 0
+        self._inserted += len(batch)
+        return len(batch)
+
+    async def run_flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            await self.flush()
+
+    async def history(self, pet_id: str, start: datetime, end: datetime, points: int) -> List[Dict]:
+        # Include buffered snapshots so a chart refreshed right after a write shows it
+        await self.flush()
+        cursor = self.collection.aggregate(history_pipeline(pet_id, start, end, points))
+        return await cursor.to_list(points)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "recorded": self._recorded,
+            "inserted": self._inserted,
+            "buffered": len(self._buffer),
+            "dropped": self._dropped,
+            "failed_flushes": self._failed_flushes
+        }
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""
+Script to export users, pets or memories as NDJSON without loading collections into memory
+
+Usage:
+    python export_data.py pets --output pets.ndjson.gz --gzip --checkpoint-file pets.checkpoint
+"""
+
+import argparse
+import asyncio
+import gzip
+import os
+import sys
+from database.database import async_db
+from database.export import EXPORT_SOURCES, DEFAULT_EXPORT_BATCH_SIZE, export_records, to_ndjson
+
+async def export(source, output, after, batch_size, use_gzip, checkpoint_file, checkpoint_every):
+    """Write an export to a file (or stdout), recording progress as it goes"""
+    # Resume from the checkpoint file when no explicit starting point was given
+    if not after and checkpoint_file and os.path.exists(checkpoint_file):
+        with open(checkpoint_file) as f:
+            after = f.read().strip() or None
+        if after:
+            print(f"Resuming {source} export after {after}", file=sys.stderr)
+
+    resuming = after is not None
+    if output == "-":
+        stream = sys.stdout.buffer
+    elif use_gzip:
+        stream = gzip.open(output, "ab" if resuming else "wb")
+    else:
+        stream = open(output, "ab" if resuming else "wb")
+
+    written = 0
+    since_checkpoint = 0
+    last_checkpoint = after
+    try:
+        async for record in export_records(async_db, source, after, batch_size):
+            checkpoint = record["_checkpoint"]
+            # Only record a checkpoint once every line for the previous id is written
+            if checkpoint_file and last_checkpoint and checkpoint != last_checkpoint and since_checkpoint >= checkpoint_every:
+                stream.flush()
+                with open(checkpoint_file, "w") as f:
+                    f.write(last_checkpoint)
+                since_checkpoint = 0
+            stream.write(to_ndjson(record).encode("utf-8"))
+            last_checkpoint = checkpoint
+            written += 1
+            since_checkpoint += 1
+        stream.flush()
+        if checkpoint_file and last_checkpoint:
+            with open(checkpoint_file, "w") as f:
+                f.write(last_checkpoint)
+    finally:
+        if stream is not sys.stdout.buffer:
+            stream.close()
+
+    print(f"Exported {written} {source} records", file=sys.stderr)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export ChronoPal data as NDJSON")
+    parser.add_argument("source", choices=sorted(EXPORT_SOURCES))
+    parser.add_argument("--output", default="-", help="File to write, or - for stdout")
+    parser.add_argument("--after", help="Resume after this _id (pet id for memories)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_EXPORT_BATCH_SIZE)
+    parser.add_argument("--gzip", action="store_true", help="Gzip the output file")
+    parser.add_argument("--checkpoint-file", help="File that records the last exported _id for resuming")
+    parser.add_argument("--checkpoint-every", type=int, default=1000, help="Records between checkpoint writes")
+    args = parser.parse_args()
+
+    asyncio.run(export(
+        args.source,
+        args.output,
+        args.after,
+        args.batch_size,
+        args.gzip,
+        args.checkpoint_file,
+        args.checkpoint_every
+    ))
@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+"""
+Script to rewrite every pet's legacy memory strings as structured memory records
+
+Usage:
+    python migrate_memories.py
+    python migrate_memories.py --batch-size 500
+"""
+
+import argparse
+import asyncio
+import json
+from database.database import memory_migrator
+
+async def migrate(batch_size):
+    """Run one migration pass over all pets with legacy memories and print the report"""
+    memory_migrator.batch_size = batch_size
+    report = await memory_migrator.run()
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate ChronoPal memory logs to structured records")
+    parser.add_argument("--batch-size", type=int, default=memory_migrator.batch_size)
+    args = parser.parse_args()
+
+    asyncio.run(migrate(args.batch_size))
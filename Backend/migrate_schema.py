@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+"""
+Script to upgrade every pet document to the current schema version
+
+Resumes from the last checkpoint if a previous run was interrupted.
+
+Usage:
+    python migrate_schema.py
+    python migrate_schema.py --batch-size 1000 --pause-ms 50
+    python migrate_schema.py --restart
+"""
+
+import argparse
+import asyncio
+import json
+from database.database import schema_migrator
+
+async def migrate(batch_size, pause_ms, restart):
+    """Run the schema migration to completion and print the report"""
+    schema_migrator.batch_size = batch_size
+    schema_migrator.pause_ms = pause_ms
+    report = await schema_migrator.run(restart=restart)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate ChronoPal pet documents to the current schema")
+    parser.add_argument("--batch-size", type=int, default=schema_migrator.batch_size)
+    parser.add_argument("--pause-ms", type=int, default=schema_migrator.pause_ms, help="Pause between batches")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start from the first pet")
+    args = parser.parse_args()
+
+    asyncio.run(migrate(args.batch_size, args.pause_ms, args.restart))
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+"""
+Script to rebuild pets' interaction fields from the interaction log
+
+Each pet is replayed from its latest snapshot and events, compared with the
+stored document, and rewritten where they differ. Pets the log doesn't fully
+cover are reported and left alone unless --force is given.
+
+Usage:
+    python rebuild_projections.py --pet-id <pet_id> --dry-run
+    python rebuild_projections.py --all
+    python rebuild_projections.py --all --snapshot-missing
+"""
+
+import argparse
+import asyncio
+import json
+from collections import Counter
+from database.database import PetDB, async_pets_collection
+
+async def all_pet_ids():
+    """Every pet id in MongoDB, oldest first"""
+    async for document in async_pets_collection.find({}, {"_id": 1}).sort("_id", 1):
+        yield str(document["_id"])
+
+async def listed(pet_ids):
+    """The pet ids given on the command line"""
+    for pet_id in pet_ids:
+        yield pet_id
+
+async def rebuild(pet_ids, dry_run, force, snapshot_missing):
+    """Rebuild (or check) each pet and print a report per pet and a summary"""
+    statuses = Counter()
+    async for pet_id in pet_ids:
+        report = await PetDB.rebuild_pet(pet_id, dry_run=dry_run, force=force)
+        if report["status"] == "no_snapshot" and snapshot_missing and not dry_run:
+            # Pets last written before the log existed start their history here
+            await PetDB.snapshot_pet(pet_id)
+            report["status"] = "snapshotted"
+        statuses[report["status"]] += 1
+        if report["status"] not in ("in_sync", "snapshotted"):
+            print(json.dumps(report, default=str))
+    print(json.dumps(dict(statuses), indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild ChronoPal pets from the interaction log")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--pet-id", action="append", help="Pet to rebuild (repeatable)")
+    target.add_argument("--all", action="store_true", help="Every pet in MongoDB")
+    parser.add_argument("--dry-run", action="store_true", help="Report drift without writing")
+    parser.add_argument("--force", action="store_true", help="Rewrite even pets with gaps in their log")
+    parser.add_argument("--snapshot-missing", action="store_true", help="Snapshot pets that have no snapshot yet")
+    args = parser.parse_args()
+
+    pet_ids = all_pet_ids() if args.all else listed(args.pet_id)
+    asyncio.run(rebuild(pet_ids, args.dry_run, args.force, args.snapshot_missing))
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+"""
+Script to replay a pet's interaction log and print its state at any version
+
+The state is rebuilt from the latest snapshot at or before the version plus
+the events after it, without touching the stored pet.
+
+Usage:
+    python replay_pet.py <pet_id>
+    python replay_pet.py <pet_id> --version 120
+    python replay_pet.py <pet_id> --events --after 100
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+from database.database import PetDB
+
+async def replay(pet_id, version, show_events, after):
+    """Print the replayed pet document, or the raw events with --events"""
+    if show_events:
+        events = await PetDB.interaction_history(pet_id, after, version)
+        for event in events:
+            event.pop("_id", None)
+            print(json.dumps(event, default=str))
+        print(f"{len(events)} events", file=sys.stderr)
+        return
+
+    state = await PetDB.replay_pet(pet_id, version)
+    if state is None:
+        print(f"No snapshot to replay pet {pet_id} from; run rebuild_projections.py --snapshot-missing", file=sys.stderr)
+        sys.exit(1)
+    if state["gaps"]:
+        print(f"Warning: the log has no record of versions {state['gaps']}", file=sys.stderr)
+    print(json.dumps(state, indent=2, default=str))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a ChronoPal pet's interaction log")
+    parser.add_argument("pet_id")
+    parser.add_argument("--version", type=int, help="Replay up to this pet version (default: the newest logged)")
+    parser.add_argument("--events", action="store_true", help="Print the events instead of the replayed state")
+    parser.add_argument("--after", type=int, default=-1, help="With --events, start after this version")
+    args = parser.parse_args()
+
+    asyncio.run(replay(args.pet_id, args.version, args.events, args.after))
@@ -0,0 +1,63 @@
+import pytest
+import asyncio
+from datetime import datetime, timezone
+from database.analytics import AnalyticsCache, summarize_pet_analytics, pet_analytics_pipeline
+
+@pytest.mark.asyncio
+async def test_concurrent_first_reads_share_one_computation():
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"totalPets": 3}
+
+    cache = AnalyticsCache(compute, refresh_seconds=60)
+    results = await asyncio.gather(*[cache.get() for _ in range(10)])
+
+    assert calls == 1
+    assert all(result["totalPets"] == 3 for result in results)
+    assert results[0]["refreshIntervalSeconds"] == 60
+
+@pytest.mark.asyncio
+async def test_reads_are_served_from_cache_until_refresh():
+    values = iter([1, 2])
+
+    async def compute():
+        return {"totalPets": next(values)}
+
+    cache = AnalyticsCache(compute, refresh_seconds=60)
+    assert (await cache.get())["totalPets"] == 1
+    assert (await cache.get())["totalPets"] == 1
+    await cache.refresh()
+    assert (await cache.get())["totalPets"] == 2
+    assert cache.refresh_count == 2
+
+def test_summarize_facets():
+    facets = {
+        "petsPerUser": [{"_id": 1, "users": 5}, {"_id": 2, "users": 2}],
+        "duplicateOwners": [{"_id": "u1", "pets": 2, "petIds": ["a", "b"]}, {"_id": "u2", "pets": 2, "petIds": ["c", "d"]}],
+        "duplicateOwnerCount": [{"owners": 2}],
+        "moodDistribution": [{"_id": "happy", "pets": 7}, {"_id": "angry", "pets": 2}],
+        "batteryHistogram": [{"_id": 0, "pets": 1}, {"_id": 100, "pets": 8}],
+        "levelHistogram": [{"_id": 1, "pets": 9}],
+        "activityPerDay": [{"_id": "2026-01-01", "pets": 4, "interactions": 30}]
+    }
+    report = summarize_pet_analytics(facets)
+
+    assert report["totalPets"] == 9
+    assert report["totalOwners"] == 7
+    assert report["duplicateOwnerCount"] == 2
+    assert report["duplicateOwners"][0] == {"userId": "u1", "pets": 2, "petIds": ["a", "b"]}
+    assert report["batteryHistogram"] == [{"from": 0, "to": 9, "pets": 1}, {"from": 100, "to": 100, "pets": 8}]
+    assert report["activityPerDay"] == [{"day": "2026-01-01", "activePets": 4, "interactions": 30}]
+
+def test_summarize_empty_collection():
+    report = summarize_pet_analytics({})
+    assert report["totalPets"] == 0
+    assert report["duplicateOwnerCount"] == 0
+
+def test_pipeline_is_a_single_facet_pass():
+    pipeline = pet_analytics_pipeline(datetime(2026, 1, 31, tzinfo=timezone.utc))
+    assert [list(stage)[0] for stage in pipeline] == ["$project", "$facet"]
@@ -0,0 +1,159 @@
+import pytest
+import asyncio
+from types import SimpleNamespace
+from api import ai_personality
+from api.circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+from api.rate_limit import ConcurrencyLimiter, RateLimitExceeded
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def make_pet():
+    return SimpleNamespace(name="Berny", species="Digital", mood="happy", level=1, sassLevel=1, batteryLevel=100)
+
+def test_breaker_opens_on_failure_rate_and_recovers_after_probe():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_rate=0.5, cooldown_seconds=30, min_calls=4, clock=clock)
+
+    for failed in [False, True, False, True]:
+        assert breaker.allow_request()
+        breaker._record(failed=failed, latency=0.1)
+    assert breaker.state == OPEN
+    assert not breaker.allow_request()
+
+    clock.now = 30
+    assert breaker.allow_request()
+    assert breaker.state == HALF_OPEN
+    # Only one probe at a time
+    assert not breaker.allow_request()
+
+    breaker.record_success(0.2)
+    assert breaker.state == CLOSED
+    assert breaker.allow_request()
+
+def test_slow_calls_open_the_breaker():
+    breaker = CircuitBreaker(failure_rate=0.5, slow_call_seconds=2, min_calls=2, clock=FakeClock())
+    breaker.record_success(5)
+    breaker.record_success(5)
+    assert breaker.state == OPEN
+
+def test_failed_probe_reopens():
+    clock = FakeClock()
+    breaker = CircuitBreaker(min_calls=1, cooldown_seconds=10, clock=clock)
+    breaker.record_failure(0.1)
+    clock.now = 10
+    assert breaker.allow_request()
+    breaker.record_failure(0.1)
+    assert breaker.state == OPEN
+    assert breaker.stats()["times_opened"] == 2
+
+def test_old_calls_leave_the_window():
+    clock = FakeClock()
+    breaker = CircuitBreaker(min_calls=3, window_seconds=60, clock=clock)
+    breaker.record_failure(0.1)
+    breaker.record_failure(0.1)
+    clock.now = 61
+    breaker.record_success(0.1)
+    assert breaker.state == CLOSED
+    assert breaker.stats()["recent_calls"] == 1
+
+@pytest.mark.asyncio
+async def test_hedged_call_returns_fallback_and_finishes_in_background(monkeypatch):
+    finished = asyncio.Event()
+
+    async def slow_remote(messages):
+        await asyncio.sleep(0.05)
+        finished.set()
+        return "remote"
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(ai_personality, "LLM_HEDGE_BUDGET_SECONDS", 0.01)
+    monkeypatch.setattr(ai_personality, "llm_breaker", CircuitBreaker())
+    monkeypatch.setattr(ai_personality, "_remote_response", slow_remote)
+
+    response = await ai_personality.get_chronopal_response("hi", make_pet())
+    assert response != "remote"
+    assert len(ai_personality._background_calls) == 1
+    await asyncio.wait_for(finished.wait(), 1)
+    await asyncio.sleep(0)
+    assert len(ai_personality._background_calls) == 0
+
+@pytest.mark.asyncio
+async def test_hedged_call_keeps_its_llm_slot_until_it_finishes(monkeypatch):
+    release = asyncio.Event()
+
+    async def slow_remote(messages):
+        await release.wait()
+        return "remote"
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(ai_personality, "LLM_HEDGE_BUDGET_SECONDS", 0.01)
+    monkeypatch.setattr(ai_personality, "llm_breaker", CircuitBreaker())
+    monkeypatch.setattr(ai_personality, "_remote_response", slow_remote)
+
+    limiter = ConcurrencyLimiter(limit=1, max_wait=0.01)
+    async with limiter.slot() as slot:
+        response = await ai_personality.get_chronopal_response("hi", make_pet(), slot)
+    assert response != "remote"
+
+    # The request is over, but its OpenAI call still holds the only slot
+    assert limiter.stats()["in_flight"] == 1 and limiter.stats()["detached"] == 1
+    with pytest.raises(RateLimitExceeded):
+        async with limiter.slot():
+            pass
+
+    release.set()
+    while ai_personality._background_calls:
+        await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    assert limiter.stats()["in_flight"] == 0 and limiter.stats()["detached"] == 0
+    async with limiter.slot():
+        pass
+
+@pytest.mark.asyncio
+async def test_open_breaker_skips_remote_call(monkeypatch):
+    async def remote(messages):
+        raise AssertionError("remote call should be skipped")
+
+    breaker = CircuitBreaker(min_calls=1)
+    breaker.record_failure(0.1)
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(ai_personality, "llm_breaker", breaker)
+    monkeypatch.setattr(ai_personality, "_remote_response", remote)
+
+    response = await ai_personality.get_chronopal_response("hi", make_pet())
+    assert isinstance(response, str) and response
+
+@pytest.mark.asyncio
+async def test_prompt_error_does_not_strand_the_half_open_probe(monkeypatch):
+    calls = []
+
+    async def remote(messages):
+        calls.append(messages)
+        breaker.record_success(0.1)
+        return "remote"
+
+    def broken_prompt(user_message, pet, memories):
+        raise ValueError("bad memory")
+
+    clock = FakeClock()
+    breaker = CircuitBreaker(min_calls=1, cooldown_seconds=10, clock=clock)
+    breaker.record_failure(0.1)
+    clock.now = 10
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(ai_personality, "LLM_HEDGE_BUDGET_SECONDS", 0)
+    monkeypatch.setattr(ai_personality, "llm_breaker", breaker)
+    monkeypatch.setattr(ai_personality, "_remote_response", remote)
+
+    with monkeypatch.context() as patched:
+        patched.setattr(ai_personality, "build_messages", broken_prompt)
+        response = await ai_personality.get_chronopal_response("hi", make_pet())
+    assert response != "remote" and not calls
+
+    # The probe is still available to the next chat, which closes the breaker
+    assert await ai_personality.get_chronopal_response("hi", make_pet()) == "remote"
+    assert breaker.state == CLOSED
@@ -0,0 +1,82 @@
+import pytest
+import asyncio
+from database.database import PetDB
+from database.memory_records import memory_count, memory_text
+
+TEST_USER_ID = "test_concurrency_user"
+
+@pytest.fixture
+async def test_pet(storage):
+    """A fresh pet for each test, in a fresh store."""
+    pet = await PetDB.create_pet({
+        "name": "StressPet",
+        "species": "cat",
+        "userId": TEST_USER_ID,
+        "batteryLevel": 50
+    })
+    yield pet
+
+@pytest.mark.asyncio
+async def test_concurrent_interactions_keep_exact_counters(test_pet):
+    feeds, plays, teaches = 100, 100, 100
+    calls = (
+        [PetDB.feed_pet(test_pet.id) for _ in range(feeds)]
+        + [PetDB.play_with_pet(test_pet.id) for _ in range(plays)]
+        + [PetDB.teach_pet(test_pet.id, f"lesson {i}") for i in range(teaches)]
+    )
+    results = await asyncio.gather(*calls)
+    assert all(result is not None for result in results)
+
+    pet = await PetDB.get_pet(test_pet.id)
+    total = feeds + plays + teaches
+    assert pet.interactionCount == total
+    assert pet.level == 1 + teaches
+    # Repeated feeds and plays are compacted into counted entries as they are written
+    assert sum(memory_count(memory) for memory in pet.memoryLog) == total
+    assert pet.batteryLevel == 100
+    assert pet.version == test_pet.version + total
+
+@pytest.mark.asyncio
+async def test_concurrent_battery_drain_is_exact(test_pet):
+    await asyncio.gather(*[PetDB.update_battery_level(test_pet.id, -3) for _ in range(10)])
+    pet = await PetDB.get_pet(test_pet.id)
+    assert pet.batteryLevel == 20
+
+    # Draining past empty clamps at zero instead of going negative
+    await asyncio.gather(*[PetDB.update_battery_level(test_pet.id, -3) for _ in range(50)])
+    pet = await PetDB.get_pet(test_pet.id)
+    assert pet.batteryLevel == 0
+
+@pytest.mark.asyncio
+async def test_depleted_pet_ignores_concurrent_interactions(test_pet):
+    await PetDB.update_pet(test_pet.id, {"batteryLevel": 0})
+    before = await PetDB.get_pet(test_pet.id)
+
+    await asyncio.gather(*[PetDB.feed_pet(test_pet.id) for _ in range(50)])
+    pet = await PetDB.get_pet(test_pet.id)
+    assert pet.interactionCount == before.interactionCount
+    assert pet.batteryLevel == 0
+
+@pytest.mark.asyncio
+async def test_concurrent_increments_and_batches(test_pet):
+    batch = [{"type": "play"}, {"type": "teach", "message": "dial-up"}]
+    await asyncio.gather(
+        *[PetDB.increment_interaction(test_pet.id) for _ in range(100)],
+        *[PetDB.apply_actions(test_pet.id, batch) for _ in range(20)]
+    )
+    pet = await PetDB.get_pet(test_pet.id)
+    assert pet.interactionCount == 100 + 20 * len(batch)
+    assert pet.level == 1 + 20
+
+@pytest.mark.asyncio
+async def test_outbox_entries_apply_once_even_when_redelivered(test_pet):
+    from database.outbox import chat_effects
+    entries = [chat_effects(test_pet.id, f"chat {i}") for i in range(10)]
+    await asyncio.gather(PetDB.apply_outbox(entries), PetDB.apply_outbox(entries))
+    await PetDB.apply_outbox(entries[:3])
+
+    pet = await PetDB.get_pet(test_pet.id)
+    assert pet.interactionCount == test_pet.interactionCount + 10
+    assert pet.batteryLevel == 20
+    # Plain-text entries queued before memory records are parsed into notes on the way in
+    assert [memory_text(memory) for memory in pet.memoryLog[-10:]] == [f"chat {i}" for i in range(10)]
@@ -1,14 +1,13 @@
 import pytest
-from fastapi.testclient import TestClient
+from api import routes
 from api.main import app
-from database.database import async_pets_collection, async_users_collection, PetDB, UserDB
+from api.rate_limit import RateLimiter, InMemoryRateLimitStore
+from database.database import PetDB, UserDB, vitals_recorder
+from database.outbox import pet_outbox
 from database.pet_schema import Pet
 from database.user_schema import UserCreate
-import os
 from dotenv import load_dotenv
-import asyncio
 from httpx import AsyncClient
-from bson import ObjectId
 from datetime import datetime, timezone
 from unittest.mock import patch
 
@@ -19,33 +18,19 @@ load_dotenv()
 def mock_get_chronopal_response(*args, **kwargs):
     return "Test response from ChronoPal"
 
-@pytest.fixture(scope="session")
-def event_loop():
-    """Create an instance of the default event loop for each test case."""
-    loop = asyncio.get_event_loop_policy().new_event_loop()
-    yield loop
-    loop.close()
-
 @pytest.fixture
-async def async_client():
-    """Create an async client for testing."""
+async def async_client(storage, monkeypatch):
+    """Create an async client for testing, wired to the test's storage backend like main.py's startup does."""
+    monkeypatch.setattr(routes, "session_functions", storage.session_functions())
+    # Without MongoDB, chat side effects are applied as they are enqueued
+    monkeypatch.setattr(pet_outbox, "collection", None)
     base_url = "http://test"
     async with AsyncClient(app=app, base_url=base_url) as client:
         yield client
 
 @pytest.fixture
-async def test_user():
-    # First, ensure no existing user with the test email
-    existing_user = await UserDB.get_user_by_email("test_endpoints@example.com")
-    if existing_user:
-        # Clean up any existing pets for this user
-        existing_pets = await PetDB.get_pets_by_user(str(existing_user.id))
-        for pet in existing_pets:
-            await async_pets_collection.delete_one({"_id": ObjectId(pet.id)})
-        # Delete the user
-        await async_users_collection.delete_one({"_id": ObjectId(existing_user.id)})
-    
-    # Create a test user
+async def test_user(storage):
+    # Each test gets a fresh store, so there is no earlier user to clean up
     user_data = {
         "username": "test_user_endpoints",
         "email": "test_endpoints@example.com",
@@ -54,21 +39,9 @@ async def test_user():
     user = UserCreate(**user_data)
     created_user = await UserDB.create_user(user)
     yield created_user
-    # Cleanup
-    # Clean up any pets for this user
-    existing_pets = await PetDB.get_pets_by_user(str(created_user.id))
-    for pet in existing_pets:
-        await async_pets_collection.delete_one({"_id": ObjectId(pet.id)})
-    # Delete the user
-    await async_users_collection.delete_one({"_id": ObjectId(created_user.id)})
 
 @pytest.fixture
 async def test_pet(test_user):
-    # First, ensure no existing pets for the test user
-    existing_pets = await PetDB.get_pets_by_user(str(test_user.id))
-    for pet in existing_pets:
-        await async_pets_collection.delete_one({"_id": ObjectId(pet.id)})
-    
     # Create a test pet with all required fields
     pet_data = Pet(
         name="TestPet",
@@ -87,21 +60,9 @@ async def test_pet(test_user):
     assert created_pet.userId == str(test_user.id)
     
     yield created_pet
-    # Cleanup
-    await async_pets_collection.delete_one({"_id": ObjectId(created_pet.id)})
 
 @pytest.mark.asyncio
 async def test_register_endpoint(async_client):
-    # First, ensure no existing user with the test email
-    existing_user = await UserDB.get_user_by_email("new_test@example.com")
-    if existing_user:
-        # Clean up any existing pets for this user
-        existing_pets = await PetDB.get_pets_by_user(str(existing_user.id))
-        for pet in existing_pets:
-            await async_pets_collection.delete_one({"_id": ObjectId(pet.id)})
-        # Delete the user
-        await async_users_collection.delete_one({"_id": ObjectId(existing_user.id)})
-    
     # Test user registration
     response = await async_client.post("/api/register", json={
         "username": "new_test_user",
@@ -113,13 +74,6 @@ async def test_register_endpoint(async_client):
     assert "_id" in data
     assert data["username"] == "new_test_user"
     assert data["email"] == "new_test@example.com"
-    # Cleanup
-    # Clean up any pets for this user
-    existing_pets = await PetDB.get_pets_by_user(str(data["_id"]))
-    for pet in existing_pets:
-        await async_pets_collection.delete_one({"_id": ObjectId(pet.id)})
-    # Delete the user
-    await async_users_collection.delete_one({"_id": ObjectId(data["_id"])})
 
 @pytest.mark.asyncio
 async def test_login_endpoint(async_client, test_user):
@@ -157,45 +111,30 @@ async def test_user_pet_endpoint(async_client, test_user, test_pet):
     assert data["userId"] == str(test_user.id)
 
 @pytest.mark.asyncio
-async def test_update_interaction_endpoint(async_client, test_user, test_pet):
+async def test_interaction_endpoints(async_client, test_user, test_pet):
     # Login first
     session_id = await test_login_endpoint(async_client, test_user)
-    
+    headers = {"session-id": session_id}
+
     # Test feeding interaction
-    response = await async_client.post("/api/update-interaction", 
-        headers={"session-id": session_id},
-        json={
-            "pet_id": str(test_pet.id),
-            "interaction_type": "feed"
-        }
-    )
+    response = await async_client.post("/api/feed-pet", headers=headers, json={"pet_id": str(test_pet.id)})
     assert response.status_code == 200
     data = response.json()
     assert data["mood"] == "happy"
     assert data["userId"] == str(test_user.id)
 
     # Test play interaction
-    response = await async_client.post("/api/update-interaction", 
-        headers={"session-id": session_id},
-        json={
-            "pet_id": str(test_pet.id),
-            "interaction_type": "play"
-        }
-    )
+    response = await async_client.post("/api/play-with-pet", headers=headers, json={"pet_id": str(test_pet.id)})
     assert response.status_code == 200
     data = response.json()
-    assert data["mood"] == "excited"
-    assert data["userId"] == str(test_user.id)
+    assert data["mood"] == "happy"
+    assert data["interactionCount"] == 2
 
     # Test teach interaction
-    response = await async_client.post("/api/update-interaction", 
-        headers={"session-id": session_id},
-        json={
-            "pet_id": str(test_pet.id),
-            "interaction_type": "teach",
-            "message": "Learn to sit"
-        }
-    )
+    response = await async_client.post("/api/teach-pet", headers=headers, json={
+        "pet_id": str(test_pet.id),
+        "message": "Learn to sit"
+    })
     assert response.status_code == 200
     data = response.json()
     assert data["level"] == 2  # Level should increase by 1
@@ -226,8 +165,6 @@ async def test_save_pet_endpoint(async_client, test_user):
     assert data["name"] == "NewPet"
     assert data["species"] == "dog"
     assert data["userId"] == str(test_user.id)
-    # Cleanup
-    await async_pets_collection.delete_one({"_id": ObjectId(data["_id"])})
 
 @pytest.mark.asyncio
 @patch('api.routes.get_chronopal_response', side_effect=mock_get_chronopal_response)
@@ -247,4 +184,47 @@ async def test_chat_endpoint(mock_response, async_client, test_user, test_pet):
     data = response.json()
     assert "response" in data
     assert isinstance(data["response"], str)
-    assert len(data["response"]) > 0 
\ No newline at end of file
+    assert len(data["response"]) > 0
+
+@pytest.mark.asyncio
+async def test_mongo_only_routes_are_unavailable(async_client, test_user, test_pet):
+    session_id = await test_login_endpoint(async_client, test_user)
+    headers = {"session-id": session_id}
+
+    for path in ["/api/leaderboard", "/api/leaderboard/me", f"/api/pets/{test_pet.id}/history",
+                 f"/api/pets/{test_pet.id}/memories/search?q=sit"]:
+        response = await async_client.get(path, headers=headers)
+        assert response.status_code == 501, path
+
+    # Writes don't buffer vitals for a MongoDB flush that would never succeed
+    recorded = vitals_recorder.stats()["recorded"]
+    await async_client.post("/api/feed-pet", headers=headers, json={"pet_id": str(test_pet.id)})
+    assert vitals_recorder.stats()["recorded"] == recorded
+
+@pytest.mark.asyncio
+async def test_batch_actions_are_charged_per_action(async_client, test_user, test_pet, monkeypatch):
+    monkeypatch.setattr(routes, "rate_limiter", RateLimiter(InMemoryRateLimitStore(), {"actions": "5/60"}))
+    session_id = await test_login_endpoint(async_client, test_user)
+    headers = {"session-id": session_id}
+    path = f"/api/pets/{test_pet.id}/actions:batch"
+
+    response = await async_client.post(path, headers=headers, json={"actions": [{"type": "play"}] * 3})
+    assert response.status_code == 200
+    # Two tokens are left, so three more actions have to wait
+    response = await async_client.post(path, headers=headers, json={"actions": [{"type": "play"}] * 3})
+    assert response.status_code == 429
+    # A batch bigger than the whole budget could never be let through
+    response = await async_client.post(path, headers=headers, json={"actions": [{"type": "play"}] * 6})
+    assert response.status_code == 422
+
+@pytest.mark.asyncio
+async def test_metrics_require_the_admin_key(async_client, monkeypatch):
+    monkeypatch.setenv("ADMIN_API_KEY", "admin-secret")
+
+    assert (await async_client.get("/api/metrics")).status_code == 404
+    assert (await async_client.get("/api/admin/metrics")).status_code == 401
+    response = await async_client.get("/api/admin/metrics", headers={"x-admin-key": "admin-secret"})
+    assert response.status_code == 200
+    assert "outbox" in response.json()
+    # The health probe stays public
+    assert (await async_client.get("/api/health")).status_code == 200
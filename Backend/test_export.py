@@ -0,0 +1,85 @@
+import pytest
+import gzip
+import json
+from datetime import datetime, timezone
+from bson import ObjectId
+from database.export import to_ndjson, parse_checkpoint, ndjson_chunks, gzip_chunks, iter_documents
+
+class FakeCursor:
+    """Just enough of a Motor cursor to exercise keyset paging"""
+
+    def __init__(self, documents, query):
+        self.documents = documents
+        self.query = query
+        self._limit = None
+
+    def sort(self, key, direction):
+        return self
+
+    def limit(self, limit):
+        self._limit = limit
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def __aiter__(self):
+        bound = self.query.get("_id", {}).get("$gt")
+        matches = [d for d in self.documents if bound is None or d["_id"] > bound]
+        self._iter = iter(matches[:self._limit])
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+class FakeCollection:
+    def __init__(self, documents):
+        self.documents = sorted(documents, key=lambda d: d["_id"])
+        self.queries = []
+
+    def find(self, query, projection):
+        self.queries.append(query)
+        return FakeCursor(self.documents, query)
+
+async def collect(iterator):
+    return [item async for item in iterator]
+
+def test_ndjson_encodes_bson_types():
+    oid = ObjectId()
+    when = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    line = to_ndjson({"_id": oid, "lastFed": when})
+    assert line.endswith("\n")
+    assert json.loads(line) == {"_id": str(oid), "lastFed": when.isoformat()}
+
+def test_parse_checkpoint():
+    oid = ObjectId()
+    assert parse_checkpoint(str(oid)) == oid
+    assert parse_checkpoint("legacy-id") == "legacy-id"
+    assert parse_checkpoint(None) is None
+
+@pytest.mark.asyncio
+async def test_iter_documents_pages_and_resumes():
+    ids = sorted(ObjectId() for _ in range(7))
+    collection = FakeCollection([{"_id": i} for i in ids])
+
+    documents = await collect(iter_documents(collection, {}, batch_size=3))
+    assert [d["_id"] for d in documents] == ids
+    # 3 + 3 + 1 documents means three keyset queries
+    assert len(collection.queries) == 3
+
+    resumed = await collect(iter_documents(collection, {}, after=ids[4], batch_size=3))
+    assert [d["_id"] for d in resumed] == ids[5:]
+
+@pytest.mark.asyncio
+async def test_gzip_stream_round_trips():
+    async def records():
+        for i in range(1000):
+            yield {"index": i}
+
+    compressed = b"".join(await collect(gzip_chunks(ndjson_chunks(records(), chunk_lines=64))))
+    lines = gzip.decompress(compressed).decode("utf-8").splitlines()
+    assert len(lines) == 1000
+    assert json.loads(lines[-1]) == {"index": 999}
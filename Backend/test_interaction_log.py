@@ -0,0 +1,98 @@
+from datetime import datetime, timezone, timedelta
+from database.database import PetDB
+from database.pet_schema import Pet, MOOD_LEVELS
+from database.memory_records import MEMORY_KINDS
+from database.outbox import chat_effects
+from database.interaction_log import PROJECTION_FIELDS, apply_event, projection_value
+
+TEST_USER_ID = "test_interaction_user"
+
+def _projection(document):
+    return {field: projection_value(document.get(field)) for field in PROJECTION_FIELDS}
+
+async def test_replay_matches_every_kind_of_write(storage):
+    storage.interactions.snapshot_every = 4
+    pet = await PetDB.create_pet(Pet(name="Berny", species="Digital", userId=TEST_USER_ID, batteryLevel=40))
+    seen = {}
+    for write in (
+        lambda: PetDB.feed_pet(pet.id),
+        lambda: PetDB.teach_pet(pet.id, "dial-up"),
+        lambda: PetDB.apply_actions(pet.id, [{"type": "play"}, {"type": "feed"}, {"type": "teach", "message": "irc"}]),
+        lambda: PetDB.update_pet(pet.id, {"name": "Bernard"}),
+        lambda: PetDB.apply_outbox([chat_effects(pet.id, {"k": MEMORY_KINDS["chat"], "u": "hi", "p": "sup"})]),
+        lambda: PetDB.play_with_pet(pet.id),
+    ):
+        await write()
+        current = await PetDB.get_pet(pet.id)
+        seen[current.version] = current.model_dump()
+
+    # Back-dated so neglect has something to decay
+    await PetDB.update_pet(pet.id, {"lastFed": datetime.now(timezone.utc) - timedelta(hours=30),
+                                    "lastInteraction": datetime.now(timezone.utc) - timedelta(hours=30)})
+    decayed = await PetDB.check_neglect(pet.id)
+    assert decayed.mood == MOOD_LEVELS["ANGRY"]
+    seen[decayed.version] = decayed.model_dump()
+
+    events = await PetDB.interaction_history(pet.id)
+    assert [event["type"] for event in events] == ["feed", "teach", "play", "feed", "teach", "chat", "play", "decay"]
+    assert [(event["seq"], event["n"]) for event in events[2:5]] == [(3, 0), (3, 1), (3, 2)]
+
+    for version, document in seen.items():
+        replayed = await PetDB.replay_pet(pet.id, version)
+        assert replayed["version"] == version and replayed["gaps"] == []
+        assert _projection(replayed) == _projection(document), version
+    assert (await PetDB.rebuild_pet(pet.id))["status"] == "in_sync"
+
+async def test_snapshots_bound_the_replayed_tail(storage):
+    storage.interactions.snapshot_every = 3
+    pet = await PetDB.create_pet({"name": "Berny", "species": "Digital", "userId": TEST_USER_ID})
+    for _ in range(7):
+        await PetDB.play_with_pet(pet.id)
+
+    assert (await storage.interactions.latest_snapshot(pet.id))["seq"] == 6
+    assert [event["seq"] for event in await storage.interactions.events(pet.id, 6)] == [7]
+    assert (await PetDB.replay_pet(pet.id))["interactionCount"] == 7
+
+async def test_rebuild_repairs_drift_and_reports_gaps(storage):
+    pet = await PetDB.create_pet({"name": "Berny", "species": "Digital", "userId": TEST_USER_ID, "batteryLevel": 50})
+    await PetDB.feed_pet(pet.id)
+
+    # A write straight to the store that bypasses the log
+    document = await storage.pets._load(pet.id)
+    document["batteryLevel"] = 5
+    await storage.pets._save(document, document["version"])
+
+    report = await PetDB.rebuild_pet(pet.id, dry_run=True)
+    assert report["status"] == "drifted" and report["drift"] == ["batteryLevel"]
+    assert (await PetDB.rebuild_pet(pet.id))["status"] == "rebuilt"
+    assert (await PetDB.get_pet(pet.id)).batteryLevel == 60
+
+    # Bumping the version without logging leaves a gap, which is only fixed on request
+    document = await storage.pets._load(pet.id)
+    document["version"] += 1
+    await storage.pets._save(document, document["version"] - 1)
+    report = await PetDB.rebuild_pet(pet.id)
+    assert report["status"] == "incomplete" and report["replayedVersion"] == report["version"] - 1
+
+async def test_pets_from_before_the_log_start_from_a_snapshot(storage):
+    # Inserted straight into the store, as pets written before the log existed were
+    document = Pet(name="Berny", species="Digital", userId=TEST_USER_ID, version=5).model_dump(by_alias=True)
+    await storage.pets._insert(document)
+    pet_id = document["_id"]
+    await PetDB.feed_pet(pet_id)
+    assert (await PetDB.rebuild_pet(pet_id))["status"] == "no_snapshot"
+
+    await PetDB.snapshot_pet(pet_id)
+    await PetDB.teach_pet(pet_id, "gopher")
+    replayed = await PetDB.replay_pet(pet_id)
+    assert replayed["version"] == 7 and replayed["gaps"] == [] and replayed["level"] == 2
+    assert (await PetDB.rebuild_pet(pet_id))["status"] == "in_sync"
+
+def test_chat_events_replay_like_the_outbox_pipeline():
+    at = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    state = {"batteryLevel": 2, "interactionCount": 4, "memoryLog": [], "lastInteraction": at - timedelta(hours=1)}
+    event = {"type": "chat", "seq": 9, "at": at, "batteryDelta": -3, "interactions": 1,
+             "memories": [{"k": MEMORY_KINDS["chat"], "u": "hi", "p": "sup"}]}
+    apply_event(state, event)
+    assert (state["batteryLevel"], state["interactionCount"], state["version"]) == (0, 5, 9)
+    assert state["lastInteraction"] == at and state["memoryLog"][0]["t"] == at
@@ -0,0 +1,118 @@
+import pytest
+import random
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from database.leaderboard import TopK, Leaderboard, leaderboard_entry, leaderboard_pipeline, sort_key
+
+def entry(pet_id, level, interactions, user_id="user1"):
+    return {"petId": pet_id, "name": pet_id, "species": "cat", "userId": user_id, "level": level, "interactionCount": interactions}
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = list(documents)
+
+    def sort(self, field, direction):
+        self.documents.sort(key=lambda document: document[field], reverse=direction < 0)
+        return self
+
+    def limit(self, count):
+        self.documents = self.documents[:count]
+        return self
+
+    async def to_list(self, length):
+        return self.documents[:length]
+
+    def __aiter__(self):
+        self._iter = iter(self.documents)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+class FakeLeaderboardCollection:
+    name = "leaderboard"
+
+    def __init__(self, documents):
+        self.documents = documents
+
+    def find(self, query=None):
+        query = query or {}
+        return FakeCursor(d for d in self.documents if all(d.get(k) == v for k, v in query.items()))
+
+    async def find_one(self, query, projection=None):
+        matches = [d for d in self.documents if all(d.get(k) == v for k, v in query.items())]
+        return matches[0] if matches else None
+
+    async def estimated_document_count(self):
+        return len(self.documents)
+
+def materialized(entries):
+    ordered = sorted(entries, key=sort_key)
+    refreshed_at = datetime(2026, 1, 1)
+    return [
+        {"_id": e["petId"], "rank": rank, "refreshedAt": refreshed_at, **{k: v for k, v in e.items() if k != "petId"}}
+        for rank, e in enumerate(ordered, start=1)
+    ]
+
+def test_top_k_matches_full_sort():
+    rng = random.Random(7)
+    board = TopK(10)
+    current = {}
+    for _ in range(500):
+        pet_id = f"pet{rng.randrange(40)}"
+        current[pet_id] = entry(pet_id, rng.randrange(1, 6), rng.randrange(100))
+        board.update(current[pet_id])
+
+    # Scores that go down can leave pets off a capped board, so compare against pets it still tracks
+    expected = sorted((current[p] for p in current if p in board), key=sort_key)
+    assert [e["petId"] for e in board.top(10)] == [e["petId"] for e in expected]
+    assert len(board) == 10
+
+def test_top_k_keeps_the_highest_and_ranks_them():
+    board = TopK(3)
+    for pet_id, level, interactions in [("a", 1, 5), ("b", 2, 0), ("c", 1, 9), ("d", 1, 1)]:
+        board.update(entry(pet_id, level, interactions))
+
+    assert [e["petId"] for e in board.top(3)] == ["b", "c", "a"]
+    assert "d" not in board
+    assert board.rank("c") == 2
+    assert board.rank("d") is None
+
+    # Growing past the leader moves a pet up; dropping out of the cap evicts the last one
+    assert board.update(entry("d", 3, 0))
+    assert [e["petId"] for e in board.top(3)] == ["d", "b", "c"]
+    board.remove("b")
+    assert [e["rank"] for e in board.top(3)] == [1, 2]
+
+def test_ties_break_on_pet_id_like_the_materialized_ranks():
+    board = TopK(5)
+    board.update(entry("b", 2, 4))
+    board.update(entry("a", 2, 4))
+    assert [e["petId"] for e in board.top(2)] == ["a", "b"]
+
+def test_entry_from_pet_defaults_missing_scores():
+    pet = SimpleNamespace(id="p1", name="Berny", species="Digital", userId="u1", level=None, interactionCount=None)
+    assert leaderboard_entry(pet)["level"] == 0
+    assert leaderboard_entry(pet)["interactionCount"] == 0
+
+def test_pipeline_ranks_with_the_index_order_and_replaces_the_collection():
+    pipeline = leaderboard_pipeline("leaderboard", datetime(2026, 1, 1, tzinfo=timezone.utc))
+    assert pipeline[0]["$setWindowFields"]["sortBy"] == {"level": -1, "interactionCount": -1, "_id": 1}
+    assert pipeline[-1] == {"$out": "leaderboard"}
+
+@pytest.mark.asyncio
+async def test_user_ranks_prefer_live_board_over_snapshot():
+    pets = [entry("a", 5, 0, "u2"), entry("b", 3, 0, "u1"), entry("c", 2, 0, "u2"), entry("d", 1, 0, "u1")]
+    leaderboard = Leaderboard(None, FakeLeaderboardCollection(materialized(pets)), size=2)
+
+    top = await leaderboard.top(10)
+    assert [e["petId"] for e in top] == ["a", "b"]
+    assert leaderboard.stats()["ranked_pets"] == 4
+
+    # d overtakes everyone on this worker; its live rank beats the materialized one
+    leaderboard.record(SimpleNamespace(id="d", name="d", species="cat", userId="u1", level=9, interactionCount=0))
+    ranks = await leaderboard.user_ranks("u1")
+    assert [(r["petId"], r["rank"], r["live"]) for r in ranks] == [("d", 1, True), ("b", 2, False)]
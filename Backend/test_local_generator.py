@@ -0,0 +1,43 @@
+import random
+import time
+from api.local_generator import LocalModelBuilder, LocalGenerator, extract_reply, load_generator
+from api.ai_personality import seed_samples, MOOD_EMOTICONS
+
+def test_extract_reply():
+    assert extract_reply("User said: 'hi', I replied: 'As if! It's, like, cool :)'") == "As if! It's, like, cool :)"
+    assert extract_reply("I was fed and it was delicious!") is None
+
+def test_generation_is_conditioned_on_mood_and_sass():
+    builder = LocalModelBuilder()
+    builder.add("happy", 1, "Totally rad day ^_^")
+    builder.add("angry", 1, "Talk to the hand >:(")
+    builder.add("angry", 5, "As if, loser >:(")
+    generator = LocalGenerator(builder.to_bytes())
+
+    assert generator.generate("happy", 1) == "Totally rad day ^_^"
+    assert generator.generate("angry", 1) == "Talk to the hand >:("
+    assert generator.generate("angry", 5) == "As if, loser >:("
+    # Unknown moods fall back to another condition instead of failing
+    assert generator.generate("confused", 1)
+
+def test_model_file_round_trip_and_speed(tmp_path):
+    path = str(tmp_path / "model.bin")
+    builder = LocalModelBuilder().add_samples(seed_samples())
+    builder.write(path)
+
+    generator = load_generator(path, seed_samples)
+    assert generator.stats()["samples"] == builder.samples
+
+    rng = random.Random(7)
+    replies = {generator.generate("grumpy", 1, rng) for _ in range(200)}
+    assert len(replies) > 10
+    assert all(reply.split()[-1] in MOOD_EMOTICONS["grumpy"] for reply in replies)
+
+    started = time.perf_counter()
+    for _ in range(1000):
+        generator.generate("happy", 5, rng)
+    assert (time.perf_counter() - started) / 1000 < 0.001
+
+def test_missing_model_file_uses_seed_phrases(tmp_path):
+    generator = load_generator(str(tmp_path / "missing.bin"), seed_samples)
+    assert generator.generate("content", 1)
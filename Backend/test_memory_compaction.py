@@ -0,0 +1,159 @@
+import copy
+import pytest
+from datetime import datetime, timezone, timedelta
+from database.memory_compaction import (
+    MemoryCompactor, MemoryMigrator, compact_memories, new_memory_entries, append_memories_expression, memory_count, memory_log_bytes
+)
+from database.memory_index import MemoryIndex
+from database.interaction_log import InMemoryInteractionLog
+from database.storage import pet_from_document
+from database.memory_records import MEMORY_KINDS, chat_record, parse_memory
+
+FED = "I was fed and it was delicious!"
+PLAYED = "We played together and it was fun!"
+FEED = MEMORY_KINDS["feed"]
+PLAY = MEMORY_KINDS["play"]
+T0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def sort(self, field, direction):
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def __aiter__(self):
+        self._iter = iter(self.documents)
+        return self
+
+    async def __anext__(self):
+        try:
+            return dict(next(self._iter))
+        except StopIteration:
+            raise StopAsyncIteration
+
+class FakePets:
+    """Pets whose version is bumped by a 'live write' just before the compactor rewrites them"""
+
+    def __init__(self, documents, raced=()):
+        self.documents = {document["_id"]: document for document in documents}
+        self.raced = set(raced)
+
+    def find(self, query, projection):
+        return FakeCursor([d for d in self.documents.values() if len(d.get("memoryLog", [])) > 1])
+
+    async def find_one_and_update(self, query, update, return_document):
+        document = self.documents[query["_id"]]
+        if query["_id"] in self.raced:
+            document["version"] += 1
+        if document.get("version") != query["version"]:
+            return None
+        document["memoryLog"] = update["$set"]["memoryLog"]
+        document["version"] += update["$inc"]["version"]
+        return copy.deepcopy(document)
+
+def test_events_merge_within_stretches_and_other_memories_stay_put():
+    log = [FED, PLAYED, FED, FED, "I learned about dial-up", FED, PLAYED, PLAYED]
+    compacted = compact_memories(log)
+
+    assert [memory_count(m) for m in compacted] == [3, 1, 1, 1, 2]
+    assert compacted[2] == "I learned about dial-up"
+    assert [parse_memory(m)["k"] for m in compacted] == [FEED, PLAY, MEMORY_KINDS["teach"], FEED, PLAY]
+    # Lone events are left as they were; only merged ones become counted records
+    assert compacted[1] == PLAYED and compacted[3] == FED
+    assert sum(memory_count(m) for m in compacted) == len(log)
+
+def test_merged_entries_cover_the_known_time_range():
+    log = [
+        {"text": FED, "count": 2, "firstAt": T0, "lastAt": T0 + timedelta(hours=1)},
+        FED,
+        {"k": FEED, "t": T0 + timedelta(hours=3)},
+    ]
+    assert compact_memories(log) == [{"k": FEED, "n": 4, "s": T0, "t": T0 + timedelta(hours=3)}]
+    # Legacy strings alone have no timestamps to report
+    assert compact_memories([FED, FED]) == [{"k": FEED, "n": 2}]
+
+def test_new_memories_are_compacted_before_they_are_written():
+    entries = new_memory_entries([{"k": FEED}, {"k": FEED}, chat_record("hi", "sup", T0)], T0)
+    assert entries == [{"k": FEED, "n": 2, "s": T0, "t": T0}, {"k": MEMORY_KINDS["chat"], "t": T0, "u": "hi", "p": "sup"}]
+    # Text queued before records is parsed on the way in
+    assert new_memory_entries(["remember me"], T0) == [{"k": MEMORY_KINDS["note"], "p": "remember me", "t": T0}]
+
+def test_append_expression_only_merges_events_into_the_last_entry():
+    chat = chat_record("$5", "cool", T0)
+    plain = append_memories_expression([chat], T0)
+    assert plain == {"$concatArrays": [{"$ifNull": ["$memoryLog", []]}, [{"$literal": chat}]]}
+
+    event = append_memories_expression([{"k": FEED}], T0)["$let"]
+    condition, merged, appended = event["in"]["$cond"]
+    assert condition == {"$eq": ["$$last.k", FEED]}
+    assert merged["$concatArrays"][1][0]["n"] == {"$add": [{"$ifNull": ["$$last.n", 1]}, 1]}
+    assert appended == {"$concatArrays": ["$$log", [{"$literal": {"k": FEED, "t": T0}}]]}
+
+@pytest.mark.asyncio
+async def test_compactor_reports_bytes_and_skips_pets_written_meanwhile():
+    busy = [FED] * 50 + ["I learned about modems"] + [PLAYED] * 50
+    pets = FakePets([
+        {"_id": "a", "version": 3, "memoryLog": list(busy)},
+        {"_id": "b", "version": 1, "memoryLog": ["hello", "there"]},
+        {"_id": "c", "version": 7, "memoryLog": list(busy)},
+    ], raced={"c"})
+    forgotten = []
+    report = await MemoryCompactor(pets, on_compacted=forgotten.append).run()
+
+    assert report["pets_scanned"] == 3
+    assert report["pets_compacted"] == 1 and report["conflicts"] == 1
+    assert report["entries_removed"] == len(busy) - 3
+    assert report["bytes_reclaimed"] == memory_log_bytes(busy) - memory_log_bytes(pets.documents["a"]["memoryLog"])
+    assert report["bytes_reclaimed"] > 0
+    assert pets.documents["a"]["version"] == 4
+    assert pets.documents["c"]["memoryLog"] == busy
+    assert forgotten == ["a"]
+
+@pytest.mark.asyncio
+async def test_compacted_pets_still_replay_from_their_log():
+    log = InMemoryInteractionLog()
+
+    async def snapshot(document):
+        await log.record(pet_from_document(document), [])
+
+    document = {"_id": "a", "name": "Berny", "species": "cat", "userId": "u1", "version": 1, "memoryLog": [FED, FED, PLAYED]}
+    await log.record(pet_from_document(copy.deepcopy(document)), [])
+    pets = FakePets([document])
+    await MemoryCompactor(pets, on_rewritten=snapshot).run()
+
+    replayed = await log.materialize("a")
+    assert replayed["version"] == 2 and replayed["gaps"] == []
+    assert replayed["memoryLog"] == pets.documents["a"]["memoryLog"]
+
+    # Writes after the compaction replay on top of the compacted log
+    pet = pet_from_document({**copy.deepcopy(pets.documents["a"]), "version": 3})
+    chat = {"type": "chat", "at": T0, "batteryDelta": -1, "interactions": 1, "memories": [chat_record("hi", "sup", T0)]}
+    await log.record(pet, [chat])
+    replayed = await log.materialize("a")
+    assert replayed["version"] == 3 and replayed["gaps"] == []
+    assert replayed["memoryLog"][:-1] == pets.documents["a"]["memoryLog"]
+
+def test_index_follows_a_compacted_entry_being_counted_up():
+    entry = {"k": FEED, "t": T0}
+    index = MemoryIndex(["I learned about dial-up", entry], version=1)
+    assert index.sync(["I learned about dial-up", {**entry, "n": 2, "s": T0}], version=2)
+    assert index.memories[-1]["n"] == 2
+    assert [p for p, _ in index.search("delicious")] == [1]
+
+@pytest.mark.asyncio
+async def test_migration_rewrites_legacy_entries_as_smaller_records():
+    legacy = ["User said: 'hi', I replied: 'sup'", {"text": FED, "count": 3, "firstAt": T0, "lastAt": T0}, "I learned about modems"]
+    pets = FakePets([
+        {"_id": "a", "version": 1, "memoryLog": list(legacy)},
+        {"_id": "b", "version": 1, "memoryLog": [{"k": FEED, "t": T0}, {"k": PLAY, "t": T0}]},
+    ])
+    report = await MemoryMigrator(pets).run()
+
+    assert report["pets_migrated"] == 1 and report["entries_removed"] == 0
+    assert report["bytes_reclaimed"] > 0
+    assert pets.documents["a"]["memoryLog"] == [parse_memory(memory) for memory in legacy]
+    assert pets.documents["b"]["version"] == 1
@@ -0,0 +1,41 @@
+from datetime import datetime, timezone
+from database.memory_records import (
+    MEMORY_KINDS, chat_record, note_record, action_record, parse_memory, memory_text, memory_view, record_match, record_condition
+)
+from database.memory_compaction import memory_log_bytes
+from api.local_generator import extract_reply
+
+T0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+def test_legacy_strings_parse_into_records():
+    assert parse_memory("User said: 'it's, like, rad', I replied: 'totally'") == {
+        "k": MEMORY_KINDS["chat"], "u": "it's, like, rad", "p": "totally"
+    }
+    assert parse_memory("I was fed and it was delicious!") == {"k": MEMORY_KINDS["feed"]}
+    assert parse_memory("I learned about dial-up") == {"k": MEMORY_KINDS["teach"], "u": "dial-up"}
+    assert parse_memory("Test memory from diagnostic tool") == {"k": MEMORY_KINDS["note"], "p": "Test memory from diagnostic tool"}
+
+def test_records_render_back_to_the_legacy_sentences():
+    for text in ["User said: 'hi', I replied: 'sup'", "We played together and it was fun!", "I learned about modems", "a note"]:
+        assert memory_text(parse_memory(text)) == text
+    assert memory_text(action_record("teach", "modems", T0)) == "I learned about modems"
+
+def test_records_are_smaller_than_the_sentences_they_replace():
+    chats = [f"User said: 'message {n}', I replied: 'reply {n}'" for n in range(100)]
+    records = [parse_memory(chat) for chat in chats]
+    assert memory_log_bytes(records) < memory_log_bytes(chats)
+
+def test_view_and_reply_work_for_both_shapes():
+    record = chat_record("hi", "sup", T0)
+    assert memory_view(record) == {"kind": "chat", "at": T0, "text": "User said: 'hi', I replied: 'sup'", "user": "hi", "pet": "sup"}
+    assert memory_view({"text": "I was fed and it was delicious!", "count": 2, "firstAt": T0, "lastAt": T0})["count"] == 2
+    assert extract_reply(record) == extract_reply("User said: 'hi', I replied: 'sup'") == "sup"
+    assert extract_reply(note_record("I replied: 'nothing'")) is None
+
+def test_kind_and_time_filters_agree():
+    until = datetime(2026, 2, 1, tzinfo=timezone.utc)
+    assert record_match(["chat", "teach"], T0, until) == {"k": {"$in": [1, 4]}, "t": {"$gte": T0, "$lt": until}}
+    assert record_match() == {"k": {"$exists": True}}
+    condition = record_condition(["chat"], until=until)["$and"]
+    assert condition[0] == {"$in": ["$$memory.k", [1]]}
+    assert {"$ne": [{"$type": "$$memory.t"}, "missing"]} in condition
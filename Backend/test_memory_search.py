@@ -0,0 +1,163 @@
+import pytest
+import random
+from types import SimpleNamespace
+from database.memory_index import MemoryIndex, MemorySearch, tokenize, highlight
+
+class FakeAggregate:
+    def __init__(self, documents):
+        self.documents = documents
+
+    async def to_list(self, length):
+        return self.documents[:length]
+
+class FakePets:
+    """Just enough of a collection for MemorySearch: one pet, $text matched by word"""
+
+    def __init__(self, memories, version=1):
+        self.memories = list(memories)
+        self.version = version
+        self.text_queries = 0
+        self.full_reads = 0
+
+    async def find_one(self, query, projection=None):
+        if "$text" in query:
+            self.text_queries += 1
+            words = set(tokenize(query["$text"]["$search"]))
+            if not any(words & set(tokenize(memory)) for memory in self.memories):
+                return None
+        else:
+            self.full_reads += 1
+        return {"_id": "pet1", "memoryLog": list(self.memories), "version": self.version}
+
+    def aggregate(self, pipeline):
+        start = pipeline[1]["$project"]["tail"]["$slice"][1]
+        return FakeAggregate([{"_id": "pet1", "version": self.version, "tail": self.memories[start:]}])
+
+PET = {"_id": "pet1", "userId": "user1"}
+
+def test_tokenize_drops_stopwords_and_plurals():
+    assert tokenize("I learned about the Lessons of dial-up's") == ["learned", "about", "lesson", "dial", "up"]
+
+def test_highlight_marks_matches_and_escapes():
+    snippet = highlight("I learned about <b>dial-up</b> modems", set(tokenize("modem")))
+    assert snippet == "I learned about &lt;b&gt;dial-up&lt;/b&gt; <mark>modems</mark>"
+
+def test_highlight_windows_long_memories_around_the_match():
+    memory = "filler " * 60 + "tamagotchi" + " filler" * 60
+    snippet = highlight(memory, {"tamagotchi"}, width=80)
+    assert "<mark>tamagotchi</mark>" in snippet
+    assert snippet.startswith("…") and snippet.endswith("…")
+
+def test_rare_terms_rank_higher_and_repeats_come_back_together():
+    index = MemoryIndex([
+        "I was fed and it was delicious!",
+        "I learned about dial-up",
+        "I was fed and it was delicious!",
+        "I learned about modems",
+    ])
+    assert [position for position, _ in index.search("learned dial-up")] == [1, 3]
+    # The repeated memory is one document; its copies come back newest first
+    assert [position for position, _ in index.search("delicious dial")] == [2, 0, 1]
+    assert index.top_memories("delicious dial", 2) == ["I was fed and it was delicious!", "I learned about dial-up"]
+    assert len(index.texts) == 3
+
+def test_extend_detects_rewritten_logs():
+    index = MemoryIndex(["a memory", "another memory"], version=2)
+    assert index.sync(["a memory", "another memory", "third memory"], version=3)
+    assert len(index) == 3 and index.version == 3
+    assert not index.sync(["reset"], version=4)
+    assert not index.sync(["a memory", "another memory", "changed", "fourth"], version=5)
+
+@pytest.mark.asyncio
+async def test_cold_pets_go_through_the_text_index_then_stay_hot():
+    pets = FakePets(["I learned about dial-up", "We played together and it was fun!"])
+    search = MemorySearch(pets)
+
+    assert (await search.search({**PET, "version": 1}, "tamagotchi"))["total"] == 0
+    assert search.stats()["hot_pets"] == 0
+
+    found = await search.search({**PET, "version": 1}, "dial-up")
+    assert found["results"][0]["snippet"] == "I learned about <mark>dial</mark>-<mark>up</mark>"
+    assert pets.text_queries == 2
+
+    # Appended memories are fetched as a tail, not as the whole log
+    pets.memories.append("I learned about modems")
+    pets.version = 2
+    found = await search.search({**PET, "version": 2}, "learned")
+    assert [r["position"] for r in found["results"]] == [2, 0]
+    assert pets.text_queries == 2 and pets.full_reads == 0
+    assert search.stats()["catch_ups"] == 1
+
+@pytest.mark.asyncio
+async def test_writes_keep_hot_indexes_current_and_pages_slice_results():
+    pets = FakePets([f"lesson {n}" for n in range(5)])
+    search = MemorySearch(pets)
+    await search.search({**PET, "version": 1}, "lesson")
+
+    search.observe(SimpleNamespace(id="pet1", memoryLog=pets.memories + ["lesson 5"], version=2))
+    page = await search.search({**PET, "version": 2}, "lesson", offset=2, limit=2)
+    assert page["total"] == 6
+    assert [r["position"] for r in page["results"]] == [3, 2]
+    assert search.stats()["hits"] == 1
+
+@pytest.mark.asyncio
+async def test_least_recently_searched_pets_are_evicted():
+    search = MemorySearch(FakePets(["dial-up"]), hot_pets=1)
+    await search.search({**PET, "version": 1}, "dial")
+    await search.search({"_id": "pet2", "userId": "user1", "version": 1}, "dial")
+    assert search.stats()["hot_pets"] == 1
+    assert search.stats()["evictions"] == 1
+
+def chat_pet(memories, version=1):
+    return SimpleNamespace(
+        id="pet1", name="Berny", species="Digital", mood="happy", level=1, sassLevel=1,
+        batteryLevel=90, memoryLog=memories, version=version
+    )
+
+def test_bm25_saturates_repeats_and_prefers_short_memories():
+    index = MemoryIndex([
+        "modem modem and then a very long story about many other things entirely unrelated to computers or phones",
+        "modem",
+        "lunch",
+    ])
+    assert [position for position, _ in index.search("modem")] == [1, 0]
+    assert index.search("modem", limit=1) == index.search("modem")[:1]
+
+def test_relevant_memories_are_built_lazily_and_extended_on_writes():
+    search = MemorySearch(None)
+    memories = ["I learned about dial-up", "I was fed and it was delicious!", "We played together and it was fun!"]
+    assert search.relevant(chat_pet(memories), "remember what I taught you about dial-up?") == ["I learned about dial-up"]
+    assert search.stats()["builds"] == 1
+
+    # add_memory publishes the written pet, which extends the index without a rebuild
+    search.observe(chat_pet(memories + ["I learned about Tamagotchi"], version=2))
+    assert search.relevant(chat_pet(memories + ["I learned about Tamagotchi"], version=2), "tamagotchi", limit=1) == ["I learned about Tamagotchi"]
+    assert search.stats()["builds"] == 1
+
+def test_indexes_are_evicted_under_the_global_budget():
+    search = MemorySearch(None, budget_bytes=5000)
+    for n in range(3):
+        search.relevant(SimpleNamespace(id=f"pet{n}", memoryLog=[f"memory number {i}" for i in range(5)], version=1), "memory")
+    stats = search.stats()
+    assert stats["estimated_bytes"] <= 5000
+    assert stats["hot_pets"] < 3 and stats["evictions"] >= 1
+    # The pet just used is never the one evicted
+    assert "pet2" in search._indexes
+    for n in range(3):
+        search.forget(f"pet{n}")
+    assert search.stats()["estimated_bytes"] == 0
+
+def test_prompt_includes_only_the_retrieved_memories():
+    from api.ai_personality import build_messages
+    messages = build_messages("remember dial-up?", chat_pet([]), ["I learned about dial-up"])
+    assert messages[-2]["content"] == "Things you remember that may be relevant:\n- I learned about dial-up"
+    assert messages[-1]["content"] == "The human says: remember dial-up?"
+    assert len(build_messages("hi", chat_pet([]))) == len(messages) - 1
+
+def test_pruned_top_k_matches_the_full_ranking():
+    rng = random.Random(3)
+    words = [f"word{n}" for n in range(40)]
+    index = MemoryIndex([" ".join(rng.choices(words, k=rng.randrange(1, 8))) for _ in range(300)])
+    for _ in range(50):
+        query = " ".join(rng.choices(words, k=rng.randrange(1, 5)))
+        assert index.rank_texts(query, 3) == index.rank_texts(query)[:3]
@@ -0,0 +1,121 @@
+import pytest
+from types import SimpleNamespace
+from bson import ObjectId
+from database.migrations import SchemaMigrator, PET_MIGRATIONS, upgrade_pet_document, upgrade_operation
+from database.pet_schema import Pet, PET_SCHEMA_VERSION
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+        self._limit = None
+
+    def sort(self, key, direction):
+        return self
+
+    def limit(self, limit):
+        self._limit = limit
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def __aiter__(self):
+        self._iter = iter(self.documents[:self._limit])
+        return self
+
+    async def __anext__(self):
+        try:
+            return dict(next(self._iter))
+        except StopIteration:
+            raise StopAsyncIteration
+
+def _lower_bound(query):
+    """The keyset bound iter_documents puts in its page filter"""
+    for clause in query.get("$and", [query]):
+        if "$gt" in clause.get("_id", {}):
+            return clause["_id"]["$gt"]
+    return None
+
+class FakePets:
+    def __init__(self, documents, fail_on_batch=None):
+        self.documents = {document["_id"]: document for document in documents}
+        self.fail_on_batch = fail_on_batch
+        self.batches = 0
+
+    def find(self, query, projection):
+        bound = _lower_bound(query)
+        outdated = [
+            d for _, d in sorted(self.documents.items())
+            if (d.get("schemaVersion") or 0) < PET_SCHEMA_VERSION and (bound is None or d["_id"] > bound)
+        ]
+        return FakeCursor(outdated)
+
+    async def bulk_write(self, operations, ordered):
+        self.batches += 1
+        if self.batches == self.fail_on_batch:
+            raise ConnectionError("primary stepped down")
+        matched = 0
+        for operation in operations:
+            guard, update = operation._filter, operation._doc
+            document = self.documents[guard["_id"]]
+            if document.get("schemaVersion") == guard["schemaVersion"] and document.get("version") == guard["version"]:
+                matched += 1
+                document.update(update["$set"])
+        return SimpleNamespace(matched_count=matched, modified_count=matched)
+
+class FakeCheckpoints:
+    def __init__(self):
+        self.state = None
+
+    async def find_one(self, query):
+        return self.state
+
+    async def update_one(self, query, update, upsert):
+        self.state = {**(self.state or {}), **update["$set"]}
+
+def legacy_pet(**fields):
+    return {"_id": ObjectId(), "name": "Berny", "species": "Digital", "userId": "u1", **fields}
+
+def test_every_schema_version_has_a_step():
+    assert len(PET_MIGRATIONS) == PET_SCHEMA_VERSION
+
+def test_reads_upgrade_legacy_documents_in_place():
+    document = legacy_pet(batteryLevel=None, memoryLog=[])
+    upgrade_pet_document(document)
+    assert document["batteryLevel"] == 100 and document["evolutionStage"] == "baby"
+    assert document["lastFed"] == document["_id"].generation_time
+    assert document["schemaVersion"] == PET_SCHEMA_VERSION
+    document["_id"] = str(document["_id"])
+    assert Pet(**document).batteryLevel == 100
+
+    # Only later steps run for documents already part way there
+    current = legacy_pet(schemaVersion=1, batteryLevel=None)
+    assert upgrade_pet_document(current)["batteryLevel"] is None
+
+def test_upgrade_sets_only_what_changed():
+    document = legacy_pet(batteryLevel=40, mood="grumpy", version=3)
+    operation = upgrade_operation(document)
+    assert operation._filter == {"_id": document["_id"], "schemaVersion": None, "version": 3}
+    changes = operation._doc["$set"]
+    assert "batteryLevel" not in changes and "mood" not in changes
+    assert changes["schemaVersion"] == PET_SCHEMA_VERSION and changes["evolutionStage"] == "baby"
+    assert "memoryLog" not in changes
+
+@pytest.mark.asyncio
+async def test_interrupted_migration_resumes_from_its_checkpoint():
+    pets = FakePets([legacy_pet() for _ in range(5)] + [legacy_pet(schemaVersion=PET_SCHEMA_VERSION)], fail_on_batch=2)
+    checkpoints = FakeCheckpoints()
+    migrator = SchemaMigrator(pets, checkpoints, batch_size=2, pause_ms=0)
+
+    with pytest.raises(ConnectionError):
+        await migrator.run()
+    first_batch = sorted(pets.documents)[:2]
+    assert checkpoints.state["lastId"] == first_batch[1]
+
+    report = await migrator.run()
+    assert report["resumed_after"] == str(first_batch[1])
+    assert report["pets_scanned"] == 3 and report["pets_upgraded"] == 3
+    assert all(d.get("schemaVersion") == PET_SCHEMA_VERSION for d in pets.documents.values())
+    assert checkpoints.state["completedAt"] is not None and checkpoints.state["lastId"] is None
+    # A finished migration starts from the beginning next time
+    assert await migrator.checkpoint() is None
@@ -0,0 +1,270 @@
+import pytest
+import asyncio
+import copy
+from types import SimpleNamespace
+from datetime import datetime, timezone
+from bson import ObjectId
+from database.database import MongoPetRepository
+from database.interaction_log import InMemoryInteractionLog
+from database.outbox import OutboxWorker, chat_effects
+from database.pet_schema import Pet
+from database.storage import APPLIED_OUTBOX_HISTORY
+
+def matches(document, query):
+    for key, condition in query.items():
+        if key == "$and":
+            if not all(matches(document, part) for part in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(document, part) for part in condition):
+                return False
+        elif isinstance(condition, dict) and "$ne" in condition:
+            if condition["$ne"] in (document.get(key) or []):
+                return False
+        elif isinstance(condition, dict) and "$in" in condition:
+            if document.get(key) not in condition["$in"]:
+                return False
+        elif isinstance(condition, dict) and "$lte" in condition:
+            if document.get(key) is None or document[key] > condition["$lte"]:
+                return False
+        elif document.get(key) != condition:
+            return False
+    return True
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def sort(self, key, direction):
+        self.documents = sorted(self.documents, key=lambda d: d[key])
+        return self
+
+    def limit(self, limit):
+        self.documents = self.documents[:limit]
+        return self
+
+    async def to_list(self, length):
+        # A round trip, giving concurrent workers the chance to interleave
+        await asyncio.sleep(0)
+        return [dict(document) for document in self.documents]
+
+class FakeOutbox:
+    """In-memory stand-in for the outbox collection"""
+
+    def __init__(self):
+        self.documents = {}
+
+    async def insert_one(self, document):
+        self.documents[document["_id"]] = dict(document)
+
+    async def insert_many(self, documents):
+        for document in documents:
+            await self.insert_one(document)
+
+    def find(self, query, projection=None):
+        return FakeCursor([d for d in self.documents.values() if matches(d, query)])
+
+    async def update_many(self, query, update):
+        for document in self.documents.values():
+            if matches(document, query):
+                document.update(update.get("$set", {}))
+                for field, delta in update.get("$inc", {}).items():
+                    document[field] = document.get(field, 0) + delta
+
+    async def delete_many(self, query):
+        for _id in query["_id"]["$in"]:
+            self.documents.pop(_id, None)
+
+@pytest.mark.asyncio
+async def test_entries_are_applied_in_batches_then_deleted():
+    applied = []
+
+    async def apply(entries):
+        applied.append([entry["memories"][0] for entry in entries])
+        return len(entries)
+
+    outbox = FakeOutbox()
+    worker = OutboxWorker(outbox, apply=apply, batch_size=2)
+    for i in range(5):
+        await worker.enqueue(chat_effects("pet1", f"memory {i}"))
+
+    await worker.drain()
+    assert applied == [["memory 0", "memory 1"], ["memory 2", "memory 3"], ["memory 4"]]
+    assert outbox.documents == {}
+    assert worker.stats()["applied"] == 5
+
+@pytest.mark.asyncio
+async def test_failed_batch_stays_leased_for_retry():
+    async def apply(entries):
+        raise ConnectionError("mongo down")
+
+    outbox = FakeOutbox()
+    worker = OutboxWorker(outbox, apply=apply, lease_seconds=30)
+    await worker.enqueue(chat_effects("pet1", "hello"))
+
+    with pytest.raises(ConnectionError):
+        await worker.process_batch()
+    entry = next(iter(outbox.documents.values()))
+    assert entry["attempts"] == 1
+    assert entry["availableAt"] > datetime.now(timezone.utc)
+    # Leased entries are hidden until the lease runs out
+    assert await worker.process_batch() == 0
+
+@pytest.mark.asyncio
+async def test_enqueue_wakes_running_worker():
+    done = asyncio.Event()
+
+    async def apply(entries):
+        done.set()
+        return len(entries)
+
+    worker = OutboxWorker(FakeOutbox(), apply=apply, poll_seconds=60)
+    task = asyncio.create_task(worker.run())
+    await asyncio.sleep(0)
+    await worker.enqueue(chat_effects("pet1", "hi"))
+    await asyncio.wait_for(done.wait(), 1)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+@pytest.mark.asyncio
+async def test_concurrent_workers_never_claim_the_same_entries():
+    applied = []
+
+    async def apply(entries):
+        applied.extend(entry["_id"] for entry in entries)
+        return len(entries)
+
+    outbox = FakeOutbox()
+    workers = [OutboxWorker(outbox, apply=apply, batch_size=10) for _ in range(2)]
+    for i in range(6):
+        await workers[0].enqueue(chat_effects("pet1", f"memory {i}"))
+
+    # Both workers find the same due entries, but only one lease lands on each
+    await asyncio.gather(*[worker.process_batch() for worker in workers])
+    assert len(applied) == len(set(applied)) == 6
+    assert outbox.documents == {}
+
+@pytest.mark.asyncio
+async def test_poison_entry_is_dead_lettered_without_holding_back_its_batch():
+    async def apply(entries):
+        if any(entry["memories"][0] == "poison" for entry in entries):
+            raise ValueError("cannot apply")
+        return len(entries)
+
+    outbox, dead_letters = FakeOutbox(), FakeOutbox()
+    worker = OutboxWorker(outbox, apply=apply, lease_seconds=0, max_attempts=2, dead_letters=dead_letters)
+    for memory in ["hi", "poison", "bye"]:
+        await worker.enqueue(chat_effects("pet1", memory))
+
+    assert await worker.process_batch() == 3
+    assert [entry["memories"] for entry in outbox.documents.values()] == [["poison"]]
+    with pytest.raises(ValueError):
+        await worker.process_batch()
+    await worker.process_batch()
+
+    assert outbox.documents == {}
+    dead = next(iter(dead_letters.documents.values()))
+    assert dead["memories"] == ["poison"] and dead["lastError"] == "cannot apply" and dead["attempts"] == 3
+    assert worker.stats()["applied"] == 2 and worker.stats()["dead_lettered"] == 1
+
+def test_chat_effects_entry():
+    entry = chat_effects("pet1", "User said: 'hi', I replied: 'sup'")
+    assert entry["interactions"] == 1
+    assert entry["batteryDelta"] == -3
+    assert entry["memories"] == ["User said: 'hi', I replied: 'sup'"]
+
+# The aggregation operators the outbox's pipeline updates use
+PIPELINE_OPERATORS = {
+    "$add": lambda *values: sum(values),
+    "$min": lambda *values: min(values),
+    "$max": lambda *values: max(value for value in values if value is not None),
+    "$ifNull": lambda value, default: default if value is None else value,
+    "$concatArrays": lambda *arrays: [item for array in arrays for item in array],
+    "$slice": lambda array, n: array[n:] if n < 0 else array[:n],
+}
+
+def evaluate(expression, document):
+    if isinstance(expression, str) and expression.startswith("$"):
+        return document.get(expression[1:])
+    if isinstance(expression, list):
+        return [evaluate(item, document) for item in expression]
+    if isinstance(expression, dict) and len(expression) == 1 and next(iter(expression)).startswith("$"):
+        operator, arguments = next(iter(expression.items()))
+        if operator == "$literal":
+            return arguments
+        return PIPELINE_OPERATORS[operator](*evaluate(arguments, document))
+    if isinstance(expression, dict):
+        return {key: evaluate(value, document) for key, value in expression.items()}
+    return expression
+
+async def iterate(documents):
+    for document in documents:
+        yield document
+
+class FakePets:
+    """In-memory stand-in for the pets collection, for the pipeline updates apply_outbox sends"""
+
+    def __init__(self, documents):
+        self.documents = {document["_id"]: document for document in documents}
+        self.interleaved = {}  # operation number -> write made just before it
+        self.operations = 0
+
+    def _update(self, document, pipeline):
+        for stage in pipeline:
+            document.update({field: evaluate(expression, document) for field, expression in stage["$set"].items()})
+
+    def _match(self, query):
+        return next((document for document in self.documents.values() if matches(document, query)), None)
+
+    def find(self, query, projection=None):
+        return iterate([copy.deepcopy(document) for document in self.documents.values() if matches(document, query)])
+
+    async def find_one(self, query):
+        document = self._match(query)
+        return copy.deepcopy(document) if document else None
+
+    async def find_one_and_update(self, query, update, return_document=None):
+        document = self._match(query)
+        if document is None:
+            return None
+        self._update(document, update)
+        return copy.deepcopy(document)
+
+    async def bulk_write(self, operations, ordered=True):
+        modified = 0
+        for operation in operations:
+            # Another worker's write landing between two of this bulk write's updates
+            interleaved = self.interleaved.pop(self.operations, None)
+            if interleaved:
+                interleaved()
+            self.operations += 1
+            document = self._match(operation._filter)
+            if document is not None:
+                self._update(document, operation._doc)
+                modified += 1
+        return SimpleNamespace(modified_count=modified)
+
+@pytest.mark.asyncio
+async def test_mongo_batch_applies_entries_once_past_the_applied_window():
+    pet = Pet(name="Berny", species="Digital", userId="outbox_user")
+    document = {**pet.model_dump(by_alias=True), "_id": ObjectId(pet.id)}
+    pets = FakePets([document])
+    # A rename lands after most of the entries, so those after it miss the bulk write and are applied one by one
+    pets.interleaved[APPLIED_OUTBOX_HISTORY + 5] = lambda: document.update(name="Bernard", version=document["version"] + 1)
+    interactions = InMemoryInteractionLog()
+    repository = MongoPetRepository(pets, interactions=interactions)
+    entries = [chat_effects(pet.id, f"chat {i}") for i in range(APPLIED_OUTBOX_HISTORY + 20)]
+
+    assert await repository.apply_outbox(entries) == len(entries)
+    assert document["interactionCount"] == len(entries)
+    assert len(document["memoryLog"]) == len(entries)
+    assert document["name"] == "Bernard" and document["version"] == len(entries) + 1
+
+    # Every entry is logged once, each under the version it wrote
+    events = await interactions.events(pet.id)
+    assert sorted(event["outboxId"] for event in events) == sorted(entry["_id"] for entry in entries)
+    assert len({event["seq"] for event in events}) == len(entries)
+
+    # Redelivered entries still in the window are skipped
+    assert await repository.apply_outbox(entries[-10:]) == 0
+    assert document["interactionCount"] == len(entries)
@@ -0,0 +1,42 @@
+import pytest
+from database.password_hashing import PasswordHasher, calibrate_bcrypt_rounds
+
+def test_calibration_picks_highest_cost_under_target():
+    # 25ms at cost 10 doubles per round: 50, 100, 200, 400...
+    rounds, expected_ms = calibrate_bcrypt_rounds(target_ms=250, measure=lambda rounds: 0.025)
+    assert rounds == 13
+    assert expected_ms == pytest.approx(200)
+
+def test_calibration_respects_bounds():
+    assert calibrate_bcrypt_rounds(target_ms=50, measure=lambda rounds: 0.5)[0] == 10
+    assert calibrate_bcrypt_rounds(target_ms=10_000, measure=lambda rounds: 0.0001)[0] == 16
+
+@pytest.mark.asyncio
+async def test_outdated_hash_is_rehashed_on_successful_login():
+    legacy = PasswordHasher(rounds=10)
+    current = PasswordHasher(rounds=11)
+    old_hash = legacy.hash("hunter2")
+
+    verified, new_hash = await current.verify_and_rehash("hunter2", old_hash)
+    assert verified
+    assert new_hash.startswith("$2b$11$")
+    assert current.verify("hunter2", new_hash)
+    assert not current.needs_update(new_hash)
+
+    assert await current.verify_and_rehash("wrong", old_hash) == (False, None)
+    assert current.stats()["rehashed_on_login"] == 1
+
+@pytest.mark.asyncio
+async def test_costlier_hashes_are_left_alone():
+    hasher = PasswordHasher(rounds=10)
+    stronger = PasswordHasher(rounds=11).hash("hunter2")
+    assert await hasher.verify_and_rehash("hunter2", stronger) == (True, None)
+
+def test_timing_metrics():
+    hasher = PasswordHasher(rounds=10)
+    hashed = hasher.hash("hunter2")
+    hasher.verify("hunter2", hashed)
+    stats = hasher.stats()
+    assert stats["hash"]["count"] == 1
+    assert stats["verify"]["count"] == 1
+    assert stats["verify"]["mean_ms"] > 0
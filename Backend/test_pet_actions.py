@@ -0,0 +1,61 @@
+from datetime import datetime, timezone, timedelta
+from database.pet_actions import fold_pet_actions
+from database.memory_records import MEMORY_KINDS
+from database.pet_schema import MOOD_LEVELS
+
+NOW = datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+def make_pet(**overrides):
+    pet = {
+        "mood": MOOD_LEVELS["GRUMPY"],
+        "level": 1,
+        "batteryLevel": 50,
+        "interactionCount": 4,
+        "lastFed": NOW - timedelta(hours=10),
+        "lastInteraction": NOW - timedelta(hours=5),
+        "memoryLog": []
+    }
+    pet.update(overrides)
+    return pet
+
+def test_fold_combines_all_effects():
+    actions = [
+        {"type": "feed", "clientTimestamp": NOW - timedelta(minutes=30)},
+        {"type": "play", "clientTimestamp": NOW - timedelta(minutes=20)},
+        {"type": "teach", "message": "dial-up", "clientTimestamp": NOW - timedelta(minutes=10)},
+    ]
+    folded = fold_pet_actions(make_pet(), actions, now=NOW)
+
+    assert folded["applied"] == 3
+    assert folded["set"]["batteryLevel"] == 72
+    assert folded["set"]["mood"] == MOOD_LEVELS["HAPPY"]
+    assert folded["set"]["lastFed"] == NOW - timedelta(minutes=30)
+    assert folded["set"]["lastInteraction"] == NOW - timedelta(minutes=10)
+    assert folded["inc"] == {"interactionCount": 3, "level": 1}
+    assert folded["memories"] == [
+        {"k": MEMORY_KINDS["feed"], "t": NOW - timedelta(minutes=30)},
+        {"k": MEMORY_KINDS["play"], "t": NOW - timedelta(minutes=20)},
+        {"k": MEMORY_KINDS["teach"], "t": NOW - timedelta(minutes=10), "u": "dial-up"},
+    ]
+
+def test_battery_is_capped():
+    folded = fold_pet_actions(make_pet(batteryLevel=95), [{"type": "feed"}, {"type": "feed"}], now=NOW)
+    assert folded["set"]["batteryLevel"] == 100
+
+def test_depleted_pet_ignores_actions():
+    folded = fold_pet_actions(make_pet(batteryLevel=0), [{"type": "feed"}], now=NOW)
+    assert folded["applied"] == 0
+    assert folded["memories"] == []
+
+def test_client_timestamps_are_clamped():
+    future = NOW + timedelta(days=1)
+    stale = NOW - timedelta(days=3)
+    folded = fold_pet_actions(make_pet(), [{"type": "play", "clientTimestamp": future}, {"type": "play", "clientTimestamp": stale}], now=NOW)
+    # Neither the future nor the out-of-order timestamp may move lastInteraction past now or backwards
+    assert folded["set"]["lastInteraction"] == NOW
+
+def test_missing_battery_defaults_to_full():
+    pet = make_pet()
+    del pet["batteryLevel"]
+    folded = fold_pet_actions(pet, [{"type": "teach", "message": "AOL"}], now=NOW)
+    assert folded["set"]["batteryLevel"] == 100
@@ -0,0 +1,89 @@
+import pytest
+import asyncio
+from database.pet_events import PetEventHub, pet_state
+
+def make_state(**overrides):
+    state = {
+        "mood": "happy",
+        "batteryLevel": 100,
+        "level": 1,
+        "interactionCount": 0,
+        "memoryCount": 0,
+        "lastMemory": None
+    }
+    state.update(overrides)
+    return state
+
+@pytest.mark.asyncio
+async def test_publish_sends_only_changed_fields():
+    hub = PetEventHub(buffer_size=4, max_connections=10)
+    subscription = hub.subscribe("pet1", make_state())
+
+    hub.publish("pet1", make_state(batteryLevel=90, memoryCount=1, lastMemory="I was fed and it was delicious!"))
+    event = await asyncio.wait_for(subscription.get(), timeout=1)
+
+    assert event["type"] == "pet_delta"
+    assert event["petId"] == "pet1"
+    assert event["changes"] == {"batteryLevel": 90, "memory": "I was fed and it was delicious!"}
+
+@pytest.mark.asyncio
+async def test_unchanged_state_is_not_published():
+    hub = PetEventHub(buffer_size=4, max_connections=10)
+    subscription = hub.subscribe("pet1", make_state())
+
+    assert hub.publish("pet1", make_state()) is None
+    assert subscription.queue.empty()
+
+@pytest.mark.asyncio
+async def test_publish_without_subscribers_is_ignored():
+    hub = PetEventHub(buffer_size=4, max_connections=10)
+    assert hub.publish("nobody-watching", make_state(level=2)) is None
+    assert hub.stats()["events_published"] == 0
+
+@pytest.mark.asyncio
+async def test_slow_consumer_is_dropped():
+    hub = PetEventHub(buffer_size=2, max_connections=10)
+    slow = hub.subscribe("pet1", make_state())
+    fast = hub.subscribe("pet1", make_state())
+
+    for battery in (99, 98):
+        hub.publish("pet1", make_state(batteryLevel=battery))
+    # Drain the fast consumer so only the slow one overflows
+    await fast.get()
+    await fast.get()
+    hub.publish("pet1", make_state(batteryLevel=97))
+
+    assert slow.dropped
+    assert await slow.get() is None
+    assert not fast.dropped
+    assert (await fast.get())["changes"] == {"batteryLevel": 97}
+    stats = hub.stats()
+    assert stats["slow_consumers_dropped"] == 1
+    assert stats["connections"] == 1
+
+@pytest.mark.asyncio
+async def test_connection_limit():
+    hub = PetEventHub(buffer_size=2, max_connections=1)
+    first = hub.subscribe("pet1")
+    assert first is not None
+    assert hub.subscribe("pet2") is None
+    assert hub.stats()["connections_rejected"] == 1
+
+    hub.unsubscribe(first)
+    assert hub.stats()["connections"] == 0
+    assert hub.stats()["pets_watched"] == 0
+    assert hub.subscribe("pet2") is not None
+
+def test_pet_state_from_document():
+    document = {
+        "_id": "abc",
+        "mood": "grumpy",
+        "batteryLevel": 40,
+        "level": 3,
+        "interactionCount": 12,
+        "memoryLog": ["first", "second"]
+    }
+    state = pet_state(document)
+    assert state["memoryCount"] == 2
+    assert state["lastMemory"] == "second"
+    assert state["mood"] == "grumpy"
@@ -0,0 +1,37 @@
+import pytest
+import asyncio
+from database.database import PetDB
+
+TEST_USER_ID = "test_primary_pet_user"
+
+@pytest.fixture
+async def clean_user(storage):
+    """The test user, starting with no pets in a fresh store."""
+    yield TEST_USER_ID
+
+@pytest.mark.asyncio
+async def test_parallel_get_or_create_creates_one_pet(clean_user):
+    # 100 concurrent first requests, like a dashboard firing several calls on load
+    pets = await asyncio.gather(*[PetDB.get_or_create_primary_pet(clean_user) for _ in range(100)])
+
+    assert len({pet.id for pet in pets}) == 1
+    assert len(await PetDB.get_pets_by_user(clean_user)) == 1
+    assert pets[0].isPrimary
+
+@pytest.mark.asyncio
+async def test_get_or_create_returns_existing_pet(clean_user):
+    first = await PetDB.get_or_create_primary_pet(clean_user)
+    second = await PetDB.get_or_create_primary_pet(clean_user)
+    assert first.id == second.id
+    assert second.name == "Berny"
+    assert second.batteryLevel == 100
+
+@pytest.mark.asyncio
+async def test_create_pet_claims_primary_only_once(clean_user):
+    first = await PetDB.create_pet({"name": "One", "species": "cat", "userId": clean_user})
+    second = await PetDB.create_pet({"name": "Two", "species": "cat", "userId": clean_user})
+
+    assert first.isPrimary
+    assert not second.isPrimary
+    primary = await PetDB.get_or_create_primary_pet(clean_user)
+    assert primary.id == first.id
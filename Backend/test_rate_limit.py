@@ -0,0 +1,77 @@
+import pytest
+import asyncio
+from api.rate_limit import (
+    InMemoryRateLimitStore, RateLimiter, ConcurrencyLimiter, RateLimitExceeded, parse_rate
+)
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_parse_rate():
+    assert parse_rate("10/60") == (10, 10 / 60)
+
+@pytest.mark.asyncio
+async def test_bucket_allows_burst_then_throttles_until_refill():
+    clock = FakeClock()
+    limiter = RateLimiter(InMemoryRateLimitStore(clock=clock), {"chat": "3/30"})
+
+    for _ in range(3):
+        await limiter.check("chat", "/chat", "user1")
+    with pytest.raises(RateLimitExceeded) as error:
+        await limiter.check("chat", "/chat", "user1")
+    assert error.value.retry_after == pytest.approx(10)
+    assert error.value.retry_after_header == "10"
+
+    # Other users and other routes have their own buckets
+    await limiter.check("chat", "/chat", "user2")
+    await limiter.check("chat", "/feed-pet", "user1")
+
+    clock.now = 10
+    await limiter.check("chat", "/chat", "user1")
+    assert limiter.stats()["throttled"] == {"/chat": 1}
+    assert limiter.stats()["allowed"] == {"/chat": 5, "/feed-pet": 1}
+
+@pytest.mark.asyncio
+async def test_store_evicts_least_recently_used_keys():
+    store = InMemoryRateLimitStore(max_keys=2)
+    for key in ["a", "b", "c"]:
+        await store.take(key, 1, 1.0)
+    assert list(store._buckets) == ["b", "c"]
+
+@pytest.mark.asyncio
+async def test_storage_errors_fail_open():
+    class BrokenStore(InMemoryRateLimitStore):
+        async def take(self, *args, **kwargs):
+            raise ConnectionError("down")
+
+    limiter = RateLimiter(BrokenStore(), {"chat": "1/60"})
+    await limiter.check("chat", "/chat", "user1")
+    await limiter.check("chat", "/chat", "user1")
+
+@pytest.mark.asyncio
+async def test_concurrency_limiter_rejects_when_saturated():
+    limiter = ConcurrencyLimiter(limit=2, max_wait=0.01)
+    release = asyncio.Event()
+
+    async def call():
+        async with limiter.slot():
+            await release.wait()
+
+    holders = [asyncio.create_task(call()) for _ in range(2)]
+    while limiter.stats()["in_flight"] < 2:
+        await asyncio.sleep(0)
+    assert limiter.stats()["in_flight"] == 2
+
+    with pytest.raises(RateLimitExceeded):
+        async with limiter.slot():
+            pass
+    assert limiter.stats()["rejected"] == 1
+
+    release.set()
+    await asyncio.gather(*holders)
+    async with limiter.slot():
+        assert limiter.stats()["in_flight"] == 1
@@ -0,0 +1,52 @@
+import json
+from datetime import datetime, timezone
+from bson import ObjectId
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from database.pet_schema import Pet
+from api.responses import encode_pet, dumps, pet_response, FastJSONResponse
+
+def make_pet():
+    return Pet(
+        name="Berny",
+        species="Digital",
+        userId="user1",
+        lastFed=datetime(2026, 1, 1, tzinfo=timezone.utc),
+        memoryLog=["I was fed and it was delicious!"]
+    )
+
+def test_encode_pet_has_both_ids():
+    pet = make_pet()
+    encoded = json.loads(dumps(encode_pet(pet)))
+    assert encoded["id"] == encoded["_id"] == pet.id
+    assert encoded["lastFed"] == "2026-01-01T00:00:00+00:00"
+    assert encoded["memoryLog"] == ["I was fed and it was delicious!"]
+    assert set(encoded) == set(Pet.model_fields) | {"_id"}
+
+def test_encoded_pet_matches_model_json():
+    pet = make_pet()
+    encoded = json.loads(dumps(encode_pet(pet)))
+    expected = pet.model_dump(mode="json")
+    expected["_id"] = expected["id"]
+    assert encoded == expected
+
+def test_dumps_handles_object_ids():
+    oid = ObjectId()
+    assert json.loads(dumps({"_id": oid})) == {"_id": str(oid)}
+
+def test_pet_response_bypasses_response_model():
+    app = FastAPI(default_response_class=FastJSONResponse)
+    pet = make_pet()
+
+    @app.get("/pet", response_model=Pet)
+    async def get_pet():
+        return pet_response(pet)
+
+    @app.get("/plain")
+    async def plain():
+        return {"ok": True}
+
+    client = TestClient(app)
+    body = client.get("/pet").json()
+    assert body["id"] == body["_id"] == pet.id
+    assert client.get("/plain").json() == {"ok": True}
@@ -0,0 +1,118 @@
+import pytest
+from api.session_tokens import SessionTokens, RevocationList, signed_session_functions
+
+class FakeClock:
+    def __init__(self, now=1_800_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+class FakeCursor:
+    def __init__(self, documents):
+        self._iter = iter(documents)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+class FakeRevocations:
+    """In-memory stand-in for the revoked_sessions collection"""
+
+    def __init__(self):
+        self.documents = {}
+
+    async def replace_one(self, query, document, upsert=False):
+        self.documents[query["_id"]] = dict(document)
+
+    def find(self, query):
+        since = query.get("revokedAt", {}).get("$gte")
+        return FakeCursor([d for d in self.documents.values() if since is None or d["revokedAt"] >= since])
+
+def test_tokens_round_trip_and_expire():
+    clock = FakeClock()
+    tokens = SessionTokens("secret", ttl_seconds=60, clock=clock)
+    token = tokens.issue("user1")
+
+    claims = tokens.verify(token)
+    assert claims["sub"] == "user1"
+    clock.now += 60
+    assert tokens.verify(token) is None
+
+def test_tampered_or_foreign_tokens_are_rejected():
+    tokens = SessionTokens("secret")
+    token = tokens.issue("user1")
+    payload, signature = token.split(".")
+
+    assert tokens.verify(f"{payload}x.{signature}") is None
+    assert tokens.verify(SessionTokens("other secret").issue("user1")) is None
+    assert tokens.verify("not-a-token") is None
+    # An opaque-mode session id
+    assert tokens.verify("9f" * 16) is None
+
+def test_malformed_tokens_are_rejected_not_raised():
+    tokens = SessionTokens("secret")
+    payload, signature = tokens.issue("user1").split(".")
+
+    assert tokens.verify("abc.déf") is None
+    assert tokens.verify(f"{payload}.{signature}é") is None
+    assert tokens.verify(f"ü{payload}.{signature}") is None
+    assert tokens.verify(f"{payload}.{signature}.extra") is None
+    assert tokens.verify("") is None
+
+def test_signed_mode_requires_a_secret():
+    with pytest.raises(ValueError):
+        SessionTokens("")
+
+@pytest.mark.asyncio
+async def test_logout_revokes_token_on_every_worker():
+    clock = FakeClock()
+    collection = FakeRevocations()
+    tokens = SessionTokens("secret", clock=clock)
+    worker_a = signed_session_functions(tokens, RevocationList(collection, clock=clock))
+    other_list = RevocationList(collection, clock=clock)
+    worker_b = signed_session_functions(tokens, other_list)
+
+    token = await worker_a["create_session"]("user1")
+    assert (await worker_b["get_session"](token))["user_id"] == "user1"
+
+    await worker_a["delete_session"](token)
+    assert await worker_a["get_session"](token) is None
+    # The other worker only learns about it on its next sync
+    assert await worker_b["get_session"](token) is not None
+    await other_list.sync()
+    assert await worker_b["get_session"](token) is None
+
+@pytest.mark.asyncio
+async def test_revoking_a_user_only_affects_existing_tokens():
+    clock = FakeClock()
+    tokens = SessionTokens("secret", clock=clock)
+    sessions = signed_session_functions(tokens, RevocationList(FakeRevocations(), clock=clock))
+
+    old_token = await sessions["create_session"]("user1")
+    other_user = await sessions["create_session"]("user2")
+    clock.now += 0.01
+    await sessions["revoke_user_sessions"]("user1")
+    clock.now += 0.01
+    new_token = await sessions["create_session"]("user1")
+
+    assert await sessions["get_session"](old_token) is None
+    assert await sessions["get_session"](other_user) is not None
+    assert await sessions["get_session"](new_token) is not None
+
+@pytest.mark.asyncio
+async def test_sync_prunes_expired_revocations():
+    clock = FakeClock()
+    tokens = SessionTokens("secret", ttl_seconds=60, clock=clock)
+    revocations = RevocationList(FakeRevocations(), clock=clock)
+    await revocations.revoke_token(tokens.verify(tokens.issue("user1")))
+    assert revocations.stats()["revoked_tokens"] == 1
+
+    clock.now += 61
+    await revocations.sync()
+    assert revocations.stats()["revoked_tokens"] == 0
@@ -0,0 +1,99 @@
+import pytest
+import asyncio
+from api.single_flight import SingleFlight, normalize_message
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_normalize_message():
+    assert normalize_message("  Hello   THERE ") == normalize_message("hello there")
+
+@pytest.mark.asyncio
+async def test_concurrent_duplicates_share_one_call():
+    calls = 0
+
+    async def respond():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "beep boop"
+
+    flights = SingleFlight(window_seconds=5)
+    results = await asyncio.gather(*[flights.do(("pet1", "hi"), respond) for _ in range(10)])
+
+    assert calls == 1
+    assert results == ["beep boop"] * 10
+    assert flights.stats()["coalesced"] == 9
+
+@pytest.mark.asyncio
+async def test_result_reused_within_window_only():
+    clock = FakeClock()
+    calls = 0
+
+    async def respond():
+        nonlocal calls
+        calls += 1
+        return calls
+
+    flights = SingleFlight(window_seconds=5, clock=clock)
+    assert await flights.do("key", respond) == 1
+    clock.now = 4
+    assert await flights.do("key", respond) == 1
+    assert await flights.do("other", respond) == 2
+    clock.now = 5
+    assert await flights.do("key", respond) == 3
+
+    # The window runs from when a call finished, not when it started
+    release = asyncio.Event()
+
+    async def slow_respond():
+        nonlocal calls
+        await release.wait()
+        calls += 1
+        return calls
+
+    slow = asyncio.ensure_future(flights.do("slow", slow_respond))
+    await asyncio.sleep(0)
+    clock.now = 11
+    release.set()
+    assert await slow == 4
+    clock.now = 11.1
+    assert await flights.do("slow", respond) == 4
+    clock.now = 16
+    assert await flights.do("slow", respond) == 5
+
+@pytest.mark.asyncio
+async def test_failures_are_shared_but_not_cached():
+    attempts = 0
+
+    async def respond():
+        nonlocal attempts
+        attempts += 1
+        await asyncio.sleep(0.01)
+        if attempts == 1:
+            raise RuntimeError("openai down")
+        return "ok"
+
+    flights = SingleFlight(window_seconds=5)
+    results = await asyncio.gather(*[flights.do("key", respond) for _ in range(3)], return_exceptions=True)
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert await flights.do("key", respond) == "ok"
+    assert attempts == 2
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_shared_call():
+    async def respond():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    flights = SingleFlight(window_seconds=5)
+    first = asyncio.create_task(flights.do("key", respond))
+    await asyncio.sleep(0)
+    second = asyncio.create_task(flights.do("key", respond))
+    await asyncio.sleep(0)
+    first.cancel()
+    assert await second == "done"
@@ -0,0 +1,91 @@
+import pytest
+import asyncio
+from datetime import datetime, timezone
+from database.database import PetDB, UserDB
+from database.pet_schema import Pet
+from database.memory_records import MEMORY_KINDS
+from database.memory_compaction import append_memories
+from database.outbox import chat_effects
+from database.user_schema import UserCreate
+
+TEST_USER_ID = "test_storage_user"
+
+async def test_primary_pet_is_created_once(storage):
+    pets = await asyncio.gather(*[PetDB.get_or_create_primary_pet(TEST_USER_ID) for _ in range(20)])
+    assert len({pet.id for pet in pets}) == 1 and pets[0].isPrimary
+
+    second = await PetDB.create_pet({"name": "Two", "species": "cat", "userId": TEST_USER_ID})
+    assert not second.isPrimary
+    assert [pet.id for pet in await PetDB.get_pets_by_user(TEST_USER_ID)] == [pets[0].id, second.id]
+
+async def test_interactions_match_the_mongo_pipelines(storage):
+    pet = await PetDB.create_pet(Pet(name="Berny", species="Digital", userId=TEST_USER_ID, batteryLevel=50))
+    await PetDB.feed_pet(pet.id)
+    await PetDB.feed_pet(pet.id)
+    taught = await PetDB.teach_pet(pet.id, "dial-up")
+
+    assert taught.batteryLevel == 77 and taught.level == 2 and taught.interactionCount == 3
+    assert taught.version == 3
+    # Repeated feeds compact into one counted record, as they do in MongoDB
+    assert [memory["k"] for memory in taught.memoryLog] == [MEMORY_KINDS["feed"], MEMORY_KINDS["teach"]]
+    assert taught.memoryLog[0]["n"] == 2
+
+    drained = await PetDB.update_battery_level(pet.id, -500)
+    assert drained.batteryLevel == 0
+    assert (await PetDB.play_with_pet(pet.id)).interactionCount == 3
+
+    memories = await PetDB.find_memories(TEST_USER_ID, kinds=["teach"])
+    assert [(memory["petId"], memory["user"]) for memory in memories] == [(pet.id, "dial-up")]
+
+async def test_outbox_entries_apply_once(storage):
+    pet = await PetDB.create_pet({"name": "Berny", "species": "Digital", "userId": TEST_USER_ID})
+    entry = chat_effects(pet.id, {"k": MEMORY_KINDS["chat"], "u": "hi", "p": "sup"})
+    assert await PetDB.apply_outbox([entry, entry]) == 1
+
+    updated = await PetDB.get_pet(pet.id)
+    assert updated.batteryLevel == 97 and updated.interactionCount == 1
+    assert [memory["u"] for memory in updated.memoryLog] == ["hi"]
+
+async def test_users_and_sessions(storage):
+    user = await UserDB.create_user(UserCreate(username="storage_user", email="storage@example.com", password="secret1"))
+    assert (await UserDB.get_user_by_email("storage@example.com")).id == user.id
+    assert await UserDB.authenticate(await UserDB.get_user_by_id(user.id), "secret1")
+
+    sessions = storage.session_functions()
+    session_id = await sessions["create_session"](user.id)
+    assert (await sessions["get_session"](session_id))["user_id"] == user.id
+    await sessions["revoke_user_sessions"](user.id)
+    assert await sessions["get_session"](session_id) is None
+
+def test_python_append_matches_the_pipeline_merge():
+    t0, t1 = datetime(2026, 1, 1, tzinfo=timezone.utc), datetime(2026, 1, 2, tzinfo=timezone.utc)
+    log = [{"k": MEMORY_KINDS["feed"], "t": t0}]
+    assert append_memories(log, [{"k": MEMORY_KINDS["feed"], "t": t1}]) == [{"k": MEMORY_KINDS["feed"], "n": 2, "s": t0, "t": t1}]
+    # Legacy strings never merge with records
+    assert len(append_memories(["I was fed and it was delicious!"], [{"k": MEMORY_KINDS["feed"], "t": t1}])) == 2
+
+async def test_pets_page_in_creation_order(storage):
+    created = [await PetDB.create_pet({"name": f"Pet {n}", "species": "cat", "userId": TEST_USER_ID}) for n in range(5)]
+    await PetDB.create_pet({"name": "Someone else's", "species": "cat", "userId": "another_user"})
+
+    pages, cursor = [], None
+    while True:
+        page = await PetDB.list_pets(TEST_USER_ID, cursor, limit=2)
+        pages.append([summary["id"] for summary in page["pets"]])
+        cursor = page["nextCursor"]
+        if cursor is None:
+            break
+    assert pages == [[created[0].id, created[1].id], [created[2].id, created[3].id], [created[4].id]]
+    assert "memoryLog" not in page["pets"][0] and page["pets"][0]["name"] == "Pet 4"
+
+    assert (await PetDB.get_primary_pet(TEST_USER_ID)).id == created[0].id
+    with pytest.raises(ValueError):
+        await PetDB.list_pets(TEST_USER_ID, "not-a-cursor")
+
+async def test_pets_and_users_load_in_one_batch(storage):
+    pets = [await PetDB.create_pet({"name": f"Pet {n}", "species": "cat", "userId": TEST_USER_ID}) for n in range(3)]
+    found = await storage.pets.get_pets([pets[0].id, pets[2].id, "missing"])
+    assert sorted(found) == sorted([pets[0].id, pets[2].id]) and found[pets[2].id].name == "Pet 2"
+
+    user = await UserDB.create_user(UserCreate(username="batch_user", email="batch@example.com", password="secret1"))
+    assert list(await storage.users.get_users([user.id, "missing"])) == [user.id]
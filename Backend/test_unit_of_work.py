@@ -0,0 +1,65 @@
+import pytest
+import asyncio
+from database import database
+from database.database import PetDB, UserDB
+from database.storage import memory_storage
+from database.unit_of_work import DataLoader, unit_of_work_scope
+from database.user_schema import UserCreate
+
+TEST_USER_ID = "test_uow_user"
+
+@pytest.fixture
+async def storage():
+    storage = memory_storage(on_written=database._pet_written)
+    previous = database.use_storage(storage)
+    yield storage
+    database.use_storage(previous)
+
+async def test_concurrent_lookups_share_one_fetch(storage):
+    pets = [await PetDB.create_pet({"name": f"Pet {n}", "species": "cat", "userId": TEST_USER_ID}) for n in range(3)]
+    ids = [pet.id for pet in pets]
+
+    with unit_of_work_scope(database.new_unit_of_work()) as unit:
+        found = await asyncio.gather(*[PetDB.get_pet(pet_id) for pet_id in ids + ids + ["missing"]])
+        again = await PetDB.get_pet(ids[0])
+
+    assert [pet.id if pet else None for pet in found] == ids + ids + [None]
+    assert again is found[0]
+    assert unit.pets.fetches == 1 and unit.pets.fetched_keys == 4 and unit.pets.hits == 4
+
+async def test_writes_update_the_identity_map(storage):
+    pet = await PetDB.create_pet({"name": "Berny", "species": "Digital", "userId": TEST_USER_ID, "batteryLevel": 50})
+
+    with unit_of_work_scope(database.new_unit_of_work()) as unit:
+        assert (await PetDB.get_pet(pet.id)).batteryLevel == 50
+        await PetDB.feed_pet(pet.id)
+        assert (await PetDB.get_pet(pet.id)).batteryLevel == 60
+        await PetDB.delete_pet(pet.id)
+        assert await PetDB.get_pet(pet.id) is None
+    assert unit.fetches == 1
+
+async def test_users_are_fetched_once(storage):
+    user = await UserDB.create_user(UserCreate(username="uow_user", email="uow@example.com", password="secret1"))
+
+    with unit_of_work_scope(database.new_unit_of_work()) as unit:
+        first = await UserDB.get_user_by_id(user.id)
+        second = await UserDB.get_user_by_id(user.id)
+    assert first is second and unit.users.fetches == 1
+
+    # Outside a request every lookup reads the store
+    assert await UserDB.get_user_by_id(user.id) is not first
+
+async def test_failed_batches_are_retried():
+    calls = []
+
+    async def flaky_load(keys):
+        calls.append(keys)
+        if len(calls) == 1:
+            raise ConnectionError("store unavailable")
+        return {key: key.upper() for key in keys}
+
+    loader = DataLoader(flaky_load)
+    results = await asyncio.gather(loader.load("a"), loader.load("b"), return_exceptions=True)
+    assert all(isinstance(result, ConnectionError) for result in results)
+    assert await loader.load("a") == "A"
+    assert calls == [["a", "b"], ["a"]]
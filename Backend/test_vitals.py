@@ -0,0 +1,70 @@
+import pytest
+import asyncio
+from datetime import datetime, timezone, timedelta
+from types import SimpleNamespace
+from database.vitals import VitalsRecorder, vitals_snapshot, history_pipeline, MOOD_SCORES
+
+class FakeVitals:
+    def __init__(self, fail=False):
+        self.inserted = []
+        self.batches = 0
+        self.fail = fail
+
+    async def insert_many(self, documents, ordered=True):
+        if self.fail:
+            raise ConnectionError("mongo down")
+        self.batches += 1
+        self.inserted.extend(documents)
+
+def make_pet(battery=80):
+    return SimpleNamespace(id="pet1", batteryLevel=battery, mood="happy", level=2, interactionCount=5)
+
+def test_snapshot_fields():
+    when = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    assert vitals_snapshot(make_pet(), when) == {
+        "timestamp": when, "petId": "pet1", "batteryLevel": 80, "mood": "happy", "level": 2, "interactionCount": 5
+    }
+
+@pytest.mark.asyncio
+async def test_full_buffer_flushes_in_the_background():
+    collection = FakeVitals()
+    recorder = VitalsRecorder(collection, batch_size=10)
+    for battery in range(10):
+        recorder.record(make_pet(battery))
+    await asyncio.sleep(0)
+    assert len(collection.inserted) == 10
+
+    # Below the batch size, snapshots wait for the periodic flush
+    for battery in range(10, 15):
+        recorder.record(make_pet(battery))
+    await asyncio.sleep(0)
+    assert len(collection.inserted) == 10
+    await recorder.flush()
+
+    assert [doc["batteryLevel"] for doc in collection.inserted] == list(range(15))
+    assert collection.batches == 2
+    assert recorder.stats()["buffered"] == 0
+
+@pytest.mark.asyncio
+async def test_failed_flush_keeps_snapshots_in_order():
+    collection = FakeVitals(fail=True)
+    recorder = VitalsRecorder(collection, batch_size=100)
+    recorder.record(make_pet(1))
+    assert await recorder.flush() == 0
+    recorder.record(make_pet(2))
+
+    collection.fail = False
+    assert await recorder.flush() == 2
+    assert [doc["batteryLevel"] for doc in collection.inserted] == [1, 2]
+    assert recorder.stats()["failed_flushes"] == 1
+
+def test_history_pipeline_buckets_the_range():
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    end = start + timedelta(days=10)
+    pipeline = history_pipeline("pet1", start, end, points=240)
+
+    assert pipeline[0]["$match"] == {"petId": "pet1", "timestamp": {"$gte": start, "$lt": end}}
+    group = pipeline[2]["$group"]
+    # 10 days over 240 points is one bucket per hour
+    assert group["_id"] == {"$floor": {"$divide": [{"$subtract": ["$timestamp", start]}, 3600 * 1000]}}
+    assert len(group["moodScore"]["$avg"]["$switch"]["branches"]) == len(MOOD_SCORES)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+"""
+Script to train the local reply model from the pets' chat memories
+
+Usage:
+    python train_local_generator.py --output models/chronopal_local.bin
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+from database.database import async_pets_collection
+from api.ai_personality import LOCAL_MODEL_PATH, seed_samples
+from api.local_generator import LocalModelBuilder, extract_reply
+from database.memory_records import MEMORY_KINDS
+
+async def train(output, batch_size, include_seeds):
+    """Stream every pet's memories and count reply transitions by the pet's mood and sass"""
+    builder = LocalModelBuilder()
+    if include_seeds:
+        builder.add_samples(seed_samples())
+
+    pets = 0
+    replies = 0
+    cursor = async_pets_collection.find(
+        # Chat records, or legacy chat strings on pets not yet migrated
+        {"$or": [{"memoryLog.k": MEMORY_KINDS["chat"]}, {"memoryLog": {"$regex": "I replied: "}}]},
+        {"mood": 1, "sassLevel": 1, "memoryLog": 1}
+    ).batch_size(batch_size)
+    async for pet in cursor:
+        pets += 1
+        # Memories don't record the mood at the time of the reply, so the pet's current one is used
+        mood = pet.get("mood", "neutral")
+        sass_level = pet.get("sassLevel", 1)
+        for memory in pet.get("memoryLog", []):
+            reply = extract_reply(memory)
+            if reply:
+                builder.add(mood, sass_level, reply)
+                replies += 1
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    builder.write(output)
+    print(f"Trained on {replies} replies from {pets} pets; wrote {output}", file=sys.stderr)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train ChronoPal's local reply model")
+    parser.add_argument("--output", default=LOCAL_MODEL_PATH, help="Model file to write")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--no-seeds", action="store_true", help="Leave the built-in phrase lists out of the training data")
+    args = parser.parse_args()
+
+    asyncio.run(train(args.output, args.batch_size, not args.no_seeds))
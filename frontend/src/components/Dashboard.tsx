@@ -3,7 +3,7 @@ import { useNavigate } from 'react-router-dom';
 import PetDisplay from './PetDisplay';
 import ActionButtons from './ActionButtons';
 import Notification from './Notification';
-import { Pet, PetAction } from '../types/pet';
+import { Pet, PetAction, appendMemory } from '../types/pet';
 import { apiService } from '../services/apiService';
 import '../styles/RetroStyles.css';
 
@@ -231,14 +231,49 @@ const Dashboard: React.FC = () => {
     // Initial fetch
     fetchPet();
     
-    // Set up automatic refresh every 30 seconds
-    const petRefreshInterval = setInterval(() => {
-      if (!petDead) {
-        fetchPet();
+    // Live updates are pushed over a websocket; poll every 30 seconds only while it is down
+    let petRefreshInterval: ReturnType<typeof setInterval> | null = null;
+    const startPolling = () => {
+      if (!petRefreshInterval) {
+        petRefreshInterval = setInterval(() => {
+          if (!petDead) {
+            fetchPet();
+          }
+        }, 30000);
       }
-    }, 30000);
+    };
+
+    let closeSocket: (() => void) | null = null;
+    try {
+      closeSocket = apiService.subscribeToPet((message) => {
+        if (message.type !== 'pet_delta' || !message.changes) {
+          return;
+        }
+        const { memory, ...changes } = message.changes;
+        setPet(prevPet => {
+          if (!prevPet) {
+            return prevPet;
+          }
+          return {
+            ...prevPet,
+            ...changes,
+            memoryLog: memory ? appendMemory(prevPet.memoryLog, memory) : prevPet.memoryLog
+          };
+        });
+      }, startPolling);
+    } catch (socketErr) {
+      console.error('Live pet updates unavailable, falling back to polling:', socketErr);
+      startPolling();
+    }
     
-    return () => clearInterval(petRefreshInterval);
+    return () => {
+      if (closeSocket) {
+        closeSocket();
+      }
+      if (petRefreshInterval) {
+        clearInterval(petRefreshInterval);
+      }
+    };
   }, [navigate, petDead]);
 
   if (loading) {
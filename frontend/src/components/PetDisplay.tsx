@@ -1,5 +1,5 @@
 import React from 'react';
-import { Pet } from '../types/pet';
+import { Pet, memoryLabel } from '../types/pet';
 import '../styles/RetroStyles.css';
 
 interface PetDisplayProps {
@@ -88,7 +88,7 @@ const PetDisplay: React.FC<PetDisplayProps> = ({ pet, isFeeding, isPlaying, isTe
         <div className="memory-log">
           {pet.memoryLog.slice(-3).map((memory, index) => (
             <div key={index} className="memory-item">
-              {memory}
+              {memoryLabel(memory)}
             </div>
           ))}
         </div>
@@ -1,5 +1,5 @@
 import axios from 'axios';
-import { Pet } from '../types/pet';
+import { Memory, Pet, PetPage } from '../types/pet';
 import { User } from '../types/user';
 
 const API_BASE_URL = process.env.REACT_APP_API_BASE_URL || 'https://chronopal-backend-00ae6a240df5.herokuapp.com';
@@ -25,12 +25,28 @@ interface ChatResponse {
   response: string;
 }
 
+export interface QueuedPetAction {
+  type: 'feed' | 'play' | 'teach';
+  message?: string;
+  clientTimestamp?: string;
+}
+
+export interface PetSocketMessage {
+  type: 'pet_snapshot' | 'pet_delta';
+  petId?: string;
+  pet?: Pet;
+  changes?: Partial<Pick<Pet, 'mood' | 'batteryLevel' | 'level' | 'interactionCount'>> & { memory?: Memory };
+  timestamp?: string;
+}
+
 class ApiService {
   private static instance: ApiService;
   private sessionId: string | null = null;
+  private activePetId: string | null = null;
 
   private constructor() {
     this.sessionId = localStorage.getItem('sessionId');
+    this.activePetId = localStorage.getItem('activePetId');
   }
 
   public static getInstance(): ApiService {
@@ -44,10 +60,24 @@ class ApiService {
     if (!this.sessionId) {
       throw new Error('No session ID found. Please log in.');
     }
-    return {
+    const headers: Record<string, string> = {
       'Content-Type': 'application/json',
       'session-id': this.sessionId
     };
+    // Routes that don't take a pet id act on this pet, or on the primary pet without it
+    if (this.activePetId) {
+      headers['x-pet-id'] = this.activePetId;
+    }
+    return headers;
+  }
+
+  public setActivePetId(petId: string | null) {
+    this.activePetId = petId;
+    if (petId) {
+      localStorage.setItem('activePetId', petId);
+    } else {
+      localStorage.removeItem('activePetId');
+    }
   }
 
   public setSessionId(sessionId: string) {
@@ -58,6 +88,7 @@ class ApiService {
   public clearSession() {
     this.sessionId = null;
     localStorage.removeItem('sessionId');
+    this.setActivePetId(null);
   }
 
   public forceSessionRefresh() {
@@ -145,6 +176,14 @@ class ApiService {
     }
   }
 
+  public async listPets(cursor?: string, limit = 20): Promise<PetPage> {
+    const response = await axios.get<PetPage>(`${API_BASE_URL}/api/pets`, {
+      headers: this.headers,
+      params: { cursor, limit }
+    });
+    return response.data;
+  }
+
   public async getUserPet(): Promise<Pet> {
     try {
       console.log('Requesting pet data from API...');
@@ -338,6 +377,65 @@ class ApiService {
     }
   }
 
+  // Replay actions queued while offline in a single request
+  public async syncQueuedActions(petId: string, actions: QueuedPetAction[]): Promise<Pet> {
+    try {
+      console.log(`[apiService] Syncing ${actions.length} queued actions for pet ${petId}`);
+      const response = await axios.post<any>(`${API_BASE_URL}/api/pets/${petId}/actions:batch`, {
+        actions
+      }, {
+        headers: this.headers
+      });
+
+      let petData = response.data;
+      if (!petData.id && petData._id) {
+        petData = {
+          ...petData,
+          id: petData._id
+        };
+      }
+      return petData;
+    } catch (error: any) {
+      console.error('[apiService] Error syncing queued actions:', error);
+      if (error.response?.status === 401) {
+        this.clearSession();
+        throw new Error('Session expired. Please log in again.');
+      }
+      throw error;
+    }
+  }
+
+  // Open the live pet channel; returns a function that closes it
+  public subscribeToPet(
+    onMessage: (message: PetSocketMessage) => void,
+    onClose?: () => void
+  ): () => void {
+    if (!this.sessionId) {
+      throw new Error('No session ID found. Please log in.');
+    }
+    const socketUrl = `${API_BASE_URL.replace(/^http/, 'ws')}/api/ws/pet?session_id=${encodeURIComponent(this.sessionId)}`;
+    const socket = new WebSocket(socketUrl);
+
+    socket.onmessage = (event) => {
+      try {
+        onMessage(JSON.parse(event.data) as PetSocketMessage);
+      } catch (err) {
+        console.error('[apiService] Invalid pet socket message:', err);
+      }
+    };
+    socket.onclose = () => {
+      console.log('[apiService] Pet socket closed');
+      if (onClose) {
+        onClose();
+      }
+    };
+
+    return () => {
+      socket.onclose = null;
+      socket.close();
+    };
+  }
+
   public async savePet(pet: Partial<Pet>): Promise<Pet> {
     try {
       const response = await axios.post<Pet>(`${API_BASE_URL}/api/save-pet`, pet, {
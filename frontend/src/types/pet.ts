@@ -1,3 +1,70 @@
+// Memories are stored as compact records; see Backend/database/memory_records.py
+export const MEMORY_KINDS = { note: 0, chat: 1, feed: 2, play: 3, teach: 4 } as const;
+
+export interface MemoryRecord {
+  k: number;   // kind code from MEMORY_KINDS
+  t?: string;  // when it happened; the latest time for a counted entry
+  u?: string;  // the user's side: chat message or lesson topic
+  p?: string;  // the pet's side: chat reply or note text
+  n?: number;  // repeated feeds and plays stored once with a count
+  s?: string;  // when a counted entry's first feed or play happened
+}
+
+// Written before records, until the migration rewrites them
+export interface LegacyMemoryEntry {
+  text: string;
+  count: number;
+  firstAt: string | null;
+  lastAt: string | null;
+}
+
+export type Memory = string | LegacyMemoryEntry | MemoryRecord;
+
+const isRecord = (memory: Memory): memory is MemoryRecord =>
+  typeof memory !== 'string' && 'k' in memory;
+
+export const memoryText = (memory: Memory): string => {
+  if (typeof memory === 'string') {
+    return memory;
+  }
+  if (!isRecord(memory)) {
+    return memory.text;
+  }
+  switch (memory.k) {
+    case MEMORY_KINDS.chat:
+      return `User said: '${memory.u ?? ''}', I replied: '${memory.p ?? ''}'`;
+    case MEMORY_KINDS.feed:
+      return 'I was fed and it was delicious!';
+    case MEMORY_KINDS.play:
+      return 'We played together and it was fun!';
+    case MEMORY_KINDS.teach:
+      return `I learned about ${memory.u ?? ''}`;
+    default:
+      return memory.p ?? '';
+  }
+};
+
+const memoryCount = (memory: Memory): number => {
+  if (typeof memory === 'string') {
+    return 1;
+  }
+  return isRecord(memory) ? memory.n ?? 1 : memory.count;
+};
+
+export const memoryLabel = (memory: Memory): string => {
+  const count = memoryCount(memory);
+  return count > 1 ? `${memoryText(memory)} (x${count})` : memoryText(memory);
+};
+
+// A counted record that repeats the last memory replaces it instead of being appended
+export const appendMemory = (log: Memory[], memory: Memory): Memory[] => {
+  const last = log[log.length - 1];
+  if (isRecord(memory) && (memory.n ?? 1) > 1 && last !== undefined && isRecord(last) && last.k === memory.k) {
+    return [...log.slice(0, -1), memory];
+  }
+  return [...log, memory];
+};
+
 export interface Pet {
   id?: string;  // Optional to handle cases where MongoDB returns _id instead
   _id?: string; // MongoDB's default ID field
@@ -11,7 +78,18 @@ export interface Pet {
   lastFed: string;
   lastInteraction: string;
   interactionCount: number;
-  memoryLog: string[];
+  createdAt?: string;
+  evolutionStage?: 'baby' | 'child' | 'teen' | 'adult';
+  memoryLog: Memory[];
+  isPrimary?: boolean; // The pet used when no pet id is given
+}
+
+// One entry of GET /api/pets: a pet without its memory log
+export type PetSummary = Pick<Pet, 'id' | 'name' | 'species' | 'mood' | 'level' | 'batteryLevel' | 'evolutionStage' | 'interactionCount' | 'lastInteraction' | 'createdAt' | 'isPrimary'>;
+
+export interface PetPage {
+  pets: PetSummary[];
+  nextCursor: string | null; // null on the last page
 }
 
 export type PetAction = {